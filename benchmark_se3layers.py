@@ -0,0 +1,265 @@
+# Global imports
+import time
+import math
+import argparse
+
+# Torch imports
+import torch
+import torch.nn.functional as F
+
+# Local imports
+import se3layers as se3nn
+import ctrlnets
+from layers.ComposeRt import ComposeRtFunction
+from layers.ComposeRtPair import compose_rt_pair
+from layers.RtInverse import rt_inverse
+from layers.CollapseRtPivots import collapse_rt_pivots
+from layers import rtops
+
+#### Setup options
+parser = argparse.ArgumentParser(description='Benchmark the FWD/BWD passes of the se3layers')
+parser.add_argument('--cuda', action='store_true', default=False,
+                    help='Run the benchmarks on the GPU (default: False)')
+parser.add_argument('--iters', default=100, type=int, metavar='N',
+                    help='Number of timed iterations per benchmark (default: 100)')
+parser.add_argument('--warmup', default=10, type=int, metavar='N',
+                    help='Number of un-timed iterations before each benchmark (default: 10)')
+
+# Define xrange
+try:
+    a = xrange(1)
+except NameError: # Not defined in Python 3.x
+    def xrange(*args):
+        return iter(range(*args))
+
+################ Timing helpers
+# Time a function (in ms per call), sync the GPU before reading the clock
+def time_fn(fn, iters, warmup, cuda):
+    for _ in xrange(warmup):
+        fn()
+    if cuda:
+        torch.cuda.synchronize()
+    st = time.time()
+    for _ in xrange(iters):
+        fn()
+    if cuda:
+        torch.cuda.synchronize()
+    return (time.time() - st) * 1000.0 / iters
+
+################ SE3ToRt
+# Params: (num rotation params) per transform type, near identity (as with init_posese3_iden) or random
+def bench_se3tort(args):
+    print('==== SE3ToRt (FWD + BWD, ms/iter)')
+    print('{:>10} {:>10} {:>10} {:>10}'.format('Type', 'B x k', 'Identity', 'Random'))
+    for batch_size, num_se3 in [(16, 8), (256, 8)]:
+        for transform_type, num_params in [('se3euler', 6), ('se3aa', 6), ('se3aar', 6), ('se3quat', 7), ('se3spquat', 6)]:
+            layer = se3nn.SE3ToRt(transform_type)
+            times = []
+            for iden in [True, False]:
+                params = torch.randn(batch_size, num_se3, num_params)
+                if iden:
+                    params.narrow(2, 3, num_params-3).zero_() # Zero rotation (small-angle branch)
+                    if transform_type == 'se3quat':
+                        params[:, :, 6] = 1 # Unit quaternion [0,0,0,1]
+                if args.cuda:
+                    params = params.cuda()
+                params.requires_grad_()
+                grad_output = params.new_empty(batch_size, num_se3, 3, 4).normal_()
+                def fwdbwd():
+                    layer(params).backward(grad_output)
+                times.append(time_fn(fwdbwd, args.iters, args.warmup, args.cuda))
+            print('{:>10} {:>10} {:>10.3f} {:>10.3f}'.format(transform_type, '{} x {}'.format(batch_size, num_se3),
+                                                             times[0], times[1]))
+
+################ ComposeRt
+# Sequential loop vs parallel prefix scan (FWD + BWD) for different chain lengths
+def bench_composert(args):
+    print('==== ComposeRt (FWD + BWD, ms/iter)')
+    print('{:>12} {:>10} {:>10} {:>10}'.format('rightToLeft', 'B x N', 'Loop', 'Scan'))
+    for batch_size in [16, 256]:
+        for num_se3 in [8, 16, 32, 64]:
+            for rightToLeft in [False, True]:
+                input = torch.randn(batch_size, num_se3, 3, 4) * 0.5
+                if args.cuda:
+                    input = input.cuda()
+                grad_output = torch.randn_like(input)
+                def loop():
+                    output = ComposeRtFunction.forwardLoop(input, rightToLeft)
+                    ComposeRtFunction.backwardLoop(grad_output, input, output, rightToLeft)
+                def scan():
+                    output = ComposeRtFunction.forwardScan(input, rightToLeft)
+                    ComposeRtFunction.backwardScan(grad_output, input, output, rightToLeft)
+                print('{:>12} {:>10} {:>10.3f} {:>10.3f}'.format(str(rightToLeft), '{} x {}'.format(batch_size, num_se3),
+                                                                 time_fn(loop, args.iters, args.warmup, args.cuda),
+                                                                 time_fn(scan, args.iters, args.warmup, args.cuda)))
+
+################ Fused 3x4 ops
+# Fused kernels (rtops, writing to a pre-allocated output) vs the same ops with torch matmul/cat (FWD only)
+def bench_rtops(args):
+    print('==== Fused 3x4 ops (FWD, ms/iter)')
+    print('{:>10} {:>10} {:>10} {:>10}'.format('Op', 'B x k', 'Torch', 'Fused'))
+    for batch_size, num_se3 in [(16, 8), (256, 8), (4096, 8)]:
+        A, B = torch.randn(batch_size, num_se3, 3, 4), torch.randn(batch_size, num_se3, 3, 4)
+        P = torch.randn(batch_size, num_se3, 3, 5)
+        if args.cuda:
+            A, B, P = A.cuda(), B.cuda(), P.cuda()
+        out = torch.empty_like(A)
+        for name, torch_fn, fused_fn in [('compose', lambda: compose_rt_pair(A, B), lambda: rtops.compose(A, B, out=out)),
+                                         ('inverse', lambda: rt_inverse(A), lambda: rtops.inverse(A, out=out)),
+                                         ('collapse', lambda: collapse_rt_pivots(P), lambda: rtops.collapse_pivots(P, out=out))]:
+            print('{:>10} {:>10} {:>10.3f} {:>10.3f}'.format(name, '{} x {}'.format(batch_size, num_se3),
+                                                             time_fn(torch_fn, args.iters, args.warmup, args.cuda),
+                                                             time_fn(fused_fn, args.iters, args.warmup, args.cuda)))
+
+################ Fused 3D losses
+# MaskedLoss3D with the fused kernels vs the same loss with torch ops (reference mode), visibility weights &
+# motion normalization (as in the training scripts)
+def bench_loss3d(args):
+    print('==== MaskedLoss3D (FWD + BWD, ms/iter)')
+    print('{:>14} {:>10} {:>10} {:>10}'.format('Type', 'B', 'Torch', 'Fused'))
+    for batch_size in [8, 32]:
+        input, target = torch.randn(batch_size, 3, 240, 320), torch.randn(batch_size, 3, 240, 320)
+        wts = (torch.rand(batch_size, 1, 240, 320) > 0.2).float()
+        if args.cuda:
+            input, target, wts = input.cuda(), target.cuda(), wts.cuda()
+        input.requires_grad_()
+        for loss_type in ['mse', 'abs', 'normmsesqrt', 'normmsesqrtpt']:
+            layer = se3nn.MaskedLoss3D(loss_type, motion_norm=True)
+            def fwdbwd():
+                layer(input, target, wts=wts, motion=target).backward()
+            times = []
+            for use_reference in [True, False]:
+                se3nn.set_use_reference(use_reference)
+                times.append(time_fn(fwdbwd, args.iters, args.warmup, args.cuda))
+            print('{:>14} {:>10} {:>10.3f} {:>10.3f}'.format(loss_type, batch_size, times[0], times[1]))
+
+################ NTfm3D with low-res masks
+# Masks at 1/scale of the point resolution: upsampled inside the kernels vs F.interpolate + NTfm3D at full res
+# (reference mode). Scale 1 is the plain NTfm3D (no upsampling)
+def bench_ntfm3d_upsampled(args):
+    print('==== NTfm3D, low-res masks (FWD + BWD, ms/iter)')
+    print('{:>10} {:>10} {:>10} {:>10}'.format('Scale', 'B', 'Torch', 'Fused'))
+    num_se3 = 8
+    for batch_size in [8, 32]:
+        for scale in [1, 2, 4]:
+            points = torch.randn(batch_size, 3, 240, 320)
+            masks = torch.randn(batch_size, num_se3, 240 // scale, 320 // scale).softmax(1)
+            tfms = torch.randn(batch_size, num_se3, 3, 4)
+            if args.cuda:
+                points, masks, tfms = points.cuda(), masks.cuda(), tfms.cuda()
+            masks.requires_grad_()
+            tfms.requires_grad_()
+            layer = se3nn.NTfm3D()
+            grad_output = torch.randn_like(points)
+            def fwdbwd():
+                layer(points, masks, tfms).backward(grad_output)
+            times = []
+            for use_reference in [True, False]:
+                se3nn.set_use_reference(use_reference)
+                times.append(time_fn(fwdbwd, args.iters, args.warmup, args.cuda))
+            print('{:>10} {:>10} {:>10.3f} {:>10.3f}'.format(scale, batch_size, times[0], times[1]))
+
+################ Flow error of low-res masks
+# Synthetic scenes: smooth background depth (at 1-2m) with 3 elliptical objects (0.4m nearer to the camera), each
+# moving rigidly (rotation of up to 0.1 rad about its center + translation of ~3cm). The GT masks are binary
+# (background + 3 objects), points are in meters
+def make_scene(batch_size, num_se3, generator, ht=240, wd=320):
+    xs, ys = torch.linspace(-0.7, 0.7, wd), torch.linspace(-0.5, 0.5, ht)
+    grid_x, grid_y = xs.view(1, wd).expand(ht, wd), ys.view(ht, 1).expand(ht, wd)
+    depth = 1.5 + 0.3 * F.interpolate(torch.rand(batch_size, 1, 4, 5, generator=generator), size=(ht, wd),
+                                      mode='bilinear', align_corners=False)
+    masks = torch.zeros(batch_size, num_se3, ht, wd)
+    masks[:, 0] = 1
+    tfms = torch.eye(4)[:3].repeat(batch_size, num_se3, 1, 1)
+    for b in range(batch_size):
+        for k in range(1, num_se3):
+            rnd = torch.rand(4, generator=generator)
+            cx = -0.5 + (k - 0.5) / (num_se3 - 1) + 0.1 * (rnd[0].item() - 0.5)
+            cy = 0.3 * (rnd[1].item() - 0.5)
+            rx, ry = 0.1 + 0.08 * rnd[2].item(), 0.08 + 0.08 * rnd[3].item()
+            inside = (((grid_x - cx) / rx) ** 2 + ((grid_y - cy) / ry) ** 2) < 1
+            masks[b, :, inside] = 0
+            masks[b, k, inside] = 1
+            depth[b, 0, inside] -= 0.4
+            # Rotation (Rodrigues) about the object center + translation
+            axis = torch.randn(3, generator=generator)
+            axis = axis / axis.norm()
+            angle = 0.1 * torch.rand(1, generator=generator).item()
+            K = torch.zeros(3, 3)
+            K[0, 1], K[0, 2], K[1, 2] = -axis[2], axis[1], -axis[0]
+            K = K - K.t()
+            rot = torch.eye(3) + math.sin(angle) * K + (1 - math.cos(angle)) * K.mm(K)
+            center = torch.Tensor([cx, cy, 1]) * depth[b, 0, inside].mean()
+            tfms[b, k, :, :3] = rot
+            tfms[b, k, :, 3] = center - rot.mv(center) + 0.03 * torch.randn(3, generator=generator)
+    points = depth * torch.stack([grid_x, grid_y, torch.ones(ht, wd)], 0).unsqueeze(0)
+    return points, masks, tfms
+
+# GT masks area-downsampled to 1/scale & upsampled inside NTfm3D vs the full-res GT masks (mean 3D flow error
+# in mm over all the points & over the moving points). This is the error floor of a model predicting low-res masks
+def bench_ntfm3d_accuracy(args):
+    print('==== NTfm3D, low-res masks (flow error vs full-res masks, mm)')
+    num_se3 = 4
+    points, masks, tfms = make_scene(16, num_se3, torch.Generator().manual_seed(123))
+    if args.cuda:
+        points, masks, tfms = points.cuda(), masks.cuda(), tfms.cuda()
+    se3nn.set_use_reference(False)
+    layer = se3nn.NTfm3D()
+    with torch.no_grad():
+        gtpts = layer(points, masks, tfms)
+        moving = (masks[:, 0] < 0.5)
+        gtflow = (gtpts - points).norm(dim=1)
+        print('Mean GT flow: {:.1f} mm (moving points: {:.1f} mm, {:.1f}% of the points)'.format(
+            gtflow.mean().item() * 1000, gtflow[moving].mean().item() * 1000, moving.float().mean().item() * 100))
+        print('{:>10} {:>10} {:>10}'.format('Scale', 'All', 'Moving'))
+        for scale in [1, 2, 4]:
+            lowres = F.avg_pool2d(masks, scale) if scale > 1 else masks
+            err = (layer(points, lowres, tfms) - gtpts).norm(dim=1)
+            print('{:>10} {:>10.3f} {:>10.3f}'.format(scale, err.mean().item() * 1000, err[moving].mean().item() * 1000))
+
+################ SE3-Pose-Model with low-res masks
+# End-to-end timing of the MultiStepSE3PoseModel (default options, 240 x 320) at each mask scale: eval forward
+# pass of the pose-mask encoder & a train step (pose-mask encoder + transition model + NTfm3D + 3D loss, FWD + BWD)
+def bench_model_mask_scale(args):
+    print('==== MultiStepSE3PoseModel, low-res masks (ms/iter)')
+    print('{:>10} {:>10} {:>10} {:>10}'.format('Scale', 'B', 'Eval fwd', 'Train step'))
+    num_se3, num_ctrl, batch_size = 8, 7, 8
+    points, _, _ = make_scene(batch_size, num_se3, torch.Generator().manual_seed(0))
+    ctrls, target = torch.randn(batch_size, num_ctrl), torch.randn(batch_size, 3, 240, 320) * 0.01
+    if args.cuda:
+        points, ctrls, target = points.cuda(), ctrls.cuda(), target.cuda()
+    se3nn.set_use_reference(False)
+    ntfm3d = se3nn.NTfm3D()
+    iters, warmup = max(args.iters // 10, 1), max(args.warmup // 10, 1)
+    for scale in [1, 2, 4]:
+        torch.manual_seed(0)
+        model = ctrlnets.MultiStepSE3PoseModel(num_ctrl=num_ctrl, num_se3=num_se3, mask_scale=scale)
+        if args.cuda:
+            model.cuda()
+        def fwd():
+            with torch.no_grad():
+                model.forward_pose_mask([points, None])
+        def train_step():
+            model.zero_grad()
+            pose, mask = model.forward_pose_mask([points, None])
+            deltapose, _ = model.forward_next_pose(pose, ctrls)
+            flow = ntfm3d(points, mask, deltapose) - points
+            ctrlnets.Loss3D(flow, target, 'mse').backward()
+        model.eval()
+        tfwd = time_fn(fwd, iters, warmup, args.cuda)
+        model.train()
+        ttrain = time_fn(train_step, iters, warmup, args.cuda)
+        print('{:>10} {:>10} {:>10.3f} {:>10.3f}'.format(scale, batch_size, tfwd, ttrain))
+
+################ Main
+if __name__ == '__main__':
+    args = parser.parse_args()
+    args.cuda = args.cuda and torch.cuda.is_available()
+    print('Running on: {}'.format('GPU' if args.cuda else 'CPU'))
+    bench_se3tort(args)
+    bench_composert(args)
+    bench_rtops(args)
+    bench_loss3d(args)
+    bench_ntfm3d_upsampled(args)
+    bench_ntfm3d_accuracy(args)
+    bench_model_mask_scale(args)
@@ -1,8 +1,12 @@
+import contextlib
+from collections import OrderedDict
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+import torch.utils.checkpoint
 #from  torch.autograd import Variable
 import se3layers as se3nn
+import gridcache # Shared coord grids (layers/gridcache.py)
 #import util
 import data
 
@@ -74,10 +78,12 @@ def init_sigmoidmask_bg(layer, num_se3=8):
     NN Modules / Loss functions
 '''
 # TODO: The weights are only supposed to be binary here. Non binary weights will do weird things
+# NOTE: The losses & mask normalizations run in float32 under autocast (mixed precision, se3nn.float32)
 
 # MSE Loss that gives gradients w.r.t both input & target
 # Input/Target: Bsz x nSE3 x 3 x 4
 # NOTE: This scales the loss by 0.5 while the default nn.MSELoss does not
+@se3nn.float32
 def PoseConsistencyLoss(input, target, size_average=True):
     delta = se3nn.ComposeRtPair()(input, se3nn.RtInverse()(target)) # input * target^-1
     rot, trans = delta.narrow(3,0,3), delta.narrow(3,3,1)
@@ -90,6 +96,7 @@ def PoseConsistencyLoss(input, target, size_average=True):
 
 # MSE Loss that gives gradients w.r.t both input & target
 # NOTE: This scales the loss by 0.5 while the default nn.MSELoss does not
+@se3nn.float32
 def BiMSELoss(input, target, size_average=True, wts=None):
     weights = wts.expand_as(input) if wts is not None else 1 # Per-pixel scalar
     diff = ((input - target) * weights).view(-1)
@@ -101,6 +108,7 @@ def BiMSELoss(input, target, size_average=True, wts=None):
         return loss
 
 # ABS Loss that gives gradients w.r.t both input & target
+@se3nn.float32
 def BiAbsLoss(input, target, size_average=True, wts=None):
     weights = wts.expand_as(input) if wts is not None else 1 # Per-pixel scalar
     loss = ((input - target).abs() * weights).view(-1).sum()
@@ -111,6 +119,7 @@ def BiAbsLoss(input, target, size_average=True, wts=None):
         return loss
 
 # NORMMSESQRT Loss that gives gradients w.r.t both input & target
+@se3nn.float32
 def BiNormMSESqrtLoss(input, target, size_average=True, norm_per_pt=False, wts=None):
     weights = wts.expand_as(input) if wts is not None else 1 # Per-pixel scalar
     if norm_per_pt:
@@ -126,8 +135,12 @@ def BiNormMSESqrtLoss(input, target, size_average=True, norm_per_pt=False, wts=N
         return loss
 
 # Loss for 3D point errors
-def Loss3D(input, target, loss_type='mse', wts=None):
-    if loss_type == 'mse':
+# If fused is set, the loss is computed by the fused MaskedLoss3D kernels (single pass, no per-element temporaries)
+@se3nn.float32
+def Loss3D(input, target, loss_type='mse', wts=None, fused=False):
+    if fused:
+        return se3nn.MaskedLoss3D(loss_type)(input, target, wts=wts)
+    elif loss_type == 'mse':
         return BiMSELoss(input, target, wts=wts)
     elif loss_type == 'abs':
         return BiAbsLoss(input, target, wts=wts)
@@ -139,13 +152,16 @@ def Loss3D(input, target, loss_type='mse', wts=None):
         assert False, "Unknown loss type: " + loss_type
 
 # Loss normalized by the number of points that move in the GT flow
+@se3nn.float32
 def MotionNormalizedLoss3D(input, target, motion, loss_type='mse',
-                           thresh=2.5e-3, wts=None):
+                           thresh=2.5e-3, wts=None, fused=False):
     # Get number of "visible" points that move in each example of the batch
     bsz = input.size(0) # batch size
     assert input.is_same_size(target), "Input and Target sizes need to match"
+    if fused: # Single pass over the data, computes the number of moving points as well
+        return se3nn.MaskedLoss3D(loss_type, motion_norm=True, motion_thresh=thresh)(input, target, wts=wts, motion=motion)
     wtmask = wts if wts is not None else 1
-    nummotionpts = ((motion.abs().sum(1) > thresh).type_as(wts) * wtmask).float().view(bsz, -1).sum(1).clamp(min=100) # Takes care of numerical instabilities & acts as margin
+    nummotionpts = ((motion.abs().sum(1, keepdim=True) > thresh).type_as(input) * wtmask).float().view(bsz, -1).sum(1).clamp(min=100) # Takes care of numerical instabilities & acts as margin
     # Compute loss
     weights = wts.expand_as(input).clone().view(bsz, -1) if wts is not None else 1 # Per-pixel scalar
     if loss_type == 'mse':
@@ -170,9 +186,60 @@ def MotionNormalizedLoss3D(input, target, motion, loss_type='mse',
     # Return
     return loss
 
+####################################
+### Per-channel scale & shift of a BN layer in eval mode (running stats): bn(x) = scale * x + shift
+def bn_scale_shift(bn):
+    scale = 1.0 / torch.sqrt(bn.running_var + bn.eps)
+    shift = -bn.running_mean * scale
+    if bn.affine:
+        scale, shift = scale * bn.weight, shift * bn.weight + bn.bias
+    return scale, shift
+
+### Fold the BN layers of the Basic Conv/Deconv blocks into their conv/deconv (for inference only, the folded
+### model can't be trained). Returns the number of folded BN layers
+def fold_batchnorm(model):
+    nfolded = 0
+    for m in model.modules():
+        if isinstance(m, (BasicConv2D, BasicDeconv2D)):
+            nfolded += int(m.fold_bn())
+    return nfolded
+
+####################################
+### The BN running stats are restored when leaving the context (the updates made inside are undone)
+@contextlib.contextmanager
+def frozen_bn_stats(module):
+    stats = [(b, b.clone()) for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)
+             for b in m.buffers()]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for b, saved in stats:
+                b.copy_(saved)
+
+### Conv/Deconv block with optional activation checkpointing: if "checkpoint" is set, the activations inside the
+### block are not stored in the FWD pass, only its inputs are kept & the block is re-run in the BWD pass (the BN
+### running stats are not updated again by the re-run). The blocks implement block_forward
+class CheckpointedBlock(nn.Module):
+    def __init__(self):
+        super(CheckpointedBlock, self).__init__()
+        self.checkpoint = False
+
+    def forward(self, *inputs):
+        if not (self.checkpoint and torch.is_grad_enabled()):
+            return self.block_forward(*inputs)
+        nruns = [0]
+        def run(*inps):
+            nruns[0] += 1
+            if nruns[0] > 1: # Re-run in the BWD pass
+                with frozen_bn_stats(self):
+                    return self.block_forward(*inps)
+            return self.block_forward(*inps)
+        return torch.utils.checkpoint.checkpoint(run, *inputs, use_reentrant=False) # Grads to the params w/o input grads
+
 ####################################
 ### Basic Conv + Pool + BN + Non-linearity structure
-class BasicConv2D(nn.Module):
+class BasicConv2D(CheckpointedBlock):
     def __init__(self, in_channels, out_channels, use_pool=False, use_bn=True, nonlinearity='prelu',
                  coord_conv=False, **kwargs):
         super(BasicConv2D, self).__init__()
@@ -185,7 +252,7 @@ class BasicConv2D(nn.Module):
         self.nonlin = get_nonlinearity(nonlinearity)
 
     # Convolution -> Pool -> BN -> Non-linearity
-    def forward(self, x):
+    def block_forward(self, x):
         x = self.conv(x)
         if self.pool:
             x = self.pool(x)
@@ -193,8 +260,24 @@ class BasicConv2D(nn.Module):
             x = self.bn(x)
         return self.nonlin(x)
 
+    # Fold the BN into the conv. With pooling, this is only valid if all the BN scales are positive (max-pool
+    # commutes with a positive scale), otherwise the BN is kept
+    def fold_bn(self):
+        if self.bn is None:
+            return False
+        scale, shift = bn_scale_shift(self.bn)
+        if self.pool is not None and (scale <= 0).any():
+            return False
+        conv = self.conv.conv if isinstance(self.conv, CoordConvBase) else self.conv
+        with torch.no_grad():
+            bias = (conv.bias * scale + shift) if conv.bias is not None else shift
+            conv.weight.mul_(scale.view(-1, 1, 1, 1))
+            conv.bias = nn.Parameter(bias, requires_grad=conv.weight.requires_grad)
+        self.bn = None
+        return True
+
 ### Basic Deconv + (Optional Skip-Add) + BN + Non-linearity structure
-class BasicDeconv2D(nn.Module):
+class BasicDeconv2D(CheckpointedBlock):
     def __init__(self, in_channels, out_channels, use_bn=True, nonlinearity='prelu',
                  coord_conv=False, **kwargs):
         super(BasicDeconv2D, self).__init__()
@@ -204,10 +287,13 @@ class BasicDeconv2D(nn.Module):
             self.deconv = nn.ConvTranspose2d(in_channels, out_channels, **kwargs)
         self.bn = nn.BatchNorm2d(out_channels, eps=0.001) if use_bn else None
         self.nonlin = get_nonlinearity(nonlinearity)
+        self.register_buffer('skip_scale', None) # BN scale for the skip input (only once the BN is folded)
 
     # BN -> Non-linearity -> Deconvolution -> (Optional Skip-Add)
-    def forward(self, x, y=None):
-        if y is not None:
+    def block_forward(self, x, y=None):
+        if y is not None and self.skip_scale is not None:
+            x = torch.addcmul(self.deconv(x), y, self.skip_scale) # Skip-Add the extra input (BN is folded)
+        elif y is not None:
             x = self.deconv(x) + y  # Skip-Add the extra input
         else:
             x = self.deconv(x)
@@ -215,8 +301,22 @@ class BasicDeconv2D(nn.Module):
             x = self.bn(x)
         return self.nonlin(x)
 
+    # Fold the BN into the deconv: bn(deconv(x) + y) = deconv'(x) + scale * y
+    def fold_bn(self):
+        if self.bn is None:
+            return False
+        scale, shift = bn_scale_shift(self.bn)
+        deconv = self.deconv.conv if isinstance(self.deconv, CoordConvBase) else self.deconv
+        with torch.no_grad():
+            bias = (deconv.bias * scale + shift) if deconv.bias is not None else shift
+            deconv.weight.mul_(scale.view(1, -1, 1, 1)) # in x out x kh x kw
+            deconv.bias = nn.Parameter(bias, requires_grad=deconv.weight.requires_grad)
+            self.skip_scale = scale.view(1, -1, 1, 1).clone()
+        self.bn = None
+        return True
+
 ###  BN + Non-linearity + Basic Conv + Pool structure
-class PreConv2D(nn.Module):
+class PreConv2D(CheckpointedBlock):
     def __init__(self, in_channels, out_channels, use_pool=False, use_bn=True, nonlinearity='prelu',
                  coord_conv=False, **kwargs):
         super(PreConv2D, self).__init__()
@@ -229,7 +329,7 @@ class PreConv2D(nn.Module):
         self.pool = nn.MaxPool2d(kernel_size=2, stride=2) if use_pool else None
 
     # BN -> Non-linearity -> Convolution -> Pool
-    def forward(self, x):
+    def block_forward(self, x):
         if self.bn:
             x = self.bn(x)
         x = self.nonlin(x)
@@ -239,7 +339,7 @@ class PreConv2D(nn.Module):
         return x
 
 ### Basic Deconv + (Optional Skip-Add) + BN + Non-linearity structure
-class PreDeconv2D(nn.Module):
+class PreDeconv2D(CheckpointedBlock):
     def __init__(self, in_channels, out_channels, use_bn=True, nonlinearity='prelu',
                  coord_conv=False, **kwargs):
         super(PreDeconv2D, self).__init__()
@@ -251,7 +351,7 @@ class PreDeconv2D(nn.Module):
             self.deconv = nn.ConvTranspose2d(in_channels, out_channels, **kwargs)
 
     # BN -> Non-linearity -> Deconvolution -> (Optional Skip-Add)
-    def forward(self, x, y=None):
+    def block_forward(self, x, y=None):
         if self.bn:
             x = self.bn(x)
         x = self.nonlin(x)
@@ -261,38 +361,102 @@ class PreDeconv2D(nn.Module):
             x = self.deconv(x)
         return x
 
+###################
+### Activation checkpointing with a memory budget
+# Storage (ptr, bytes) of a tensor, views of the same storage are only counted once
+def storage_ptr_bytes(x):
+    if hasattr(x, 'untyped_storage'):
+        st = x.untyped_storage()
+        return st.data_ptr(), st.nbytes()
+    st = x.storage()
+    return st.data_ptr(), st.size() * x.element_size()
+
+# Activations saved for the BWD pass by one call of forward_fn(model) (a probe, the BN running stats are not
+# updated). Returns the bytes of each saved storage, the names of the Conv/Deconv blocks that save it (empty if
+# saved outside of the blocks) & the storages of the inputs of each block (these are kept if the block is
+# checkpointed). The parameters are not counted
+def saved_activations(model, forward_fn):
+    blocks = OrderedDict((n, m) for n, m in model.named_modules() if isinstance(m, CheckpointedBlock))
+    params = set(storage_ptr_bytes(p)[0] for p in model.parameters())
+    nbytes, savers, inputs, current = {}, {}, OrderedDict(), [None]
+    def pack(x):
+        ptr, size = storage_ptr_bytes(x)
+        if ptr != 0 and ptr not in params:
+            nbytes[ptr] = size
+            savers.setdefault(ptr, set())
+            if current[0] is not None:
+                savers[ptr].add(current[0])
+        return x
+    def pre_hook(name):
+        def hook(m, inps):
+            current[0], inputs[name] = name, set()
+            for x in inps:
+                if torch.is_tensor(x):
+                    ptr, size = storage_ptr_bytes(x)
+                    nbytes[ptr] = size
+                    inputs[name].add(ptr)
+        return hook
+    def post_hook(m, inps, out):
+        current[0] = None
+    handles = [h for n, m in blocks.items() for h in (m.register_forward_pre_hook(pre_hook(n)),
+                                                      m.register_forward_hook(post_hook))]
+    prev = [(m, m.checkpoint) for m in blocks.values()]
+    try:
+        for m in blocks.values():
+            m.checkpoint = False
+        with torch.enable_grad(), frozen_bn_stats(model), torch.autograd.graph.saved_tensors_hooks(pack, lambda x: x):
+            forward_fn(model)
+    finally:
+        for h in handles:
+            h.remove()
+        for m, ckpt in prev:
+            m.checkpoint = ckpt
+    return nbytes, savers, inputs
+
+# Bytes of the saved activations if the given blocks are checkpointed: a storage is kept if it is saved outside
+# of the blocks, by a block that is not checkpointed or if it is an input of a checkpointed block
+def activation_bytes(nbytes, savers, inputs, checkpointed):
+    kept = set(ptr for ptr, names in savers.items() if not names or (names - checkpointed))
+    for name in checkpointed:
+        kept |= inputs[name]
+    return sum(nbytes[ptr] for ptr in kept if ptr in nbytes)
+
+### Checkpoint the Conv/Deconv blocks of a model till its saved activations fit in "budget" bytes. The activations
+### are measured for one call of forward_fn(model) (e.g. a single sample) & scaled by "scale" (e.g. the batch size).
+### The blocks are picked greedily (most saved memory first). Returns the names of the checkpointed blocks & the
+### estimated activation bytes without/with checkpointing (the budget can't always be met)
+def set_checkpointing(model, budget, forward_fn, scale=1):
+    nbytes, savers, inputs = saved_activations(model, forward_fn)
+    total = lambda ckpt: scale * activation_bytes(nbytes, savers, inputs, ckpt)
+    checkpointed = set()
+    while total(checkpointed) > budget:
+        rest = [n for n in inputs if n not in checkpointed]
+        if not rest:
+            break
+        best = min(rest, key=lambda n: total(checkpointed | set([n])))
+        if total(checkpointed | set([best])) >= total(checkpointed):
+            break # No more savings
+        checkpointed.add(best)
+    for name, m in model.named_modules():
+        if isinstance(m, CheckpointedBlock):
+            m.checkpoint = name in checkpointed
+    return [n for n in inputs if n in checkpointed], total(set()), total(checkpointed)
+
 ###################
 ####### CoordConv from Uber: https://eng.uber.com/coordconv/
 class CoordConvBase(nn.Module):
     def __init__(self):
         super(CoordConvBase, self).__init__()
         self.conv = None
-        self.coord = None
-        self.batch_size = None
-        self.coord_batch = None
 
     def forward(self, inp):
         # Assumes input is B x C x H x W
+        # Coords from -1 to 1 come from the process-wide grid cache (shared by all CoordConv layers)
         bsz, _, ht, wd = inp.size()
-        if self.coord is None:
-            ## Create the coordinates
-            def trange(dim1, dim2):
-                r = torch.arange(0, dim1) / (dim1 - 1)
-                a = r.view(dim1,1).expand(dim1,dim2)
-                return a
-            # Setup coords from -1 to 1
-            xrng = trange(wd, ht).transpose(0,1)[None, None, :, :] # 0 to 1 along cols
-            yrng = trange(ht, wd)[None, None, :, :] # 0 to 1 along rows
-            self.coord = (torch.cat([xrng, yrng], dim=1).type_as(inp) * 2) - 1 # -1 to 1
-
-        # If the batch size changes we need to recompute some things. Then
-        # we can save the batch size info + precomputed info.
-        if self.batch_size is None or self.batch_size != bsz:
-            self.batch_size = bsz
-            self.coord_batch = self.coord.expand(bsz,2,ht,wd) # No gradients
+        coord = gridcache.coord_grid(ht, wd, inp.dtype, inp.device).expand(bsz, 2, ht, wd) # No gradients, no copy
 
         # Cat coords to input and apply the conv layer
-        x = torch.cat([inp, self.coord_batch], dim=1) # Concat along channels dimension
+        x = torch.cat([inp, coord], dim=1) # Concat along channels dimension
         return self.conv(x)
 
 class CoordConv(CoordConvBase):
@@ -325,6 +489,7 @@ class BasicLinear(nn.Module):
 ### output = Normalize( (sigmoid(input) + noise)^p + eps )
 ### where the noise is sampled from a 0-mean, sig-std dev distribution (sig is increased over time),
 ### the power "p" is also increased over time and the "Normalize" operation does a 1-norm normalization
+@se3nn.float32
 def sharpen_masks(input, add_noise=True, noise_std=0, pow=1):
     input = F.sigmoid(input)
     if (add_noise and noise_std > 0):
@@ -333,82 +498,56 @@ def sharpen_masks(input, add_noise=True, noise_std=0, pow=1):
     input = (torch.clamp(input, min=0, max=100000) ** pow) + 1e-12  # Clamp to non-negative values, raise to a power and add a constant
     return F.normalize(input, p=1, dim=1, eps=1e-12)  # Normalize across channels to sum to 1
 
+### Softmax normalization of the masks across the channels (in float32 under mixed precision)
+class Softmax2d(nn.Softmax2d):
+    forward = se3nn.float32(nn.Softmax2d.forward)
+
+### Low-resolution masks: predict the masks at 1/mask_scale (2 or 4) of the input resolution. The last log2(mask_scale)
+### deconvs of the mask decoder (the most expensive ones, at the highest resolutions) are dropped & a 3x3 conv head
+### predicts the "num_se3" channels from the output of the last deconv that is kept. The masks are normalized at
+### the low resolution & NTfm3D upsamples them (bilinear, the sum stays 1), on the fly while blending the transforms
+### in the CPU kernels & before the kernels for CUDA inputs
+def mask_decoder_skip(mask_scale):
+    assert (mask_scale in (1, 2, 4)), "Mask scale has to be 1, 2 or 4. Input: {}".format(mask_scale)
+    return {1: 0, 2: 1, 4: 2}[mask_scale]
+
+### Replace the last deconvs (deconv1 ... deconv"ndeconv") of a mask decoder with the low-res mask head (in-place)
+### chn[i] is the number of output channels of deconv"ndeconv-1-i"
+def add_lowres_mask_head(decoder, num_se3, chn, ndeconv, mask_scale, pre_conv=False, use_bn=True,
+                         nonlinearity='prelu'):
+    decoder.mask_skip = mask_decoder_skip(mask_scale)
+    if decoder.mask_skip == 0:
+        return
+    for k in range(ndeconv - decoder.mask_skip + 1, ndeconv + 1):
+        delattr(decoder, 'deconv{}'.format(k))
+    if pre_conv:
+        # Can fit an extra BN + Non-linearity (as the last deconv)
+        decoder.maskhead = PreConv2D(chn[decoder.mask_skip - 1], num_se3, kernel_size=3, stride=1, padding=1,
+                                     use_pool=False, use_bn=use_bn, nonlinearity=nonlinearity)
+    else:
+        decoder.maskhead = nn.Conv2d(chn[decoder.mask_skip - 1], num_se3, kernel_size=3, stride=1, padding=1)
+
+### Run the mask decoder: deconvs with skip-adds of the conv outputs in "skips" (coarse to fine) & the final deconv
+### to "num_se3" channels or, for low-res masks, the deconvs that are kept & the mask head
+def decode_masks(decoder, m, skips):
+    nskip = getattr(decoder, 'mask_skip', 0) # BWDs compatibility
+    for k in range(len(skips) - max(nskip - 1, 0)):
+        m = getattr(decoder, 'deconv{}'.format(k + 1))(m, skips[k])
+    if nskip > 0:
+        return decoder.maskhead(m)
+    return getattr(decoder, 'deconv{}'.format(len(skips) + 1))(m)
+
 #############################
 ### NEW SE3 LAYER (se3toSE3 with some additional transformation for the translation vector)
 
-# Create a skew-symmetric matrix "S" of size [(Bk) x 3 x 3] (passed in) given a [(Bk) x 3] vector
-def create_skew_symmetric_matrix(vector):
-    # Create the skew symmetric matrix:
-    # [0 -z y; z 0 -x; -y x 0]
-    N = vector.size(0)
-    output = vector.view(N,3,1).expand(N,3,3).clone()
-    output[:, 0, 0] = 0
-    output[:, 1, 1] = 0
-    output[:, 2, 2] = 0
-    output[:, 0, 1] = -vector[:, 2]
-    output[:, 1, 0] =  vector[:, 2]
-    output[:, 0, 2] =  vector[:, 1]
-    output[:, 2, 0] = -vector[:, 1]
-    output[:, 1, 2] = -vector[:, 0]
-    output[:, 2, 1] =  vector[:, 0]
-    return output
-
 # Compute the rotation matrix R & translation vector from the axis-angle parameters using Rodriguez's formula:
 # (R = I + (sin(theta)/theta) * K + ((1-cos(theta))/theta^2) * K^2)
 # (t = I + (1-cos(theta))/theta^2 * K + ((theta-sin(theta)/theta^3) * K^2
 # where K is the skew symmetric matrix based on the un-normalized axis & theta is the norm of the input parameters
-# From Wikipedia: https://en.wikipedia.org/wiki/Rodrigues%27_rotation_formula
 # Eqns: 77-84 (PAGE: 10) of http://ethaneade.com/lie.pdf
+# This is the 'se3aar' transform type of the SE3ToRt layer, both use the fused exp map in layers/SE3Exp.py
 def se3ToRt(input):
-    # Check dimensions
-    bsz, nse3, ndim = input.size()
-    N = bsz*nse3
-    eps = 1e-12
-    assert (ndim == 6)
-
-    # Trans | Rot params
-    input_v = input.view(N, ndim, 1)
-    rotparam   = input_v.narrow(1,3,3) # so(3)
-    transparam = input_v.narrow(1,0,3) # R^3
-
-    # Get the un-normalized axis and angle
-    axis = rotparam.clone().view(N, 3, 1)  # Un-normalized axis
-    angle2 = (axis * axis).sum(1).view(N, 1, 1)  # Norm of vector (squared angle)
-    angle  = torch.sqrt(angle2)  # Angle
-    small  = (angle2 < eps).detach() # Don't need gradient w.r.t this operation (also because of pytorch error: https://discuss.pytorch.org/t/get-error-message-maskedfill-cant-differentiate-the-mask/9129/4)
-
-    # Create Identity matrix
-    I = angle2.expand(N,3,3).clone()
-    I[:] = 0 # Fill will all zeros
-    I[:,0,0], I[:,1,1], I[:,2,2] = 1.0, 1.0, 1.0 # Diagonal elements = 1
-
-    # Compute skew-symmetric matrix "K" from the axis of rotation
-    K = create_skew_symmetric_matrix(axis)
-    K2 = torch.bmm(K, K)  # K * K
-
-    # Compute A = (sin(theta)/theta)
-    A = torch.sin(angle) / angle
-    A[small] = 1.0 # sin(0)/0 ~= 1
-
-    # Compute B = (1 - cos(theta)/theta^2)
-    B = (1 - torch.cos(angle)) / angle2
-    B[small] = 1/2 # lim 0-> 0 (1 - cos(0))/0^2 = 1/2
-
-    # Compute C = (theta - sin(theta))/theta^3
-    C = (1 - A) / angle2
-    C[small] = 1/6 # lim 0-> 0 (0 - sin(0))/0^3 = 1/6
-
-    # Compute the rotation matrix: R = I + (sin(theta)/theta)*K + ((1-cos(theta))/theta^2) * K^2
-    R = I + K * A.expand(N, 3, 3) + K2 * B.expand(N, 3, 3)
-
-    # Compute the translation tfm matrix: V = I + ((1-cos(theta))/theta^2) * K + ((theta-sin(theta))/theta^3)*K^2
-    V = I + K * B.expand(N, 3, 3) + K2 * C.expand(N, 3, 3)
-
-    # Compute translation vector
-    t = torch.bmm(V, transparam) # V*u
-
-    # Final tfm
-    return torch.cat([R, t], 2).view(bsz,nse3,3,4).clone() # B x K x 3 x 4
+    return se3nn.SE3Exp(full=True)(input) # B x K x 3 x 4
 
 
 ################################################################################
@@ -484,7 +623,6 @@ class PoseEncoder(nn.Module):
         # Create pose decoder (convert to r/t)
         self.se3_type = se3_type
         self.posedecoder = nn.Sequential()
-        #if se3_type != 'se3aar':
         self.posedecoder.add_module('se3rt', se3nn.SE3ToRt(se3_type, use_pivot)) # Convert to Rt
         if use_pivot:
             self.posedecoder.add_module('pivotrt', se3nn.CollapseRtPivots()) # Collapse pivots
@@ -525,7 +663,7 @@ class PoseEncoder(nn.Module):
 class MaskEncoder(nn.Module):
     def __init__(self, num_se3, pre_conv=False, input_channels=3, use_bn=True, nonlinearity='prelu',
                  use_wt_sharpening=False, sharpen_start_iter=0, sharpen_rate=1,
-                 wide=False, full_res=False, noise_stop_iter=1e6):
+                 wide=False, full_res=False, noise_stop_iter=1e6, mask_scale=1):
         super(MaskEncoder, self).__init__()
 
         ###### Choose type of convolution
@@ -596,6 +734,10 @@ class MaskEncoder(nn.Module):
             else:
                 self.deconv5 = nn.ConvTranspose2d(chn[0], num_se3, kernel_size=8, stride=2, padding=3)  # 8x8, 120x160 -> 240x320
 
+        # Predict the masks at a lower resolution (if mask_scale > 1)
+        add_lowres_mask_head(self, num_se3, chn, 6 if full_res else 5, mask_scale, pre_conv=pre_conv,
+                             use_bn=use_bn, nonlinearity=nonlinearity)
+
         # Normalize to generate mask (wt-sharpening vs soft-mask model)
         self.use_wt_sharpening = use_wt_sharpening
         if use_wt_sharpening:
@@ -604,7 +746,7 @@ class MaskEncoder(nn.Module):
             self.maskdecoder = sharpen_masks  # Use the weight-sharpener
             self.noise_stop_iter = noise_stop_iter # Stop adding noise after this many iters
         else:
-            self.maskdecoder = nn.Softmax2d()  # SoftMax normalization
+            self.maskdecoder = Softmax2d()  # SoftMax normalization
 
     def compute_wt_sharpening_stats(self, train_iter=0):
         citer = 1 + (train_iter - self.sharpen_start_iter)
@@ -633,20 +775,11 @@ class MaskEncoder(nn.Module):
 
             # Run mask-decoder to predict a smooth mask
             m = self.conv1x1(c6)
-            m = self.deconv1(m, c5)
-            m = self.deconv2(m, c4)
-            m = self.deconv3(m, c3)
-            m = self.deconv4(m, c2)
-            m = self.deconv5(m, c1)
-            m = self.deconv6(m)
+            m = decode_masks(self, m, [c5, c4, c3, c2, c1])
         else:
             # Run mask-decoder to predict a smooth mask
             m = self.conv1x1(c5)
-            m = self.deconv1(m, c4)
-            m = self.deconv2(m, c3)
-            m = self.deconv3(m, c2)
-            m = self.deconv4(m, c1)
-            m = self.deconv5(m)
+            m = decode_masks(self, m, [c4, c3, c2, c1])
 
         # Predict a mask (either wt-sharpening or sigmoid-mask or soft-mask approach)
         # Normalize to sum across 1 along the channels (only for weight sharpening or soft-mask)
@@ -668,7 +801,7 @@ class PoseMaskEncoder(nn.Module):
                  input_channels=3, use_bn=True, nonlinearity='prelu', init_se3_iden=False,
                  use_wt_sharpening=False, sharpen_start_iter=0, sharpen_rate=1,
                 wide=False, use_jt_angles=False, num_state=7,
-                 full_res=False, noise_stop_iter=1e6):
+                 full_res=False, noise_stop_iter=1e6, mask_scale=1):
         super(PoseMaskEncoder, self).__init__()
 
         ###### Choose type of convolution
@@ -742,6 +875,10 @@ class PoseMaskEncoder(nn.Module):
                 self.deconv5 = nn.ConvTranspose2d(chn[0], num_se3, kernel_size=8, stride=2,
                                                   padding=3)  # 8x8, 120x160 -> 240x320
 
+        # Predict the masks at a lower resolution (if mask_scale > 1)
+        add_lowres_mask_head(self, num_se3, chn, 6 if full_res else 5, mask_scale, pre_conv=pre_conv,
+                             use_bn=use_bn, nonlinearity=nonlinearity)
+
         # Normalize to generate mask (wt-sharpening vs sigmoid-mask vs soft-mask model)
         self.use_wt_sharpening = use_wt_sharpening
         if use_wt_sharpening:
@@ -750,7 +887,7 @@ class PoseMaskEncoder(nn.Module):
             self.maskdecoder = sharpen_masks # Use the weight-sharpener
             self.noise_stop_iter = noise_stop_iter
         else:
-            self.maskdecoder = nn.Softmax2d() # SoftMax normalization
+            self.maskdecoder = Softmax2d() # SoftMax normalization
 
         ###### Encode jt angles
         self.use_jt_angles = use_jt_angles
@@ -784,7 +921,6 @@ class PoseMaskEncoder(nn.Module):
         # Create pose decoder (convert to r/t)
         self.se3_type = se3_type
         self.posedecoder = nn.Sequential()
-        #if se3_type != 'se3aar':
         self.posedecoder.add_module('se3rt', se3nn.SE3ToRt(se3_type, use_pivot)) # Convert to Rt
         if use_pivot:
             self.posedecoder.add_module('pivotrt', se3nn.CollapseRtPivots()) # Collapse pivots
@@ -799,7 +935,8 @@ class PoseMaskEncoder(nn.Module):
             pow = min(1 + (citer/500.0) * self.sharpen_rate, 100) # Should be 26 by ~12500 iters from start (if rate=1)
         return noise_std, pow
 
-    def forward(self, z, predict_masks=True, train_iter=0):
+    # If "mask_ids" is given, masks are only decoded for those elements of the batch (the poses are computed for all)
+    def forward(self, z, predict_masks=True, train_iter=0, mask_ids=None):
         if self.use_jt_angles or type(z) == list:
             x,j = z # Pts, Jt angles
         else:
@@ -828,31 +965,26 @@ class PoseMaskEncoder(nn.Module):
         p = self.se3decoder(p)
         p = p.view(-1, self.num_se3, self.se3_dim)
         self.se3output = p.clone() # SE3 prediction
-        #if self.se3_type == 'se3aar':
-        #    p = se3ToRt(p) # Use new se3ToRt layer!
         p = self.posedecoder(p)
 
         # Run mask-decoder to predict a smooth mask
         # NOTE: Conditional based on input flag
         if predict_masks:
+            # Only decode the masks that are needed
+            if mask_ids is not None:
+                c1, c2, c3, c4, c5 = [c.index_select(0, mask_ids) for c in [c1, c2, c3, c4, c5]]
+                if self.full_res:
+                    c6 = c6.index_select(0, mask_ids)
+
             ### Full-res vs Not
             if self.full_res:
                 # Run mask-decoder to predict a smooth mask
                 m = self.conv1x1(c6)
-                m = self.deconv1(m, c5)
-                m = self.deconv2(m, c4)
-                m = self.deconv3(m, c3)
-                m = self.deconv4(m, c2)
-                m = self.deconv5(m, c1)
-                m = self.deconv6(m)
+                m = decode_masks(self, m, [c5, c4, c3, c2, c1])
             else:
                 # Run mask-decoder to predict a smooth mask
                 m = self.conv1x1(c5)
-                m = self.deconv1(m, c4)
-                m = self.deconv2(m, c3)
-                m = self.deconv3(m, c2)
-                m = self.deconv4(m, c1)
-                m = self.deconv5(m)
+                m = decode_masks(self, m, [c4, c3, c2, c1])
 
             # Predict a mask (either wt-sharpening or sigmoid-mask or soft-mask approach)
             # Normalize to sum across 1 along the channels (only for weight sharpening or soft-mask)
@@ -970,6 +1102,32 @@ class TransitionModel(nn.Module):
         # Return
         return [y, z] # Return both the deltas (in global frame) and the composed next pose
 
+    # First layer of the delta-SE3 decoder applied to the concatenation of the pose, jt angle (can be None) & ctrl
+    # encodings, without concatenating them: the layer is split into its pose/jt-angle/ctrl parts & the
+    # results are summed (the encodings broadcast against each other)
+    def decode_encodings(self, pe, je, ce):
+        weight, bias = self.deltase3decoder[0].weight, self.deltase3decoder[0].bias
+        h = F.linear(pe, weight.narrow(1, 0, pe.size(-1)))
+        if je is not None:
+            h = h + F.linear(je, weight.narrow(1, pe.size(-1), je.size(-1)))
+        return h + F.linear(ce, weight.narrow(1, weight.size(1) - ce.size(-1), ce.size(-1)), bias)
+
+    # Planning: evaluate N controls from each pose without copying the pose N times
+    # p: B x nSE3 x 3 x 4, c: B x N x num_ctrl, j: B x num_state (if using jt angles, shared by the N controls)
+    # The first layer of the delta-SE3 decoder is split into its pose/jt-angle/ctrl parts, so that the pose &
+    # jt angle terms are computed once per pose & broadcast over the controls (see decode_encodings)
+    # Returns the deltas & the composed next poses (B x N x nSE3 x 3 x 4)
+    def forward_candidates(self, p, c, j=None):
+        assert (not self.inp_pivot), "Planning is not supported with externally provided pivots"
+        bsz, ncand = c.size(0), c.size(1)
+        pe = self.poseencoder(p.view(-1, self.num_se3*12)).unsqueeze(1)                  # Encode pose (once)
+        je = self.jtangleencoder(j).unsqueeze(1) if self.use_jt_angles else None         # Encode jt angles (once)
+        ce = self.ctrlencoder(c.reshape(bsz*ncand, -1)).view(bsz, ncand, -1)             # Encode ctrls
+        x = self.deltase3decoder[1:](self.decode_encodings(pe, je, ce).view(bsz*ncand, -1)) # Predict delta-SE3
+        x = self.deltaposedecoder(x.view(-1, self.num_se3, self.se3_dim)).view(bsz, ncand, self.num_se3, 3, 4)
+        z = se3nn.compose_rt_pair(x, p.unsqueeze(1)) # Broadcasts the pose over the controls
+        return [x, z]
+
 
 ####################################
 ### Multi-step version of the SE3-Pose-Model
@@ -983,7 +1141,7 @@ class MultiStepSE3PoseModel(nn.Module):
                  local_delta_se3=False, wide=False,
                  use_jt_angles=False, use_jt_angles_trans=False, num_state=7,
                  full_res=False, noise_stop_iter=1e6, trans_type='default',
-                 posemask_type='default'):
+                 posemask_type='default', mask_scale=1):
         super(MultiStepSE3PoseModel, self).__init__()
 
         # Initialize the pose & mask model
@@ -1001,7 +1159,7 @@ class MultiStepSE3PoseModel(nn.Module):
                                          nonlinearity=nonlinearity, use_wt_sharpening=use_wt_sharpening,
                                          sharpen_start_iter=sharpen_start_iter, sharpen_rate=sharpen_rate,
                                          wide=wide,
-                                         full_res=full_res, noise_stop_iter=noise_stop_iter)
+                                         full_res=full_res, noise_stop_iter=noise_stop_iter, mask_scale=mask_scale)
         else:
             self.posemaskmodel = PoseMaskEncoder(num_se3=num_se3, se3_type=se3_type, use_pivot=use_pivot,
                                             input_channels=input_channels,
@@ -1010,7 +1168,8 @@ class MultiStepSE3PoseModel(nn.Module):
                                             sharpen_start_iter=sharpen_start_iter, sharpen_rate=sharpen_rate,
                                             wide=wide,
                                             use_jt_angles=use_jt_angles, num_state=num_state,
-                                            full_res=full_res, noise_stop_iter=noise_stop_iter)
+                                            full_res=full_res, noise_stop_iter=noise_stop_iter,
+                                            mask_scale=mask_scale)
 
         # Initialize the transition model
         self.transitionmodel = TransitionModel(num_ctrl=num_ctrl, num_se3=num_se3, delta_pivot=delta_pivot,
@@ -1043,6 +1202,23 @@ class MultiStepSE3PoseModel(nn.Module):
         else:
             return self.posemaskmodel(inp, train_iter=train_iter, predict_masks=True) # Predict both
 
+    # Predict the poses for all the frames of a sequence with a single (batched) encoder pass & the masks only
+    # for the frames in "mask_steps". Inputs are B x S x ..., frames are folded into the batch dimension.
+    # Returns the poses (B x S x nSE3 x 3 x 4) & the masks (B x len(mask_steps) x nSE3 x H x W, at 1/mask_scale of H x W)
+    # NOTE: In training mode, the batch-norm statistics are computed over all B*S frames
+    def forward_poses_masks(self, x, mask_steps=(0,), train_iter=0):
+        ptcloud, jtangles = x
+        bsz, nsteps = ptcloud.size(0), ptcloud.size(1)
+        ptcloud = ptcloud.reshape(bsz * nsteps, *ptcloud.size()[2:])
+        inp = [ptcloud, jtangles.reshape(bsz * nsteps, -1)] if self.use_jt_angles else ptcloud
+        mask_ids = torch.LongTensor([b * nsteps + s for b in range(bsz) for s in mask_steps]).to(ptcloud.device)
+        if self.decomp_model:
+            poses = self.posemodel(inp)
+            masks = self.maskmodel(ptcloud.index_select(0, mask_ids), train_iter=train_iter)
+        else:
+            poses, masks = self.posemaskmodel(inp, train_iter=train_iter, predict_masks=True, mask_ids=mask_ids)
+        return poses.view(bsz, nsteps, *poses.size()[1:]), masks.view(bsz, len(mask_steps), *masks.size()[1:])
+
     # Predict next pose based on current pose and control
     def forward_next_pose(self, pose, ctrl, jtangles=None, pivots=None):
         inp = [pose, jtangles, ctrl] if self.use_jt_angles_trans else [pose, ctrl]
@@ -1050,6 +1226,24 @@ class MultiStepSE3PoseModel(nn.Module):
             inp.append(pivots)
         return self.transitionmodel(inp)
 
+    # Planning: evaluate N candidate control sequences over H steps from each pose in a single batched call
+    # pose: B x nSE3 x 3 x 4 (encoded once), ctrls: B x N x H x num_ctrl, jtangles: B x num_state (if the transition
+    # model uses jt angles, these are the jt angles @ t=0 & are used for all the steps)
+    # The first step broadcasts the pose over the candidates, the rest are batched over all B*N candidates
+    # Returns the deltas & the poses (B x N x H x nSE3 x 3 x 4), gradients flow back to the controls
+    def forward_plan(self, pose, ctrls, jtangles=None):
+        bsz, ncand, horizon = ctrls.size(0), ctrls.size(1), ctrls.size(2)
+        deltapose, nextpose = self.transitionmodel.forward_candidates(pose, ctrls[:, :, 0], jtangles)
+        deltas, poses = [deltapose], [nextpose]
+        if self.use_jt_angles_trans and horizon > 1:
+            jtangles = jtangles.unsqueeze(1).expand(bsz, ncand, jtangles.size(-1)).reshape(bsz*ncand, -1)
+        for h in range(1, horizon):
+            deltapose, nextpose = self.forward_next_pose(poses[-1].view(bsz*ncand, *pose.size()[1:]),
+                                                         ctrls[:, :, h].reshape(bsz*ncand, -1), jtangles)
+            deltas.append(deltapose.view(bsz, ncand, *pose.size()[1:]))
+            poses.append(nextpose.view(bsz, ncand, *pose.size()[1:]))
+        return torch.stack(deltas, 2), torch.stack(poses, 2)
+
     # Forward pass through the model
     def forward(self, x):
         print('Forward pass for Multi-Step SE3-Pose-Model is not yet implemented')
@@ -4,13 +4,16 @@ import numpy as np
 import cv2
 import os
 import math
+import time
 from torch.utils.data import Dataset
 import se3layers as se3nn
 from torch.autograd import Variable
 import util.util3d as u3d  # In case tf is not installed
 
 # NOTE: This is slightly ugly, use this only for the NTfm3D implementation (for use in dataloader)
-from layers._ext import se3layers
+from layers.backend import se3layers
+from layers import rtops # Fused kernels for the R/t helpers
+import gridcache # Shared camera grids (same module as the layers use, se3layers adds layers/ to the path)
 
 ############
 ### Helper functions for reading baxter data
@@ -269,55 +272,42 @@ def read_color_image(filename, ht=240, wd=320, colormap='rgb'):
 #############
 ### Helper functions for perspective projection stuff
 ### Computes the pixel x&y grid based on the camera intrinsics assuming perspective projection
+### The grid is shared (process-wide cache, see layers/gridcache.py), so don't modify it in-place
 def compute_camera_xygrid_from_intrinsics(height, width, intrinsics):
-    assert (height > 1 and width > 1)
-    assert (intrinsics['fx'] > 0  and intrinsics['fy'] > 0     and
-            intrinsics['cx'] >= 0 and intrinsics['cx'] < width and
-            intrinsics['cy'] >= 0 and intrinsics['cy'] < height)
-    xygrid = torch.ones(1, 2, height, width) # (x,y,1)
-    for j in xrange(0, width):  # +x is increasing columns
-        xygrid[0, 0, :, j].fill_((j - intrinsics['cx']) / intrinsics['fx'])
-    for i in xrange(0, height):  # +y is increasing rows
-        xygrid[0, 1, i, :].fill_((i - intrinsics['cy']) / intrinsics['fy'])
-    return xygrid
+    return gridcache.camera_xygrid(height, width, intrinsics) # (x,y)
+
+###
+### Get a temp tensor of the given size & type from a dict of buffers. The storage is re-used across calls
+### (and grown if needed), so the returned tensor is only valid till the next call with the same key
+def get_buffer(buffers, key, size, ttype=torch.FloatTensor):
+    if key not in buffers:
+        buffers[key] = ttype()
+    numel = int(np.prod(size))
+    if buffers[key].nelement() < numel:
+        buffers[key].resize_(numel)
+    return buffers[key].narrow(0, 0, numel).view(*size)
 
 #############
 ### Helper functions - R/t functions for operating on tensors, not vars
 
 ###
-### Invert a 3x4 transform (R/t)
-def RtInverse(input):
+### Invert a 3x4 transform (R/t): [R^T -R^T * t]
+### Uses the fused rtops kernels, the result is written to "output" if it is given (can be the input)
+def RtInverse(input, output=None):
     # Check dimensions
     _, _, nrows, ncols = input.size()
     assert (nrows == 3 and ncols == 4)
-
-    # Init for FWD pass
-    input_v = input.view(-1, 3, 4)
-    r, t = input_v.narrow(2, 0, 3), input_v.narrow(2, 3, 1)
-
-    # Compute output: [R^T -R^T * t]
-    r_o = r.transpose(1, 2)
-    t_o = torch.bmm(r_o, t).mul_(-1)
-    return torch.cat([r_o, t_o], 2).view_as(input).contiguous()
+    return rtops.inverse(input, out=output)
 
 ###
 ### Compose two tranforms: [R1 t1] * [R2 t2]
-def ComposeRtPair(A, B):
+### Uses the fused rtops kernels, the result is written to "output" if it is given (can be A or B)
+def ComposeRtPair(A, B, output=None):
     # Check dimensions
     _, _, num_rows, num_cols = A.size()
     assert (num_rows == 3 and num_cols == 4)
     assert (A.is_same_size(B))
-
-    # Init for FWD pass
-    Av = A.view(-1, 3, 4)
-    Bv = B.view(-1, 3, 4)
-    rA, rB = Av.narrow(2, 0, 3), Bv.narrow(2, 0, 3)
-    tA, tB = Av.narrow(2, 3, 1), Bv.narrow(2, 3, 1)
-
-    # Compute output
-    r = torch.bmm(rA, rB)
-    t = torch.baddbmm(tA, rA, tB)
-    return torch.cat([r, t], 2).view_as(A).contiguous()
+    return rtops.compose(A, B, out=output)
 
 ###
 ### Non-Rigid Transform of 3D points given masks & corrseponding [R t] transforms
@@ -346,22 +336,32 @@ def NTfm3D(points, masks, transforms, output=None):
 
 ### Compute fwd/bwd visibility (for points in time t, which are visible in time t+1 & vice-versa)
 # Expects 4D inputs: seq x ndim x ht x wd (or seq x ndim x 3 x 4)
+# If "buffers" (a dict) is passed in, the BWD outputs & temp memory are taken from it (and re-used across calls)
+# unless "keep_bwd" is set, in which case the BWD outputs are freshly allocated like the FWD ones
+# "daearlyexit" stops the DA search (not used for use_only_da) at the nearest window row that has a match. This can
+# pick a different match than the full window search (the default, same as a row-major scan of the window)
 def ComputeFlowAndVisibility(cloud_1, cloud_2, label_1, label_2,
                              poses_1, poses_2, intrinsics,
                              dathreshold=0.01, dawinsize=5,
-                             use_only_da=False):
+                             use_only_da=False, buffers=None, keep_bwd=True,
+                             daearlyexit=False):
     # Create memory
     seq, dim, ht, wd = cloud_1.size()
     fwdflows      = torch.FloatTensor(seq, 3, ht, wd).type_as(cloud_1)
-    bwdflows      = torch.FloatTensor(seq, 3, ht, wd).type_as(cloud_2)
     fwdvisibility = torch.ByteTensor(seq, 1, ht, wd).cuda() if cloud_1.is_cuda else torch.ByteTensor(seq, 1, ht, wd)
-    bwdvisibility = torch.ByteTensor(seq, 1, ht, wd).cuda() if cloud_2.is_cuda else torch.ByteTensor(seq, 1, ht, wd)
     fwdassocpixelids = torch.IntTensor(seq, 1, ht, wd).cuda() if cloud_1.is_cuda else torch.IntTensor(seq, 1, ht, wd)
-    bwdassocpixelids = torch.IntTensor(seq, 1, ht, wd).cuda() if cloud_2.is_cuda else torch.IntTensor(seq, 1, ht, wd)
+    if (buffers is not None) and (not keep_bwd):
+        bwdflows      = get_buffer(buffers, 'bwdflows', (seq, 3, ht, wd), torch.FloatTensor)
+        bwdvisibility = get_buffer(buffers, 'bwdvisibility', (seq, 1, ht, wd), torch.ByteTensor)
+        bwdassocpixelids = get_buffer(buffers, 'bwdassocpixelids', (seq, 1, ht, wd), torch.IntTensor)
+    else:
+        bwdflows      = torch.FloatTensor(seq, 3, ht, wd).type_as(cloud_2)
+        bwdvisibility = torch.ByteTensor(seq, 1, ht, wd).cuda() if cloud_2.is_cuda else torch.ByteTensor(seq, 1, ht, wd)
+        bwdassocpixelids = torch.IntTensor(seq, 1, ht, wd).cuda() if cloud_2.is_cuda else torch.IntTensor(seq, 1, ht, wd)
 
     # Compute inverse of poses
-    poseinvs_1 = RtInverse(poses_1.clone())
-    poseinvs_2 = RtInverse(poses_2.clone())
+    poseinvs_1 = RtInverse(poses_1)
+    poseinvs_2 = RtInverse(poses_2)
 
     # Call cpp/CUDA functions
     if cloud_1.is_cuda:
@@ -372,8 +372,12 @@ def ComputeFlowAndVisibility(cloud_1, cloud_2, label_1, label_2,
             # This computes flows based only on points @ t1 that are visible and can be associated to a point @ t2
             # So it assumes that we are only given data-associations as opposed to full tracking information
             # This flow will be noisy for real data. For sim data, it should give the same result as the other function
-            local_1 = torch.FloatTensor(seq, 3, ht, wd).type_as(cloud_1)
-            local_2 = torch.FloatTensor(seq, 3, ht, wd).type_as(cloud_2)
+            if buffers is not None:
+                local_1 = get_buffer(buffers, 'local_1', (seq, 3, ht, wd), torch.FloatTensor)
+                local_2 = get_buffer(buffers, 'local_2', (seq, 3, ht, wd), torch.FloatTensor)
+            else:
+                local_1 = torch.FloatTensor(seq, 3, ht, wd).type_as(cloud_1)
+                local_2 = torch.FloatTensor(seq, 3, ht, wd).type_as(cloud_2)
             se3layers.ComputeFlowAndVisibility_Pts_float(cloud_1,
                                                          cloud_2,
                                                          local_1,
@@ -419,7 +423,8 @@ def ComputeFlowAndVisibility(cloud_1, cloud_2, label_1, label_2,
                                                      intrinsics['cx'],
                                                      intrinsics['cy'],
                                                      dathreshold,
-                                                     dawinsize)
+                                                     dawinsize,
+                                                     int(daearlyexit))
 
     # Return
     return fwdflows, bwdflows, fwdvisibility, bwdvisibility, fwdassocpixelids, bwdassocpixelids
@@ -453,10 +458,59 @@ def ComputeNormals(cloud_1, cloud_2, label_1, delta_12,
     # Return
     return normal_1, normal_2, valid_normal_1, valid_normal_2
 
-
-### Compute fwd/bwd visibility (for points in time t, which are visible in time t+1 & vice-versa)
+### Compute normals for both clouds (along with their transformed versions) in a single pass
+# Normals are computed from box-filtered ("width" x "width") neighbourhoods using integral images, so this is
+# both faster & smoother than ComputeNormals. Returns the FWD (normals of cloud_1, rotated by delta_12) and
+# BWD (normals of cloud_2, rotated by delta_21) normals and their valid masks
+# Normals are dropped if a box mean is more than "maxdepthdiff" from the depth of the center pixel or its box mean.
+# The boxes ignore the labels, so points of another object at a similar depth (e.g. near a silhouette where the depths
+# meet) can still skew the normals of the pixels close to it
+# If "compute_bwd" is False, only the FWD normals are computed (cloud_2, label_2 & delta_21 are not used, can be None)
+# and the BWD outputs are None
 # Expects 4D inputs: seq x ndim x ht x wd (or seq x ndim x 3 x 4)
-def BilateralDepthSmoothing(depth, width=9, depthstd=0.001):
+def ComputeNormalsFast(cloud_1, cloud_2, label_1, label_2, delta_12, delta_21,
+                       maxdepthdiff=0.05, width=5, compute_bwd=True):
+    # Create memory
+    seq, dim, ht, wd = cloud_1.size()
+    normal_1, tnormal_1 = torch.FloatTensor(seq, 3, ht, wd), torch.FloatTensor(seq, 3, ht, wd)
+    if compute_bwd:
+        normal_2, tnormal_2 = torch.FloatTensor(seq, 3, ht, wd), torch.FloatTensor(seq, 3, ht, wd)
+    else:
+        normal_2, tnormal_2 = torch.FloatTensor(), torch.FloatTensor()
+        cloud_2, label_2, delta_21 = torch.FloatTensor(), torch.ByteTensor(), torch.FloatTensor()
+
+    # Call cpp/CUDA functions
+    assert not cloud_1.is_cuda, "Only Float version implemented!"
+    assert (cloud_1.type() == 'torch.FloatTensor')
+    assert (width > 1) # Need atleast a 3x3 neighbourhood
+    se3layers.ComputeNormalsFast_float(cloud_1,
+                                       cloud_2,
+                                       label_1,
+                                       label_2,
+                                       delta_12,
+                                       delta_21,
+                                       normal_1,
+                                       tnormal_1,
+                                       normal_2,
+                                       tnormal_2,
+                                       maxdepthdiff,
+                                       width//2,
+                                       compute_bwd)
+    valid_normal_1 = normal_1.abs().sum(1).gt(0).unsqueeze(1)
+    if not compute_bwd:
+        return normal_1, tnormal_1, valid_normal_1, None, None, None
+    valid_normal_2 = normal_2.abs().sum(1).gt(0).unsqueeze(1)
+
+    # Return
+    return normal_1, tnormal_1, valid_normal_1, normal_2, tnormal_2, valid_normal_2
+
+
+### Bilateral smoothing of depth images (position kernel is a "width" x "width" gaussian, depth kernel has std "depthstd")
+# Expects 4D inputs: seq x 1 x ht x wd
+# If "approx" is set, this uses a separable approximation of the filter (a horizontal & a vertical 1D pass) that
+# only uses every "approx_step"-th pixel in the window. Larger steps are faster but less accurate
+# (see bilateral_smoothing_error)
+def BilateralDepthSmoothing(depth, width=9, depthstd=0.001, approx=False, approx_step=1):
     # Create memory
     seq, dim, ht, wd = depth.size()
     assert(dim == 1) # Depth only
@@ -465,26 +519,48 @@ def BilateralDepthSmoothing(depth, width=9, depthstd=0.001):
     # Create half of the smoothing kernel (in position space)
     # This is symmetric about zero (so we only go from 0->width/2)
     # It is also same for x & y so it's a symmetric 2D Gaussian with independent x and y
-    lockernel = torch.zeros(width//2+1) # TODO: Is this correct for even sized kernels?
-    lockernelstd = lockernel.nelement()/2. # Std deviation in pixel space (~1/2 of half the kernel size, for a 9x9 kernel it is 2.5 pixels)
-    for k in range(lockernel.nelement()):
-        lockernel[k] = math.exp(-(k*k) / (2.0*lockernelstd*lockernelstd))
+    # TODO: Is this correct for even sized kernels?
+    lockernelstd = (width//2+1)/2. # Std deviation in pixel space (~1/2 of half the kernel size, for a 9x9 kernel it is 2.5 pixels)
+    lockernel = torch.arange(0, width//2+1).float().pow_(2).div_(-2.0*lockernelstd*lockernelstd).exp_()
 
     # Call cpp/CUDA functions
     if depth.is_cuda:
         assert NotImplementedError, "Only Float version implemented!"
     else:
         assert (depth.type() == 'torch.FloatTensor')
-        # This computes normals for the initial cloud and transforms
-        # these based on the R/t to get transformed normal clouds
-        se3layers.BilateralDepthSmoothing_float(depth,
-                                                depth_s,
-                                                lockernel,
-                                                depthstd)
+        if approx:
+            se3layers.BilateralDepthSmoothingFast_float(depth,
+                                                        depth_s,
+                                                        lockernel,
+                                                        depthstd,
+                                                        approx_step)
+        else:
+            se3layers.BilateralDepthSmoothing_float(depth,
+                                                    depth_s,
+                                                    lockernel,
+                                                    depthstd)
 
     # Return
     return depth_s
 
+### Error (in m) & speedup of the approximate bilateral smoothing w.r.t the exact filter for a batch of depth images
+### Errors are computed only for pixels with non-zero input depth
+def bilateral_smoothing_error(depth, width=9, depthstd=0.001, approx_step=1):
+    st = time.time()
+    depth_e = BilateralDepthSmoothing(depth, width, depthstd)
+    exact_time = time.time() - st
+    st = time.time()
+    depth_a = BilateralDepthSmoothing(depth, width, depthstd, approx=True, approx_step=approx_step)
+    approx_time = time.time() - st
+
+    # Compute errors
+    valid = depth.ne(0)
+    err = (depth_a - depth_e).abs()[valid]
+    return {'mean': float(err.mean()) if err.nelement() > 0 else 0.,
+            'max': float(err.max()) if err.nelement() > 0 else 0.,
+            'exact_time': exact_time, 'approx_time': approx_time,
+            'speedup': exact_time / max(approx_time, 1e-9)}
+
 ############
 ###  SETUP DATASETS: RECURRENT VERSIONS FOR BAXTER DATA - FROM NATHAN'S BAG FILE
 
@@ -735,17 +811,26 @@ def add_gaussian_noise(depths, configs, std_d=0.02,
     noise_c = torch.randn(configs.size()).mul_(std_j).clamp_(max=2*std_j, min=-2*std_j)
     configs.add_(noise_c)
 
+# Noise is generated using a counter-based RNG, so it is fully determined by the seed (use noise_seed to get
+# a seed for a sample). If no seed is given, one is sampled from the torch RNG
 def add_edge_based_noise(depths, zthresh=0.04, edgeprob=0.35,
-                         defprob=0.005, noisestd=0.005):
+                         defprob=0.005, noisestd=0.005, seed=None):
+    if seed is None:
+        seed = int(torch.LongTensor(1).random_(0, 2**62)[0])
     depths_n = depths.clone()
     se3layers.AddNoise_float(depths,    # input depth (unchanged)
                              depths_n,  # noisy depth
                              zthresh,   # zthresh
                              edgeprob,  # edgeprob
                              defprob,   # def prob
-                             noisestd)  # noise std
+                             noisestd,  # noise std
+                             seed)      # seed for the RNG
     return depths_n
 
+### Seed for the noise of a sample, based on the (epoch, dataset id, sample id)
+def noise_seed(epoch, datasetid, sampleid):
+    return ((int(epoch) * 1000003 + int(datasetid)) * 1000000007 + int(sampleid)) % (2**62)
+
 ### Load baxter sequence from disk
 def read_baxter_sequence_from_disk(dataset, id, img_ht=240, img_wd=320, img_scale=1e-4,
                                    ctrl_type='actdiffvel', num_ctrl=7,
@@ -757,7 +842,10 @@ def read_baxter_sequence_from_disk(dataset, id, img_ht=240, img_wd=320, img_scal
                                    dathreshold=0.01, dawinsize=5, use_only_da=False,
                                    noise_func=None, compute_normals=False, maxdepthdiff=0.05,
                                    bismooth_depths=False, bismooth_width=9, bismooth_std=0.001,
-                                   compute_bwdnormals=False, supervised_seg_loss=False):
+                                   compute_bwdnormals=False, supervised_seg_loss=False,
+                                   defer_flows=False, daearlyexit=False,
+                                   fast_normals=False, fast_normals_width=5,
+                                   bismooth_approx=False, bismooth_step=1):
     # Setup vars
     num_meshes = mesh_ids.nelement()  # Num meshes
     seq_len, step_len = dataset['seq'], dataset['step'] # Get sequence & step length
@@ -859,7 +947,7 @@ def read_baxter_sequence_from_disk(dataset, id, img_ht=240, img_wd=320, img_scal
     # Add noise to the depths before we compute the point cloud
     if (noise_func is not None) and dataset['addnoise']:
         assert(ctrl_type == 'actdiffvel') # Since we add noise only to the configs
-        depths_n = noise_func(depths)
+        depths_n = noise_func(depths, seed=dataset.get('noiseseed'))
         depths.copy_(depths_n) # Replace by noisy depths
         #noise_func(depths, actctrlconfigs)
 
@@ -893,19 +981,22 @@ def read_baxter_sequence_from_disk(dataset, id, img_ht=240, img_wd=320, img_scal
     tarposes  = allposes[1:]  # t+1, t+2, t+3, ....
     initpose  = allposes[0:1].expand_as(tarposes)
 
-    # Compute flow and visibility
-    fwdflows, bwdflows, \
-    fwdvisibilities, bwdvisibilities, \
-    fwdassocpixelids, bwdassocpixelids = ComputeFlowAndVisibility(initpt, tarpts, initlabel, tarlabels,
-                                                                  initpose, tarposes, camera_intrinsics,
-                                                                  dathreshold, dawinsize, use_only_da)
+    # Compute flow and visibility (unless it is deferred to the collater, see BatchFlowAndVisibility)
+    if not defer_flows:
+        fwdflows, bwdflows, \
+        fwdvisibilities, bwdvisibilities, \
+        fwdassocpixelids, bwdassocpixelids = ComputeFlowAndVisibility(initpt, tarpts, initlabel, tarlabels,
+                                                                      initpose, tarposes, camera_intrinsics,
+                                                                      dathreshold, dawinsize, use_only_da,
+                                                                      daearlyexit=daearlyexit)
 
     # Compute normal maps & target normal maps (rot/trans of init ones)
     if compute_normals:
         # If asked to do bilateral depth smoothing, do it afresh here
         if bismooth_depths:
             # Compute smoothed depths
-            depths_s = BilateralDepthSmoothing(depths, bismooth_width, bismooth_std)
+            depths_s = BilateralDepthSmoothing(depths, bismooth_width, bismooth_std,
+                                               approx=bismooth_approx, approx_step=bismooth_step)
             points_s = torch.FloatTensor(seq_len + 1, 3, img_ht, img_wd) # Create "smoothed" pts
             points_s[:,2].copy_(depths_s) # Copy smoothed depths
 
@@ -921,27 +1012,47 @@ def read_baxter_sequence_from_disk(dataset, id, img_ht=240, img_wd=320, img_scal
             initpt_s = initpt # Use unsmoothed init pts
             tarpts_s = tarpts # Use unsmoothed tar pts
 
-        tardeltas = ComposeRtPair(tarposes, RtInverse(initpose.clone()))  # Pose_t+1 * Pose_t^-1
-        initnormals, tarnormals,\
-        validinitnormals, validtarnormals = ComputeNormals(initpt_s, tarpts_s, initlabel, tardeltas,
-                                                           maxdepthdiff=maxdepthdiff)
+        tardeltas = ComposeRtPair(tarposes, RtInverse(initpose))  # Pose_t+1 * Pose_t^-1
+        if fast_normals:
+            # Compute FWD & BWD (if needed) normals in a single pass
+            initdeltas = ComposeRtPair(initpose, RtInverse(tarposes)) if compute_bwdnormals else None # Pose_t * Pose_t+1^-1
+            initnormals, tarnormals, validinitnormals, \
+            bwdinitnormals, bwdtarnormals, validbwdinitnormals = ComputeNormalsFast(initpt_s, tarpts_s,
+                                                                                    initlabel, tarlabels,
+                                                                                    tardeltas, initdeltas,
+                                                                                    maxdepthdiff=maxdepthdiff,
+                                                                                    width=fast_normals_width,
+                                                                                    compute_bwd=compute_bwdnormals)
+            validtarnormals    = validinitnormals # Rotated normals are valid where the originals are
+            validbwdtarnormals = validbwdinitnormals
+        else:
+            initnormals, tarnormals,\
+            validinitnormals, validtarnormals = ComputeNormals(initpt_s, tarpts_s, initlabel, tardeltas,
+                                                               maxdepthdiff=maxdepthdiff)
 
         # Compute normals in the BWD dirn (along with their transformed versions)
-        if compute_bwdnormals:
-            initdeltas = ComposeRtPair(initpose.clone(), RtInverse(tarposes))  # Pose_t+1 * Pose_t^-1
+        if compute_bwdnormals and not fast_normals:
+            initdeltas = ComposeRtPair(initpose, RtInverse(tarposes))  # Pose_t+1 * Pose_t^-1
             bwdinitnormals, bwdtarnormals, \
             validbwdinitnormals, validbwdtarnormals = ComputeNormals(tarpts_s, initpt_s, tarlabels, initdeltas,
                                                                      maxdepthdiff=maxdepthdiff)
 
     # Return loaded data
-    data = {'points': points, 'fwdflows': fwdflows, 'fwdvisibilities': fwdvisibilities, 'folderid': int(folid),
-            'fwdassocpixelids': fwdassocpixelids, 'controls': controls, 'comconfigs': comconfigs,
+    data = {'points': points, 'folderid': int(folid), 'controls': controls, 'comconfigs': comconfigs,
             'poses': poses, 'dt': dt, 'actctrlconfigs': actctrlconfigs}
+    if defer_flows:
+        data['flowlabels'] = labels
+        data['flowposes']  = allposes
+    else:
+        data['fwdflows']        = fwdflows
+        data['fwdvisibilities'] = fwdvisibilities
+        data['fwdassocpixelids'] = fwdassocpixelids
     if compute_bwdflows:
         data['masks']           = masks
-        data['bwdflows']        = bwdflows
-        data['bwdvisibilities'] = bwdvisibilities
-        data['bwdassocpixelids'] = bwdassocpixelids
+        if not defer_flows:
+            data['bwdflows']        = bwdflows
+            data['bwdvisibilities'] = bwdvisibilities
+            data['bwdassocpixelids'] = bwdassocpixelids
     if supervised_seg_loss:
         data['labels'] = masks.max(dim=1)[1] # Get label image for supervised classification
     if compute_normals:
@@ -984,7 +1095,8 @@ def read_box_sequence_from_disk(dataset, id, img_ht=240, img_wd=320, img_scale=1
                                 ctrl_type='ballposforce', num_ctrl=6,
                                 compute_bwdflows=True, dathreshold=0.01, dawinsize=5,
                                 use_only_da=False, noise_func=None,
-                                load_color=False, mesh_ids=torch.Tensor()): # mesh_ids unused
+                                load_color=False, mesh_ids=torch.Tensor(), # mesh_ids unused
+                                defer_flows=False, daearlyexit=False):
     # Setup vars
     seq_len, step_len = dataset['seq'], dataset['step']  # Get sequence & step length
     camera_intrinsics = dataset['camintrinsics']
@@ -1059,7 +1171,7 @@ def read_box_sequence_from_disk(dataset, id, img_ht=240, img_wd=320, img_scale=1
 
     # Add noise to the depths before we compute the point cloud
     if (noise_func is not None) and dataset['addnoise']:
-        depths_n = noise_func(depths)
+        depths_n = noise_func(depths, seed=dataset.get('noiseseed'))
         depths.copy_(depths_n)  # Replace by noisy depths
 
     # Different control types
@@ -1085,33 +1197,127 @@ def read_box_sequence_from_disk(dataset, id, img_ht=240, img_wd=320, img_scale=1
     tarposes = poses[1:]  # t+1, t+2, t+3, ....
     initpose = poses[0:1].expand_as(tarposes)
 
-    # Compute flow and visibility
-    fwdflows, bwdflows, \
-    fwdvisibilities, bwdvisibilities, \
-    fwdassocpixelids, bwdassocpixelids = ComputeFlowAndVisibility(initpt, tarpts, initlabel, tarlabels,
-                                                                  initpose, tarposes, camera_intrinsics,
-                                                                  dathreshold, dawinsize, use_only_da)
+    # Compute flow and visibility (unless it is deferred to the collater, see BatchFlowAndVisibility)
+    if not defer_flows:
+        fwdflows, bwdflows, \
+        fwdvisibilities, bwdvisibilities, \
+        fwdassocpixelids, bwdassocpixelids = ComputeFlowAndVisibility(initpt, tarpts, initlabel, tarlabels,
+                                                                      initpose, tarposes, camera_intrinsics,
+                                                                      dathreshold, dawinsize, use_only_da,
+                                                                      daearlyexit=daearlyexit)
 
     # Return loaded data
-    data = {'points': points, 'fwdflows': fwdflows, 'fwdvisibilities': fwdvisibilities,
-            'fwdassocpixelids': fwdassocpixelids,
-            'states': states, 'controls': controls, 'poses': poses, 'dt': dt}
+    data = {'points': points, 'states': states, 'controls': controls, 'poses': poses, 'dt': dt}
+    if defer_flows:
+        data['flowlabels'] = labels
+        data['flowposes']  = poses
+    else:
+        data['fwdflows']        = fwdflows
+        data['fwdvisibilities'] = fwdvisibilities
+        data['fwdassocpixelids'] = fwdassocpixelids
     if compute_bwdflows:
         data['masks'] = masks
-        data['bwdflows'] = bwdflows
-        data['bwdvisibilities'] = bwdvisibilities
-        data['bwdassocpixelids'] = bwdassocpixelids
+        if not defer_flows:
+            data['bwdflows'] = bwdflows
+            data['bwdvisibilities'] = bwdvisibilities
+            data['bwdassocpixelids'] = bwdassocpixelids
     if load_color:
         data['rgbs'] = rgbs
 
     return data
 
+###################### BATCHED FLOW COMPUTATION
+### Computes the flows & visibilities for an entire batch of samples (loaded with defer_flows=True) in the collater.
+### All B x seq pairs of frames go through a single (multi-threaded) call to the flow/visibility kernel instead of
+### B separate calls in the disk loader. Temp memory (contiguous copies of the inputs, inverse poses and the BWD
+### outputs if they are not returned) is re-used across batches.
+class BatchFlowAndVisibility(object):
+    def __init__(self, dathreshold=0.01, dawinsize=5, use_only_da=False,
+                 compute_bwdflows=False, num_threads=0, daearlyexit=False):
+        self.dathreshold = dathreshold
+        self.dawinsize = dawinsize
+        self.use_only_da = use_only_da
+        self.daearlyexit = daearlyexit
+        self.compute_bwdflows = compute_bwdflows
+        self.num_threads = num_threads # Threads used by the flow kernel (0 = use current setting)
+        self.buffers = {}
+
+    def __call__(self, batch, datasets):
+        # Pad the poses to the same number of links (this can vary across datasets) before collating
+        datasetids = [sample['datasetid'] for sample in batch]
+        numposes = max([sample['flowposes'].size(1) for sample in batch])
+        for sample in batch:
+            poses = sample['flowposes']
+            if poses.size(1) < numposes:
+                sample['flowposes'] = torch.cat([poses, poses.new(poses.size(0), numposes-poses.size(1), 3, 4).zero_()], 1)
+        collated_batch = torch.utils.data.dataloader.default_collate(batch)
+
+        # Get data
+        points, labels, poses = collated_batch['points'], collated_batch.pop('flowlabels'), collated_batch.pop('flowposes')
+        bsz, seq, _, ht, wd = points.size()
+        seq, nposes = seq - 1, poses.size(2)
+
+        # Copy the init & target frames into contiguous B*seq buffers (all inputs to the kernel need the same strides)
+        initpts   = get_buffer(self.buffers, 'initpts', (bsz, seq, 3, ht, wd), torch.FloatTensor)
+        tarpts    = get_buffer(self.buffers, 'tarpts', (bsz, seq, 3, ht, wd), torch.FloatTensor)
+        initlabel = get_buffer(self.buffers, 'initlabel', (bsz, seq, 1, ht, wd), torch.ByteTensor)
+        tarlabels = get_buffer(self.buffers, 'tarlabels', (bsz, seq, 1, ht, wd), torch.ByteTensor)
+        initposes = get_buffer(self.buffers, 'initposes', (bsz, seq, nposes, 3, 4), torch.FloatTensor)
+        tarposes  = get_buffer(self.buffers, 'tarposes', (bsz, seq, nposes, 3, 4), torch.FloatTensor)
+        initpts.copy_(points[:, 0:1].expand_as(initpts)); tarpts.copy_(points[:, 1:])
+        initlabel.copy_(labels[:, 0:1].expand_as(initlabel)); tarlabels.copy_(labels[:, 1:])
+        initposes.copy_(poses[:, 0:1].expand_as(initposes)); tarposes.copy_(poses[:, 1:])
+
+        # Compute flows & visibilities, one call per distinct set of camera intrinsics in the batch (usually one)
+        num_threads = torch.get_num_threads()
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+        groups = {}
+        for k, did in enumerate(datasetids):
+            intrinsics = datasets[did]['camintrinsics']
+            key = (intrinsics['fx'], intrinsics['fy'], intrinsics['cx'], intrinsics['cy'])
+            groups.setdefault(key, (intrinsics, []))[1].append(k)
+        outputs = None
+        for intrinsics, ids in groups.values():
+            if len(ids) == bsz:
+                sel = lambda x: x.view(bsz*seq, *x.size()[2:])
+            else:
+                idx = torch.LongTensor(ids)
+                sel = lambda x: x.index_select(0, idx).view(len(ids)*seq, *x.size()[2:])
+            flowdata = ComputeFlowAndVisibility(sel(initpts), sel(tarpts), sel(initlabel), sel(tarlabels),
+                                                sel(initposes), sel(tarposes), intrinsics,
+                                                self.dathreshold, self.dawinsize, self.use_only_da,
+                                                buffers=self.buffers, keep_bwd=self.compute_bwdflows,
+                                                daearlyexit=self.daearlyexit)
+            if len(ids) == bsz:
+                outputs = flowdata
+            else:
+                if outputs is None:
+                    outputs = [f.new(bsz*seq, *f.size()[1:]) for f in flowdata]
+                for f, fout in zip(flowdata, outputs):
+                    fout.view(bsz, seq, *f.size()[1:]).index_copy_(0, idx, f.view(len(ids), seq, *f.size()[1:]))
+        torch.set_num_threads(num_threads)
+
+        # Save outputs to batch
+        fwdflows, bwdflows, fwdvisibilities, bwdvisibilities, fwdassocpixelids, bwdassocpixelids = \
+            [f.view(bsz, seq, *f.size()[1:]) for f in outputs]
+        collated_batch['fwdflows']        = fwdflows
+        collated_batch['fwdvisibilities'] = fwdvisibilities
+        collated_batch['fwdassocpixelids'] = fwdassocpixelids
+        if self.compute_bwdflows:
+            collated_batch['bwdflows']        = bwdflows
+            collated_batch['bwdvisibilities'] = bwdvisibilities
+            collated_batch['bwdassocpixelids'] = bwdassocpixelids
+
+        # Return
+        return collated_batch
+
 ###################### DATASET
 ### Dataset for Baxter Sequences
 class BaxterSeqDataset(Dataset):
     ''' Datasets for training SE3-Nets based on Baxter Sequential data '''
 
-    def __init__(self, datasets, load_function, dtype='train', filter_func=None):
+    def __init__(self, datasets, load_function, dtype='train', filter_func=None, batch_func=None):
         '''
         Create the data loader given paths to existing list of datasets:
         :param datasets: 		List of datasets that have train | test | val splits
@@ -1119,6 +1325,8 @@ class BaxterSeqDataset(Dataset):
                                 return a dictionary of torch tensors)
         :param dtype:			Type of dataset: 'train', 'test' or 'val'
         :param filter_func:     Function that filters out bad samples from a batch during collating
+        :param batch_func:      Function that collates the filtered samples & computes batched data from them
+                                (e.g. BatchFlowAndVisibility). Called with the samples and the list of datasets
         '''
         assert (len(datasets) > 0);  # Need atleast one dataset
         assert (dtype == 'train' or dtype == 'val' or dtype == 'test')  # Has to be one of the types
@@ -1126,6 +1334,8 @@ class BaxterSeqDataset(Dataset):
         self.load_function = load_function
         self.dtype = dtype
         self.filter_func = filter_func # Filters samples in the collater
+        self.batch_func = batch_func # Collates samples & computes batched data in the collater
+        self.epoch = 0 # Used for seeding the noise (set by the data loader)
 
         # Get some stats
         self.numdata = 0
@@ -1139,6 +1349,9 @@ class BaxterSeqDataset(Dataset):
     def __len__(self):
         return self.numdata
 
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
     def __getitem__(self, idx):
         # Find which dataset to sample from
         assert (idx < self.numdata);  # Check if we are within limits
@@ -1149,9 +1362,10 @@ class BaxterSeqDataset(Dataset):
         diff = (idx - self.datahist[did])  # This will be from 0 - size for either train/test/val part of that dataset
         sid = int(start + diff)
 
-        # Call the disk load function
+        # Call the disk load function (with the noise seed for this sample & epoch)
         # Assumption: This function returns a dict of torch tensors
-        sample = self.load_function(self.datasets[did], sid)
+        dataset = dict(self.datasets[did], noiseseed=noise_seed(self.epoch, did, sid))
+        sample = self.load_function(dataset, sid)
         sample['id'] = int(idx) # Add the ID of the sample in
         sample['datasetid'] = int(did) # Add the ID of the dataset in
 
@@ -1175,7 +1389,10 @@ class BaxterSeqDataset(Dataset):
                 return None
 
         # Collate the other samples together using the default collate function
-        collated_batch = torch.utils.data.dataloader.default_collate(filtered_batch)
+        if self.batch_func is not None:
+            collated_batch = self.batch_func(filtered_batch, self.datasets)
+        else:
+            collated_batch = torch.utils.data.dataloader.default_collate(filtered_batch)
 
         # Return post-processed batch
         return collated_batch
@@ -0,0 +1,216 @@
+# Global imports
+import os
+import json
+import time
+import argparse
+from collections import OrderedDict
+
+# Torch imports
+import torch
+import torch.nn as nn
+
+# Local imports
+import se3layers as se3nn
+import ctrlnets
+import se3nets
+import flownets
+from inference import build_model, inference_mode
+
+'''
+    --------------------- TorchScript export of the SE3-Pose-Models, SE3-Nets & Flow-Nets ------------------------------
+    python export.py <checkpoint> <output dir> [--no-fold-bn] [--no-freeze] [--batch-size 1]
+
+    Traces the entry points of a trained model into serialized TorchScript modules (one file per entry point) that
+    only need torch to run: torch.jit.load(path) in a fresh process, no training code & no _ext build. The layers are
+    traced through their pure-tensor reference implementations (se3nn.set_use_reference, the custom autograd
+    Functions & C/CUDA kernels can not be traced), the BN layers are folded (ctrlnets.fold_batchnorm) & the traced
+    modules are frozen (weights inlined as constants, if the torch version has torch.jit.freeze).
+    Entry points (the inputs in brackets are only there if the model uses them):
+        MultiStepSE3PoseModel (train_se3posenets.py) => PoseMaskEncoder or PoseEncoder + MaskEncoder, TransitionModel
+            pose.pt      : (pts, [jtangles])              -> pose
+            pose_mask.pt : (pts, [jtangles])              -> pose, mask
+            next_pose.pt : (pose, [jtangles], ctrl, [pivots]) -> delta, next pose
+        SE3Model (train_flow_se3_nets.py --use-se3-nets)
+            se3model.pt  : (pts, jtangles, ctrl)          -> flows, delta, mask
+        FlowNet (train_flow_se3_nets.py)
+            flownet.pt   : (pts, jtangles, ctrl)          -> flows
+    The input & output names are saved in each file (extra file "signature.json"). The traced modules work for any
+    batch size, the image size is fixed by the model. The masks are at 1/mask_scale of the image size (upsample them
+    with se3nn.upsample_masks, NTfm3D does that itself). Run this file to export a checkpoint, check the traced
+    modules against the original model & time both.
+'''
+
+### Tensor-only call of (sub-)modules for tracing: forward(*inputs) = fn(self, *inputs), the modules are attributes
+class TracedCall(nn.Module):
+    def __init__(self, fn, **modules):
+        super(TracedCall, self).__init__()
+        for name, module in modules.items():
+            self.add_module(name, module)
+        self.fn = fn
+
+    def forward(self, *inputs):
+        return self.fn(self, *inputs)
+
+### Trace a TracedCall with the reference implementations of the layers (no grads, eval mode)
+# "check_inputs" is a list of other example inputs, the trace is re-run on these & checked for changes
+def trace(call, example_inputs, check_inputs=None, freeze=True):
+    prev = se3nn.use_reference()
+    se3nn.set_use_reference(True)
+    try:
+        with torch.no_grad():
+            traced = torch.jit.trace(call.eval(), tuple(example_inputs), check_inputs=check_inputs)
+    finally:
+        se3nn.set_use_reference(prev)
+    if freeze and hasattr(torch.jit, 'freeze'):
+        traced = torch.jit.freeze(traced)
+    return traced
+
+### Save a traced module with its signature
+def save(traced, path, inputs, outputs):
+    traced.save(path, _extra_files={'signature.json': json.dumps({'inputs': inputs, 'outputs': outputs})})
+
+### Entry points of the models: name -> (TracedCall, input names, output names), in the order they are traced
+def se3pose_entry_points(model):
+    jt, jtt, pivot = model.use_jt_angles, model.use_jt_angles_trans, model.transitionmodel.inp_pivot
+    enc_inputs = ['pts', 'jtangles'] if jt else ['pts']
+    inp = lambda x: list(x) if jt else x[0] # Pose/Pose-mask encoder input
+    if model.decomp_model:
+        pose = TracedCall(lambda s, *x: s.posemodel(inp(x)), posemodel=model.posemodel)
+        pose_mask = TracedCall(lambda s, *x: (s.posemodel(inp(x)), s.maskmodel(x[0])),
+                               posemodel=model.posemodel, maskmodel=model.maskmodel)
+    else:
+        pose = TracedCall(lambda s, *x: s.posemaskmodel(inp(x), predict_masks=False),
+                          posemaskmodel=model.posemaskmodel)
+        pose_mask = TracedCall(lambda s, *x: tuple(s.posemaskmodel(inp(x), predict_masks=True)),
+                               posemaskmodel=model.posemaskmodel)
+    next_pose = TracedCall(lambda s, *x: tuple(s.transitionmodel(list(x))), transitionmodel=model.transitionmodel)
+    trans_inputs = ['pose'] + (['jtangles'] if jtt else []) + ['ctrl'] + (['pivots'] if pivot else [])
+    return OrderedDict([('pose', (pose, enc_inputs, ['pose'])),
+                        ('pose_mask', (pose_mask, enc_inputs, ['pose', 'mask'])),
+                        ('next_pose', (next_pose, trans_inputs, ['delta', 'pose']))])
+
+def se3model_call(s, pts, jtangles, ctrl):
+    flows, (delta, mask) = s.model([pts, jtangles, ctrl])
+    return flows, delta, mask
+
+def se3model_entry_points(model):
+    return OrderedDict([('se3model', (TracedCall(se3model_call, model=model), ['pts', 'jtangles', 'ctrl'],
+                                      ['flows', 'delta', 'mask']))])
+
+def flownet_entry_points(model):
+    return OrderedDict([('flownet', (TracedCall(lambda s, *x: s.model(list(x)), model=model),
+                                     ['pts', 'jtangles', 'ctrl'], ['flows']))])
+
+### Build the model saved in a checkpoint & its entry points
+def load_entry_points(path, device='cpu'):
+    checkpoint = torch.load(path, map_location=lambda storage, loc: storage)
+    args = checkpoint['args']
+    num_state = getattr(args, 'num_state_net', args.num_ctrl)
+    if not hasattr(args, 'use_se3_nets'):
+        model, entry_points = build_model(args), se3pose_entry_points
+    elif args.use_se3_nets:
+        model = se3nets.SE3Model(num_ctrl=args.num_ctrl, num_se3=args.num_se3,
+                        se3_type=args.se3_type, use_pivot=args.pred_pivot,
+                        input_channels=3, use_bn=args.batch_norm, nonlinearity=args.nonlin,
+                        init_transse3_iden=args.init_transse3_iden,
+                        use_wt_sharpening=args.use_wt_sharpening, sharpen_start_iter=args.sharpen_start_iter,
+                        sharpen_rate=args.sharpen_rate, pre_conv=args.pre_conv,
+                        wide=args.wide_model, use_jt_angles=args.use_jt_angles,
+                        num_state=num_state, mask_scale=getattr(args, 'mask_scale', 1))
+        entry_points = se3model_entry_points
+    else:
+        model = flownets.FlowNet(num_ctrl=args.num_ctrl, num_state=num_state,
+                                 input_channels=3, use_bn=args.batch_norm, pre_conv=args.pre_conv,
+                                 nonlinearity=args.nonlin, init_flow_iden=args.init_flow_iden,
+                                 use_jt_angles=args.use_jt_angles)
+        entry_points = flownet_entry_points
+    key = 'state_dict' if 'state_dict' in checkpoint else 'model_state_dict' # BWDs compatibility
+    model.load_state_dict(checkpoint[key])
+    model = model.to(device).eval()
+    return model, entry_points, args
+
+### Random example inputs (batch size "bsz") for the given input names
+def example_inputs(names, args, bsz=1, pose=None, device='cpu'):
+    sizes = {'pts': (3, args.img_ht, args.img_wd), 'jtangles': (getattr(args, 'num_state_net', args.num_ctrl),),
+             'ctrl': (args.num_ctrl,), 'pivots': (args.num_se3, 3)}
+    inputs = []
+    for name in names:
+        if name == 'pose':
+            inputs.append(pose[:1].expand(bsz, *pose.size()[1:]).contiguous())
+        else:
+            inputs.append(torch.randn(bsz, *sizes[name], device=device))
+    return inputs
+
+### Poses predicted from random points (example inputs of the transition model)
+def example_pose(posecall, names, args, device='cpu'):
+    with inference_mode():
+        return posecall(*example_inputs(names, args, 1, device=device))
+
+### Export all the entry points of a model, returns name -> (traced module, input names, output names)
+def export_model(model, entry_points, args, outdir=None, bsz=1, fold_bn=True, freeze=True, device='cpu'):
+    for p in model.parameters():
+        p.requires_grad_(False)
+    if fold_bn:
+        ctrlnets.fold_batchnorm(model)
+    exports, pose = OrderedDict(), None
+    for name, (call, inputs, outputs) in entry_points(model).items():
+        if 'pose' in inputs and pose is None:
+            pose = example_pose(exports['pose'][0], exports['pose'][1], args, device)
+        # Trace with batch size "bsz", check with a different batch size
+        traced = trace(call, example_inputs(inputs, args, bsz, pose, device),
+                       [tuple(example_inputs(inputs, args, bsz+1, pose, device))], freeze=freeze)
+        if outdir is not None:
+            save(traced, os.path.join(outdir, name + '.pt'), inputs, outputs)
+        exports[name] = (traced, inputs, outputs)
+    return exports
+
+################ Export, check & time a checkpoint
+parser = argparse.ArgumentParser(description='TorchScript export of a trained model')
+parser.add_argument('checkpoint', type=str, metavar='PATH',
+                    help='path to the checkpoint (e.g. model_flow_best.pth.tar)')
+parser.add_argument('outdir', type=str, metavar='DIR',
+                    help='directory for the exported modules')
+parser.add_argument('--cuda', action='store_true', default=False,
+                    help='Export for the GPU (default: False)')
+parser.add_argument('--no-fold-bn', action='store_true', default=False,
+                    help='Do not fold the BN layers into the conv layers (default: False)')
+parser.add_argument('--no-freeze', action='store_true', default=False,
+                    help='Do not freeze the traced modules (default: False)')
+parser.add_argument('--batch-size', default=1, type=int, metavar='N',
+                    help='Batch size of the example inputs & the timing (default: 1)')
+parser.add_argument('--iters', default=50, type=int, metavar='N',
+                    help='Number of timed iterations (default: 50)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    device = 'cuda' if (args.cuda and torch.cuda.is_available()) else 'cpu'
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    model, entry_points, ckargs = load_entry_points(args.checkpoint, device)
+    origmodel, _, _ = load_entry_points(args.checkpoint, device)
+    exports = export_model(model, entry_points, ckargs, args.outdir, args.batch_size,
+                           fold_bn=not args.no_fold_bn, freeze=not args.no_freeze, device=device)
+    print('Exported {} to {}: {}'.format(args.checkpoint, args.outdir, ', '.join(sorted(exports.keys()))))
+
+    # Check the traced modules against the original model (C/CUDA kernels) & time both
+    def time_fn(fn, inps):
+        with inference_mode():
+            fn(*inps) # Warmup
+            if device == 'cuda':
+                torch.cuda.synchronize()
+            st = time.time()
+            for _ in range(args.iters):
+                fn(*inps)
+            if device == 'cuda':
+                torch.cuda.synchronize()
+        return (time.time() - st) * 1000.0 / args.iters
+    origcalls, pose = entry_points(origmodel), None
+    for name, (traced, inputs, outputs) in exports.items():
+        if 'pose' in inputs and pose is None:
+            pose = example_pose(exports['pose'][0], exports['pose'][1], ckargs, device)
+        inps = example_inputs(inputs, ckargs, args.batch_size, pose, device)
+        with inference_mode():
+            origouts, outs = [o if isinstance(o, tuple) else (o,) for o in [origcalls[name][0](*inps), traced(*inps)]]
+        diffs = ['{}: {:.3e}'.format(o, (x - y).abs().max().item()) for o, x, y in zip(outputs, origouts, outs)]
+        print('{:>10} => Max abs diff ({}), Original: {:.3f} ms, Traced: {:.3f} ms'.format(
+            name, ', '.join(diffs), time_fn(origcalls[name][0], inps), time_fn(traced, inps)))
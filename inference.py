@@ -0,0 +1,152 @@
+# Global imports
+import copy
+import time
+import argparse
+
+# Torch imports
+import torch
+
+# Local imports
+import ctrlnets
+import data
+
+'''
+    --------------------- Inference runtime for trained SE3-Pose-Models ------------------------------
+    SE3PosePredictor.from_checkpoint(path, device='cpu', fold_bn=True)
+
+    Loads a checkpoint saved by train_se3posenets.py (checkpoint.pth.tar, model_best.pth.tar,
+    model_flow_best.pth.tar, ...) into a MultiStepSE3PoseModel built from the args saved with it. The model is
+    put in eval mode, its weights are frozen & the BN layers of the Basic Conv/Deconv blocks are folded into their
+    conv/deconv layers (ctrlnets.fold_batchnorm, the BN of the PreConv/PreDeconv blocks is applied before a
+    non-linearity & is kept). All predictions run without autograd (inference mode) & the inputs are staged
+    into buffers that are re-used across calls (only if they are not on the model's device as contiguous float
+    tensors already):
+        predict_pose(pts, jtangles=None)            : poses (B x nSE3 x 3 x 4)
+        predict_pose_mask(pts, jtangles=None)       : poses & masks (B x nSE3 x H x W, at 1/mask_scale of H x W)
+        predict_next_pose(pose, ctrl, jtangles=None) : deltas & next poses (B x nSE3 x 3 x 4)
+    The points are B x 3 x H x W (or 3 x H x W for a single frame), the controls & jt angles B x N (or N).
+    Run this file with a checkpoint to check the folded model against the original one & time the predictions.
+'''
+
+# No autograd at all if the torch version has it, no grads otherwise
+inference_mode = getattr(torch, 'inference_mode', torch.no_grad)
+
+### Build a model from the args saved in a checkpoint (same as train_se3posenets.py)
+def build_model(args):
+    return ctrlnets.MultiStepSE3PoseModel(num_ctrl=args.num_ctrl, num_se3=args.num_se3,
+                    se3_type=args.se3_type, delta_pivot=args.delta_pivot,
+                    input_channels=3, use_bn=args.batch_norm, nonlinearity=args.nonlin,
+                    init_posese3_iden=args.init_posese3_iden, init_transse3_iden=args.init_transse3_iden,
+                    use_wt_sharpening=args.use_wt_sharpening, sharpen_start_iter=args.sharpen_start_iter,
+                    sharpen_rate=args.sharpen_rate, pre_conv=args.pre_conv, decomp_model=args.decomp_model,
+                    local_delta_se3=args.local_delta_se3,
+                    wide=args.wide_model, use_jt_angles=args.use_jt_angles,
+                    use_jt_angles_trans=args.use_jt_angles_trans,
+                    num_state=getattr(args, 'num_state_net', args.num_ctrl),
+                    full_res=getattr(args, 'full_res', False), noise_stop_iter=getattr(args, 'noise_stop_iter', 1e6),
+                    trans_type="default", posemask_type="default", mask_scale=getattr(args, 'mask_scale', 1))
+
+### Load a checkpoint (on the CPU)
+def load_checkpoint(path):
+    return torch.load(path, map_location=lambda storage, loc: storage)
+
+### Load a model (in eval mode) from a checkpoint (a path or a loaded checkpoint)
+def load_model(checkpoint, device='cpu'):
+    if not isinstance(checkpoint, dict):
+        checkpoint = load_checkpoint(checkpoint)
+    model = build_model(checkpoint['args'])
+    key = 'state_dict' if 'state_dict' in checkpoint else 'model_state_dict' # BWDs compatibility
+    model.load_state_dict(checkpoint[key])
+    return model.to(device).eval()
+
+### Predictor
+class SE3PosePredictor(object):
+    def __init__(self, model, device='cpu', fold_bn=True):
+        self.device = torch.device(device)
+        if self.device.type == 'cuda' and self.device.index is None:
+            self.device = torch.device('cuda', torch.cuda.current_device()) # Tensors are on "cuda:<index>"
+        self.model  = model.to(self.device).eval()
+        for p in self.model.parameters():
+            p.requires_grad_(False)
+        self.nfolded = ctrlnets.fold_batchnorm(self.model) if fold_bn else 0
+        self.buffers = {} # Staging buffers for the inputs
+
+    @classmethod
+    def from_checkpoint(cls, path, device='cpu', fold_bn=True):
+        return cls(load_model(path, device), device, fold_bn)
+
+    # Input on the model's device (as a contiguous float tensor with "ndim" dims), copied into a re-used
+    # buffer if needed
+    def stage(self, key, x, ndim):
+        if x is None:
+            return None
+        x = torch.as_tensor(x)
+        if x.dim() == ndim - 1:
+            x = x.unsqueeze(0) # Single element
+        if x.device == self.device and x.dtype == torch.float32 and x.is_contiguous():
+            return x
+        buf = data.get_buffer(self.buffers, key, x.size(), lambda: torch.empty(0, device=self.device))
+        return buf.copy_(x)
+
+    # Poses from points (& jt angles)
+    def predict_pose(self, pts, jtangles=None):
+        with inference_mode():
+            return self.model.forward_only_pose([self.stage('pts', pts, 4), self.stage('jtangles', jtangles, 2)])
+
+    # Poses & masks from points (& jt angles)
+    def predict_pose_mask(self, pts, jtangles=None):
+        with inference_mode():
+            return self.model.forward_pose_mask([self.stage('pts', pts, 4), self.stage('jtangles', jtangles, 2)])
+
+    # Deltas & next poses from poses & controls (& jt angles)
+    def predict_next_pose(self, pose, ctrl, jtangles=None):
+        with inference_mode():
+            return self.model.forward_next_pose(self.stage('pose', pose, 4), self.stage('ctrl', ctrl, 2),
+                                                self.stage('jtangles', jtangles, 2))
+
+################ Check & time a checkpoint
+parser = argparse.ArgumentParser(description='Check & time the inference runtime on a checkpoint')
+parser.add_argument('checkpoint', type=str, metavar='PATH',
+                    help='path to the checkpoint (e.g. model_flow_best.pth.tar)')
+parser.add_argument('--cuda', action='store_true', default=False,
+                    help='Run on the GPU (default: False)')
+parser.add_argument('--batch-size', default=1, type=int, metavar='N',
+                    help='Batch size (default: 1)')
+parser.add_argument('--iters', default=50, type=int, metavar='N',
+                    help='Number of timed iterations (default: 50)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    device = 'cuda' if (args.cuda and torch.cuda.is_available()) else 'cpu'
+    checkpoint = load_checkpoint(args.checkpoint)
+    model = load_model(checkpoint, device)
+    predictor = SE3PosePredictor(copy.deepcopy(model), device) # Folding the BN layers changes the model in-place
+    print('Loaded {}, folded {} BN layers'.format(args.checkpoint, predictor.nfolded))
+
+    # Random inputs
+    ckargs = checkpoint['args']
+    ht, wd = ckargs.img_ht, ckargs.img_wd
+    num_ctrl, num_state = ckargs.num_ctrl, getattr(ckargs, 'num_state_net', ckargs.num_ctrl)
+    pts, jtangles = torch.randn(args.batch_size, 3, ht, wd), torch.randn(args.batch_size, num_state)
+    ctrl = torch.randn(args.batch_size, num_ctrl)
+
+    # Check the folded model against the original one
+    with torch.no_grad():
+        pose, mask = model.forward_pose_mask([pts.to(device), jtangles.to(device)])
+    fpose, fmask = predictor.predict_pose_mask(pts, jtangles)
+    print('Max abs diff w.r.t the original model => Pose: {:.3e}, Mask: {:.3e}'.format(
+        (pose - fpose).abs().max().item(), (mask - fmask).abs().max().item()))
+
+    # Time the predictions
+    for name, fn in [('predict_pose', lambda: predictor.predict_pose(pts, jtangles)),
+                     ('predict_pose_mask', lambda: predictor.predict_pose_mask(pts, jtangles)),
+                     ('predict_next_pose', lambda: predictor.predict_next_pose(fpose, ctrl, jtangles))]:
+        fn() # Warmup
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        st = time.time()
+        for _ in range(args.iters):
+            fn()
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        print('{:>20}: {:.3f} ms'.format(name, (time.time() - st) * 1000.0 / args.iters))
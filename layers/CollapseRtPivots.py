@@ -1,6 +1,8 @@
 import torch
 from torch.autograd import Function
 from torch.nn import Module
+import backend
+import rtops
 
 '''
 	--------------------- Collapses [R|t|pivots] to [R|t'] where t' = p + t - Rp ------------------------------
@@ -12,47 +14,37 @@ from torch.nn import Module
 	R' = R & t' = t + p - Rp
    Each 3D transform is a (3x5) matrix [R|t|p],
    where "R" is a (3x3) affine matrix, "t" is a translation (3x1) and "p" is a pivot (3x1).
+   collapse_rt_pivots(input) is a pure-tensor version of the layer (gradients through autograd) which can be
+   scripted/traced & graph compiled. The module uses it if backend.set_use_reference(True) is set.
 '''
 
+## Pure-tensor FWD pass (gradients through autograd)
+def collapse_rt_pivots(input):
+	# type: (Tensor) -> Tensor
+	r, t, p = input.narrow(-1,0,3), input.narrow(-1,3,1), input.narrow(-1,4,1)
+	return torch.cat([r, t + p - torch.matmul(r, p)], -1) # [r | t + p - Rp]
+
 ## FWD/BWD pass function
 class CollapseRtPivotsFunction(Function):
-	def forward(self, input):
+	@staticmethod
+	def forward(ctx, input):
 		# Check dimensions
 		batch_size, num_se3, num_rows, num_cols = input.size()
 		assert (num_rows == 3 and num_cols == 5);
 
-		# Init for FWD pass
-		self.save_for_backward(input)
-		input_v = input.view(-1, 3, 5);
-		r = input_v.narrow(2, 0, 3);
-		t = input_v.narrow(2, 3, 1);
-		p = input_v.narrow(2, 4, 1);
-
-		# Compute output = [r, t + p - Rp]
-		output = input.new().resize_(batch_size, num_se3, 3, 4);
-		output.narrow(3, 0, 3).copy_(r); # r
-		output.narrow(3, 3, 1).copy_(t+p).add_(-1, torch.bmm(r, p)); # t + p - Rp
-
-		# Return
-		return output;
-
-	def backward(self, grad_output):
-		# Get saved tensors & setup vars
-		input = self.saved_tensors[0]
-		input_v = input.view(-1, 3, 5);
-		r = input_v.narrow(2, 0, 3);
-		p = input_v.narrow(2, 4, 1);
-		ro_g = grad_output.view(-1, 3, 4).narrow(2, 0, 3);
-		to_g = grad_output.view(-1, 3, 4).narrow(2, 3, 1);
+		# Compute output = [r, t + p - Rp] (fused kernel)
+		ctx.save_for_backward(input)
+		return rtops.collapse_pivots(input);
 
-		# Initialize grad input
-		input_g = input.new().resize_as_(input);
-		input_g.narrow(3,0,3).copy_(ro_g).add_(-1, torch.bmm(to_g, p.transpose(1,2))); # r_g = ro_g - (to_g * p^T)
-		input_g.narrow(3,3,1).copy_(to_g); 											  # t_g = to_g
-		input_g.narrow(3,4,1).copy_(to_g).add_(-1, torch.bmm(r.transpose(1,2), to_g)); # p_g = to_g - (R^T * to_g)
+	@staticmethod
+	def backward(ctx, grad_output):
+		# Nothing to do if the input doesn't need a gradient
+		if not ctx.needs_input_grad[0]:
+			return None
 
-		# Return
-		return input_g;
+		# r_g = ro_g - (to_g * p^T), t_g = to_g, p_g = to_g - (R^T * to_g)
+		input = ctx.saved_tensors[0]
+		return rtops.collapse_pivots_backward(input, grad_output);
 
 
 ## FWD/BWD pass module
@@ -60,5 +52,8 @@ class CollapseRtPivots(Module):
 	def __init__(self):
 		super(CollapseRtPivots, self).__init__()
 
+	@backend.float32
 	def forward(self, input):
-		return CollapseRtPivotsFunction()(input)
\ No newline at end of file
+		if backend.use_reference():
+			return collapse_rt_pivots(input)
+		return CollapseRtPivotsFunction.apply(input)
\ No newline at end of file
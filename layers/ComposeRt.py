@@ -1,6 +1,9 @@
 import torch
 from torch.autograd import Function
 from torch.nn import Module
+import backend
+import rtops
+from ComposeRtPair import compose_rt_pair
 
 '''
 	--------------------- Compose multiple transformations ------------------------------
@@ -22,103 +25,176 @@ from torch.nn import Module
 		This makes sense if the points are specified in the body frame of reference (eg: joint frames)
 	end
 	By default, rightToLeft is "false"
+	The composition is done either sequentially (one pair of transforms per step) or as a parallel prefix scan
+	(Hillis-Steele, log2(N) steps that each compose all pairs at a distance of 2^i at once). The BWD pass of the
+	scan solves the recurrence for the gradients (h_n = g_n + h_n+1 * T_n+1^T in homogeneous coordinates) with
+	the same scan. The scan does O(N log N) work instead of O(N) but has fewer, larger ops, so it is used on the GPU.
+	On the CPU, the sequential version (which composes the pairs in-place with the fused kernels in rtops) is faster.
+	ComposeRt(rightToLeft, use_scan) can force either version (use_scan = None picks the scan for CUDA inputs). The
+	scan composes the pairs with the fused kernel if there is one for the device, else with compose_rt_pair.
+	compose_rt(input, rightToLeft) is a pure-tensor version of the layer (gradients through autograd) which can be
+	scripted/traced & graph compiled. The module uses it if backend.set_use_reference(True) is set.
 '''
 
+## Pure-tensor FWD pass (gradients through autograd)
+def compose_rt(input, rightToLeft=False):
+	# type: (Tensor, bool) -> Tensor
+	outputs = [input.select(1,0)]
+	for n in range(1, input.size(1)): # 1,2,3,...nSE3-1
+		if rightToLeft: # Append to left
+			outputs.append(compose_rt_pair(input.select(1,n), outputs[n-1])) # T'_n = T_n * T'_n-1
+		else: # Append to right
+			outputs.append(compose_rt_pair(outputs[n-1], input.select(1,n))) # T'_n = T'_n-1 * T_n
+	return torch.stack(outputs, 1)
+
 ## FWD/BWD pass function
 class ComposeRtFunction(Function):
-	def __init__(self, rightToLeft = False):
-		self.rightToLeft = rightToLeft;
-
-	def forwardPair(self, A, B):
-		# Check dimensions
-		batch_size, num_rows, num_cols = A.size()
-		assert (num_rows == 3 and num_cols == 4);
-		assert (A.is_same_size(B));
-
-		# Init for FWD pass
-		rA = A.narrow(2, 0, 3);
-		rB = B.narrow(2, 0, 3);
-		tA = A.narrow(2, 3, 1);
-		tB = B.narrow(2, 3, 1);
-
-		# Init output
-		output = A.new().resize_as_(A);
-		output.narrow(2, 0, 3).copy_(torch.bmm(rA, rB));
-		output.narrow(2, 3, 1).copy_(torch.baddbmm(tA, rA, tB));
-
-		# Return
-		return output;
-
-	def backwardPair(self, grad, A, B):
-		# Setup vars
-		rA = A.narrow(2, 0, 3);
-		rB = B.narrow(2, 0, 3);
-		tA = A.narrow(2, 3, 1);
-		tB = B.narrow(2, 3, 1);
-		r_g = grad.narrow(2, 0, 3);
-		t_g = grad.narrow(2, 3, 1);
-
-		# Initialize grad input
-		A_g = grad.new().resize_as_(grad);
-		B_g = grad.new().resize_as_(grad);
-
-		# Compute gradients w.r.t translations tA & tB
-		# t = rA * tB + tA
-		A_g.narrow(2, 3, 1).copy_(t_g);  # tA_g = t_g
-		B_g.narrow(2, 3, 1).copy_(torch.bmm(rA.transpose(1, 2), t_g));  # tB_g = rA ^ T * t_g
-
-		# Compute gradients w.r.t rotations rA & rB
-		# r = rA * rB
-		A_g.narrow(2, 0, 3).copy_(torch.bmm(r_g, rB.transpose(1, 2)).baddbmm_(t_g, tB.transpose(1,2)));  # rA_g = r_g * rB ^ T + (t_g * tB ^ T)
-		B_g.narrow(2, 0, 3).copy_(torch.bmm(rA.transpose(1, 2), r_g));  # rB_g = rA ^ T * r_g (similar to translation grad, but with 3 column vectors)
-
-		# Return
-		return A_g, B_g;
-
-	def forward(self, input):
-		# Check dimensions
-		batch_size, num_se3, num_rows, num_cols = input.size()
-		assert (num_rows == 3 and num_cols == 4);
-
+	########
+	#### Sequential FWD/BWD pass
+	@staticmethod
+	def forwardLoop(input, rightToLeft):
 		# Compute output
+		num_se3 = input.size(1)
 		output = input.clone()
 		for n in range(1,num_se3): # 1,2,3,...nSE3-1
-			if self.rightToLeft: # Append to left
-				output.select(1,n).copy_(self.forwardPair(input.select(1,n), output.select(1,n-1))) # T'_n = T_n * T'_n-1
+			if rightToLeft: # Append to left
+				rtops.compose(input.select(1,n), output.select(1,n-1), out=output.select(1,n)) # T'_n = T_n * T'_n-1
 			else: # Append to right
-				output.select(1,n).copy_(self.forwardPair(output.select(1,n-1), input.select(1,n))) # T'_n = T'_n-1 * T_n
-		self.save_for_backward(input, output)
+				rtops.compose(output.select(1,n-1), input.select(1,n), out=output.select(1,n)) # T'_n = T'_n-1 * T_n
 		return output
 
-	def backward(self, grad_output):
-		# Get input and check for dimensions
-		input, output = self.saved_tensors
-		batch_size, num_se3, num_rows, num_cols = input.size()
-		assert (num_rows == 3 and num_cols == 4);
-
+	@staticmethod
+	def backwardLoop(grad_output, input, output, rightToLeft):
 		# Temp memory for gradient computation
 		temp = grad_output.clone()
 
 		# Compute gradient w.r.t input
-		grad_input = input.clone().zero_()
-		for n in range(num_se3-1,0,-1): # nSE3-1,...2,1
-			if self.rightToLeft:
-				A_g, B_g = self.backwardPair(temp.select(1,n), input.select(1,n), output.select(1,n-1)) # T'_n = T_n * T'_n-1
-				grad_input.select(1,n).copy_(A_g) # Finished for this transform
-				temp.select(1,n-1).add_(B_g)	  # Gradient w.r.t previous transform (added to it's grad_output)
-			else:
-				A_g, B_g = self.backwardPair(temp.select(1,n), output.select(1,n-1), input.select(1,n)) # T'_n = T'_n-1 * T_n
-				grad_input.select(1,n).copy_(B_g) # Finished for this transform
-				temp.select(1,n-1).add_(A_g)	  # Gradient w.r.t previous transform (added to it's grad_output)
+		grad_input = input.new(input.size())
+		# The gradient w.r.t the previous transform is written over its own grad_output (in-place), as that is not needed anymore
+		for n in range(input.size(1)-1,0,-1): # nSE3-1,...2,1
+			g = temp.select(1,n)
+			if rightToLeft: # T'_n = T_n * T'_n-1
+				rtops.compose_backward(input.select(1,n), output.select(1,n-1), g, grad_A=grad_input.select(1,n), grad_B=g)
+			else: # T'_n = T'_n-1 * T_n
+				rtops.compose_backward(output.select(1,n-1), input.select(1,n), g, grad_A=g, grad_B=grad_input.select(1,n))
+			temp.select(1,n-1).add_(g) # Gradient w.r.t previous transform (added to it's grad_output)
 		grad_input.select(1,0).copy_(temp.select(1,0))
 
 		return grad_input
 
+	########
+	#### Parallel prefix scan FWD/BWD pass
+
+	# Compose all pairs of transforms in A & B (B x N x 3 x 4): [rA * rB | rA * tB + tA]
+	# A & B are overlapping views of the same tensor, so this can't be done in-place
+	@staticmethod
+	def composePairs(A, B):
+		if rtops.has_func('ComposeRtPair_forward', A):
+			return rtops.compose(A, B);
+		return compose_rt_pair(A, B) # No kernel for this device
+
+	@staticmethod
+	def forwardScan(input, rightToLeft):
+		# After the step with distance d, T'_n is the composition of (upto) 2d transforms ending at T_n
+		num_se3 = input.size(1)
+		output = input.clone()
+		d = 1
+		while d < num_se3:
+			prev, curr = output.narrow(1,0,num_se3-d), output.narrow(1,d,num_se3-d)
+			if rightToLeft: # Append to left
+				curr.copy_(ComposeRtFunction.composePairs(curr, prev)) # T'_n = T'_n * T'_n-d
+			else: # Append to right
+				curr.copy_(ComposeRtFunction.composePairs(prev, curr)) # T'_n = T'_n-d * T'_n
+			d *= 2
+		return output
+
+	# Solves the recurrence h_n = g_n + h_n+1 * U_n^T (rightToLeft = False) or h_n = g_n + h_n+1 * U_n (rightToLeft = True),
+	# with h_N = 0, in homogeneous coordinates, where "g" (B x N x r x 4) & "U" (B x N x 3 x 4) are [R|t] transforms
+	# Each element is a linear map h -> b + h * A, composing two of them is: (b1, A1) o (b2, A2) = (b1 + b2 * A1, A2 * A1)
+	# where "A" is either U^T (it stays a transposed [R|t]) or U, so only the 3x4 part of A needs to be stored
+	@staticmethod
+	def reverseScan(g, U, rightToLeft):
+		num_se3 = g.size(1)
+		h = g.clone()
+		U = U.clone()
+		d = 1
+		while d < num_se3:
+			hn, Un = h.narrow(1,d,num_se3-d), U.narrow(1,0,num_se3-d)
+			if rightToLeft: # h * [R t; 0 1] = [h_r * R | h_r * t + h_t]
+				delta = torch.matmul(hn.narrow(-1,0,3), Un);
+				delta.narrow(-1,3,1).add_(hn.narrow(-1,3,1));
+			else: # h * [R t; 0 1]^T = [h * [R|t]^T | h_t]
+				delta = torch.cat([torch.matmul(hn, Un.transpose(-1,-2)), hn.narrow(-1,3,1)], -1)
+			h.narrow(1,0,num_se3-d).add_(delta)
+			if 2*d < num_se3: # A_n = A_n+d * A_n
+				Up, Uc = U.narrow(1,d,num_se3-d), U.narrow(1,0,num_se3-d)
+				if rightToLeft:
+					Uc.copy_(ComposeRtFunction.composePairs(Up, Uc))
+				else:
+					Uc.copy_(ComposeRtFunction.composePairs(Uc, Up))
+			d *= 2
+		return h
+
+	@staticmethod
+	def backwardScan(grad_output, input, output, rightToLeft):
+		# Gradient w.r.t T_n is a sum over all outputs T'_m (m >= n) that it is a part of:
+		#   rightToLeft = False, T'_m = T'_n-1 * T_n * (T_n+1 ... T_m): T_n_g = R'_n-1^T * h_n, h_n = g_n + h_n+1 * T_n+1^T
+		#   rightToLeft = True,  T'_m = (T_m ... T_n+1) * T_n * T'_n-1: T_n_g = [H_n * T'_n-1^T]_(0:3), H_n = G_n + T_n+1^T * H_n+1
+		# where G_n is the 4x4 gradient (3x4 with a zero row) & T'_0 = Id. We compute H_n^T with the same recurrence as h_n
+		batch_size, num_se3 = input.size(0), input.size(1)
+		iden = torch.eye(3, 4).type_as(input).view(1, 1, 3, 4).expand(batch_size, 1, 3, 4)
+		U = torch.cat([input.narrow(1,1,num_se3-1), iden], 1) # T_n+1 (with T_N+1 = Id, not used)
+		prev = torch.cat([iden, output.narrow(1,0,num_se3-1)], 1) # T'_n-1 (with T'_0 = Id)
+		if rightToLeft:
+			G = torch.cat([grad_output, grad_output.new_zeros(batch_size, num_se3, 1, 4)], 2).transpose(2,3) # G_n^T (4x4)
+			H = ComposeRtFunction.reverseScan(G, U, True).transpose(2,3).narrow(2,0,3) # Top 3 rows of H_n
+			return torch.cat([torch.matmul(H, prev.transpose(-1,-2)), H.narrow(-1,3,1)], -1) # H_n * [R t; 0 1]^T
+		else:
+			h = ComposeRtFunction.reverseScan(grad_output, U, False)
+			return torch.matmul(prev.narrow(-1,0,3).transpose(-1,-2), h) # R'_n-1^T * h_n
+
+	########
+	#### FWD/BWD pass
+	@staticmethod
+	def forward(ctx, input, rightToLeft=False, use_scan=None):
+		# Check dimensions
+		batch_size, num_se3, num_rows, num_cols = input.size()
+		assert (num_rows == 3 and num_cols == 4);
+
+		# Compute output
+		ctx.use_scan = input.is_cuda if (use_scan is None) else use_scan
+		if ctx.use_scan:
+			output = ComposeRtFunction.forwardScan(input, rightToLeft)
+		else:
+			output = ComposeRtFunction.forwardLoop(input, rightToLeft)
+		ctx.rightToLeft = rightToLeft
+		ctx.save_for_backward(input, output)
+		return output
+
+	@staticmethod
+	def backward(ctx, grad_output):
+		# Nothing to do if the input doesn't need a gradient
+		if not ctx.needs_input_grad[0]:
+			return None, None, None
+
+		# Get input and compute gradients
+		input, output = ctx.saved_tensors
+		grad_output = grad_output.contiguous()
+		if ctx.use_scan:
+			grad_input = ComposeRtFunction.backwardScan(grad_output, input, output, ctx.rightToLeft)
+		else:
+			grad_input = ComposeRtFunction.backwardLoop(grad_output, input, output, ctx.rightToLeft)
+		return grad_input, None, None
+
 ## FWD/BWD pass module
 class ComposeRt(Module):
-	def __init__(self, rightToLeft = False):
+	def __init__(self, rightToLeft = False, use_scan = None):
 		super(ComposeRt, self).__init__()
 		self.rightToLeft = rightToLeft
+		self.use_scan    = use_scan
 
+	@backend.float32
 	def forward(self, input):
-		return ComposeRtFunction(self.rightToLeft)(input)
\ No newline at end of file
+		if backend.use_reference():
+			return compose_rt(input, self.rightToLeft)
+		return ComposeRtFunction.apply(input, self.rightToLeft, self.use_scan)
\ No newline at end of file
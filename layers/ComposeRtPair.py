@@ -1,6 +1,8 @@
 import torch
 from torch.autograd import Function
 from torch.nn import Module
+import backend
+import rtops
 
 '''
 	--------------------- Compose multiple transformations ------------------------------
@@ -12,66 +14,44 @@ from torch.nn import Module
    resulting in a set of composed transforms T_n * T_n-1 (also of size B x N x 3 x 4). 
    Each 3D transform is a (3x4) matrix [R|t],
    where "R" is a (3x3) affine matrix and "t" is a translation (3x1).
+   compose_rt_pair(A, B) is a pure-tensor version of the layer (gradients through autograd, works for any number
+   of leading dims) which can be scripted/traced & graph compiled. The module uses it if backend.set_use_reference(True) is set.
 '''
 
+## Pure-tensor FWD pass (gradients through autograd)
+def compose_rt_pair(A, B):
+	# type: (Tensor, Tensor) -> Tensor
+	rA, tA = A.narrow(-1,0,3), A.narrow(-1,3,1)
+	rB, tB = B.narrow(-1,0,3), B.narrow(-1,3,1)
+	return torch.cat([torch.matmul(rA, rB), torch.matmul(rA, tB) + tA], -1) # [rA * rB | rA * tB + tA]
+
 ## FWD/BWD pass function
 class ComposeRtPairFunction(Function):
-	def forward(self, A, B):
+	@staticmethod
+	def forward(ctx, A, B):
 		# Check dimensions
 		batch_size, num_se3, num_rows, num_cols = A.size()
 		assert(num_rows == 3 and num_cols == 4);
 		assert(A.is_same_size(B));
 		
-		# Init for FWD pass
-		self.save_for_backward(A,B); # Save for BWD pass
-		Av = A.view(-1,3,4);
-		Bv = B.view(-1,3,4);
-		rA = Av.narrow(2,0,3);
-		rB = Bv.narrow(2,0,3);
-		tA = Av.narrow(2,3,1);
-		tB = Bv.narrow(2,3,1);
-
-		# Init output
-		output = A.new().resize_as_(A);
-		output.view(-1,3,4).narrow(2,0,3).copy_(torch.bmm(rA, rB));
-		output.view(-1,3,4).narrow(2,3,1).copy_(torch.baddbmm(tA, rA, tB));
-
-		# Return
-		return output;
-
-	def backward(self, grad_output):
-		# Get saved tensors & setup vars
-		A, B = self.saved_tensors
-		Av = A.view(-1, 3, 4);
-		Bv = B.view(-1, 3, 4);
-		rA = Av.narrow(2, 0, 3);
-		rB = Bv.narrow(2, 0, 3);
-		tA = Av.narrow(2, 3, 1);
-		tB = Bv.narrow(2, 3, 1);
-		r_g = grad_output.view(-1,3,4).narrow(2,0,3);
-		t_g = grad_output.view(-1,3,4).narrow(2,3,1);
-
-		# Initialize grad input
-		A_g = grad_output.new().resize_as_(grad_output);
-		B_g = grad_output.new().resize_as_(grad_output);
-
-		# Compute gradients w.r.t translations tA & tB
-		# t = rA * tB + tA
-		A_g.view(-1,3,4).narrow(2,3,1).copy_(t_g); # tA_g = t_g
-		B_g.view(-1,3,4).narrow(2,3,1).copy_(torch.bmm(rA.transpose(1,2), t_g)); # tB_g = rA ^ T * t_g
-
-		# Compute gradients w.r.t rotations rA & rB
-		# r = rA * rB
-		A_g.view(-1,3,4).narrow(2,0,3).copy_(torch.bmm(r_g, rB.transpose(1,2)).baddbmm_(t_g, tB.transpose(1,2))); # rA_g = r_g * rB ^ T + (t_g * tB ^ T)
-		B_g.view(-1,3,4).narrow(2,0,3).copy_(torch.bmm(rA.transpose(1,2), r_g)); # rB_g = rA ^ T * r_g (similar to translation grad, but with 3 column vectors)
+		# Compute output (fused kernel)
+		ctx.save_for_backward(A,B); # Save for BWD pass
+		return rtops.compose(A, B);
 
-		# Return
-		return A_g, B_g;
+	@staticmethod
+	def backward(ctx, grad_output):
+		# Get saved tensors & compute the grads (only the grads that are needed are computed)
+		# t = rA * tB + tA, r = rA * rB
+		A, B = ctx.saved_tensors
+		return rtops.compose_backward(A, B, grad_output, need_A=ctx.needs_input_grad[0], need_B=ctx.needs_input_grad[1]);
 
 ## FWD/BWD pass module
 class ComposeRtPair(Module):
 	def __init__(self):
 		super(ComposeRtPair, self).__init__()
 
+	@backend.float32
 	def forward(self, A, B):
-		return ComposeRtPairFunction()(A, B)
\ No newline at end of file
+		if backend.use_reference():
+			return compose_rt_pair(A, B)
+		return ComposeRtPairFunction.apply(A, B)
\ No newline at end of file
@@ -1,7 +1,8 @@
+import weakref
 import torch
 from torch.autograd import Function
 from torch.nn import Module
-from _ext import se3layers
+from backend import se3layers
 
 '''
 	Dense3DPointsToRenderedSubPixelDepth(fy,fx,cy,cx) :
@@ -19,68 +20,72 @@ from _ext import se3layers
       	Points with z = 0 are set to (X,Y,Z) = (0,0,0)
       	Points that are not visible are set to (X,Y,Z) = (0,0,0)
    	The parameters (fy,fx,cy,cx) are optional - they default to values for a 240 x 320 image
+   	NOTE: The module re-uses its (integer) index map across calls, unless the graph of the previous call still needs
+   	it for its BWD pass (a new index map is created then). The index map is saved for the BWD pass through ctx, so a
+   	BWD pass that runs after the index map was re-used (e.g. with retain_graph=True) raises an error in autograd
 '''
 
 ## FWD/BWD pass function
 class Dense3DPointsToRenderedSubPixelDepthFunction(Function):
-	def __init__(self,
-				 fy = 589.3664541825391 * 0.5,
-				 fx = 589.3664541825391 * 0.5,
-				 cy = 240.5 * 0.5,
-				 cx = 320.5 * 0.5):
-		# Declare params(default for a 240 x 320 image)
-		self.fy, self.fx, self.cy, self.cx = fy, fx, cy, cx
-		self.indexmap = None
-		assert (self.fy > 0 and self.fx > 0 and self.cy >= 0 and self.cx >= 0)
-
-	def forward(self, points):
-		# Check dimensions
+	@staticmethod
+	def forward(ctx, points,
+				fy = 589.3664541825391 * 0.5,
+				fx = 589.3664541825391 * 0.5,
+				cy = 240.5 * 0.5,
+				cx = 320.5 * 0.5,
+				indexmap = None):
+		# Check dimensions & params (default for a 240 x 320 image)
 		batch_size, num_channels, data_height, data_width = points.size()
 		assert (num_channels == 3);
-		assert (self.cx < data_width and self.cy < data_height)
+		assert (fy > 0 and fx > 0 and cy >= 0 and cx >= 0)
+		assert (cx < data_width and cy < data_height)
 
-		# Create output & temp data (3D)
-		output = points.new().resize_as_(points)
-		if not self.indexmap:
-			self.indexmap = points.new()
-		self.indexmap.resize_(batch_size,1,data_height,data_width) # 1-channel
+		# Create output & the index map (1-channel, re-sizing the given buffer is a no-op if the size is unchanged)
+		output = points.new_empty(points.size())
+		if indexmap is None:
+			indexmap = points.new_empty((batch_size,1,data_height,data_width), dtype=torch.long)
+		indexmap.resize_(batch_size,1,data_height,data_width)
 
 		# Run the FWD pass
 		if points.is_cuda:
-			se3layers.Project3DPointsToSubPixelDepth_forward_cuda(points, self.indexmap, output,
-																  self.fy, self.fx, self.cy, self.cx)
+			se3layers.Project3DPointsToSubPixelDepth_forward_cuda(points, indexmap, output, fy, fx, cy, cx)
 		elif points.type() == 'torch.DoubleTensor':
-			se3layers.Project3DPointsToSubPixelDepth_forward_double(points, self.indexmap, output,
-																  self.fy, self.fx, self.cy, self.cx)
+			se3layers.Project3DPointsToSubPixelDepth_forward_double(points, indexmap, output, fy, fx, cy, cx)
 		else:
-			se3layers.Project3DPointsToSubPixelDepth_forward_float(points, self.indexmap, output,
-																  self.fy, self.fx, self.cy, self.cx)
+			se3layers.Project3DPointsToSubPixelDepth_forward_float(points, indexmap, output, fy, fx, cy, cx)
+		ctx.intrinsics = (fy, fx, cy, cx)
+		ctx.save_for_backward(points, indexmap) # Save for BWD pass (autograd checks that the index map is unchanged)
 
 		# Return
-		self.save_for_backward(points)  # Save for BWD pass
 		return output
 
-	def backward(self, grad_output):
+	@staticmethod
+	def backward(ctx, grad_output):
+		# The module can re-use the index map after this (nothing to do if the input doesn't need a gradient)
+		ctx.bwd_done = True
+		if not ctx.needs_input_grad[0]:
+			return None, None, None, None, None, None
+
 		# Get saved tensors
-		points = self.saved_tensors[0]
+		points, indexmap = ctx.saved_tensors
 		assert (grad_output.is_same_size(points))
 
 		# Initialize grad input
-		grad_points = points.new().resize_as_(points)
+		grad_points = points.new_empty(points.size())
 
 		# Run the BWD pass
 		if grad_output.is_cuda:
-			se3layers.Project3DPointsToSubPixelDepth_backward_cuda(points, self.indexmap, grad_points, grad_output,
-																  self.fy, self.fx, self.cy, self.cx)
+			se3layers.Project3DPointsToSubPixelDepth_backward_cuda(points, indexmap, grad_points, grad_output,
+																   *ctx.intrinsics)
 		elif grad_output.type() == 'torch.DoubleTensor':
-			se3layers.Project3DPointsToSubPixelDepth_backward_double(points, self.indexmap, grad_points, grad_output,
-																  self.fy, self.fx, self.cy, self.cx)
+			se3layers.Project3DPointsToSubPixelDepth_backward_double(points, indexmap, grad_points, grad_output,
+																	 *ctx.intrinsics)
 		else:
-			se3layers.Project3DPointsToSubPixelDepth_backward_float(points, self.indexmap, grad_points, grad_output,
-																  self.fy, self.fx, self.cy, self.cx)
+			se3layers.Project3DPointsToSubPixelDepth_backward_float(points, indexmap, grad_points, grad_output,
+																	*ctx.intrinsics)
 
 		# Return
-		return grad_points
+		return grad_points, None, None, None, None, None
 
 ## FWD/BWD pass module
 class Dense3DPointsToRenderedSubPixelDepth(Module):
@@ -91,7 +96,19 @@ class Dense3DPointsToRenderedSubPixelDepth(Module):
 				 cx=320.5 * 0.5):
 		super(Dense3DPointsToRenderedSubPixelDepth, self).__init__()
 		self.fy, self.fx, self.cy, self.cx = fy, fx, cy, cx
+		self.indexmap = None # Re-used across calls
+		self.indexmap_user = None # Weak ref to the BWD node (ctx) of the last call that saved the index map
 		assert (self.fy > 0 and self.fx > 0 and self.cy >= 0 and self.cx >= 0)
 
+	# The graph of the last call is alive & its BWD pass hasn't run yet
+	def indexmap_in_use(self):
+		user = self.indexmap_user() if (self.indexmap_user is not None) else None
+		return (user is not None) and not getattr(user, 'bwd_done', False)
+
 	def forward(self, points):
-		return Dense3DPointsToRenderedSubPixelDepthFunction(self.fy, self.fx, self.cy, self.cx)(points)
+		if (self.indexmap is None) or (self.indexmap.device != points.device) or self.indexmap_in_use():
+			self.indexmap = points.new_empty(0, dtype=torch.long)
+		output = Dense3DPointsToRenderedSubPixelDepthFunction.apply(points, self.fy, self.fx, self.cy, self.cx,
+																	self.indexmap)
+		self.indexmap_user = weakref.ref(output.grad_fn) if (output.grad_fn is not None) else None
+		return output
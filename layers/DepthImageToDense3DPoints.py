@@ -1,6 +1,6 @@
-import torch
 from torch.autograd import Function
 from torch.nn import Module
+import gridcache
 
 '''
    DepthImageToDense3DPoints(height,width,fy,fx,cy,cx) :
@@ -22,53 +22,36 @@ from torch.nn import Module
 
 ## FWD/BWD pass function
 class DepthImageToDense3DPointsFunction(Function):
-	def __init__(self, height, width, base_grid,
-				 fy = 589.3664541825391 * 0.5,
-				 fx = 589.3664541825391 * 0.5,
-				 cy = 240.5 * 0.5,
-				 cx = 320.5 * 0.5):
-		# Image dimensions
-		assert (height > 1 and width > 1)
-		self.height    = height
-		self.width 	   = width
-		self.base_grid = base_grid
-
-		# Declare params(default for a 240 x 320 image)
-		self.fx = fx
-		self.fy = fy
-		self.cx = cx
-		self.cy = cy
-		assert (self.fx > 0 and self.fy > 0 and
-				self.cx >= 0 and self.cx < self.width and
-				self.cy >= 0 and self.cy < self.height)
-
-	def forward(self, depth):
+	@staticmethod
+	def forward(ctx, depth, base_grid):
 		# Check dimensions (B x 1 x H x W)
 		batch_size, num_channels, num_rows, num_cols = depth.size()
 		assert(num_channels == 1)
-		assert(num_rows == self.height)
-		assert(num_cols == self.width)
+		assert(num_rows == base_grid.size(2))
+		assert(num_cols == base_grid.size(3))
 
 		# Compute output = (x, y, depth)
 		output = depth.new().resize_(batch_size,3,num_rows,num_cols)
 		xy, z = output.narrow(1,0,2), output.narrow(1,2,1)
 		z.copy_(depth) # z = depth
-		xy.copy_(depth.expand_as(xy) * self.base_grid.narrow(1,0,2).expand_as(xy)) # [x*z, y*z, z]
+		xy.copy_(depth.expand_as(xy) * base_grid.narrow(1,0,2).expand_as(xy)) # [x*z, y*z, z]
+		ctx.base_grid = base_grid # Constant (from the grid cache), no need to save it for backward
 
 		# Return
 		return output
 
-	def backward(self, grad_output):
+	@staticmethod
+	def backward(ctx, grad_output):
 		# Get saved tensors & check dimensions
-		_, _, num_rows, num_cols = self.base_grid.size()
+		_, _, num_rows, num_cols = ctx.base_grid.size()
 		assert((grad_output.size(2) == num_rows) and (grad_output.size(3) == num_cols));
 
 		# Compute grad input
 		# g_z = x * go_x + y * go_y + go_z
-		grad_input = (self.base_grid.expand_as(grad_output) * grad_output).sum(1)
+		grad_input = (ctx.base_grid.expand_as(grad_output) * grad_output).sum(1, keepdim=True)
 
 		# Return
-		return grad_input
+		return grad_input, None
 
 ## FWD/BWD pass module
 class DepthImageToDense3DPoints(Module):
@@ -83,7 +66,6 @@ class DepthImageToDense3DPoints(Module):
 		assert(height > 1 and width > 1)
 		self.height = height
 		self.width  = width
-		self.base_grid = None
 
 		# Declare params(default for a 240 x 320 image)
 		self.fx = fx
@@ -95,15 +77,10 @@ class DepthImageToDense3DPoints(Module):
 				self.cy >= 0 and self.cy < self.height)
 
 	def forward(self, input):
-		# Generate basegrid only once
-		# TODO: This explicitly assumes that a "Variable" is passed in. Will fail if a tensor is passed in
-		if self.base_grid is None:
-			self.base_grid = torch.ones(1,3,self.height,self.width).type_as(input.data)  # (x,y,1)
-			for j in xrange(0, self.width):  # +x is increasing columns
-				self.base_grid[:, 0, :, j].fill_((j - self.cx) / self.fx)
-			for i in xrange(0, self.height):  # +y is increasing rows
-				self.base_grid[:, 1, i, :].fill_((i - self.cy) / self.fy)
+		# Get the (x,y,1) grid from the process-wide cache (shared with the loaders & other layers)
+		intrinsics = {'fx': self.fx, 'fy': self.fy, 'cx': self.cx, 'cy': self.cy}
+		base_grid  = gridcache.camera_xyzgrid(self.height, self.width, intrinsics, input.dtype, input.device)
 
 		# Run the rest of the FWD pass
-		return DepthImageToDense3DPointsFunction(self.height, self.width, self.base_grid,
-												 self.fy, self.fx, self.cy, self.cx)(input)
\ No newline at end of file
+		assert(input.size(2) == self.height and input.size(3) == self.width)
+		return DepthImageToDense3DPointsFunction.apply(input, base_grid)
\ No newline at end of file
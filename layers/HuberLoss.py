@@ -1,10 +1,25 @@
 import torch
-from torch.autograd import Function
 from torch.nn import Module
+import backend
 
 '''
    --------------------- Huber loss ------------------------------
+   huber_loss(input, target, size_average, delta) is the loss as a plain function which can be
+   scripted/traced & graph compiled (the module uses it, there is no custom BWD pass).
 '''
+
+## Loss function (gradients through autograd)
+def huber_loss(input, target, size_average, delta):
+	# type: (Tensor, Tensor, bool, float) -> Tensor
+	# Compute loss
+	absDiff = (input - target).abs()
+	minDiff = torch.clamp(absDiff, max=delta)  # cmin
+	output = 0.5 * (minDiff * (2 * absDiff - minDiff)).sum()
+	if size_average:
+		output = output * (1.0 / input.numel())
+
+	# Return
+	return output
 '''
 ## FWD/BWD pass function
 class HuberLossFunction(Function):
@@ -45,13 +60,6 @@ class HuberLoss(Module):
 		self.delta		  = delta
 		assert(delta >= 0);
 
+	@backend.float32
 	def forward(self, input, target):
-		# Compute loss
-		absDiff = (input - target).abs()
-		minDiff = torch.clamp(absDiff, max=self.delta)  # cmin
-		output = 0.5 * (minDiff * (2 * absDiff - minDiff)).sum()
-		if self.size_average:
-			output *= (1.0 / input.nelement())
-
-		# Return
-		return output
+		return huber_loss(input, target, self.size_average, self.delta)
@@ -0,0 +1,124 @@
+import torch
+from torch.autograd import Function
+from torch.nn import Module
+import backend
+from rtops import get_func, has_func
+
+'''
+   --------------------- Fused masked losses for dense 3D points/flows ------------------------------
+   MaskedLoss3D(loss_type, motion_norm, motion_thresh, size_average, sigma_scale, sigma_offset, sigma_min) :
+   MaskedLoss3D.forward(input, target, wts=None, motion=None)
+
+   Computes the losses used for the 3D point/flow errors (ctrlnets.Loss3D & ctrlnets.MotionNormalizedLoss3D) in a
+   single pass over the data. Input/target are B x C x N x M, the (optional) weights are B x 1 x N x M. For a point with
+   values (x, y), weight "w" & d = x - y, the loss is:
+		mse           : 0.5 * sum_c (w * d_c)^2
+		abs           : sum_c |w * d_c|
+		normmsesqrt   : 0.5 * sum_c (w * d_c)^2 / sigma_c, sigma_c = max(sigma_scale * |y_c| + sigma_offset, sigma_min)
+		normmsesqrtpt : 0.5 * sum_c (w * d_c)^2 / sigma,   sigma   = max(sigma_scale * ||y||_2 + sigma_offset, sigma_min)
+	The kernels (se3layers_aten.cpp & cuda/loss3d_kernel.cu) compute the per-batch sums of the loss, the weights
+	& the weights of the points that move (sum_c |motion_c| > motion_thresh). The BWD pass computes the grads w.r.t the
+	input & target directly from the inputs, so there are no per-element temporaries in either pass. The sums are
+	then normalized:
+		motion_norm  : mean_b (loss_b / max(#moving points_b, 100))
+		size_average : sum_b loss_b / (C * sum of the weights) (or the number of elements if there are no weights)
+   There are no grads w.r.t the weights & the motion. masked_loss_3d_sums(...) is a pure-tensor version of the kernels
+   (gradients through autograd), the module uses it if backend.set_use_reference(True) is set or if there are no
+   kernels for the device of the input (e.g. CUDA inputs with an extension built without CUDA).
+'''
+
+# Loss types (same order as in se3layers_aten.cpp & cuda/loss3d_kernel.cu)
+LOSS_TYPES = ['mse', 'abs', 'normmsesqrt', 'normmsesqrtpt']
+
+## Per-batch sums of the loss, the weights & the moving points (gradients through autograd)
+def masked_loss_3d_sums(input, target, wts=None, motion=None, loss_type='mse', motion_thresh=2.5e-3,
+						sigma_scale=0.5, sigma_offset=0.0, sigma_min=2e-3):
+	bsz = input.size(0)
+	weights = wts if wts is not None else input.new_ones(bsz, 1, input.size(2), input.size(3))
+	diff = (input - target) * weights
+	if loss_type == 'mse':
+		loss = 0.5 * diff.pow(2)
+	elif loss_type == 'abs':
+		loss = diff.abs()
+	elif loss_type == 'normmsesqrt':
+		loss = 0.5 * diff.pow(2) / (sigma_scale * target.abs() + sigma_offset).clamp(min=sigma_min)
+	else:
+		assert (loss_type == 'normmsesqrtpt'), "Unknown loss type: " + loss_type
+		sigma = (sigma_scale * target.norm(2, 1, keepdim=True) + sigma_offset).clamp(min=sigma_min)
+		loss = 0.5 * diff.pow(2) / sigma
+	loss_sums = loss.reshape(bsz, -1).sum(1)
+	wt_sums = weights.detach().reshape(bsz, -1).sum(1)
+	if motion is not None:
+		moving = (motion.detach().abs().sum(1, keepdim=True) > motion_thresh).type_as(input)
+		motion_sums = (moving * weights.detach()).reshape(bsz, -1).sum(1)
+	else:
+		motion_sums = torch.zeros_like(wt_sums)
+	return loss_sums, wt_sums, motion_sums
+
+## FWD/BWD pass function
+class MaskedLoss3DFunction(Function):
+	@staticmethod
+	def forward(ctx, input, target, wts, motion, loss_type, motion_thresh, sigma_params):
+		# Check dimensions
+		assert (input.dim() == 4 and input.is_same_size(target)), "Input & target have to be B x C x N x M"
+		assert (wts is None or wts.size() == torch.Size([input.size(0), 1, input.size(2), input.size(3)])), \
+			"Weights have to be B x 1 x N x M"
+		assert (motion is None or motion.is_same_size(input)), "Motion has to be the same size as the input"
+
+		# Compute the per-batch sums
+		loss_sums, wt_sums, motion_sums = input.new(), input.new(), input.new()
+		ctx.loss_type, ctx.sigma_params = LOSS_TYPES.index(loss_type), sigma_params
+		get_func('Loss3D_forward', input)(input, target, wts if wts is not None else input.new(),
+										  motion if motion is not None else input.new(),
+										  loss_sums, wt_sums, motion_sums, ctx.loss_type, wts is not None,
+										  motion is not None, motion_thresh, *sigma_params)
+		ctx.save_for_backward(input, target, wts)
+		ctx.mark_non_differentiable(wt_sums, motion_sums)
+		return loss_sums, wt_sums, motion_sums
+
+	@staticmethod
+	def backward(ctx, grad_loss_sums, grad_wt_sums, grad_motion_sums):
+		# Compute the grads that are needed
+		input, target, wts = ctx.saved_tensors
+		need_input, need_target = ctx.needs_input_grad[0], ctx.needs_input_grad[1]
+		grad_input, grad_target = None, None
+		if need_input or need_target:
+			grad_input, grad_target = input.new(), target.new()
+			get_func('Loss3D_backward', input)(input, target, wts if wts is not None else input.new(),
+											   grad_input, grad_target, grad_loss_sums.contiguous(), ctx.loss_type,
+											   wts is not None, need_input, need_target, *ctx.sigma_params)
+		return (grad_input if need_input else None), (grad_target if need_target else None), \
+			   None, None, None, None, None
+
+## FWD/BWD pass module
+class MaskedLoss3D(Module):
+	def __init__(self, loss_type='mse', motion_norm=False, motion_thresh=2.5e-3, size_average=True,
+				 sigma_scale=0.5, sigma_offset=0.0, sigma_min=2e-3):
+		super(MaskedLoss3D, self).__init__()
+		assert (loss_type in LOSS_TYPES), "Unknown loss type: " + loss_type
+		self.loss_type     = loss_type
+		self.motion_norm   = motion_norm
+		self.motion_thresh = motion_thresh
+		self.size_average  = size_average
+		self.sigma_params  = (sigma_scale, sigma_offset, sigma_min)
+
+	@backend.float32
+	def forward(self, input, target, wts=None, motion=None):
+		# Per-batch sums
+		assert (not self.motion_norm or motion is not None), "Motion is needed for the motion normalized loss"
+		motion = motion if self.motion_norm else None
+		if backend.use_reference() or not has_func('Loss3D_forward', input):
+			loss_sums, wt_sums, motion_sums = masked_loss_3d_sums(input, target, wts, motion, self.loss_type,
+																  self.motion_thresh, *self.sigma_params)
+		else:
+			loss_sums, wt_sums, motion_sums = MaskedLoss3DFunction.apply(input, target, wts, motion, self.loss_type,
+																		 self.motion_thresh, self.sigma_params)
+
+		# Normalize
+		if self.motion_norm:
+			return (loss_sums / motion_sums.clamp(min=100)).mean()  # Clamp takes care of numerical instabilities & acts as margin
+		loss = loss_sums.sum()
+		if self.size_average:
+			npts = (wt_sums.sum() * input.size(1)) if wts is not None else input.numel()  # Normalize by visibility mask
+			loss = loss / npts
+		return loss
@@ -1,7 +1,9 @@
 import torch
+import torch.nn.functional as F
 from torch.autograd import Function
 from torch.nn import Module
-from _ext import se3layers
+import backend
+from backend import se3layers
 
 '''
 	--------------------- Non-Rigidly deform the input point cloud by transforming and blending across multiple SE3s ------------------------------
@@ -16,20 +18,46 @@ from _ext import se3layers
 	Each 3D transform is a (3x4) matrix [R|t], where "R" is a (3x3) affine matrix and "t" is the translation (3x1).
 	Note: The mask values have to sum to 1.0
 		sum(mask,2) = 1
+	The masks can be at a lower resolution than the points (B x k x n x m, n <= N & m <= M, e.g. predicted at 1/2 or
+	1/4 of the image resolution). These are bilinearly upsampled to N x M inside the layer (upsample_masks, same as
+	F.interpolate(mode='bilinear', align_corners=False), which keeps the sum of the masks at 1). The CPU kernels do
+	this on the fly without creating the full-resolution masks. The CUDA kernels need full-resolution masks, so for
+	CUDA inputs the module upsamples the masks first (gradients through autograd). The gradients w.r.t the masks are
+	at the resolution of the masks.
+	ntfm3d(points, masks, transforms) is a pure-tensor version of the layer (gradients through autograd, as with
+	use_mask_gradmag = True) which can be scripted/traced & graph compiled. The module uses it if backend.set_use_reference(True) is set.
 '''
 
+## Bilinearly upsample the masks to the resolution of the points (no-op if these are the same)
+def upsample_masks(masks, height, width):
+	# type: (Tensor, int, int) -> Tensor
+	if masks.size(2) == height and masks.size(3) == width:
+		return masks
+	return F.interpolate(masks, size=(height, width), mode='bilinear', align_corners=False)
+
+## Pure-tensor FWD pass (gradients through autograd)
+def ntfm3d(points, masks, transforms):
+	# type: (Tensor, Tensor, Tensor) -> Tensor
+	batch_size, num_se3 = masks.size(0), masks.size(1)
+	data_height, data_width = points.size(2), points.size(3)
+	masks = upsample_masks(masks, data_height, data_width)
+	pts = points.contiguous().view(batch_size, 1, 3, -1) # B x 1 x 3 x N
+	tfmpts = torch.matmul(transforms.narrow(3,0,3), pts) + transforms.narrow(3,3,1) # B x k x 3 x N => R_k * x + t_k
+	wts = masks.contiguous().view(batch_size, num_se3, 1, -1) # B x k x 1 x N
+	return (wts * tfmpts).sum(1).view(batch_size, 3, data_height, data_width)
+
 ## FWD/BWD pass function
 class NTfm3DFunction(Function):
-	def __init__(self, use_mask_gradmag=True):
-		super(NTfm3DFunction, self).__init__()
-		self.use_mask_gradmag = use_mask_gradmag  # Default this is true
-
-	def forward(self, points, masks, transforms):
+	@staticmethod
+	def forward(ctx, points, masks, transforms, use_mask_gradmag=True):
 		# Check dimensions
 		batch_size, num_channels, data_height, data_width = points.size()
 		num_se3 = masks.size()[1]
 		assert(num_channels == 3)
-		assert(masks.size() == torch.Size([batch_size, num_se3, data_height, data_width]))
+		assert(masks.size()[:2] == torch.Size([batch_size, num_se3]))
+		assert(masks.size(2) <= data_height and masks.size(3) <= data_width) # Upsampled in the CPU kernels if smaller
+		assert(not points.is_cuda or masks.size()[2:] == points.size()[2:]), \
+			"The CUDA kernels need masks at the resolution of the points (upsample them with upsample_masks)"
 		assert(transforms.size() == torch.Size([batch_size, num_se3, 3, 4])) # Transforms [R|t]
 
 		# Create output (or reshape)
@@ -42,37 +70,43 @@ class NTfm3DFunction(Function):
 			se3layers.NTfm3D_forward_double(points, masks, transforms, output)
 		else:
 			se3layers.NTfm3D_forward_float(points, masks, transforms, output)
-		self.save_for_backward(points, masks, transforms, output) # Save for BWD pass
+		ctx.use_mask_gradmag = use_mask_gradmag  # Default this is true
+		ctx.save_for_backward(points, masks, transforms, output) # Save for BWD pass
 
 		# Return
 		return output
 
-	def backward(self, grad_output):
+	@staticmethod
+	def backward(ctx, grad_output):
 		# Get saved tensors
-		points, masks, transforms, output = self.saved_tensors
+		points, masks, transforms, output = ctx.saved_tensors
 		assert(grad_output.is_same_size(output))
 
-		# Initialize grad input
-		grad_points 	= points.new_zeros(*points.size())
-		grad_masks      = masks.new_zeros(*masks.size())
-		grad_transforms = transforms.new_zeros(*transforms.size())
+		# Initialize grad input (only the grads that are needed are computed, the rest are not used)
+		need_points, need_masks, need_transforms = ctx.needs_input_grad[:3]
+		grad_points 	= points.new_zeros(*points.size()) if need_points else points.new()
+		grad_masks      = masks.new_zeros(*masks.size()) if need_masks else masks.new()
+		grad_transforms = transforms.new_zeros(*transforms.size()) if need_transforms else transforms.new()
+		flags = (int(need_points), int(need_masks), int(need_transforms))
 
 		# Run the BWD pass
 		if grad_output.is_cuda:
 			se3layers.NTfm3D_backward_cuda(points, masks, transforms, output,
 										   grad_points, grad_masks, grad_transforms, grad_output,
-										   self.use_mask_gradmag)
+										   ctx.use_mask_gradmag, *flags)
 		elif grad_output.type() == 'torch.DoubleTensor':
 			se3layers.NTfm3D_backward_double(points, masks, transforms, output,
 											 grad_points, grad_masks, grad_transforms, grad_output,
-											 self.use_mask_gradmag)
+											 ctx.use_mask_gradmag, *flags)
 		else:
 			se3layers.NTfm3D_backward_float(points, masks, transforms, output,
 											grad_points, grad_masks, grad_transforms, grad_output,
-											self.use_mask_gradmag)
+											ctx.use_mask_gradmag, *flags)
 
 		# Return
-		return grad_points, grad_masks, grad_transforms
+		return (grad_points if need_points else None,
+				grad_masks if need_masks else None,
+				grad_transforms if need_transforms else None, None)
 
 ## FWD/BWD pass module
 class NTfm3D(Module):
@@ -80,5 +114,10 @@ class NTfm3D(Module):
 		super(NTfm3D, self).__init__()
 		self.use_mask_gradmag = use_mask_gradmag  # Default this is true
 
+	@backend.float32
 	def forward(self, points, masks, transforms):
-		return NTfm3DFunction(use_mask_gradmag=self.use_mask_gradmag)(points, masks, transforms)
+		if backend.use_reference():
+			return ntfm3d(points, masks, transforms)
+		if points.is_cuda: # The CUDA kernels don't upsample the masks
+			masks = upsample_masks(masks, points.size(2), points.size(3))
+		return NTfm3DFunction.apply(points, masks, transforms, self.use_mask_gradmag)
@@ -1,61 +1,64 @@
 import torch
 from torch.autograd import Function
 from torch.nn import Module
+import backend
 
 '''
 From: https://github.com/willwhitney/understanding-visual-concepts/blob/master/Noise.lua
 Adds gaussian noise to the inputs during training, leaves inputs unchanged during testing
 Gradients are passed back as is
+add_noise(input, std) is a pure-tensor version of the layer (gradients through autograd) which can be
+scripted/traced & graph compiled. The module uses it if backend.set_use_reference(True) is set.
 '''
 
+## Pure-tensor FWD pass (gradients through autograd)
+def add_noise(input, std):
+	# type: (Tensor, float) -> Tensor
+	if std == 0:
+		return input # no noise
+	return input + torch.randn_like(input) * std # Gaussian noise with 0-mean, std-standard deviation
+
 ## FWD/BWD pass function
 class NoiseFunction(Function):
-	def __init__(self, max_std, slope_std, iter_count, start_iter, training):
-		assert (max_std >= 0 and slope_std >= 0 and start_iter >= 0);
-		assert (iter_count.nelement() == 1);
-		self.max_std	= max_std
-		self.slope_std	= slope_std
-		self.iter_count = iter_count
-		self.start_iter = start_iter
-		self.training	= training
-
-	def get_std(self):
-		iter = 1 + (self.iter_count[0] - self.start_iter)
-		if (iter > 0) :
-			return min((iter/125000)*self.slope_std, self.max_std)
+	@staticmethod
+	def forward(ctx, input, std):
+		noise = input.new(input.size())
+		if std == 0:
+			noise.fill_(0) # no noise
 		else:
-			return 0
-
-	def forward(self, input):
-		std = self.get_std()
-		if self.training:
-			noise = input.new().resize_as_(input)
-			if std == 0:
-				noise.fill_(0) # no noise
-			else:
-				noise.normal_(0, std) # Gaussian noise with 0-mean, std-standard deviation
-			output = input + noise
-		else:
-			output = input
+			noise.normal_(0, std) # Gaussian noise with 0-mean, std-standard deviation
+		output = input + noise
 
 		# Return
 		return output
 
-	def backward(self, grad_output):
-		return grad_output.clone()
+	@staticmethod
+	def backward(ctx, grad_output):
+		return grad_output.clone(), None
 
 
 ## FWD/BWD pass module
 class Noise(Module):
 	def __init__(self, max_std, slope_std, iter_count, start_iter):
 		super(Noise, self).__init__()
-		assert(max_std >= 0 and slope_std >= 0);
+		assert(max_std >= 0 and slope_std >= 0 and start_iter >= 0);
 		assert(iter_count.nelement() == 1);
 		self.max_std	= max_std
 		self.slope_std	= slope_std
 		self.iter_count = iter_count
 		self.start_iter = start_iter
 
+	def get_std(self):
+		iter = 1 + (self.iter_count[0] - self.start_iter)
+		if (iter > 0) :
+			return min((iter/125000)*self.slope_std, self.max_std)
+		else:
+			return 0
+
 	def forward(self, input):
-		return NoiseFunction(self.max_std, self.slope_std,
-					 		 self.iter_count, self.start_iter, self.training)(input)
\ No newline at end of file
+		if not self.training:
+			return input
+		std = float(self.get_std())
+		if backend.use_reference():
+			return add_noise(input, std)
+		return NoiseFunction.apply(input, std)
@@ -1,4 +1,5 @@
 from torch.nn import Module
+import backend
 
 """Performs :math:`L_p` normalization of inputs over specified dimension.
     Does:
@@ -26,5 +27,6 @@ class Normalize(Module):
         super(Normalize, self).__init__()
         self.p, self.dim, self.eps = p, dim, eps
 
+    @backend.float32
     def forward(self, input):
         return input / input.norm(self.p, self.dim).clamp(min=self.eps).expand_as(input)
\ No newline at end of file
@@ -1,6 +1,7 @@
-import torch
-from torch.autograd import Function
 from torch.nn import Module
+import backend
+from MaskedLoss3D import MaskedLoss3D
+from rtops import has_func
 
 '''
    --------------------- Normalized MSE loss ------------------------------
@@ -14,7 +15,25 @@ from torch.nn import Module
 	where scale is a user-set parameter, with a default value of 0.5 & defsigma is also a user set parameter (default: 0.005) 
 	to reduce numerical instabilities. In effect, we try to normalize the loss to be scale invariant. 
 	NOTE: This loss will only work if the input and target values are approx. zero mean
+	The module computes the loss in a single pass over the data with the fused MaskedLoss3D kernels (the tensors are
+	viewed as 1 x 1 x 1 x N, sigma is not clamped) if these are available for the device of the input.
+	normalized_mse_sqrt_loss(input, target, size_average, scale, defsigma) is the loss as a plain function which can be
+	scripted/traced & graph compiled (the module uses it if backend.set_use_reference(True) is set or if there are
+	no kernels for the device).
 '''
+## Loss function (gradients through autograd)
+def normalized_mse_sqrt_loss(input, target, size_average, scale=0.5, defsigma=0.005):
+	# type: (Tensor, Tensor, bool, float, float) -> Tensor
+	# Compute loss
+	sigma    = (scale * target.abs()) + defsigma # sigma	= scale * abs(target)  + defsigma
+	residual = (input - target).pow(2)	# res = (x - mu)^2
+	output   = 0.5 * (residual / sigma).sum() # -- SUM [ 0.5 * ((x-mu)^2/sigma) ]
+	if size_average:
+		output = output * (1.0 / input.numel())
+
+	# Return
+	return output
+
 ## FWD/BWD pass module
 class NormalizedMSESqrtLoss(Module):
 	def __init__(self, size_average, scale=0.5, defsigma=0.005):
@@ -22,14 +41,11 @@ class NormalizedMSESqrtLoss(Module):
 		self.size_average = size_average
 		self.scale		  = scale
 		self.defsigma	  = defsigma
+		self.fused		  = MaskedLoss3D('normmsesqrt', size_average=size_average,
+										 sigma_scale=scale, sigma_offset=defsigma, sigma_min=0)
 
+	@backend.float32
 	def forward(self, input, target):
-		# Compute loss
-		sigma    = (self.scale * target.abs()) + self.defsigma # sigma	= scale * abs(target)  + defsigma
-		residual = (input - target).pow(2)	# res = (x - mu)^2
-		output   = 0.5 * (residual / sigma).sum() # -- SUM [ 0.5 * ((x-mu)^2/sigma) ]
-		if self.size_average:
-			output *= (1.0 / input.nelement())
-
-		# Return
-		return output
\ No newline at end of file
+		if backend.use_reference() or not has_func('Loss3D_forward', input):
+			return normalized_mse_sqrt_loss(input, target, self.size_average, self.scale, self.defsigma)
+		return self.fused(input.reshape(1, 1, 1, -1), target.reshape(1, 1, 1, -1))
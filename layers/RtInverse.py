@@ -1,6 +1,8 @@
 import torch
 from torch.autograd import Function
 from torch.nn import Module
+import backend
+import rtops
 
 '''
 	--------------------- Invert transformations of type R|t ------------------------------
@@ -10,49 +12,38 @@ from torch.nn import Module
 
    Inverts the transform: Given [R|t], returns [R^T | -R^T*t]
    Size of inputs/outputs: (B x k x 3 x 4)
+   rt_inverse(input) is a pure-tensor version of the layer (gradients through autograd) which can be
+   scripted/traced & graph compiled. The module uses it if backend.set_use_reference(True) is set.
 '''
 
+## Pure-tensor FWD pass (gradients through autograd)
+def rt_inverse(input):
+	# type: (Tensor) -> Tensor
+	rT = input.narrow(-1,0,3).transpose(-1,-2)
+	t = input.narrow(-1,3,1)
+	return torch.cat([rT, -torch.matmul(rT, t)], -1) # [r^T | -r^T * t]
+
 ## FWD/BWD pass function
 class RtInverseFunction(Function):
-	def forward(self, input):
+	@staticmethod
+	def forward(ctx, input):
 		# Check dimensions
 		_, _, num_rows, num_cols = input.size()
 		assert (num_rows == 3 and num_cols == 4);
 
-		# Init for FWD pass
-		self.save_for_backward(input)
-		input_v = input.view(-1, 3, 4);
-		r = input_v.narrow(2, 0, 3);
-		t = input_v.narrow(2, 3, 1);
-
-		# Compute output = [r^T -r^T * t]
-		output = input.new().resize_as_(input);
-		output.narrow(3, 0, 3).copy_(r.transpose(1,2)); # r^T
-		output.narrow(3, 3, 1).copy_(torch.bmm(r.transpose(1,2), t).mul_(-1)); # -r^T * t
-
-		# Return
-		return output;
-
-	def backward(self, grad_output):
-		# Get saved tensors & setup vars
-		input = self.saved_tensors[0]
-		input_v = input.view(-1, 3, 4);
-		r = input_v.narrow(2, 0, 3);
-		t = input_v.narrow(2, 3, 1);
-		ro_g = grad_output.contiguous().view(-1, 3, 4).narrow(2, 0, 3);
-		to_g = grad_output.contiguous().view(-1, 3, 4).narrow(2, 3, 1);
-
-		# Initialize grad input
-		input_g = input.new().resize_as_(input);
-
-		# Grad "R"
-		input_g.narrow(3,0,3).copy_(torch.bmm(t, to_g.transpose(1,2)).mul_(-1)).add_(ro_g.transpose(1,2)); # r_g = ro_g ^ T - (t * to_g^T)
+		# Compute output = [r^T -r^T * t] (fused kernel)
+		ctx.save_for_backward(input)
+		return rtops.inverse(input);
 
-		# Grad "t"
-		input_g.narrow(3,3,1).copy_(torch.bmm(r, to_g).mul_(-1)); # t_g = -r * to_g
+	@staticmethod
+	def backward(ctx, grad_output):
+		# Nothing to do if the input doesn't need a gradient
+		if not ctx.needs_input_grad[0]:
+			return None
 
-		# Return
-		return input_g;
+		# r_g = ro_g ^ T - (t * to_g^T), t_g = -r * to_g
+		input = ctx.saved_tensors[0]
+		return rtops.inverse_backward(input, grad_output);
 
 
 ## FWD/BWD pass module
@@ -60,5 +51,8 @@ class RtInverse(Module):
 	def __init__(self):
 		super(RtInverse, self).__init__()
 
+	@backend.float32
 	def forward(self, input):
-		return RtInverseFunction()(input)
+		if backend.use_reference():
+			return rt_inverse(input)
+		return RtInverseFunction.apply(input)
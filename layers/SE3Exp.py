@@ -0,0 +1,215 @@
+import torch
+from torch.autograd import Function
+from torch.nn import Module
+import backend
+
+'''
+   --------------------- Exponential & log maps of SE(3)/SO(3) ------------------------------
+   SE3Exp(full) :
+   SE3Exp.forward(input)
+   SE3Exp.backward(grad_output)
+
+   SE3Exp takes [batchSize x nSE3 x 6] se(3) parameters [u, w] = [tx,ty,tz,r1,r2,r3] and converts them to [B x N x 3 x 4]
+	transforms [R|t] using the exponential map:
+		R = I + A * K + B * K^2
+		t = V * u, where V = I + B * K + C * K^2 (if full is set, else t = u)
+	where K is the skew-symmetric matrix of the (un-normalized) axis w, theta = ||w||_2 is the angle of rotation and:
+		A = sin(theta)/theta, B = (1 - cos(theta))/theta^2, C = (theta - sin(theta))/theta^3
+	From Eqns: 77-84 (PAGE: 10) of http://ethaneade.com/lie.pdf
+	The FWD pass computes A, B, C (& their derivatives w.r.t theta^2), K and K^2 once & saves them for the BWD pass, which
+	is analytic. For small angles (theta^2 < SMALL_ANGLE2), the coefficients are computed from their Taylor expansions.
+	The SE3ToRt layer uses the same code for the se3aa (full = False) & se3aar (full = True) transform types.
+   se3_exp(input, full) is a pure-tensor version of the layer (gradients through autograd) which can be scripted/traced
+   & graph compiled. The module uses it if backend.set_use_reference(True) is set.
+   so3_exp(w) / so3_log(R) convert between axis-angles (N x 3) & rotation matrices (N x 3 x 3) and se3_log(input, full)
+   is the inverse of se3_exp (B x N x 3 x 4 => B x N x 6). The log maps are pure-tensor functions (gradients through
+   autograd) & are not accurate for angles close to pi.
+'''
+
+# Threshold on the squared angle below which the Taylor expansions of the coefficients are used
+SMALL_ANGLE2 = 1e-2
+
+########
+#### Helpers
+
+# Create a skew-symmetric matrix "S" of size [B x 3 x 3] (passed in) given a [B x 3] vector
+def create_skew_symmetric_matrix(vector):
+    # type: (Tensor) -> Tensor
+    # Create the skew symmetric matrix:
+    # [0 -z y; z 0 -x; -y x 0]
+    N = vector.size(0)
+    vec = vector.contiguous().view(N, 3)
+    x, y, z = vec[:, 0], vec[:, 1], vec[:, 2]
+    zero = torch.zeros_like(x)
+    return torch.stack([zero,   -z,    y,
+                           z, zero,   -x,
+                          -y,    x, zero], 1).view(N, 3, 3)
+
+# Given a set of [B x 3 x 3] matrices "A", compute the [B x 3] vectors "h" s.t: sum(S(w) .* A) = w^T * h for any
+# vector "w" with skew-symmetric matrix S(w). "h" is the vector of the skew-symmetric part of A: vee(A - A^T)
+def compute_skew_symmetric_dual(A):
+    # type: (Tensor) -> Tensor
+    return torch.stack([A[:, 2, 1] - A[:, 1, 2],
+                        A[:, 0, 2] - A[:, 2, 0],
+                        A[:, 1, 0] - A[:, 0, 1]], 1)
+
+# Compute the coefficients of the exp map [A, B, C] & their derivatives w.r.t the squared angle [dA, dB, dC]
+# given the squared angles (N). Returns a (N x 6) tensor
+def compute_exp_coeffs(angle2, small_angle2=SMALL_ANGLE2):
+    # type: (Tensor, float) -> Tensor
+    small = angle2.lt(small_angle2)
+    s = torch.where(small, torch.ones_like(angle2), angle2)  # Small angles are masked out below (this avoids NaNs/NaN gradients)
+    angle = torch.sqrt(s)
+    A = torch.where(small, 1 - angle2 / 6 * (1 - angle2 / 20), torch.sin(angle) / angle)  # sin(theta)/theta
+    B = torch.where(small, 0.5 - angle2 / 24 * (1 - angle2 / 30), (1 - torch.cos(angle)) / s)  # (1 - cos(theta))/theta^2
+    C = torch.where(small, 1.0 / 6 - angle2 / 120 * (1 - angle2 / 42), (1 - A) / s)  # (theta - sin(theta))/theta^3
+    dA = 0.5 * (C - B)  # dA/dtheta^2 = (theta*cos(theta) - sin(theta))/(2*theta^3)
+    dB = torch.where(small, -1.0 / 24 + angle2 / 360, (0.5 * A - B) / s)  # dB/dtheta^2
+    dC = torch.where(small, -1.0 / 120 + angle2 / 2520, (B - 3 * C) / (2 * s))  # dC/dtheta^2
+    return torch.stack([A, B, C, dA, dB, dC], 1)
+
+# Compute [R|t] (N x 3 x 4) given the translation params u (N x 3), K, K^2 (N x 3 x 3) & the coefficients (N x 6)
+def compose_exp(u, K, K2, coeffs, full):
+    # type: (Tensor, Tensor, Tensor, Tensor, bool) -> Tensor
+    N = u.size(0)
+    A, B, C = coeffs[:, 0].view(N, 1, 1), coeffs[:, 1].view(N, 1, 1), coeffs[:, 2].view(N, 1, 1)
+    I = torch.eye(3, dtype=u.dtype, device=u.device).view(1, 3, 3)
+    R = I + A * K + B * K2  # R = I + A*K + B*K^2
+    t = u.contiguous().view(N, 3, 1)
+    if full:
+        t = t + torch.bmm(B * K + C * K2, t)  # V*u = (I + B*K + C*K^2) * u
+    return torch.cat([R, t], 2)
+
+# Compute the terms of the exp map that are shared by the FWD & BWD passes: K, K^2 & the coefficients
+def compute_exp_terms(w):
+    # type: (Tensor) -> Tuple[Tensor, Tensor, Tensor]
+    K = create_skew_symmetric_matrix(w)
+    K2 = torch.bmm(K, K)
+    coeffs = compute_exp_coeffs((w * w).sum(1))
+    return K, K2, coeffs
+
+# Compute the gradient w.r.t the params [u, w] (N x 6) given the gradient w.r.t [R|t] (N x 3 x 4) & the terms
+# computed in the FWD pass. For a gradient "G" w.r.t a matrix M = a*K + b*K^2 (scalars a, b are functions of theta^2):
+#	d/dw sum(G .* K)   = vee(G - G^T) = h
+#	d/dw sum(G .* K^2) = d/dw (w^T * G * w - theta^2 * tr(G)) = (G + G^T) * w - 2 * tr(G) * w
+#	d/dw a             = 2 * (da/dtheta^2) * w
+# With G_t = g_t * u^T for the translation (t = V*u, grad w.r.t u is V^T * g_t)
+def se3_exp_backward(grad_output, u, w, K, K2, coeffs, full):
+    # type: (Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, bool) -> Tensor
+    N = w.size(0)
+    A, B, C, dA, dB, dC = [coeffs[:, k].view(N, 1) for k in range(6)]
+    G, g = grad_output.narrow(2, 0, 3), grad_output.narrow(2, 3, 1)  # Grads w.r.t R & t
+
+    # Gradient w.r.t w from R = I + A*K + B*K^2
+    trG = (G[:, 0, 0] + G[:, 1, 1] + G[:, 2, 2]).view(N, 1)
+    GK, GK2 = (G * K).sum(2).sum(1).view(N, 1), (G * K2).sum(2).sum(1).view(N, 1)  # sum(G .* K), sum(G .* K^2)
+    dK2 = torch.bmm(G + G.transpose(1, 2), w.unsqueeze(2)).squeeze(2) - 2 * trG * w
+    grad_w = 2 * (dA * GK + dB * GK2) * w + A * compute_skew_symmetric_dual(G) + B * dK2
+
+    # Gradient w.r.t u (& w) from t = V*u
+    if full:
+        gv = g.view(N, 3)
+        grad_u = gv - B * torch.bmm(K, g).squeeze(2) + C * torch.bmm(K2, g).squeeze(2)  # V^T * g (K^T = -K)
+        gu, uw, gw = (gv * u).sum(1, keepdim=True), (u * w).sum(1, keepdim=True), (gv * w).sum(1, keepdim=True)
+        GtK = (w * torch.cross(u, gv, 1)).sum(1, keepdim=True)  # sum(g*u^T .* K) = w^T * (u x g)
+        GtK2 = gw * uw - (w * w).sum(1, keepdim=True) * gu  # sum(g*u^T .* K^2)
+        dtK2 = gv * uw + u * gw - 2 * gu * w
+        grad_w = grad_w + 2 * (dB * GtK + dC * GtK2) * w + B * torch.cross(u, gv, 1) + C * dtK2
+    else:
+        grad_u = g.view(N, 3)
+
+    return torch.cat([grad_u, grad_w], 1)
+
+########
+#### Pure-tensor exp/log maps (gradients through autograd)
+
+# Rotation matrices (N x 3 x 3) from axis-angles (N x 3): R = I + A*K + B*K^2
+def so3_exp(w):
+    # type: (Tensor) -> Tensor
+    N = w.size(0)
+    K = create_skew_symmetric_matrix(w)
+    coeffs = compute_exp_coeffs((w * w).sum(1))
+    I = torch.eye(3, dtype=w.dtype, device=w.device).view(1, 3, 3)
+    return I + coeffs[:, 0].view(N, 1, 1) * K + coeffs[:, 1].view(N, 1, 1) * torch.bmm(K, K)
+
+# Transforms [R|t] (B x k x 3 x 4) from se(3) params (B x k x 6)
+def se3_exp(input, full=True):
+    # type: (Tensor, bool) -> Tensor
+    batch_size, num_se3 = input.size(0), input.size(1)
+    params = input.contiguous().view(batch_size * num_se3, 6)
+    u, w = params.narrow(1, 0, 3), params.narrow(1, 3, 3)
+    K = create_skew_symmetric_matrix(w)
+    coeffs = compute_exp_coeffs((w * w).sum(1))
+    return compose_exp(u, K, torch.bmm(K, K), coeffs, full).view(batch_size, num_se3, 3, 4)
+
+# Axis-angles (N x 3) from rotation matrices (N x 3 x 3): w = theta/(2*sin(theta)) * vee(R - R^T) = vee(R - R^T) / (2*A)
+def so3_log(rot):
+    # type: (Tensor) -> Tensor
+    h = compute_skew_symmetric_dual(rot)  # 2*sin(theta) * axis
+    sin = 0.5 * torch.sqrt((h * h).sum(1).clamp(min=1e-24))
+    cos = 0.5 * (rot[:, 0, 0] + rot[:, 1, 1] + rot[:, 2, 2] - 1)
+    angle = torch.atan2(sin, cos)
+    return h / (2 * compute_exp_coeffs(angle * angle)[:, 0]).unsqueeze(1)
+
+# se(3) params (B x k x 6) from transforms [R|t] (B x k x 3 x 4). u = V^-1 * t (if full, else u = t) where
+# V^-1 = I - 0.5*K + (1 - A/(2*B))/theta^2 * K^2
+def se3_log(input, full=True, small_angle2=SMALL_ANGLE2):
+    # type: (Tensor, bool, float) -> Tensor
+    batch_size, num_se3 = input.size(0), input.size(1)
+    N = batch_size * num_se3
+    rt = input.contiguous().view(N, 3, 4)
+    w = so3_log(rt.narrow(2, 0, 3))
+    t = rt.narrow(2, 3, 1)
+    if full:
+        K = create_skew_symmetric_matrix(w)
+        angle2 = (w * w).sum(1)
+        coeffs = compute_exp_coeffs(angle2, small_angle2)
+        small = angle2.lt(small_angle2)
+        s = torch.where(small, torch.ones_like(angle2), angle2)
+        D = torch.where(small, 1.0 / 12 + angle2 / 720, (1 - coeffs[:, 0] / (2 * coeffs[:, 1])) / s)
+        t = t - 0.5 * torch.bmm(K, t) + D.view(N, 1, 1) * torch.bmm(torch.bmm(K, K), t)
+    return torch.cat([t.view(N, 3), w], 1).view(batch_size, num_se3, 6)
+
+
+## FWD/BWD pass function
+class SE3ExpFunction(Function):
+    @staticmethod
+    def forward(ctx, input, full=True):
+        # Check dimensions
+        batch_size, num_se3, num_params = input.size()
+        assert (num_params == 6)
+
+        # Compute the terms shared by the FWD & BWD passes, save them for the BWD pass
+        params = input.contiguous().view(batch_size * num_se3, 6)
+        K, K2, coeffs = compute_exp_terms(params.narrow(1, 3, 3))
+        ctx.full = full
+        ctx.save_for_backward(params, K, K2, coeffs)
+
+        # Compute output
+        return compose_exp(params.narrow(1, 0, 3), K, K2, coeffs, full).view(batch_size, num_se3, 3, 4)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        # Nothing to do if the input doesn't need a gradient
+        if not ctx.needs_input_grad[0]:
+            return None, None
+
+        # Compute the gradients using the saved terms
+        params, K, K2, coeffs = ctx.saved_tensors
+        batch_size, num_se3 = grad_output.size(0), grad_output.size(1)
+        grad_input = se3_exp_backward(grad_output.contiguous().view(-1, 3, 4), params.narrow(1, 0, 3),
+                                      params.narrow(1, 3, 3), K, K2, coeffs, ctx.full)
+        return grad_input.view(batch_size, num_se3, 6), None
+
+
+## FWD/BWD pass module
+class SE3Exp(Module):
+    def __init__(self, full=True):
+        super(SE3Exp, self).__init__()
+        self.full = full
+
+    @backend.float32
+    def forward(self, input):
+        if backend.use_reference():
+            return se3_exp(input, self.full)
+        return SE3ExpFunction.apply(input, self.full)
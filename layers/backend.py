@@ -0,0 +1,73 @@
+'''
+	Backend for the C/CUDA kernels used by the layers & the data loaders
+	se3layers.<function> looks up the function in the C++/CUDA extension (_ext.se3layers_aten, built by make.sh or
+	build_aten.py). The layers call <function>_float/_double for CPU inputs & <function>_cuda for CUDA inputs, the
+	_cuda functions are only there if the extension was built with CUDA. The functions take inputs with any strides
+	(no contiguous copies of expanded tensors) & release the GIL while they run.
+
+	set_use_reference(True) makes the layers use their pure-tensor reference implementations instead of the
+	custom autograd Functions & C/CUDA kernels. These have no custom BWD pass (autograd computes the gradients)
+	so models using them can be scripted/traced & graph compiled. They need no compiled extension either.
+
+	float32(forward) runs a layer in float32 under autocast (mixed-precision training): autocast is disabled inside
+	the layer & its half/bfloat16 inputs are cast to float. The geometry (SE3ToRt, ComposeRtPair, NTfm3D, ...) &
+	the losses use it, their results & gradients would lose too much precision otherwise.
+'''
+import functools
+import torch
+
+try:
+	from _ext import se3layers_aten
+except ImportError:
+	se3layers_aten = None
+
+class Backend(object):
+	def __init__(self, *exts):
+		self.exts = [ext for ext in exts if ext is not None]
+
+	def __getattr__(self, name):
+		assert(len(self.exts) > 0), "The se3layers extension was not found. Build it with make.sh"
+		for ext in self.exts:
+			if hasattr(ext, name):
+				func = getattr(ext, name)
+				setattr(self, name, func) # Cache for the next lookup
+				return func
+		if name.endswith('_cuda'):
+			raise AttributeError("The se3layers extension has no function: {} (it was built without CUDA, "
+								 "rebuild it with make.sh on a machine with nvcc)".format(name))
+		raise AttributeError("The se3layers extension has no function: {}".format(name))
+
+	# The extension has the function (e.g. the *_cuda ones are only there if it was built with CUDA)
+	def has(self, name):
+		return any(hasattr(ext, name) for ext in self.exts)
+
+se3layers = Backend(se3layers_aten)
+
+# Use the pure-tensor reference implementations of the layers (default: False)
+_use_reference = False
+
+def set_use_reference(use_reference=True):
+	global _use_reference
+	_use_reference = use_reference
+
+def use_reference():
+	return _use_reference
+
+# Autocast is on (CPU or GPU)
+def autocast_enabled():
+	return getattr(torch, 'is_autocast_cpu_enabled', lambda: False)() or \
+		   getattr(torch, 'is_autocast_enabled', lambda: False)()
+
+# Run a function/forward in float32 under autocast, a plain call otherwise
+def float32(forward):
+	to_float = lambda x: x.float() if torch.is_tensor(x) and x.dtype in (torch.float16, torch.bfloat16) else x
+	@functools.wraps(forward)
+	def wrapper(*inputs, **kwargs):
+		if not autocast_enabled():
+			return forward(*inputs, **kwargs)
+		device = next((x.device.type for x in list(inputs) + list(kwargs.values()) if torch.is_tensor(x)), None)
+		if device is None: # No tensor inputs, nothing to cast
+			return forward(*inputs, **kwargs)
+		with torch.autocast(device, enabled=False):
+			return forward(*[to_float(x) for x in inputs], **dict((k, to_float(v)) for k, v in kwargs.items()))
+	return wrapper
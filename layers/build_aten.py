@@ -0,0 +1,42 @@
+import os
+import torch
+from setuptools import setup
+from torch.utils.cpp_extension import BuildExtension, CppExtension, CUDAExtension, CUDA_HOME
+
+# C++/CUDA extension with the kernels of the layers (takes strided inputs, releases the GIL), see src/se3layers_aten.cpp
+# Build in place with: python build_aten.py build_ext --inplace (creates _ext/se3layers_aten*.so)
+# The CUDA kernels (src/se3layers_cuda.cpp & src/cuda/*.cu) are built in if torch has CUDA & nvcc is found (CUDA_HOME).
+# Set TORCH_CUDA_ARCH_LIST (e.g. "6.1;7.5;8.6") to build for other GPUs than the ones on this machine
+this_file = os.path.dirname(os.path.realpath(__file__))
+if not os.path.isdir(os.path.join(this_file, '_ext')):
+    os.makedirs(os.path.join(this_file, '_ext'))
+sources = [os.path.join(this_file, 'src/se3layers_aten.cpp')]
+with_cuda = (torch.version.cuda is not None) and (CUDA_HOME is not None)
+if with_cuda:
+    print('Including CUDA code.')
+    sources += [os.path.join(this_file, fname) for fname in ['src/se3layers_cuda.cpp',
+                                                             'src/cuda/ntfm3d_kernel.cu',
+                                                             'src/cuda/project3dpts_kernel.cu',
+                                                             'src/cuda/rt3x4_kernel.cu',
+                                                             'src/cuda/loss3d_kernel.cu']]
+    ext = CUDAExtension(
+        '_ext.se3layers_aten',
+        sources=sources,
+        define_macros=[('WITH_CUDA', None)],
+        extra_compile_args={'cxx': ['-O3','-fopenmp'], 'nvcc': ['-O3']},
+        extra_link_args=['-fopenmp']
+    )
+else:
+    print('Cannot find a CUDA installation, just building the CPU version of the layers')
+    ext = CppExtension(
+        '_ext.se3layers_aten',
+        sources=sources,
+        extra_compile_args=['-O3','-fopenmp'],
+        extra_link_args=['-fopenmp']
+    )
+
+# Compile
+if __name__ == '__main__':
+    setup(name='se3layers_aten',
+          ext_modules=[ext],
+          cmdclass={'build_ext': BuildExtension})
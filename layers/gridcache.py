@@ -0,0 +1,57 @@
+import torch
+
+'''
+	--------------------- Process-wide cache of pixel grids ------------------------------
+   Grids are computed once (vectorized) per (height, width, intrinsics, dtype, device) & shared by everyone that asks
+   for them: the data loaders, the DepthImageToDense3DPoints layer & the CoordConv layers in ctrlnets.
+	camera_xyzgrid(ht, wd, intrinsics) : 1 x 3 x H x W grid of [(c - cx)/fx, (r - cy)/fy, 1] per pixel (r, c)
+	camera_xygrid(ht, wd, intrinsics)  : the first two channels of the above (a view, no extra memory)
+	coord_grid(ht, wd)                 : 1 x 2 x H x W grid of [x, y] in [-1, 1] (x along cols, y along rows)
+   "intrinsics" is a dict with the keys "fx", "fy", "cx" & "cy" (other keys are ignored).
+   The grids are shared, so they should never be modified in-place. Use expand() to get a batch of them (no copy).
+'''
+
+# All cached grids, keyed by (name, height, width, params, dtype, device)
+_grids = {}
+
+# Get a grid from the cache, create it (on CPU in double precision, then converted) if it isn't there yet
+def _get_grid(key, create, dtype, device):
+	grid = _grids.get(key)
+	if grid is None:
+		grid = _grids[key] = create().to(dtype=dtype, device=device)
+	return grid
+
+# Key for a device, so that "cuda", "cuda:0" & torch.device('cuda:0') are not cached separately
+def _device_key(device):
+	device = torch.device(device)
+	if device.type == 'cuda' and device.index is None:
+		device = torch.device('cuda', torch.cuda.current_device())
+	return str(device)
+
+## 1 x 3 x H x W grid of [(c - cx)/fx, (r - cy)/fy, 1]
+def camera_xyzgrid(height, width, intrinsics, dtype=torch.float32, device='cpu'):
+	assert (height > 1 and width > 1)
+	fx, fy, cx, cy = [float(intrinsics[k]) for k in ['fx', 'fy', 'cx', 'cy']]
+	assert (fx > 0 and fy > 0 and cx >= 0 and cx < width and cy >= 0 and cy < height)
+	def create():
+		grid = torch.ones(1, 3, height, width, dtype=torch.float64)
+		grid[0, 0].copy_(((torch.arange(width, dtype=torch.float64) - cx) / fx).view(1, width).expand(height, width))   # +x is increasing columns
+		grid[0, 1].copy_(((torch.arange(height, dtype=torch.float64) - cy) / fy).view(height, 1).expand(height, width)) # +y is increasing rows
+		return grid
+	return _get_grid(('xyz', height, width, (fx, fy, cx, cy), dtype, _device_key(device)), create, dtype, device)
+
+## 1 x 2 x H x W grid of [(c - cx)/fx, (r - cy)/fy] (view of the xyz grid)
+def camera_xygrid(height, width, intrinsics, dtype=torch.float32, device='cpu'):
+	return camera_xyzgrid(height, width, intrinsics, dtype, device).narrow(1, 0, 2)
+
+## 1 x 2 x H x W grid of [x, y] in [-1, 1]
+def coord_grid(height, width, dtype=torch.float32, device='cpu'):
+	def create():
+		x = torch.linspace(-1, 1, width, dtype=torch.float64).view(1, width).expand(height, width)  # -1 to 1 along cols
+		y = torch.linspace(-1, 1, height, dtype=torch.float64).view(height, 1).expand(height, width) # -1 to 1 along rows
+		return torch.stack([x, y], 0).unsqueeze(0)
+	return _get_grid(('coord', height, width, None, dtype, _device_key(device)), create, dtype, device)
+
+## Drop all cached grids (e.g. to free GPU memory)
+def clear():
+	_grids.clear()
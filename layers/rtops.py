@@ -0,0 +1,96 @@
+import backend
+
+'''
+	--------------------- Batched ops on compact (3x4) rigid transforms ------------------------------
+   Fused FWD/BWD kernels (se3layers_aten.cpp & the CUDA versions in cuda/rt3x4_kernel.cu) for:
+	compose(A, B)              : A * B = [rA * rB | rA * tB + tA]                 (... x 3 x 4)
+	inverse(input)             : [R^T | -R^T * t]                                  (... x 3 x 4)
+	collapse_pivots(input)     : [R|t|p] => [R | t + p - Rp]                       (... x 3 x 5 => ... x 3 x 4)
+	transform_points(pts, tfms): R * p + t, one transform per batch element        (B x 3 x H x W, B x 3 x 4)
+   Each op has a *_backward function which computes the grads w.r.t its inputs (only the ones that are needed).
+
+   These work on plain tensors (no autograd). The result is written to "out" (or the grad_* tensors) if it is given,
+   else to a new tensor. "out" can be one of the inputs (in-place), e.g: inverse(poses, out=poses) or
+   compose(A, B, out=B). Transforms can have up to 2 leading dims (B x K x 3 x 4). The CUDA kernels are float only.
+   These are used by the data loaders & the FWD/BWD passes of the ComposeRtPair, ComposeRt, RtInverse &
+   CollapseRtPivots layers.
+'''
+
+# Name of the kernel "name" for the type of the given tensor
+def func_name(name, tensor):
+	if tensor.is_cuda:
+		return name + '_cuda'
+	elif tensor.type() == 'torch.DoubleTensor':
+		return name + '_double'
+	else:
+		return name + '_float'
+
+# Get the kernel "name" for the type of the given tensor
+def get_func(name, tensor):
+	return getattr(backend.se3layers, func_name(name, tensor))
+
+# The kernel "name" is available for the type of the given tensor
+def has_func(name, tensor):
+	return backend.se3layers.has(func_name(name, tensor))
+
+# Check that a tensor is a set of (3 x ncols) transforms
+def check_tfms(tensor, ncols):
+	assert(tensor.dim() >= 2 and tensor.dim() <= 4), "Transforms have to be 2D-4D (... x 3 x {})".format(ncols)
+	assert(tensor.size(-2) == 3 and tensor.size(-1) == ncols), "Transforms have to be ... x 3 x {}".format(ncols)
+
+## Compose pairs of transforms: A * B
+def compose(A, B, out=None):
+	check_tfms(A, 4)
+	assert(A.is_same_size(B))
+	out = A.new(A.size()) if out is None else out
+	get_func('ComposeRtPair_forward', A)(A, B, out)
+	return out
+
+def compose_backward(A, B, grad_output, grad_A=None, grad_B=None, need_A=True, need_B=True):
+	grad_A = A.new(A.size()) if (need_A and grad_A is None) else grad_A
+	grad_B = B.new(B.size()) if (need_B and grad_B is None) else grad_B
+	get_func('ComposeRtPair_backward', A)(A, B, grad_A if need_A else A.new(), grad_B if need_B else B.new(),
+										  grad_output, need_A, need_B)
+	return grad_A, grad_B
+
+## Invert transforms: [R^T | -R^T * t]
+def inverse(input, out=None):
+	check_tfms(input, 4)
+	out = input.new(input.size()) if out is None else out
+	get_func('RtInverse_forward', input)(input, out)
+	return out
+
+def inverse_backward(input, grad_output, grad_input=None):
+	grad_input = input.new(input.size()) if grad_input is None else grad_input
+	get_func('RtInverse_backward', input)(input, grad_input, grad_output)
+	return grad_input
+
+## Collapse pivots: [R|t|p] => [R | t + p - Rp]
+def collapse_pivots(input, out=None):
+	check_tfms(input, 5)
+	out = input.new(input.size()[:-1] + (4,)) if out is None else out
+	get_func('CollapseRtPivots_forward', input)(input, out)
+	return out
+
+def collapse_pivots_backward(input, grad_output, grad_input=None):
+	grad_input = input.new(input.size()) if grad_input is None else grad_input
+	get_func('CollapseRtPivots_backward', input)(input, grad_input, grad_output)
+	return grad_input
+
+## Transform 3D points (B x 3 x H x W) by one transform per batch element (B x 3 x 4): R * p + t
+def transform_points(points, tfms, out=None):
+	assert(points.dim() == 4 and points.size(1) == 3), "Points have to be B x 3 x H x W"
+	assert(tfms.numel() == points.size(0) * 12), "Need one (3x4) transform per batch element"
+	out = points.new(points.size()) if out is None else out
+	get_func('TransformPoints3D_forward', points)(points, tfms, out)
+	return out
+
+def transform_points_backward(points, tfms, grad_output, grad_points=None, grad_tfms=None,
+							  need_points=True, need_tfms=True):
+	grad_points = points.new(points.size()) if (need_points and grad_points is None) else grad_points
+	grad_tfms   = tfms.new(tfms.size()) if (need_tfms and grad_tfms is None) else grad_tfms
+	get_func('TransformPoints3D_backward', points)(points, tfms,
+												   grad_points if need_points else points.new(),
+												   grad_tfms if need_tfms else tfms.new(),
+												   grad_output, need_points, need_tfms)
+	return grad_points, grad_tfms
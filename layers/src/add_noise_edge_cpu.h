@@ -1,7 +0,0 @@
-int AddNoise_float(
-            THFloatTensor *depth,
-            THFloatTensor *depth_n,
-            float zthresh,
-            float edgeprob,
-            float defprob,
-            float noisestd);
@@ -7,13 +7,13 @@
 __inline__ __device__
 float warpReduceSum(float val) {
   for (int offset = WARPSIZE/2; offset > 0; offset /= 2)
-    val += __shfl_down(val, offset);
+    val += __shfl_down_sync(0xffffffff, val, offset);
   return val;
 }
 
 /// Get the (batch,row,col) indices corresponding to a given thread index (3D point index)
-__device__ void getCoordinates(const int tid, const int nrows, const int ncols,
-                               int &batch, int &row, int &col)
+__inline__ __device__ void getCoordinates(const int tid, const int nrows, const int ncols,
+                                          int &batch, int &row, int &col)
 {
     // Get col id
     int id = tid;
@@ -0,0 +1,205 @@
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include <stdio.h>
+#include <math.h>
+#include <float.h>
+#include <assert.h>
+#include "cudautils.h"
+
+// Fused masked losses for dense 3D points/flows (B x C x N x M), same as the CPU versions in se3layers_aten.cpp
+// All data is contiguous. One thread per point, the per-batch sums are reduced within each block (warp shuffles +
+// shared memory) & the block sums are added to the outputs
+
+// Loss types (same order as in MaskedLoss3D.py)
+#define LOSS_MSE           0
+#define LOSS_ABS           1
+#define LOSS_NORMMSESQRT   2
+#define LOSS_NORMMSESQRTPT 3
+
+// Check for errors after a kernel launch
+static int checkLaunch(const char *name)
+{
+    cudaError_t err = cudaGetLastError();
+    if (err != cudaSuccess) {
+        printf("error in %s: %s\n", name, cudaGetErrorString(err));
+        assert(false);
+    }
+    return 1;
+}
+
+__device__ inline float signf(float x)
+{
+    return (x > 0) ? 1 : ((x < 0) ? -1 : 0);
+}
+
+// =============== PER-POINT OPS ================== //
+
+// Per-batch sums of the loss, the weights & the weights of the points that move
+__global__ void loss3d(const float *input, const float *target, const float *wts, const float *motion,
+                       float *lossSums, float *wtSums, float *motionSums,
+                       int lossType, int hasWts, int hasMotion, float motionThresh,
+                       float sigmaScale, float sigmaOffset, float sigmaMin, int nChannels, int nPoints)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x; // Point ID
+    int b = blockIdx.y; // Batch ID
+
+    // Compute the loss for the point (zero if outside limits, so it adds nothing to the sums)
+    float loss = 0, wt = 0, mot = 0;
+    if (n < nPoints)
+    {
+        const float *x = input + b*nChannels*nPoints + n, *y = target + b*nChannels*nPoints + n;
+        float w = hasWts ? wts[b*nPoints + n] : 1, sigma = 0;
+        if (lossType == LOSS_NORMMSESQRTPT)
+        {
+            float norm2 = 0;
+            for (int c = 0; c < nChannels; c++)
+                norm2 += y[c*nPoints] * y[c*nPoints];
+            sigma = fmaxf(sigmaScale * sqrtf(norm2) + sigmaOffset, sigmaMin);
+        }
+        for (int c = 0; c < nChannels; c++)
+        {
+            float e = w * (x[c*nPoints] - y[c*nPoints]);
+            if (lossType == LOSS_MSE)
+                loss += 0.5f * e * e;
+            else if (lossType == LOSS_ABS)
+                loss += fabsf(e);
+            else
+            {
+                if (lossType == LOSS_NORMMSESQRT)
+                    sigma = fmaxf(sigmaScale * fabsf(y[c*nPoints]) + sigmaOffset, sigmaMin);
+                loss += 0.5f * e * e / sigma;
+            }
+        }
+        wt = w;
+        if (hasMotion)
+        {
+            const float *m = motion + b*nChannels*nPoints + n;
+            float msum = 0;
+            for (int c = 0; c < nChannels; c++)
+                msum += fabsf(m[c*nPoints]);
+            mot = (msum > motionThresh) ? w : 0;
+        }
+    }
+
+    // Reduce over the block
+    __shared__ float sharedSums[3][WARPSIZE];
+    float v[3] = {loss, wt, mot};
+    int lane = threadIdx.x % WARPSIZE, warp = threadIdx.x / WARPSIZE;
+    int nWarps = (blockDim.x + WARPSIZE - 1) / WARPSIZE;
+    for (int k = 0; k < 3; k++)
+    {
+        float s = warpReduceSum(v[k]);
+        if (lane == 0) sharedSums[k][warp] = s;
+    }
+    __syncthreads();
+    if (warp == 0)
+    {
+        float *sums[3] = {lossSums, wtSums, motionSums};
+        for (int k = 0; k < 3; k++)
+        {
+            float s = (lane < nWarps) ? sharedSums[k][lane] : 0;
+            s = warpReduceSum(s);
+            if (lane == 0) atomicAdd(sums[k] + b, s);
+        }
+    }
+}
+
+// Grads w.r.t the input & target, scaled by the grad w.r.t the loss sum of the batch element
+__global__ void loss3dGrad(const float *input, const float *target, const float *wts,
+                           float *gradInput, float *gradTarget, const float *gradLossSums,
+                           int lossType, int hasWts, int computeGradInput, int computeGradTarget,
+                           float sigmaScale, float sigmaOffset, float sigmaMin, int nChannels, int nPoints)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x; // Point ID
+    int b = blockIdx.y; // Batch ID
+    if (n >= nPoints) return;
+
+    int off = b*nChannels*nPoints + n;
+    const float *x = input + off, *y = target + off;
+    float w = hasWts ? wts[b*nPoints + n] : 1, g = gradLossSums[b];
+
+    // Per-point sigma: sigma = max(s * ||y|| + o, m), dsigma/dy_c = (s/||y||) * y_c = dsigma * y_c
+    float sigma = 0, dsigma = 0, lsum = 0;
+    if (lossType == LOSS_NORMMSESQRTPT)
+    {
+        float norm2 = 0;
+        for (int c = 0; c < nChannels; c++)
+        {
+            float e = w * (x[c*nPoints] - y[c*nPoints]);
+            norm2 += y[c*nPoints] * y[c*nPoints];
+            lsum  += 0.5f * e * e;
+        }
+        float norm = sqrtf(norm2), sigmaRaw = sigmaScale * norm + sigmaOffset;
+        sigma  = fmaxf(sigmaRaw, sigmaMin);
+        dsigma = (sigmaRaw >= sigmaMin && norm > 0) ? sigmaScale / norm : 0;
+    }
+    for (int c = 0; c < nChannels; c++)
+    {
+        float yc = y[c*nPoints], e = w * (x[c*nPoints] - yc);
+        float gxc, gyc;
+        if (lossType == LOSS_MSE)
+        {
+            gxc = w * e;
+            gyc = -gxc;
+        }
+        else if (lossType == LOSS_ABS)
+        {
+            gxc = w * signf(e);
+            gyc = -gxc;
+        }
+        else if (lossType == LOSS_NORMMSESQRT)
+        {
+            float sigmaRaw = sigmaScale * fabsf(yc) + sigmaOffset;
+            float sigmac   = fmaxf(sigmaRaw, sigmaMin);
+            gxc = w * e / sigmac;
+            gyc = -gxc - ((sigmaRaw >= sigmaMin) ? (0.5f * e * e / (sigmac * sigmac)) * sigmaScale * signf(yc) : 0);
+        }
+        else
+        {
+            gxc = w * e / sigma;
+            gyc = -gxc - (lsum / (sigma * sigma)) * dsigma * yc;
+        }
+        if (computeGradInput)  gradInput[off + c*nPoints]  = g * gxc;
+        if (computeGradTarget) gradTarget[off + c*nPoints] = g * gyc;
+    }
+}
+
+///////////////// Launchers (one thread per point)
+int Loss3D_ForwardLauncher(const float *input, const float *target, const float *wts, const float *motion,
+                           float *lossSums, float *wtSums, float *motionSums,
+                           int lossType, int hasWts, int hasMotion, float motionThresh,
+                           float sigmaScale, float sigmaOffset, float sigmaMin,
+                           int batchSize, int nChannels, int nPoints, cudaStream_t stream)
+{
+    // Sums are accumulated
+    cudaMemsetAsync(lossSums, 0, batchSize * sizeof(float), stream);
+    cudaMemsetAsync(wtSums, 0, batchSize * sizeof(float), stream);
+    cudaMemsetAsync(motionSums, 0, batchSize * sizeof(float), stream);
+
+    dim3 blocks((nPoints + 255) / 256, batchSize);
+    dim3 threads(256);
+    loss3d <<< blocks, threads, 0, stream >>>(input, target, wts, motion, lossSums, wtSums, motionSums,
+                                              lossType, hasWts, hasMotion, motionThresh,
+                                              sigmaScale, sigmaOffset, sigmaMin, nChannels, nPoints);
+    return checkLaunch("Loss3D_ForwardLauncher");
+}
+
+int Loss3D_BackwardLauncher(const float *input, const float *target, const float *wts,
+                            float *gradInput, float *gradTarget, const float *gradLossSums,
+                            int lossType, int hasWts, int computeGradInput, int computeGradTarget,
+                            float sigmaScale, float sigmaOffset, float sigmaMin,
+                            int batchSize, int nChannels, int nPoints, cudaStream_t stream)
+{
+    dim3 blocks((nPoints + 255) / 256, batchSize);
+    dim3 threads(256);
+    loss3dGrad <<< blocks, threads, 0, stream >>>(input, target, wts, gradInput, gradTarget, gradLossSums,
+                                                  lossType, hasWts, computeGradInput, computeGradTarget,
+                                                  sigmaScale, sigmaOffset, sigmaMin, nChannels, nPoints);
+    return checkLaunch("Loss3D_BackwardLauncher");
+}
+
+#ifdef __cplusplus
+}
+#endif
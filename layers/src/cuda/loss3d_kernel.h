@@ -0,0 +1,24 @@
+#ifndef _LOSS3D_KERNEL
+#define _LOSS3D_KERNEL
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+int Loss3D_ForwardLauncher(const float *input, const float *target, const float *wts, const float *motion,
+                           float *lossSums, float *wtSums, float *motionSums,
+                           int lossType, int hasWts, int hasMotion, float motionThresh,
+                           float sigmaScale, float sigmaOffset, float sigmaMin,
+                           int batchSize, int nChannels, int nPoints, cudaStream_t stream);
+
+int Loss3D_BackwardLauncher(const float *input, const float *target, const float *wts,
+                            float *gradInput, float *gradTarget, const float *gradLossSums,
+                            int lossType, int hasWts, int computeGradInput, int computeGradTarget,
+                            float sigmaScale, float sigmaOffset, float sigmaMin,
+                            int batchSize, int nChannels, int nPoints, cudaStream_t stream);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
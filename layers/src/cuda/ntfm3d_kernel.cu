@@ -69,7 +69,7 @@ int NTfm3D_ForwardLauncher(const float *points, const float *masks, const float
 								  cudaStream_t stream)
 {
     // Copy transforms to constant memory to reduce global memory read overhead
-    cudaMemcpyToSymbol(constTfms, tfms, nTfmParams * sizeof(float));
+    cudaMemcpyToSymbolAsync(constTfms, tfms, nTfmParams * sizeof(float), 0, cudaMemcpyDeviceToDevice, stream);
 
     // Block and thread structure - we have one large set of points, so use 1d block/threads
     int npoints = batchSize * nrows * ncols;
@@ -132,6 +132,7 @@ int NTfm3D_ForwardLauncher(const float *points, const float *masks, const float
 __global__ void computeGradients(const float *points, const float *masks,
                                  float *gradPoints, float *gradMasks, float *gradTfms,
                                  const float *gradTfmpoints, int useMaskGradMag,
+                                 int computeGradPoints, int computeGradMasks, int computeGradTfms,
                                  int nrows, int ncols, int nSE3,
                                  int ps0, int ps1, int ps2, int ps3,
                                  int ms0, int ms1, int ms2, int ms3,
@@ -193,7 +194,9 @@ __global__ void computeGradients(const float *points, const float *masks,
             gz += w_k * tz;
 
             // === Gradient w.r.t mask (w_k) = (R_k^T * p + t_k) * gpt
-            if (useMaskGradMag)
+            if (!computeGradMasks)
+                ; // Not needed
+            else if (useMaskGradMag)
                 *(gradMasks + k*ms1 + valm) = x * tx + y * ty + z * tz +
                                           gxt * T[3] + gyt * T[7] + gzt * T[11];
             else
@@ -201,6 +204,10 @@ __global__ void computeGradients(const float *points, const float *masks,
                                               sgn_1(gyt) * (T[4] * x + T[5] * y + T[6]  * z + T[7]) +
                                               sgn_1(gzt) * (T[8] * x + T[9] * y + T[10] * z + T[11]); // Use only sign
 
+            // Skip the (expensive) shared memory reduction if the tfm gradients are not needed
+            // computeGradTfms is the same for all threads in the block, so this doesn't break the __syncthreads below
+            if (!computeGradTfms) continue;
+
             // === Gradients w.r.t transforms (t_k), stored in shared memory
             // Grads w.r.t rotation parameters (sum across all pts)
             // First nThreads params is Tfm(0,0), next is Tfm(0,1) etc for removing memory bank conflicts when reading to shared memory
@@ -219,6 +226,10 @@ __global__ void computeGradients(const float *points, const float *masks,
             sharedGradTfms[7*nThreads+tid]  = w_k * gyt;
             sharedGradTfms[11*nThreads+tid] = w_k * gzt;
         }
+        else if (!computeGradTfms)
+        {
+            continue; // Not needed
+        }
         else
         {
             // Re-initialize shared memory to zero (no need to sync here as we don't += to this memory till we do a syncthreads later)
@@ -265,11 +276,14 @@ __global__ void computeGradients(const float *points, const float *masks,
     __syncthreads(); // Wait till all gradients have been propely summed up!
 
     // Add computed tfm gradients to global memory in parallel!
-    for(int i = tid; i < nSharedGradResults; i+=nThreads)
-        atomicAdd(gradTfms + b*ts0 + i, sharedGradTfmResults[i]); // Final value corresponding to that term of the tfm
+    if (computeGradTfms)
+    {
+        for(int i = tid; i < nSharedGradResults; i+=nThreads)
+            atomicAdd(gradTfms + b*ts0 + i, sharedGradTfmResults[i]); // Final value corresponding to that term of the tfm
+    }
 
     // Gradients w.r.t pts (copy after sum across tfms)
-    if (withinLimits)
+    if (withinLimits && computeGradPoints)
     {
         *(gradPoints + 0*ps1 + valp) = gx;
         *(gradPoints + 1*ps1 + valp) = gy;
@@ -281,12 +295,13 @@ __global__ void computeGradients(const float *points, const float *masks,
 // == BWD pass code
 int NTfm3D_BackwardLauncher(const float *points, const float *masks, const float *tfms, const float *tfmpoints,
 									float *gradPoints, float *gradMasks, float *gradTfms, const float *gradTfmpoints,
-									int useMaskGradMag, int batchSize, int ndim, int nrows, int ncols, int nSE3, int nTfmParams,
+									int useMaskGradMag, int computeGradPoints, int computeGradMasks, int computeGradTfms,
+									int batchSize, int ndim, int nrows, int ncols, int nSE3, int nTfmParams,
 									const long *ps, const long *ms, const long *ts,
 									cudaStream_t stream)
 {
     // Copy transforms to constant memory to reduce global memory read overhead
-    cudaMemcpyToSymbol(constTfms, tfms, nTfmParams * sizeof(float));
+    cudaMemcpyToSymbolAsync(constTfms, tfms, nTfmParams * sizeof(float), 0, cudaMemcpyDeviceToDevice, stream);
 
     // Compute gradients w.r.t the input tfms next
     dim3 threads(16,16,1);
@@ -313,6 +328,9 @@ int NTfm3D_BackwardLauncher(const float *points, const float *masks, const float
                                                                     gradTfms,
                                                                     gradTfmpoints,
                                                                     useMaskGradMag,
+                                                                    computeGradPoints,
+                                                                    computeGradMasks,
+                                                                    computeGradTfms,
                                                                     nrows,
                                                                     ncols,
                                                                     nSE3,
@@ -76,7 +76,7 @@ __global__ void projectPointsAndDepthTest(const float *input_data, float *output
  * i.e. if that point is closest to the camera and visible. If so, this point has its index set.
  * If not, that point's values are set to (0,0,0)
  */
-__global__ void refineOutput(const float *input_data, float *output_data, float *indexMap_data,
+__global__ void refineOutput(const float *input_data, float *output_data, long *indexMap_data,
                              const float fx, const float fy, const float cx, const float cy,
                              const int batchSize, const int nrows, const int ncols, const int npoints,
                              const int is0, const int is1, const int is2, const int is3,
@@ -135,7 +135,7 @@ __global__ void refineOutput(const float *input_data, float *output_data, float
  * Computes the gradient for the perspective projection + depth test function
  */
 __global__ void projectionGradient(const float *input_data, const float *gradOutput_data,
-                                   const float *indexMap_data, float *gradInput_data,
+                                   const long *indexMap_data, float *gradInput_data,
                                    const float fx, const float fy,
                                    const int batchSize, const int nrows, const int ncols, const int npoints,
                                    const int is0, const int is1, const int is2, const int is3,
@@ -151,7 +151,7 @@ __global__ void projectionGradient(const float *input_data, const float *gradOut
 
     // Get the index map value (for that output pixel)
     long valim = b*iMs0 + r*iMs2 + c*iMs3; // y = row, x = col
-    long vali  = (long)(*(indexMap_data + valim));
+    long vali  = *(indexMap_data + valim);
     if (vali == -1) return; // In case this point has no corresponding output index, return
 
     // Get input point (from set of all input points)
@@ -175,7 +175,7 @@ __global__ void projectionGradient(const float *input_data, const float *gradOut
 
 // =============== FWD PASS ================== //
 
-int Project3DPointsToSubPixelDepth_ForwardLauncher(const float *input, float *indexMap, float *output,
+int Project3DPointsToSubPixelDepth_ForwardLauncher(const float *input, long *indexMap, float *output,
                                                    int batchSize, int nrows, int ncols,
                                                    float fx, float fy, float cx, float cy,
                                                    const long *is, const long *iMs,
@@ -216,7 +216,7 @@ int Project3DPointsToSubPixelDepth_ForwardLauncher(const float *input, float *in
 
 // =============== BWD PASS ================== //
 
-int Project3DPointsToSubPixelDepth_BackwardLauncher(const float *input, const float *indexMap,
+int Project3DPointsToSubPixelDepth_BackwardLauncher(const float *input, const long *indexMap,
                                                     float *gradInput, const float *gradOutput,
                                                     int batchSize, int nrows, int ncols,
                                                     float fx, float fy, float cx, float cy,
@@ -5,13 +5,13 @@
 extern "C" {
 #endif
 
-int Project3DPointsToSubPixelDepth_ForwardLauncher(const float *input, float *indexMap, float *output,
+int Project3DPointsToSubPixelDepth_ForwardLauncher(const float *input, long *indexMap, float *output,
                                                    int batchSize, int nrows, int ncols,
                                                    float fx, float fy, float cx, float cy,
                                                    const long *is, const long *iMs,
                                                    cudaStream_t stream);
 
-int Project3DPointsToSubPixelDepth_BackwardLauncher(const float *input, const float *indexMap,
+int Project3DPointsToSubPixelDepth_BackwardLauncher(const float *input, const long *indexMap,
                                                     float *gradInput, const float *gradOutput,
                                                     int batchSize, int nrows, int ncols,
                                                     float fx, float fy, float cx, float cy,
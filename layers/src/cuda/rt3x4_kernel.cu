@@ -0,0 +1,278 @@
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include <stdio.h>
+#include <math.h>
+#include <float.h>
+#include <assert.h>
+#include "cudautils.h"
+
+// Batched ops on compact (3x4) transforms [R|t] (3x5 [R|t|p] for the pivots), same as the CPU versions in se3layers_aten.cpp
+// All data is contiguous. Each thread reads all the inputs of its transform/point before writing the outputs,
+// so the outputs can be the same memory as the inputs (in-place ops)
+
+// Check for errors after a kernel launch
+static int checkLaunch(const char *name)
+{
+    cudaError_t err = cudaGetLastError();
+    if (err != cudaSuccess) {
+        printf("error in %s: %s\n", name, cudaGetErrorString(err));
+        assert(false);
+    }
+    return 1;
+}
+
+// =============== PER-TRANSFORM OPS ================== //
+
+// C = A * B : [rA * rB | rA * tB + tA]
+__global__ void composeRtPair(const float *A, const float *B, float *C, int nTfms)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x;
+    if (n >= nTfms) return;
+    A += 12*n; B += 12*n; C += 12*n;
+
+    float a[12], b[12];
+    for (int k = 0; k < 12; k++) { a[k] = A[k]; b[k] = B[k]; }
+    for (int i = 0; i < 3; i++)
+        for (int j = 0; j < 4; j++)
+            C[4*i+j] = a[4*i] * b[j] + a[4*i+1] * b[4+j] + a[4*i+2] * b[8+j] + ((j == 3) ? a[4*i+3] : 0);
+}
+
+// rA_g = r_g * rB^T + t_g * tB^T, tA_g = t_g, rB_g = rA^T * r_g, tB_g = rA^T * t_g
+__global__ void composeRtPairGrad(const float *A, const float *B, const float *gradC,
+                                  float *gradA, float *gradB, int computeGradA, int computeGradB, int nTfms)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x;
+    if (n >= nTfms) return;
+    A += 12*n; B += 12*n; gradC += 12*n;
+
+    float a[12], b[12], g[12];
+    for (int k = 0; k < 12; k++) { a[k] = A[k]; b[k] = B[k]; g[k] = gradC[k]; }
+    for (int i = 0; i < 3; i++)
+    {
+        if (computeGradA)
+        {
+            for (int j = 0; j < 3; j++)
+                gradA[12*n+4*i+j] = g[4*i] * b[4*j] + g[4*i+1] * b[4*j+1] + g[4*i+2] * b[4*j+2] + g[4*i+3] * b[4*j+3];
+            gradA[12*n+4*i+3] = g[4*i+3];
+        }
+        if (computeGradB)
+        {
+            for (int j = 0; j < 4; j++)
+                gradB[12*n+4*i+j] = a[i] * g[j] + a[4+i] * g[4+j] + a[8+i] * g[8+j];
+        }
+    }
+}
+
+// O = [r^T | -r^T * t]
+__global__ void rtInverse(const float *I, float *O, int nTfms)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x;
+    if (n >= nTfms) return;
+    I += 12*n; O += 12*n;
+
+    float r[12];
+    for (int k = 0; k < 12; k++) r[k] = I[k];
+    for (int i = 0; i < 3; i++)
+    {
+        O[4*i+0] = r[i];
+        O[4*i+1] = r[4+i];
+        O[4*i+2] = r[8+i];
+        O[4*i+3] = -(r[i] * r[3] + r[4+i] * r[7] + r[8+i] * r[11]);
+    }
+}
+
+// r_g = ro_g^T - t * to_g^T, t_g = -r * to_g
+__global__ void rtInverseGrad(const float *I, const float *gradO, float *gradI, int nTfms)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x;
+    if (n >= nTfms) return;
+    I += 12*n; gradO += 12*n; gradI += 12*n;
+
+    float r[12], g[12];
+    for (int k = 0; k < 12; k++) { r[k] = I[k]; g[k] = gradO[k]; }
+    for (int i = 0; i < 3; i++)
+    {
+        for (int j = 0; j < 3; j++)
+            gradI[4*i+j] = g[4*j+i] - r[4*i+3] * g[4*j+3];
+        gradI[4*i+3] = -(r[4*i] * g[3] + r[4*i+1] * g[7] + r[4*i+2] * g[11]);
+    }
+}
+
+// [R|t|p] (3x5) => [R|t + p - Rp] (3x4)
+__global__ void collapseRtPivots(const float *I, float *O, int nTfms)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x;
+    if (n >= nTfms) return;
+    I += 15*n; O += 12*n;
+
+    float r[15];
+    for (int k = 0; k < 15; k++) r[k] = I[k];
+    for (int i = 0; i < 3; i++)
+    {
+        O[4*i+0] = r[5*i+0];
+        O[4*i+1] = r[5*i+1];
+        O[4*i+2] = r[5*i+2];
+        O[4*i+3] = r[5*i+3] + r[5*i+4] - (r[5*i] * r[4] + r[5*i+1] * r[9] + r[5*i+2] * r[14]);
+    }
+}
+
+// r_g = ro_g - to_g * p^T, t_g = to_g, p_g = to_g - R^T * to_g
+__global__ void collapseRtPivotsGrad(const float *I, const float *gradO, float *gradI, int nTfms)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x;
+    if (n >= nTfms) return;
+    I += 15*n; gradO += 12*n; gradI += 15*n;
+
+    float r[15], g[12];
+    for (int k = 0; k < 15; k++) r[k] = I[k];
+    for (int k = 0; k < 12; k++) g[k] = gradO[k];
+    for (int i = 0; i < 3; i++)
+    {
+        for (int j = 0; j < 3; j++)
+            gradI[5*i+j] = g[4*i+j] - g[4*i+3] * r[5*j+4];
+        gradI[5*i+3] = g[4*i+3];
+        gradI[5*i+4] = g[4*i+3] - (r[i] * g[3] + r[5+i] * g[7] + r[10+i] * g[11]);
+    }
+}
+
+///////////////// Per-transform launchers (one thread per transform)
+int ComposeRtPair_ForwardLauncher(const float *A, const float *B, float *output, int nTfms, cudaStream_t stream)
+{
+    composeRtPair <<< (nTfms + 255) / 256, 256, 0, stream >>>(A, B, output, nTfms);
+    return checkLaunch("ComposeRtPair_ForwardLauncher");
+}
+
+int ComposeRtPair_BackwardLauncher(const float *A, const float *B, float *gradA, float *gradB, const float *gradOutput,
+                                   int computeGradA, int computeGradB, int nTfms, cudaStream_t stream)
+{
+    composeRtPairGrad <<< (nTfms + 255) / 256, 256, 0, stream >>>(A, B, gradOutput, gradA, gradB,
+                                                                  computeGradA, computeGradB, nTfms);
+    return checkLaunch("ComposeRtPair_BackwardLauncher");
+}
+
+int RtInverse_ForwardLauncher(const float *input, float *output, int nTfms, cudaStream_t stream)
+{
+    rtInverse <<< (nTfms + 255) / 256, 256, 0, stream >>>(input, output, nTfms);
+    return checkLaunch("RtInverse_ForwardLauncher");
+}
+
+int RtInverse_BackwardLauncher(const float *input, float *gradInput, const float *gradOutput,
+                               int nTfms, cudaStream_t stream)
+{
+    rtInverseGrad <<< (nTfms + 255) / 256, 256, 0, stream >>>(input, gradOutput, gradInput, nTfms);
+    return checkLaunch("RtInverse_BackwardLauncher");
+}
+
+int CollapseRtPivots_ForwardLauncher(const float *input, float *output, int nTfms, cudaStream_t stream)
+{
+    collapseRtPivots <<< (nTfms + 255) / 256, 256, 0, stream >>>(input, output, nTfms);
+    return checkLaunch("CollapseRtPivots_ForwardLauncher");
+}
+
+int CollapseRtPivots_BackwardLauncher(const float *input, float *gradInput, const float *gradOutput,
+                                      int nTfms, cudaStream_t stream)
+{
+    collapseRtPivotsGrad <<< (nTfms + 255) / 256, 256, 0, stream >>>(input, gradOutput, gradInput, nTfms);
+    return checkLaunch("CollapseRtPivots_BackwardLauncher");
+}
+
+// =============== TRANSFORM POINTS ================== //
+
+// R * p + t for each point (B x 3 x N), one transform per batch element (B x 3 x 4)
+__global__ void transformPoints(const float *points, const float *tfms, float *tfmpoints, int npoints)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x; // Point ID
+    int b = blockIdx.y; // Batch ID
+    if (n >= npoints) return;
+
+    const float *T = tfms + 12*b;
+    int valp = 3*npoints*b + n;
+    float x = points[valp], y = points[valp + npoints], z = points[valp + 2*npoints];
+    tfmpoints[valp]             = T[0] * x + T[1] * y + T[2]  * z + T[3];
+    tfmpoints[valp + npoints]   = T[4] * x + T[5] * y + T[6]  * z + T[7];
+    tfmpoints[valp + 2*npoints] = T[8] * x + T[9] * y + T[10] * z + T[11];
+}
+
+// Grad w.r.t points = R^T * g, grad w.r.t transforms = [sum_n g_n * p_n^T | sum_n g_n]
+// The grads w.r.t the transforms are reduced within each block (warp shuffles + shared memory) & the block sums
+// are added to the output (which has to be zeroed before)
+__global__ void transformPointsGrad(const float *points, const float *tfms, float *gradPoints, float *gradTfms,
+                                    const float *gradTfmpoints, int computeGradPoints, int computeGradTfms, int npoints)
+{
+    int n = blockIdx.x * blockDim.x + threadIdx.x; // Point ID
+    int b = blockIdx.y; // Batch ID
+    bool withinLimits = (n < npoints);
+
+    // Read the point & its grad (zero if outside limits, so they add nothing to the sums)
+    const float *T = tfms + 12*b;
+    int valp = 3*npoints*b + n;
+    float x = 0, y = 0, z = 0, gxt = 0, gyt = 0, gzt = 0;
+    if (withinLimits)
+    {
+        x   = points[valp]; y = points[valp + npoints]; z = points[valp + 2*npoints];
+        gxt = gradTfmpoints[valp]; gyt = gradTfmpoints[valp + npoints]; gzt = gradTfmpoints[valp + 2*npoints];
+    }
+
+    // Grad w.r.t points (R^T * gpt)
+    if (computeGradPoints && withinLimits)
+    {
+        gradPoints[valp]             = T[0] * gxt + T[4] * gyt + T[8]  * gzt;
+        gradPoints[valp + npoints]   = T[1] * gxt + T[5] * gyt + T[9]  * gzt;
+        gradPoints[valp + 2*npoints] = T[2] * gxt + T[6] * gyt + T[10] * gzt;
+    }
+    if (!computeGradTfms) return;
+
+    // Grad w.r.t transform, reduced over the block
+    __shared__ float sharedGrads[12][WARPSIZE];
+    float g[12] = {gxt * x, gxt * y, gxt * z, gxt,
+                   gyt * x, gyt * y, gyt * z, gyt,
+                   gzt * x, gzt * y, gzt * z, gzt};
+    int lane = threadIdx.x % WARPSIZE, warp = threadIdx.x / WARPSIZE;
+    int nWarps = (blockDim.x + WARPSIZE - 1) / WARPSIZE;
+    for (int k = 0; k < 12; k++)
+    {
+        float v = warpReduceSum(g[k]);
+        if (lane == 0) sharedGrads[k][warp] = v;
+    }
+    __syncthreads();
+    if (warp == 0)
+    {
+        for (int k = 0; k < 12; k++)
+        {
+            float v = (lane < nWarps) ? sharedGrads[k][lane] : 0;
+            v = warpReduceSum(v);
+            if (lane == 0) atomicAdd(gradTfms + 12*b + k, v);
+        }
+    }
+}
+
+///////////////// Transform points launchers (one thread per point)
+int TransformPoints3D_ForwardLauncher(const float *points, const float *tfms, float *tfmpoints,
+                                      int batchSize, int npoints, cudaStream_t stream)
+{
+    dim3 blocks((npoints + 255) / 256, batchSize);
+    dim3 threads(256);
+    transformPoints <<< blocks, threads, 0, stream >>>(points, tfms, tfmpoints, npoints);
+    return checkLaunch("TransformPoints3D_ForwardLauncher");
+}
+
+int TransformPoints3D_BackwardLauncher(const float *points, const float *tfms, float *gradPoints, float *gradTfms,
+                                       const float *gradTfmpoints, int computeGradPoints, int computeGradTfms,
+                                       int batchSize, int npoints, cudaStream_t stream)
+{
+    // Grads w.r.t the transforms are accumulated
+    if (computeGradTfms)
+        cudaMemsetAsync(gradTfms, 0, batchSize * 12 * sizeof(float), stream);
+
+    dim3 blocks((npoints + 255) / 256, batchSize);
+    dim3 threads(256);
+    transformPointsGrad <<< blocks, threads, 0, stream >>>(points, tfms, gradPoints, gradTfms, gradTfmpoints,
+                                                           computeGradPoints, computeGradTfms, npoints);
+    return checkLaunch("TransformPoints3D_BackwardLauncher");
+}
+
+#ifdef __cplusplus
+}
+#endif
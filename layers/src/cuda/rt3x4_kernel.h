@@ -0,0 +1,35 @@
+#ifndef _RT3X4_KERNEL
+#define _RT3X4_KERNEL
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+int ComposeRtPair_ForwardLauncher(const float *A, const float *B, float *output, int nTfms, cudaStream_t stream);
+
+int ComposeRtPair_BackwardLauncher(const float *A, const float *B, float *gradA, float *gradB, const float *gradOutput,
+                                   int computeGradA, int computeGradB, int nTfms, cudaStream_t stream);
+
+int RtInverse_ForwardLauncher(const float *input, float *output, int nTfms, cudaStream_t stream);
+
+int RtInverse_BackwardLauncher(const float *input, float *gradInput, const float *gradOutput,
+                               int nTfms, cudaStream_t stream);
+
+int CollapseRtPivots_ForwardLauncher(const float *input, float *output, int nTfms, cudaStream_t stream);
+
+int CollapseRtPivots_BackwardLauncher(const float *input, float *gradInput, const float *gradOutput,
+                                      int nTfms, cudaStream_t stream);
+
+int TransformPoints3D_ForwardLauncher(const float *points, const float *tfms, float *tfmpoints,
+                                      int batchSize, int npoints, cudaStream_t stream);
+
+int TransformPoints3D_BackwardLauncher(const float *points, const float *tfms, float *gradPoints, float *gradTfms,
+                                       const float *gradTfmpoints, int computeGradPoints, int computeGradTfms,
+                                       int batchSize, int npoints, cudaStream_t stream);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
+
@@ -1,35 +0,0 @@
-// == Float
-int NTfm3D_forward_float(
-			THFloatTensor *points,
-			THFloatTensor *masks,
-			THFloatTensor *tfms,
-			THFloatTensor *tfmpoints);
-
-int NTfm3D_backward_float(
-			THFloatTensor *points,
-			THFloatTensor *masks,
-			THFloatTensor *tfms,
-			THFloatTensor *tfmpoints,
-			THFloatTensor *gradPoints,
-			THFloatTensor *gradMasks,
-			THFloatTensor *gradTfms,
-			THFloatTensor *gradTfmpoints,
-            int useMaskGradMag);
-
-// == Double
-int NTfm3D_forward_double(
-			THDoubleTensor *points,
-			THDoubleTensor *masks,
-			THDoubleTensor *tfms,
-			THDoubleTensor *tfmpoints);
-
-int NTfm3D_backward_double(
-			THDoubleTensor *points,
-			THDoubleTensor *masks,
-			THDoubleTensor *tfms,
-			THDoubleTensor *tfmpoints,
-			THDoubleTensor *gradPoints,
-			THDoubleTensor *gradMasks,
-			THDoubleTensor *gradTfms,
-			THDoubleTensor *gradTfmpoints,
-            int useMaskGradMag);
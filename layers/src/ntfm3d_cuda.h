@@ -1,16 +0,0 @@
-int NTfm3D_forward_cuda(
-			THCudaTensor *points,
-			THCudaTensor *masks,
-			THCudaTensor *tfms,
-			THCudaTensor *tfmpoints);
-
-int NTfm3D_backward_cuda(
-			THCudaTensor *points,
-			THCudaTensor *masks,
-			THCudaTensor *tfms,
-			THCudaTensor *tfmpoints,
-			THCudaTensor *gradPoints,
-			THCudaTensor *gradMasks,
-			THCudaTensor *gradTfms,
-			THCudaTensor *gradTfmpoints,
-            int useMaskGradMag);
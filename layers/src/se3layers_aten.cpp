@@ -0,0 +1,2404 @@
+#include <torch/extension.h>
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+#include <vector>
+
+// ATen (C++ extension) CPU kernels of the layers (the CUDA ones are in se3layers_cuda.cpp, see backend.py)
+// These never make contiguous copies of their inputs. Every tensor is read/written using
+// its own strides, so expanded (zero-stride) views such as the "initpt"/"initpose" tensors in the data loaders are
+// used as is. All kernels dispatch on the type of the input (float/double) & are run with the GIL released, so
+// multiple loader threads can run them concurrently
+
+// ===== HELPERS
+
+// Pointer to the data of a (upto) 4D tensor, indexed using the strides of that tensor
+template <typename T>
+struct StridedPtr
+{
+    T *data;
+    int64_t s[4];
+
+    explicit StridedPtr(const at::Tensor &t)
+        : data(t.data_ptr<typename std::remove_const<T>::type>())
+    {
+        for (int k = 0; k < 4; k++)
+            s[k] = (k < t.dim()) ? t.stride(k) : 0;
+    }
+
+    inline T& operator()(int64_t i0, int64_t i1, int64_t i2, int64_t i3) const
+    {
+        return data[i0*s[0] + i1*s[1] + i2*s[2] + i3*s[3]];
+    }
+};
+
+// Copy a set of (3x4) transforms [R|t] (B x K x 3 x 4, any strides) to contiguous memory (B x K x 12)
+// These are re-used by every pixel of an image, so this removes the strided reads from the inner loops
+template <typename scalar_t>
+std::vector<scalar_t> gather_transforms(const at::Tensor &tfms)
+{
+    const int64_t batchsize = tfms.size(0), ntfms = tfms.size(1);
+    StridedPtr<const scalar_t> tp(tfms);
+    std::vector<scalar_t> T(batchsize*ntfms*12);
+    for (int64_t b = 0; b < batchsize; b++)
+        for (int64_t k = 0; k < ntfms; k++)
+            for (int64_t i = 0; i < 3; i++)
+                for (int64_t j = 0; j < 4; j++)
+                    T[(b*ntfms + k)*12 + i*4 + j] = tp(b, k, i, j);
+    return T;
+}
+
+// Check that a tensor is a 4D CPU tensor
+void check_input(const at::Tensor &t, const char *name)
+{
+    TORCH_CHECK(!t.is_cuda(), name, " has to be a CPU tensor");
+    TORCH_CHECK(t.dim() == 4, name, " has to be 4D");
+}
+
+// ===== NTFM3D
+// The masks can be at a lower resolution than the points (B x k x n x m, n <= N & m <= M). These are upsampled on the
+// fly (bilinear, same as F.interpolate(mode='bilinear', align_corners=False)) & the gradients w.r.t the low-res masks
+// are the gradients w.r.t the upsampled masks, summed over the points that each mask pixel contributes to
+
+// Source pixels & weights for the bilinear upsampling along a dimension ("nin" -> "nout" pixels):
+// out[i] = (1 - l[i]) * in[i0[i]] + l[i] * in[i1[i]]
+template <typename scalar_t>
+struct BilinearCoeffs
+{
+    std::vector<int64_t> i0, i1;
+    std::vector<scalar_t> l;
+
+    BilinearCoeffs(int64_t nin, int64_t nout)
+        : i0(nout), i1(nout), l(nout)
+    {
+        const scalar_t scale = (scalar_t)nin / (scalar_t)nout;
+        for (int64_t i = 0; i < nout; i++)
+        {
+            scalar_t src = std::max(scale * (i + (scalar_t)0.5) - (scalar_t)0.5, (scalar_t)0);
+            i0[i] = std::min((int64_t)src, nin-1);
+            i1[i] = std::min(i0[i] + 1, nin-1);
+            l[i]  = src - i0[i];
+        }
+    }
+};
+
+// Weight of the 'k'th transform at point (r,c): the mask value or the upsampled mask value (UP)
+template <typename scalar_t, bool UP>
+struct MaskSampler
+{
+    StridedPtr<const scalar_t> msk;
+    BilinearCoeffs<scalar_t> ry, cx;
+
+    MaskSampler(const at::Tensor &masks, int64_t nrows, int64_t ncols)
+        : msk(masks), ry(UP ? masks.size(2) : 0, UP ? nrows : 0), cx(UP ? masks.size(3) : 0, UP ? ncols : 0) {}
+
+    inline scalar_t operator()(int64_t b, int64_t k, int64_t r, int64_t c) const
+    {
+        if (!UP) return msk(b,k,r,c);
+        const scalar_t lr = ry.l[r], lc = cx.l[c];
+        return (1 - lr) * ((1 - lc) * msk(b,k,ry.i0[r],cx.i0[c]) + lc * msk(b,k,ry.i0[r],cx.i1[c])) +
+                    lr  * ((1 - lc) * msk(b,k,ry.i1[r],cx.i0[c]) + lc * msk(b,k,ry.i1[r],cx.i1[c]));
+    }
+};
+
+template <typename scalar_t, bool UP>
+void ntfm3d_forward_kernel(
+            const at::Tensor &points,
+            const at::Tensor &masks,
+            const at::Tensor &tfms,
+            at::Tensor &tfmpoints)
+{
+    // Initialize vars
+    const int64_t batchsize = points.size(0);
+    const int64_t nrows     = points.size(2);
+    const int64_t ncols     = points.size(3);
+    const int64_t nSE3      = masks.size(1);
+
+    // Get data
+    StridedPtr<const scalar_t> pts(points);
+    StridedPtr<scalar_t> out(tfmpoints);
+    const MaskSampler<scalar_t, UP> msk(masks, nrows, ncols);
+    const std::vector<scalar_t> tfms_data = gather_transforms<scalar_t>(tfms);
+
+    // Iterate over all points
+    // Each (image, row) pair is independent, so split these across threads
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                // Get input point (p)
+                scalar_t x = pts(b,0,r,c), y = pts(b,1,r,c), z = pts(b,2,r,c);
+
+                // Compute sum_k w_k * (R_k*p + t_k) across the different SE3s
+                scalar_t xt = 0, yt = 0, zt = 0;
+                for (int64_t k = 0; k < nSE3; k++)
+                {
+                    scalar_t w_k = msk(b,k,r,c);                     // Get the weight for the 'k'th transform
+                    const scalar_t *T = &tfms_data[(b*nSE3 + k)*12]; // Get the 'k'th transform
+                    xt += w_k * (T[0] * x + T[1] * y + T[2]  * z + T[3]);
+                    yt += w_k * (T[4] * x + T[5] * y + T[6]  * z + T[7]);
+                    zt += w_k * (T[8] * x + T[9] * y + T[10] * z + T[11]);
+                }
+
+                // Copy to output
+                out(b,0,r,c) = xt;
+                out(b,1,r,c) = yt;
+                out(b,2,r,c) = zt;
+            }
+        }
+    }
+}
+
+// Check the sizes of the masks & transforms, returns true if the masks have to be upsampled
+bool check_ntfm3d_inputs(const at::Tensor &points, const at::Tensor &masks, const at::Tensor &tfms)
+{
+    check_input(points, "points");
+    TORCH_CHECK(points.size(1) == 3, "points has to be B x 3 x N x M");
+    TORCH_CHECK(masks.dim() == 4 && masks.size(0) == points.size(0) && masks.size(2) <= points.size(2) &&
+                masks.size(3) <= points.size(3), "masks has to be B x k x n x m (n <= N, m <= M)");
+    TORCH_CHECK(tfms.dim() == 4 && tfms.size(0) == points.size(0) && tfms.size(1) == masks.size(1) &&
+                tfms.size(2) == 3 && tfms.size(3) == 4, "tfms has to be B x k x 3 x 4");
+    return (masks.size(2) != points.size(2)) || (masks.size(3) != points.size(3));
+}
+
+int NTfm3D_forward(
+            at::Tensor points,
+            at::Tensor masks,
+            at::Tensor tfms,
+            at::Tensor tfmpoints)
+{
+    const bool upsample = check_ntfm3d_inputs(points, masks, tfms);
+    tfmpoints.resize_(points.sizes());
+    AT_DISPATCH_FLOATING_TYPES(points.scalar_type(), "NTfm3D_forward", [&] {
+        if (upsample)
+            ntfm3d_forward_kernel<scalar_t, true>(points, masks, tfms, tfmpoints);
+        else
+            ntfm3d_forward_kernel<scalar_t, false>(points, masks, tfms, tfmpoints);
+    });
+    return 1;
+}
+
+template <typename scalar_t, bool UP>
+void ntfm3d_backward_kernel(
+            const at::Tensor &points,
+            const at::Tensor &masks,
+            const at::Tensor &tfms,
+            at::Tensor &gradPoints,
+            at::Tensor &gradMasks,
+            at::Tensor &gradTfms,
+            const at::Tensor &gradTfmpoints,
+            bool useMaskGradMag,
+            bool computeGradPoints,
+            bool computeGradMasks,
+            bool computeGradTfms)
+{
+    // Initialize vars
+    const int64_t batchsize = points.size(0);
+    const int64_t nrows     = points.size(2);
+    const int64_t ncols     = points.size(3);
+    const int64_t nSE3      = masks.size(1);
+    const int64_t mrows     = masks.size(2);
+    const int64_t mcols     = masks.size(3);
+
+    // Get data
+    StridedPtr<const scalar_t> pts(points), gout(gradTfmpoints);
+    StridedPtr<scalar_t> gpts(gradPoints), gmsk(gradMasks), gtfm(gradTfms);
+    const MaskSampler<scalar_t, UP> msk(masks, nrows, ncols);
+    const std::vector<scalar_t> tfms_data = gather_transforms<scalar_t>(tfms);
+
+    // The gradients w.r.t the transforms are summed over all the points. Each row accumulates into its own
+    // buffer (so rows can be run in parallel) & these are summed up in order later (so the result is deterministic)
+    // Only the gradients that are needed (computeGrad*) are computed, the other grad tensors are not used
+    std::vector<scalar_t> rowgT(computeGradTfms ? batchsize*nrows*nSE3*12 : 0, 0);
+
+    // With upsampled masks, the gradients w.r.t the masks of each row are summed along the columns into a buffer
+    // (nSE3 x mcols per row) & the rows are summed up later (also in order)
+    std::vector<scalar_t> rowgM((UP && computeGradMasks) ? batchsize*nrows*nSE3*mcols : 0, 0);
+
+    // Iterate over all points
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            scalar_t *gTr = computeGradTfms ? &rowgT[(b*nrows + r)*nSE3*12] : nullptr;
+            scalar_t *gMr = (UP && computeGradMasks) ? &rowgM[(b*nrows + r)*nSE3*mcols] : nullptr;
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                // Get input point (p) & gradient w.r.t output point (gpt)
+                scalar_t x = pts(b,0,r,c), y = pts(b,1,r,c), z = pts(b,2,r,c);
+                scalar_t gxt = gout(b,0,r,c), gyt = gout(b,1,r,c), gzt = gout(b,2,r,c);
+                scalar_t sxt = (0 < gxt) - (gxt < 0), syt = (0 < gyt) - (gyt < 0), szt = (0 < gzt) - (gzt < 0);
+
+                // Gradients w.r.t pts, masks & tfms
+                scalar_t gx = 0, gy = 0, gz = 0; // Grads w.r.t input pts
+                for (int64_t k = 0; k < nSE3; k++)
+                {
+                    // Get transform & wt
+                    scalar_t w_k = msk(b,k,r,c);
+                    const scalar_t *T = &tfms_data[(b*nSE3 + k)*12];
+
+                    // === Gradient w.r.t input point (p = R^T * gpt, summed across all the "k" transforms)
+                    gx += w_k * (T[0] * gxt + T[4] * gyt + T[8]  * gzt);
+                    gy += w_k * (T[1] * gxt + T[5] * gyt + T[9]  * gzt);
+                    gz += w_k * (T[2] * gxt + T[6] * gyt + T[10] * gzt);
+
+                    // === Gradient w.r.t mask (w_k) = (R_k^T * p + t_k) * gpt (or only its sign)
+                    if (computeGradMasks)
+                    {
+                        scalar_t xk = T[0] * x + T[1] * y + T[2]  * z + T[3];
+                        scalar_t yk = T[4] * x + T[5] * y + T[6]  * z + T[7];
+                        scalar_t zk = T[8] * x + T[9] * y + T[10] * z + T[11];
+                        scalar_t gw_k = useMaskGradMag ? (gxt * xk + gyt * yk + gzt * zk) :
+                                                         (sxt * xk + syt * yk + szt * zk);
+                        if (UP)
+                        {
+                            // Split between the two mask columns the point is interpolated from
+                            const scalar_t lc = msk.cx.l[c];
+                            gMr[k*mcols + msk.cx.i0[c]] += (1 - lc) * gw_k;
+                            gMr[k*mcols + msk.cx.i1[c]] += lc * gw_k;
+                        }
+                        else
+                            gmsk(b,k,r,c) = gw_k;
+                    }
+
+                    // === Gradients w.r.t transforms (t_k)
+                    if (!computeGradTfms) continue;
+                    scalar_t *gT = gTr + k*12;
+                    gT[0]  += w_k * x * gxt;
+                    gT[1]  += w_k * y * gxt;
+                    gT[2]  += w_k * z * gxt;
+                    gT[3]  += w_k * gxt;
+                    gT[4]  += w_k * x * gyt;
+                    gT[5]  += w_k * y * gyt;
+                    gT[6]  += w_k * z * gyt;
+                    gT[7]  += w_k * gyt;
+                    gT[8]  += w_k * x * gzt;
+                    gT[9]  += w_k * y * gzt;
+                    gT[10] += w_k * z * gzt;
+                    gT[11] += w_k * gzt;
+                }
+
+                // Gradients w.r.t pts (copy after sum across tfms)
+                if (computeGradPoints)
+                {
+                    gpts(b,0,r,c) = gx;
+                    gpts(b,1,r,c) = gy;
+                    gpts(b,2,r,c) = gz;
+                }
+            }
+        }
+    }
+
+    // Sum up the gradients w.r.t the masks across the rows that each mask row is interpolated into
+    if (UP && computeGradMasks)
+    {
+        #pragma omp parallel for collapse(2)
+        for (int64_t b = 0; b < batchsize; b++)
+        {
+            for (int64_t mr = 0; mr < mrows; mr++)
+            {
+                std::vector<scalar_t> gM(nSE3*mcols, 0);
+                for (int64_t r = 0; r < nrows; r++)
+                {
+                    const scalar_t lr = msk.ry.l[r];
+                    const scalar_t wt = (msk.ry.i0[r] == mr ? 1 - lr : 0) + (msk.ry.i1[r] == mr ? lr : 0);
+                    if (wt == 0) continue;
+                    const scalar_t *gMr = &rowgM[(b*nrows + r)*nSE3*mcols];
+                    for (int64_t j = 0; j < nSE3*mcols; j++)
+                        gM[j] += wt * gMr[j];
+                }
+                for (int64_t k = 0; k < nSE3; k++)
+                    for (int64_t mc = 0; mc < mcols; mc++)
+                        gmsk(b,k,mr,mc) = gM[k*mcols + mc];
+            }
+        }
+    }
+    if (!computeGradTfms) return;
+
+    // Sum up the gradients w.r.t the transforms across rows
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t k = 0; k < nSE3; k++)
+        {
+            scalar_t gT[12] = {0};
+            for (int64_t r = 0; r < nrows; r++)
+                for (int64_t j = 0; j < 12; j++)
+                    gT[j] += rowgT[((b*nrows + r)*nSE3 + k)*12 + j];
+            for (int64_t j = 0; j < 12; j++)
+                gtfm(b,k,j/4,j%4) = gT[j];
+        }
+    }
+}
+
+int NTfm3D_backward(
+            at::Tensor points,
+            at::Tensor masks,
+            at::Tensor tfms,
+            at::Tensor tfmpoints,
+            at::Tensor gradPoints,
+            at::Tensor gradMasks,
+            at::Tensor gradTfms,
+            at::Tensor gradTfmpoints,
+            int useMaskGradMag,
+            int computeGradPoints,
+            int computeGradMasks,
+            int computeGradTfms)
+{
+    const bool upsample = check_ntfm3d_inputs(points, masks, tfms);
+    AT_DISPATCH_FLOATING_TYPES(points.scalar_type(), "NTfm3D_backward", [&] {
+        if (upsample)
+            ntfm3d_backward_kernel<scalar_t, true>(points, masks, tfms, gradPoints, gradMasks, gradTfms, gradTfmpoints,
+                                                   useMaskGradMag != 0, computeGradPoints != 0,
+                                                   computeGradMasks != 0, computeGradTfms != 0);
+        else
+            ntfm3d_backward_kernel<scalar_t, false>(points, masks, tfms, gradPoints, gradMasks, gradTfms, gradTfmpoints,
+                                                    useMaskGradMag != 0, computeGradPoints != 0,
+                                                    computeGradMasks != 0, computeGradTfms != 0);
+    });
+    return 1;
+}
+
+// ===== PROJECT 3D POINTS TO SUB-PIXEL DEPTH
+// NOTE: The index map here stores the linear id ((b*nrows + r)*ncols + c) of the point that projects onto a pixel,
+// not its offset in memory (the inputs can have any strides), so it is only valid for the functions in this file
+
+template <typename scalar_t>
+inline bool perspective_projection(scalar_t x, scalar_t y, scalar_t z,
+                                   scalar_t fx, scalar_t fy, scalar_t cx, scalar_t cy,
+                                   scalar_t &xpix, scalar_t &ypix)
+{
+    // Do a perspective transform, scale by focal length & add principal point
+    if (z > 0)
+    {
+        xpix = ((x/z) * fx) + cx;
+        ypix = ((y/z) * fy) + cy;
+        return true;
+    }
+    return false;
+}
+
+template <typename scalar_t>
+void project3dpts_forward_kernel(
+            const at::Tensor &input,
+            at::Tensor &indexMap,
+            at::Tensor &output,
+            scalar_t fy, scalar_t fx,
+            scalar_t cy, scalar_t cx)
+{
+    // Initialize vars
+    const int64_t batchsize = input.size(0);
+    const int64_t nrows     = input.size(2);
+    const int64_t ncols     = input.size(3);
+
+    // Get data
+    StridedPtr<const scalar_t> in(input);
+    StridedPtr<scalar_t> out(output);
+    StridedPtr<int64_t> imap(indexMap);
+
+    // Iterate over all points & do the depth test (in parallel)
+    // The index map holds the ID of the closest point projecting onto each pixel so far. It is updated with an
+    // atomic compare-and-swap. Ties in depth go to the point with the smaller ID, which is the point that a serial
+    // scan would pick
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                // Compute pixel coordinates based on focal length and COP
+                scalar_t z = in(b,2,r,c), xpix, ypix;
+                if (!perspective_projection(in(b,0,r,c), in(b,1,r,c), z, fx, fy, cx, cy, xpix, ypix))
+                    continue; // No valid projection : Z <= 0
+
+                // Check limits & do the depth test
+                int64_t xpixr = (int64_t) std::round(xpix); // Rounded off pixel col
+                int64_t ypixr = (int64_t) std::round(ypix); // Rounded off pixel row
+                if (xpixr < 0 || xpixr >= ncols || ypixr < 0 || ypixr >= nrows) continue;
+                int64_t id     = (b*nrows + r)*ncols + c;
+                int64_t *pixid = &imap(b,0,ypixr,xpixr); // y = row, x = col
+                int64_t curri  = __atomic_load_n(pixid, __ATOMIC_RELAXED);
+                while (true)
+                {
+                    if (curri != -1)
+                    {
+                        scalar_t zc = in(b, 2, (curri / ncols) % nrows, curri % ncols);
+                        if ((zc < z) || ((zc == z) && (curri < id))) break; // Current point is closer
+                    }
+                    if (__atomic_compare_exchange_n(pixid, &curri, id, false, __ATOMIC_RELAXED, __ATOMIC_RELAXED))
+                        break; // Updated the index map (else curri is set to the new value at the pixel & we retry)
+                }
+            }
+        }
+    }
+
+    // Iterate over all output pixels & set outputs based on the point that projects onto it
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                int64_t id = imap(b,0,r,c);
+                if (id == -1) continue; // No point projects onto this pixel
+
+                // (XO,YO,ZO) = (xpix, ypix, z) ==> Save sub-pixel x,y and depth
+                int64_t ri = (id / ncols) % nrows, ci = id % ncols;
+                scalar_t z = in(b,2,ri,ci), xpix = 0, ypix = 0;
+                perspective_projection(in(b,0,ri,ci), in(b,1,ri,ci), z, fx, fy, cx, cy, xpix, ypix);
+                out(b,0,r,c) = xpix;
+                out(b,1,r,c) = ypix;
+                out(b,2,r,c) = z;
+            }
+        }
+    }
+}
+
+int Project3DPointsToSubPixelDepth_forward(
+            at::Tensor input,
+            at::Tensor indexMap,
+            at::Tensor output,
+            double fy, double fx,
+            double cy, double cx)
+{
+    check_input(input, "input");
+    TORCH_CHECK(indexMap.scalar_type() == at::kLong, "indexMap has to be a LongTensor");
+    output.fill_(0);
+    indexMap.fill_(-1); // -1 means invalid
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "Project3DPointsToSubPixelDepth_forward", [&] {
+        project3dpts_forward_kernel<scalar_t>(input, indexMap, output, fy, fx, cy, cx);
+    });
+    return 1;
+}
+
+template <typename scalar_t>
+void project3dpts_backward_kernel(
+            const at::Tensor &input,
+            const at::Tensor &indexMap,
+            at::Tensor &gradInput,
+            const at::Tensor &gradOutput,
+            scalar_t fy, scalar_t fx)
+{
+    // Initialize vars
+    const int64_t batchsize = input.size(0);
+    const int64_t nrows     = input.size(2);
+    const int64_t ncols     = input.size(3);
+
+    // Get data
+    StridedPtr<const scalar_t> in(input), gout(gradOutput);
+    StridedPtr<const int64_t> imap(indexMap);
+    StridedPtr<scalar_t> gin(gradInput);
+
+    // Iterate over all output pixels (each point projects onto one pixel only, so these writes don't overlap)
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                int64_t id = imap(b,0,r,c);
+                if (id == -1) continue; // In case this point has no corresponding output index, continue
+
+                // Get input point & gradOutput value (for that output pixel)
+                int64_t ri = (id / ncols) % nrows, ci = id % ncols;
+                scalar_t x = in(b,0,ri,ci), y = in(b,1,ri,ci), z = in(b,2,ri,ci);
+                scalar_t gx = gout(b,0,r,c), gy = gout(b,1,r,c), gz = gout(b,2,r,c);
+
+                // Gradient w.r.t x = (fx/z) * gx
+                // Gradient w.r.t y = (fy/z) * gy
+                // Gradient w.r.t z = (-x/z^2) * fx * gx + (-y/z^2) * fy * gy + gz
+                gin(b,0,ri,ci) = (fx/z) * gx;
+                gin(b,1,ri,ci) = (fy/z) * gy;
+                gin(b,2,ri,ci) = ((-x/(z*z)) * fx * gx) + ((-y/(z*z)) * fy * gy) + gz;
+            }
+        }
+    }
+}
+
+int Project3DPointsToSubPixelDepth_backward(
+            at::Tensor input,
+            at::Tensor indexMap,
+            at::Tensor gradInput,
+            at::Tensor gradOutput,
+            double fy, double fx,
+            double cy, double cx)
+{
+    check_input(input, "input");
+    gradInput.fill_(0);
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "Project3DPointsToSubPixelDepth_backward", [&] {
+        project3dpts_backward_kernel<scalar_t>(input, indexMap, gradInput, gradOutput, fy, fx);
+    });
+    return 1;
+}
+
+// ===== COMPUTE FLOW AND VISIBILITY
+
+// Per-frame, per-label index of the pixels in a label image. For every (frame, row, label) this stores the
+// (sorted) list of columns with that label, so the DA search only touches candidates of the same link
+struct LabelIndex
+{
+    int64_t nlabels;              // Max label + 1
+    std::vector<int64_t> offsets; // (batchsize x nrows x nlabels) + 1 offsets into cols
+    std::vector<int> cols;        // Column ids, grouped by (frame, row, label) & sorted within each group
+
+    LabelIndex(const StridedPtr<const uint8_t> &label, int64_t batchsize, int64_t nrows, int64_t ncols)
+    {
+        // Find the number of labels
+        uint8_t maxlabel = 0;
+        for (int64_t b = 0; b < batchsize; b++)
+            for (int64_t r = 0; r < nrows; r++)
+                for (int64_t c = 0; c < ncols; c++)
+                    maxlabel = std::max(maxlabel, label(b,0,r,c));
+        nlabels = (int64_t)maxlabel + 1;
+        offsets.assign(batchsize*nrows*nlabels + 1, 0);
+        cols.resize(batchsize*nrows*ncols);
+
+        // Count the number of pixels per (frame, row, label)
+        #pragma omp parallel for collapse(2)
+        for (int64_t b = 0; b < batchsize; b++)
+        {
+            for (int64_t r = 0; r < nrows; r++)
+            {
+                int64_t *count = &offsets[(b*nrows + r)*nlabels + 1];
+                for (int64_t c = 0; c < ncols; c++)
+                    count[label(b,0,r,c)]++;
+            }
+        }
+
+        // Offsets are the cumulative sum of the counts
+        for (size_t k = 1; k < offsets.size(); k++)
+            offsets[k] += offsets[k-1];
+
+        // Fill in the columns (each row is filled left -> right, so the columns are sorted)
+        #pragma omp parallel for collapse(2)
+        for (int64_t b = 0; b < batchsize; b++)
+        {
+            for (int64_t r = 0; r < nrows; r++)
+            {
+                const int64_t *start = &offsets[(b*nrows + r)*nlabels];
+                int64_t fill[256] = {0};
+                for (int64_t c = 0; c < ncols; c++)
+                {
+                    uint8_t l = label(b,0,r,c);
+                    cols[start[l] + fill[l]++] = c;
+                }
+            }
+        }
+    }
+};
+
+template <typename scalar_t>
+void compute_visibility(
+        const StridedPtr<scalar_t> &local1,
+        const StridedPtr<scalar_t> &local2,
+        const StridedPtr<const uint8_t> &label1,
+        const StridedPtr<const uint8_t> &label2,
+        const LabelIndex &index2,
+        const std::vector<scalar_t> &poses2,
+        int64_t nposes,
+        const StridedPtr<uint8_t> &visible1,
+        const StridedPtr<int> &assocpixelid1,
+        scalar_t fx,
+        scalar_t fy,
+        scalar_t cx,
+        scalar_t cy,
+        scalar_t threshold,
+        scalar_t winsize,
+        bool earlyexit,
+        int64_t batchsize,
+        int64_t nrows,
+        int64_t ncols)
+{
+    // Setup extra params
+    scalar_t sqthresh = threshold*threshold;      // Threshold on squared distance
+    int winhalfsize   = std::floor(winsize/2.0);  // -winhalfsize -> (-winhalfsize + winsize-1)
+    int iwinsize      = (int) winsize;
+
+    // Project to get pixel in target image & search for the closest point in a window around it
+    // Each (image, row) pair is independent, so split these across threads
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                // Get local pt & link label for that input point
+                scalar_t xi = local1(b,0,r,c), yi = local1(b,1,r,c), zi = local1(b,2,r,c);
+                uint8_t mi = label1(b,0,r,c);
+
+                // In case the ID is background, then skip DA
+                // If no other object has moved on top of it then it is visible at next timestep, else not
+                if (mi == 0)
+                {
+                    if (label2(b,0,r,c) == 0)
+                    {
+                        visible1(b,0,r,c) = 1;
+                        assocpixelid1(b,0,r,c) = (r * ncols) + c;
+                    }
+                    continue;
+                }
+
+                // No pixels of this link in the target frame
+                if (mi >= index2.nlabels) continue;
+
+                // Find the 3D point where this vertex projects onto in the target frame
+                const scalar_t *T = &poses2[(b*nposes + mi)*12];
+                scalar_t xp = T[0] * xi + T[1] * yi + T[2]  * zi + T[3];
+                scalar_t yp = T[4] * xi + T[5] * yi + T[6]  * zi + T[7];
+                scalar_t zp = T[8] * xi + T[9] * yi + T[10] * zi + T[11];
+
+                // Project target 3D point (in cam frame) onto canvas to get approx pixel location to search for DA
+                int cpix = (int) std::round((xp/zp)*fx + cx);
+                int rpix = (int) std::round((yp/zp)*fy + cy);
+                if (rpix < 0 || rpix >= nrows || cpix < 0 || cpix >= ncols) continue;
+
+                // Check in a region around this point (only pixels with the same link label). Ties are broken
+                // towards the lowest pixel index, as in a row-major scan of the window. With "earlyexit", rows are
+                // searched outwards from the projected pixel & we stop at the first row with a match (this can pick
+                // a different match than the full search), else the rows are searched in order
+                int rmin = std::max(rpix-winhalfsize, 0), rmax = std::min<int>(rpix-winhalfsize+iwinsize-1, nrows-1);
+                int cmin = std::max(cpix-winhalfsize, 0), cmax = std::min<int>(cpix-winhalfsize+iwinsize-1, ncols-1);
+                scalar_t mindist = std::numeric_limits<scalar_t>::infinity();
+                int mintr = -1, mintc = -1;
+                int nk = earlyexit ? 2*iwinsize : rmax-rmin+1;
+                for (int k = 0; k < nk; k++)
+                {
+                    // Row order: rpix, rpix-1, rpix+1, rpix-2, ... (early exit), rmin -> rmax (full search)
+                    int tr = !earlyexit ? rmin + k : ((k % 2 == 0) ? rpix + k/2 : rpix - (k+1)/2);
+                    if (tr < rmin || tr > rmax) continue;
+
+                    // Get the columns with the same label in this row & find the first one inside the window
+                    const int64_t *off = &index2.offsets[(b*nrows + tr)*index2.nlabels + mi];
+                    const int *first = std::lower_bound(&index2.cols[0] + off[0], &index2.cols[0] + off[1], cmin);
+                    const int *last  = &index2.cols[0] + off[1];
+
+                    // Iterate over the candidates in the window
+                    for (const int *tcp = first; tcp != last && *tcp <= cmax; tcp++)
+                    {
+                        // Check distance in local-coordinates
+                        int tc = *tcp;
+                        scalar_t dx = xi - local2(b,0,tr,tc), dy = yi - local2(b,1,tr,tc), dz = zi - local2(b,2,tr,tc);
+                        scalar_t dist = dx*dx + dy*dy + dz*dz;
+                        bool closer = (dist < mindist) ||
+                                      ((dist == mindist) && (tr*ncols + tc < mintr*ncols + mintc));
+                        if (closer && (dist < sqthresh))
+                        {
+                            mindist = dist;
+                            mintr = tr;
+                            mintc = tc;
+                        }
+                    }
+
+                    // Stop at the first row with a match
+                    if (earlyexit && mintr != -1) break;
+                }
+
+                // In case we found a match, update outputs
+                if (mintr != -1)
+                {
+                    visible1(b,0,r,c) = 1;
+                    assocpixelid1(b,0,r,c) = (mintr * ncols) + mintc; // ID of pixel at t=2 that associates to (r,c) at t=1
+                }
+            }
+        }
+    }
+}
+
+// Transform the points of a cloud to the local frame of their link: local_pt = T_cam_to_local * global_pt
+template <typename scalar_t>
+void compute_local_points(
+        const StridedPtr<const scalar_t> &cloud,
+        const StridedPtr<const uint8_t> &label,
+        const std::vector<scalar_t> &poseinvs,
+        int64_t nposes,
+        const StridedPtr<scalar_t> &local,
+        int64_t batchsize,
+        int64_t nrows,
+        int64_t ncols)
+{
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                scalar_t x = cloud(b,0,r,c), y = cloud(b,1,r,c), z = cloud(b,2,r,c);
+                const scalar_t *T = &poseinvs[(b*nposes + label(b,0,r,c))*12];
+                local(b,0,r,c) = T[0] * x + T[1] * y + T[2]  * z + T[3];
+                local(b,1,r,c) = T[4] * x + T[5] * y + T[6]  * z + T[7];
+                local(b,2,r,c) = T[8] * x + T[9] * y + T[10] * z + T[11];
+            }
+        }
+    }
+}
+
+template <typename scalar_t>
+void computeflowandvisibility_kernel(
+            const at::Tensor &cloud_1,
+            const at::Tensor &cloud_2,
+            const at::Tensor &label_1,
+            const at::Tensor &label_2,
+            const at::Tensor &poses_1,
+            const at::Tensor &poses_2,
+            const at::Tensor &poseinvs_1,
+            const at::Tensor &poseinvs_2,
+            at::Tensor &fwdflows,
+            at::Tensor &bwdflows,
+            at::Tensor &fwdvisibility,
+            at::Tensor &bwdvisibility,
+            at::Tensor &fwdassocpixelids,
+            at::Tensor &bwdassocpixelids,
+            scalar_t fx, scalar_t fy, scalar_t cx, scalar_t cy,
+            scalar_t threshold, scalar_t winsize, bool earlyexit)
+{
+    // Initialize vars
+    const int64_t batchsize = cloud_1.size(0);
+    const int64_t nrows     = cloud_1.size(2);
+    const int64_t ncols     = cloud_1.size(3);
+    const int64_t nposes    = poses_1.size(1);
+
+    // Get data
+    StridedPtr<const scalar_t> cloud1(cloud_1), cloud2(cloud_2);
+    StridedPtr<const uint8_t> label1(label_1), label2(label_2);
+    StridedPtr<scalar_t> fwdflow(fwdflows), bwdflow(bwdflows);
+    StridedPtr<uint8_t> fwdvis(fwdvisibility), bwdvis(bwdvisibility);
+    StridedPtr<int> fwdassoc(fwdassocpixelids), bwdassoc(bwdassocpixelids);
+    const std::vector<scalar_t> poses1 = gather_transforms<scalar_t>(poses_1), poses2 = gather_transforms<scalar_t>(poses_2);
+    const std::vector<scalar_t> poseinvs1 = gather_transforms<scalar_t>(poseinvs_1);
+    const std::vector<scalar_t> poseinvs2 = gather_transforms<scalar_t>(poseinvs_2);
+
+    /// ====== Compute local coordinates @ t & t+1, save in flows for now
+    compute_local_points(cloud1, label1, poseinvs1, nposes, fwdflow, batchsize, nrows, ncols);
+    compute_local_points(cloud2, label2, poseinvs2, nposes, bwdflow, batchsize, nrows, ncols);
+
+    /// ======== Compute visibility masks (t -> t+1 & t+1 -> t)
+    LabelIndex index1(label1, batchsize, nrows, ncols), index2(label2, batchsize, nrows, ncols);
+    compute_visibility(fwdflow, bwdflow, label1, label2, index2, poses2, nposes, fwdvis, fwdassoc,
+                       fx, fy, cx, cy, threshold, winsize, earlyexit, batchsize, nrows, ncols);
+    compute_visibility(bwdflow, fwdflow, label2, label1, index1, poses1, nposes, bwdvis, bwdassoc,
+                       fx, fy, cx, cy, threshold, winsize, earlyexit, batchsize, nrows, ncols);
+
+    /// ======== Compute flows (transform local point to the other frame, flow = 0 for BG points)
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                for (int k = 0; k < 2; k++)
+                {
+                    const StridedPtr<scalar_t> &flow          = (k == 0) ? fwdflow : bwdflow;
+                    const StridedPtr<const scalar_t> &cloud   = (k == 0) ? cloud1 : cloud2;
+                    uint8_t m = (k == 0) ? label1(b,0,r,c) : label2(b,0,r,c);
+                    if (m == 0)
+                    {
+                        flow(b,0,r,c) = 0;
+                        flow(b,1,r,c) = 0;
+                        flow(b,2,r,c) = 0;
+                        continue;
+                    }
+                    scalar_t x = flow(b,0,r,c), y = flow(b,1,r,c), z = flow(b,2,r,c);
+                    const scalar_t *T = &((k == 0) ? poses2 : poses1)[(b*nposes + m)*12];
+                    flow(b,0,r,c) = (T[0] * x + T[1] * y + T[2]  * z + T[3])  - cloud(b,0,r,c);
+                    flow(b,1,r,c) = (T[4] * x + T[5] * y + T[6]  * z + T[7])  - cloud(b,1,r,c);
+                    flow(b,2,r,c) = (T[8] * x + T[9] * y + T[10] * z + T[11]) - cloud(b,2,r,c);
+                }
+            }
+        }
+    }
+}
+
+int ComputeFlowAndVisibility(
+            at::Tensor cloud_1,
+            at::Tensor cloud_2,
+            at::Tensor label_1,
+            at::Tensor label_2,
+            at::Tensor poses_1,
+            at::Tensor poses_2,
+            at::Tensor poseinvs_1,
+            at::Tensor poseinvs_2,
+            at::Tensor fwdflows,
+            at::Tensor bwdflows,
+            at::Tensor fwdvisibility,
+            at::Tensor bwdvisibility,
+            at::Tensor fwdassocpixelids,
+            at::Tensor bwdassocpixelids,
+            double fx, double fy, double cx, double cy,
+            double threshold, double winsize, int earlyexit)
+{
+    check_input(cloud_1, "cloud_1");
+    TORCH_CHECK(label_1.scalar_type() == at::kByte && label_2.scalar_type() == at::kByte, "labels have to be ByteTensors");
+    TORCH_CHECK(fwdassocpixelids.scalar_type() == at::kInt && bwdassocpixelids.scalar_type() == at::kInt,
+                "assoc pixel ids have to be IntTensors");
+    fwdvisibility.fill_(0); // Not visible by default
+    bwdvisibility.fill_(0);
+    fwdassocpixelids.fill_(-1); // No association by default
+    bwdassocpixelids.fill_(-1);
+    AT_DISPATCH_FLOATING_TYPES(cloud_1.scalar_type(), "ComputeFlowAndVisibility", [&] {
+        computeflowandvisibility_kernel<scalar_t>(cloud_1, cloud_2, label_1, label_2, poses_1, poses_2,
+                                                  poseinvs_1, poseinvs_2, fwdflows, bwdflows,
+                                                  fwdvisibility, bwdvisibility, fwdassocpixelids, bwdassocpixelids,
+                                                  fx, fy, cx, cy, threshold, winsize, earlyexit != 0);
+    });
+    return 1;
+}
+
+// ===== COMPUTE FLOW AND VISIBILITY (DATA-ASSOCIATION ONLY)
+
+template <typename scalar_t>
+void compute_visibility_and_flows(
+        const StridedPtr<const scalar_t> &cloud1,
+        const StridedPtr<const scalar_t> &cloud2,
+        const StridedPtr<scalar_t> &local1,
+        const StridedPtr<const uint8_t> &label1,
+        const StridedPtr<const uint8_t> &label2,
+        const std::vector<scalar_t> &poses2,
+        int64_t nposes,
+        const StridedPtr<uint8_t> &visible1,
+        const StridedPtr<int> &assocpixelid1,
+        const StridedPtr<scalar_t> &flows12,
+        scalar_t fx, scalar_t fy, scalar_t cx, scalar_t cy,
+        scalar_t threshold,
+        int64_t batchsize,
+        int64_t nrows,
+        int64_t ncols)
+{
+    // Project to get pixel in target image & interpolate the target depth around it
+    // Each (image, row) pair is independent, so split these across threads
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                // Get local pt & link label for that input point
+                scalar_t xi = local1(b,0,r,c), yi = local1(b,1,r,c), zi = local1(b,2,r,c);
+                uint8_t mi = label1(b,0,r,c);
+
+                // In case the ID is background, then skip DA
+                if (mi == 0)
+                {
+                    if (label2(b,0,r,c) == 0)
+                    {
+                        visible1(b,0,r,c) = 1;
+                        assocpixelid1(b,0,r,c) = (r * ncols) + c;
+                    }
+                    continue;
+                }
+
+                // Find the 3D point where this vertex projects onto in the target frame
+                const scalar_t *T = &poses2[(b*nposes + mi)*12];
+                scalar_t xp = T[0] * xi + T[1] * yi + T[2]  * zi + T[3];
+                scalar_t yp = T[4] * xi + T[5] * yi + T[6]  * zi + T[7];
+                scalar_t zp = T[8] * xi + T[9] * yi + T[10] * zi + T[11];
+
+                // Project target 3D point (in cam frame) onto canvas
+                scalar_t csubpix = (xp/zp)*fx + cx;
+                scalar_t rsubpix = (yp/zp)*fy + cy;
+
+                // Bilinearly interpolate the target depth (only from neighbours within the threshold)
+                const int64_t c1 = std::floor(csubpix), c2 = c1 + 1;
+                const int64_t r1 = std::floor(rsubpix), r2 = r1 + 1;
+                const int64_t rs[4] = {r1, r2, r1, r2}, cs[4] = {c1, c1, c2, c2};
+                const scalar_t wts[4] = {(r2-rsubpix) * (c2-csubpix), (rsubpix-r1) * (c2-csubpix),
+                                         (r2-rsubpix) * (csubpix-c1), (rsubpix-r1) * (csubpix-c1)};
+                scalar_t w = 0, z = 0;
+                for (int k = 0; k < 4; k++)
+                {
+                    if ((rs[k] >= 0) && (rs[k] < nrows) && (cs[k] >= 0) && (cs[k] < ncols))
+                    {
+                        scalar_t zt = cloud2(b,2,rs[k],cs[k]);
+                        if (std::fabs(zp - zt) < threshold)
+                        {
+                            w += wts[k];
+                            z += wts[k] * zt;
+                        }
+                    }
+                }
+
+                // Compute interpolated depth, flows & visibility
+                // In case none of the points are within the threshold, then w = 0 here
+                if (w > 0)
+                {
+                    visible1(b,0,r,c) = 1;
+                    int cpix = (int) std::round(csubpix);
+                    int rpix = (int) std::round(rsubpix);
+                    assocpixelid1(b,0,r,c) = (rpix * ncols) + cpix;
+
+                    // Flow is difference between that point @ t1 & DA point @ t2
+                    flows12(b,0,r,c) = xp - cloud1(b,0,r,c);
+                    flows12(b,1,r,c) = yp - cloud1(b,1,r,c);
+                    flows12(b,2,r,c) = zp - cloud1(b,2,r,c);
+                }
+            }
+        }
+    }
+}
+
+template <typename scalar_t>
+void computeflowandvisibility_pts_kernel(
+            const at::Tensor &cloud_1,
+            const at::Tensor &cloud_2,
+            at::Tensor &local_1,
+            at::Tensor &local_2,
+            const at::Tensor &label_1,
+            const at::Tensor &label_2,
+            const at::Tensor &poses_1,
+            const at::Tensor &poses_2,
+            const at::Tensor &poseinvs_1,
+            const at::Tensor &poseinvs_2,
+            at::Tensor &fwdflows,
+            at::Tensor &bwdflows,
+            at::Tensor &fwdvisibility,
+            at::Tensor &bwdvisibility,
+            at::Tensor &fwdassocpixelids,
+            at::Tensor &bwdassocpixelids,
+            scalar_t fx, scalar_t fy, scalar_t cx, scalar_t cy,
+            scalar_t threshold)
+{
+    // Initialize vars
+    const int64_t batchsize = cloud_1.size(0);
+    const int64_t nrows     = cloud_1.size(2);
+    const int64_t ncols     = cloud_1.size(3);
+    const int64_t nposes    = poses_1.size(1);
+
+    // Get data
+    StridedPtr<const scalar_t> cloud1(cloud_1), cloud2(cloud_2);
+    StridedPtr<scalar_t> local1(local_1), local2(local_2);
+    StridedPtr<const uint8_t> label1(label_1), label2(label_2);
+    StridedPtr<scalar_t> fwdflow(fwdflows), bwdflow(bwdflows);
+    StridedPtr<uint8_t> fwdvis(fwdvisibility), bwdvis(bwdvisibility);
+    StridedPtr<int> fwdassoc(fwdassocpixelids), bwdassoc(bwdassocpixelids);
+    const std::vector<scalar_t> poses1 = gather_transforms<scalar_t>(poses_1), poses2 = gather_transforms<scalar_t>(poses_2);
+    const std::vector<scalar_t> poseinvs1 = gather_transforms<scalar_t>(poseinvs_1);
+    const std::vector<scalar_t> poseinvs2 = gather_transforms<scalar_t>(poseinvs_2);
+
+    // Compute local coordinates @ t & t+1, then the visibility & flows (t -> t+1 & t+1 -> t)
+    compute_local_points(cloud1, label1, poseinvs1, nposes, local1, batchsize, nrows, ncols);
+    compute_local_points(cloud2, label2, poseinvs2, nposes, local2, batchsize, nrows, ncols);
+    compute_visibility_and_flows(cloud1, cloud2, local1, label1, label2, poses2, nposes, fwdvis, fwdassoc, fwdflow,
+                                 fx, fy, cx, cy, threshold, batchsize, nrows, ncols);
+    compute_visibility_and_flows(cloud2, cloud1, local2, label2, label1, poses1, nposes, bwdvis, bwdassoc, bwdflow,
+                                 fx, fy, cx, cy, threshold, batchsize, nrows, ncols);
+}
+
+int ComputeFlowAndVisibility_Pts(
+            at::Tensor cloud_1,
+            at::Tensor cloud_2,
+            at::Tensor local_1,
+            at::Tensor local_2,
+            at::Tensor label_1,
+            at::Tensor label_2,
+            at::Tensor poses_1,
+            at::Tensor poses_2,
+            at::Tensor poseinvs_1,
+            at::Tensor poseinvs_2,
+            at::Tensor fwdflows,
+            at::Tensor bwdflows,
+            at::Tensor fwdvisibility,
+            at::Tensor bwdvisibility,
+            at::Tensor fwdassocpixelids,
+            at::Tensor bwdassocpixelids,
+            double fx, double fy, double cx, double cy,
+            double threshold, double winsize)
+{
+    check_input(cloud_1, "cloud_1");
+    TORCH_CHECK(label_1.scalar_type() == at::kByte && label_2.scalar_type() == at::kByte, "labels have to be ByteTensors");
+    TORCH_CHECK(fwdassocpixelids.scalar_type() == at::kInt && bwdassocpixelids.scalar_type() == at::kInt,
+                "assoc pixel ids have to be IntTensors");
+    fwdvisibility.fill_(0);
+    bwdvisibility.fill_(0);
+    fwdflows.fill_(0);
+    bwdflows.fill_(0);
+    fwdassocpixelids.fill_(-1);
+    bwdassocpixelids.fill_(-1);
+    AT_DISPATCH_FLOATING_TYPES(cloud_1.scalar_type(), "ComputeFlowAndVisibility_Pts", [&] {
+        computeflowandvisibility_pts_kernel<scalar_t>(cloud_1, cloud_2, local_1, local_2, label_1, label_2,
+                                                      poses_1, poses_2, poseinvs_1, poseinvs_2, fwdflows, bwdflows,
+                                                      fwdvisibility, bwdvisibility, fwdassocpixelids, bwdassocpixelids,
+                                                      fx, fy, cx, cy, threshold);
+    });
+    return 1;
+}
+
+// ===== COMPUTE NORMALS
+
+template <typename scalar_t>
+void computenormals_kernel(
+            const at::Tensor &cloud_1,
+            const at::Tensor &label_1,
+            const at::Tensor &deltaposes_12,
+            at::Tensor &normals_1,
+            at::Tensor &tnormals_2,
+            scalar_t maxdepthdiff)
+{
+    // Initialize vars
+    const int64_t batchsize = cloud_1.size(0);
+    const int64_t nrows     = cloud_1.size(2);
+    const int64_t ncols     = cloud_1.size(3);
+    const int64_t nposes    = deltaposes_12.size(1);
+
+    // Get data
+    StridedPtr<const scalar_t> cloud(cloud_1);
+    StridedPtr<const uint8_t> label(label_1);
+    StridedPtr<scalar_t> normals(normals_1), tnormals(tnormals_2);
+    const std::vector<scalar_t> deltaposes = gather_transforms<scalar_t>(deltaposes_12);
+
+    // Iterate over all points, compute normals, rotate them
+    // Each (image, row) pair is independent, so split these across threads
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                // Get center point
+                scalar_t xc = cloud(b,0,r,c), yc = cloud(b,1,r,c), zc = cloud(b,2,r,c);
+
+                // Read data from horizontal neighbours (on same row), use the right one if the left one is invalid
+                scalar_t hSign = 1, xh = 0, yh = 0, zh = 0;
+                if (c-1 >= 0)
+                {
+                    xh = cloud(b,0,r,c-1); yh = cloud(b,1,r,c-1); zh = cloud(b,2,r,c-1);
+                }
+                if ((zh == 0) && (c+1 < ncols))
+                {
+                    xh = cloud(b,0,r,c+1); yh = cloud(b,1,r,c+1); zh = cloud(b,2,r,c+1);
+                    hSign = -1; // Flip sign
+                }
+
+                // Read data from vertical neighbours (on same column)
+                scalar_t vSign = 1, xv = 0, yv = 0, zv = 0;
+                if (r-1 >= 0)
+                {
+                    xv = cloud(b,0,r-1,c); yv = cloud(b,1,r-1,c); zv = cloud(b,2,r-1,c);
+                }
+                if ((zv == 0) && (r+1 < nrows))
+                {
+                    xv = cloud(b,0,r+1,c); yv = cloud(b,1,r+1,c); zv = cloud(b,2,r+1,c);
+                    vSign = -1; // Flip sign
+                }
+
+                // Check max/min diff in depth. If it is crossing an edge then don't use that point
+                if (std::fabs(zh - zc) > maxdepthdiff)
+                {
+                    xh = 0; yh = 0; zh = 0;
+                }
+                if (std::fabs(zv - zc) > maxdepthdiff)
+                {
+                    xv = 0; yv = 0; zv = 0;
+                }
+
+                // Compute the normal (cross product of the horizontal & vertical vectors)
+                scalar_t nx = 0, ny = 0, nz = 0;
+                if (zh > 0 && zv > 0 && zc > 0)
+                {
+                    scalar_t u1 = hSign * (xh - xc), u2 = hSign * (yh - yc), u3 = hSign * (zh - zc);
+                    scalar_t v1 = vSign * (xv - xc), v2 = vSign * (yv - yc), v3 = vSign * (zv - zc);
+                    nx = (u2*v3 - u3*v2);
+                    ny = (u3*v1 - u1*v3);
+                    nz = (u1*v2 - u2*v1);
+
+                    // Normalize the vector to get unit direction
+                    const scalar_t nMagSquared = nx*nx + ny*ny + nz*nz;
+                    if (nMagSquared)
+                    {
+                        scalar_t s = 1.0/std::sqrt(nMagSquared);
+                        nx *= s; ny *= s; nz *= s;
+                    }
+                    else
+                    {
+                        nx = 0; ny = 0; nz = 0;
+                    }
+                }
+
+                // Save normal & transformed normal = R * orig normal (no translation)
+                const scalar_t *T = &deltaposes[(b*nposes + label(b,0,r,c))*12];
+                normals(b,0,r,c)  = nx;
+                normals(b,1,r,c)  = ny;
+                normals(b,2,r,c)  = nz;
+                tnormals(b,0,r,c) = T[0] * nx + T[1] * ny + T[2]  * nz;
+                tnormals(b,1,r,c) = T[4] * nx + T[5] * ny + T[6]  * nz;
+                tnormals(b,2,r,c) = T[8] * nx + T[9] * ny + T[10] * nz;
+            }
+        }
+    }
+}
+
+int ComputeNormals(
+            at::Tensor cloud_1,
+            at::Tensor cloud_2,
+            at::Tensor label_1,
+            at::Tensor deltaposes_12,
+            at::Tensor normals_1,
+            at::Tensor tnormals_2,
+            double maxdepthdiff)
+{
+    check_input(cloud_1, "cloud_1");
+    AT_DISPATCH_FLOATING_TYPES(cloud_1.scalar_type(), "ComputeNormals", [&] {
+        computenormals_kernel<scalar_t>(cloud_1, label_1, deltaposes_12, normals_1, tnormals_2, maxdepthdiff);
+    });
+    return 1;
+}
+
+// ===== FAST NORMALS
+
+// Integral image of the valid points (z > 0) of a cloud: (x, y, z, count) summed over [0,r) x [0,c)
+// Stored as (nrows+1) x (ncols+1) x 4 doubles per image
+template <typename scalar_t>
+void compute_integral_image(
+        const StridedPtr<const scalar_t> &cloud,
+        std::vector<double> &integral,
+        int64_t batchsize,
+        int64_t nrows,
+        int64_t ncols)
+{
+    integral.assign(batchsize*(nrows+1)*(ncols+1)*4, 0); // First row & column are zero
+    #pragma omp parallel for
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        double *I = &integral[b*(nrows+1)*(ncols+1)*4];
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            double rowsum[4] = {0, 0, 0, 0};
+            const double *Iprev = I + r*(ncols+1)*4;
+            double *Icurr = I + (r+1)*(ncols+1)*4;
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                scalar_t z = cloud(b,2,r,c);
+                if (z > 0)
+                {
+                    rowsum[0] += cloud(b,0,r,c);
+                    rowsum[1] += cloud(b,1,r,c);
+                    rowsum[2] += z;
+                    rowsum[3] += 1;
+                }
+                for (int k = 0; k < 4; k++)
+                    Icurr[(c+1)*4 + k] = Iprev[(c+1)*4 + k] + rowsum[k];
+            }
+        }
+    }
+}
+
+// Mean of the valid points in the box [r-h, r+h] x [c-h, c+h] (clipped to the image). Returns false if there are none
+template <typename scalar_t>
+inline bool box_mean(const double *I, int64_t r, int64_t c, int64_t h, int64_t nrows, int64_t ncols, scalar_t *pt)
+{
+    int64_t r1 = std::max<int64_t>(r-h, 0), r2 = std::min<int64_t>(r+h+1, nrows);
+    int64_t c1 = std::max<int64_t>(c-h, 0), c2 = std::min<int64_t>(c+h+1, ncols);
+    const double *I11 = I + (r1*(ncols+1) + c1)*4, *I12 = I + (r1*(ncols+1) + c2)*4;
+    const double *I21 = I + (r2*(ncols+1) + c1)*4, *I22 = I + (r2*(ncols+1) + c2)*4;
+    double n = I22[3] - I21[3] - I12[3] + I11[3];
+    if (n < 0.5) return false;
+    for (int k = 0; k < 3; k++)
+        pt[k] = (I22[k] - I21[k] - I12[k] + I11[k]) / n;
+    return true;
+}
+
+// Normal at (r,c) from central differences of the box-filtered points. Returns false if it can't be computed
+template <typename scalar_t>
+inline bool integral_normal(const StridedPtr<const scalar_t> &cloud, const double *I,
+                            int64_t b, int64_t r, int64_t c, int64_t h, scalar_t maxdepthdiff,
+                            int64_t nrows, int64_t ncols, scalar_t *n)
+{
+    // Center needs to be valid
+    if (cloud(b,2,r,c) <= 0) return false;
+
+    // Get box-filtered points around the center (left/right, up/down)
+    scalar_t pc[3], pl[3], pr[3], pu[3], pd[3];
+    if (!box_mean(I, r, c, h, nrows, ncols, pc) ||
+        !box_mean(I, r, c-h, h, nrows, ncols, pl) || !box_mean(I, r, c+h, h, nrows, ncols, pr) ||
+        !box_mean(I, r-h, c, h, nrows, ncols, pu) || !box_mean(I, r+h, c, h, nrows, ncols, pd))
+        return false;
+
+    // Don't compute normals across depth edges. The box means mix the points on both sides of an edge, so these are
+    // also checked against the depth of the center pixel itself
+    if (std::fabs(pl[2] - pc[2]) > maxdepthdiff || std::fabs(pr[2] - pc[2]) > maxdepthdiff ||
+        std::fabs(pu[2] - pc[2]) > maxdepthdiff || std::fabs(pd[2] - pc[2]) > maxdepthdiff)
+        return false;
+    const scalar_t z = cloud(b,2,r,c);
+    if (std::fabs(pc[2] - z) > maxdepthdiff ||
+        std::fabs(pl[2] - z) > maxdepthdiff || std::fabs(pr[2] - z) > maxdepthdiff ||
+        std::fabs(pu[2] - z) > maxdepthdiff || std::fabs(pd[2] - z) > maxdepthdiff)
+        return false;
+
+    // Horizontal & vertical vectors (same orientation as ComputeNormals)
+    scalar_t u1 = pl[0] - pr[0], u2 = pl[1] - pr[1], u3 = pl[2] - pr[2];
+    scalar_t v1 = pu[0] - pd[0], v2 = pu[1] - pd[1], v3 = pu[2] - pd[2];
+
+    // Compute cross product & normalize the vector to get unit direction
+    scalar_t nx = (u2*v3 - u3*v2), ny = (u3*v1 - u1*v3), nz = (u1*v2 - u2*v1);
+    const scalar_t nMagSquared = nx*nx + ny*ny + nz*nz;
+    if (!nMagSquared) return false;
+    scalar_t s = 1.0/std::sqrt(nMagSquared);
+    n[0] = nx*s; n[1] = ny*s; n[2] = nz*s;
+    return true;
+}
+
+template <typename scalar_t>
+void computenormalsfast_kernel(
+            const at::Tensor &cloud_1,
+            const at::Tensor &cloud_2,
+            const at::Tensor &label_1,
+            const at::Tensor &label_2,
+            const at::Tensor &deltaposes_12,
+            const at::Tensor &deltaposes_21,
+            at::Tensor &normals_1,
+            at::Tensor &tnormals_1,
+            at::Tensor &normals_2,
+            at::Tensor &tnormals_2,
+            scalar_t maxdepthdiff,
+            int64_t halfwidth,
+            bool computeBwd)
+{
+    // Initialize vars
+    const int64_t batchsize = cloud_1.size(0);
+    const int64_t nrows     = cloud_1.size(2);
+    const int64_t ncols     = cloud_1.size(3);
+    const int64_t nposes    = deltaposes_12.size(1);
+    const int npasses       = computeBwd ? 2 : 1; // BWD inputs/outputs (cloud_2, ...) are not used if !computeBwd
+
+    // Get data
+    const StridedPtr<const scalar_t> clouds[2] = {StridedPtr<const scalar_t>(cloud_1), StridedPtr<const scalar_t>(cloud_2)};
+    const StridedPtr<const uint8_t> labels[2]  = {StridedPtr<const uint8_t>(label_1), StridedPtr<const uint8_t>(label_2)};
+    const StridedPtr<scalar_t> normals[2]      = {StridedPtr<scalar_t>(normals_1), StridedPtr<scalar_t>(normals_2)};
+    const StridedPtr<scalar_t> tnormals[2]     = {StridedPtr<scalar_t>(tnormals_1), StridedPtr<scalar_t>(tnormals_2)};
+    const std::vector<scalar_t> deltaposes[2]  = {gather_transforms<scalar_t>(deltaposes_12),
+                                                  computeBwd ? gather_transforms<scalar_t>(deltaposes_21)
+                                                             : std::vector<scalar_t>()};
+
+    // Compute integral images for the clouds
+    const int64_t isize = (nrows+1)*(ncols+1)*4;
+    std::vector<double> integrals[2];
+    for (int k = 0; k < npasses; k++)
+        compute_integral_image(clouds[k], integrals[k], batchsize, nrows, ncols);
+
+    // Iterate over all points, compute FWD (cloud_1) & BWD (cloud_2, if computeBwd) normals, rotate them
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                for (int k = 0; k < npasses; k++)
+                {
+                    // Compute normal
+                    scalar_t n[3] = {0, 0, 0};
+                    integral_normal(clouds[k], &integrals[k][b*isize], b, r, c, halfwidth, maxdepthdiff, nrows, ncols, n);
+
+                    // Save normal & transformed normal = R * orig normal (no translation)
+                    const scalar_t *T = &deltaposes[k][(b*nposes + labels[k](b,0,r,c))*12];
+                    normals[k](b,0,r,c)  = n[0];
+                    normals[k](b,1,r,c)  = n[1];
+                    normals[k](b,2,r,c)  = n[2];
+                    tnormals[k](b,0,r,c) = T[0] * n[0] + T[1] * n[1] + T[2]  * n[2];
+                    tnormals[k](b,1,r,c) = T[4] * n[0] + T[5] * n[1] + T[6]  * n[2];
+                    tnormals[k](b,2,r,c) = T[8] * n[0] + T[9] * n[1] + T[10] * n[2];
+                }
+            }
+        }
+    }
+}
+
+int ComputeNormalsFast(
+            at::Tensor cloud_1,
+            at::Tensor cloud_2,
+            at::Tensor label_1,
+            at::Tensor label_2,
+            at::Tensor deltaposes_12,
+            at::Tensor deltaposes_21,
+            at::Tensor normals_1,
+            at::Tensor tnormals_1,
+            at::Tensor normals_2,
+            at::Tensor tnormals_2,
+            double maxdepthdiff,
+            int halfwidth,
+            bool computeBwd)
+{
+    check_input(cloud_1, "cloud_1");
+    TORCH_CHECK(halfwidth > 0, "halfwidth has to be > 0");
+    TORCH_CHECK(!computeBwd || cloud_2.sizes() == cloud_1.sizes(), "cloud_2 has to be the same size as cloud_1");
+    AT_DISPATCH_FLOATING_TYPES(cloud_1.scalar_type(), "ComputeNormalsFast", [&] {
+        computenormalsfast_kernel<scalar_t>(cloud_1, cloud_2, label_1, label_2, deltaposes_12, deltaposes_21,
+                                            normals_1, tnormals_1, normals_2, tnormals_2, maxdepthdiff, halfwidth,
+                                            computeBwd);
+    });
+    return 1;
+}
+
+// ===== BILATERAL DEPTH SMOOTHING
+
+template <typename scalar_t>
+void bilateraldepthsmoothing_kernel(
+            const at::Tensor &depth_i,
+            at::Tensor &depth_o,
+            const std::vector<scalar_t> &lochalfkernel,
+            scalar_t depthstd)
+{
+    // Initialize vars
+    const int64_t batchsize  = depth_i.size(0);
+    const int64_t nrows      = depth_i.size(2);
+    const int64_t ncols      = depth_i.size(3);
+    const int64_t khalfwidth = lochalfkernel.size()-1; // half-width of kernel (-khalfwidth -> khalfwidth)
+    const scalar_t oneOverTwoSigmaDepth = 0.5/(depthstd*depthstd); // 1/2*sigma^2
+
+    // Get data
+    StridedPtr<const scalar_t> din(depth_i);
+    StridedPtr<scalar_t> dout(depth_o);
+
+    // Iterate over all pixels, compute smoothed depths
+    // Each (image, row) pair is independent, so split these across threads
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                scalar_t center = din(b,0,r,c);
+                if (!center) continue; // Only for pixels with non-zero depth
+
+                // Iterate over the window and compute smoothed result
+                scalar_t totalWeight = 0, totalValue = 0;
+                const int64_t drMin = std::max(-khalfwidth, -r), drMax = std::min(khalfwidth, nrows-r-1);
+                const int64_t dcMin = std::max(-khalfwidth, -c), dcMax = std::min(khalfwidth, ncols-c-1);
+                for (int64_t dr = drMin; dr <= drMax; dr++)
+                {
+                    for (int64_t dc = dcMin; dc <= dcMax; dc++)
+                    {
+                        scalar_t val = din(b,0,r+dr,c+dc);
+                        if (val) // Use non-zero depth only
+                        {
+                            // Gaussian in depth space x Gaussian in position space
+                            scalar_t diff = val - center;
+                            scalar_t wt = lochalfkernel[std::abs(dr)] * lochalfkernel[std::abs(dc)] *
+                                          std::exp(-(diff * diff) * oneOverTwoSigmaDepth);
+                            totalWeight += wt;
+                            totalValue  += wt * val;
+                        }
+                    }
+                }
+
+                // Save smoothed value
+                dout(b,0,r,c) = totalValue / totalWeight;
+            }
+        }
+    }
+}
+
+int BilateralDepthSmoothing(
+            at::Tensor depth_i,
+            at::Tensor depth_o,
+            at::Tensor lochalfkernel,
+            double depthstd)
+{
+    check_input(depth_i, "depth_i");
+    TORCH_CHECK(lochalfkernel.dim() == 1, "lochalfkernel has to be 1D");
+    depth_o.fill_(0); // Zero by default
+    AT_DISPATCH_FLOATING_TYPES(depth_i.scalar_type(), "BilateralDepthSmoothing", [&] {
+        at::Tensor k = lochalfkernel.to(depth_i.scalar_type()).contiguous();
+        std::vector<scalar_t> kernel(k.data_ptr<scalar_t>(), k.data_ptr<scalar_t>() + k.numel());
+        bilateraldepthsmoothing_kernel<scalar_t>(depth_i, depth_o, kernel, depthstd);
+    });
+    return 1;
+}
+
+// Approximate bilateral smoothing: a horizontal and a vertical 1D pass, using only every "step"-th pixel of the window
+template <typename scalar_t>
+void bilateraldepthsmoothingfast_kernel(
+            const at::Tensor &depth_i,
+            at::Tensor &depth_o,
+            const std::vector<scalar_t> &lochalfkernel,
+            scalar_t depthstd,
+            int64_t step)
+{
+    // Initialize vars
+    const int64_t batchsize  = depth_i.size(0);
+    const int64_t nrows      = depth_i.size(2);
+    const int64_t ncols      = depth_i.size(3);
+    const int64_t khalfwidth = lochalfkernel.size()-1;
+    const scalar_t oneOverTwoSigmaDepth = 0.5/(depthstd*depthstd);
+
+    // Get data & temp memory for the result of the horizontal pass
+    StridedPtr<const scalar_t> din(depth_i);
+    StridedPtr<scalar_t> dout(depth_o);
+    std::vector<scalar_t> temp(batchsize*nrows*ncols, 0);
+
+    // Horizontal pass (depth_i -> temp), then vertical pass (temp -> depth_o)
+    for (int pass = 0; pass < 2; pass++)
+    {
+        #pragma omp parallel for collapse(2)
+        for (int64_t b = 0; b < batchsize; b++)
+        {
+            for (int64_t r = 0; r < nrows; r++)
+            {
+                for (int64_t c = 0; c < ncols; c++)
+                {
+                    if (!din(b,0,r,c)) continue; // Only for pixels with non-zero input depth
+                    const int64_t pos  = (pass == 0) ? c : r;
+                    const int64_t npos = (pass == 0) ? ncols : nrows;
+                    const scalar_t *tp = &temp[(b*nrows + r)*ncols + c];
+                    scalar_t center    = (pass == 0) ? din(b,0,r,c) : *tp;
+
+                    // Iterate over the window and compute smoothed result
+                    scalar_t totalWeight = 0, totalValue = 0;
+                    const int64_t dMin = std::max(-khalfwidth, -pos), dMax = std::min(khalfwidth, npos-pos-1);
+                    for (int64_t d = -((-dMin)/step)*step; d <= dMax; d += step)
+                    {
+                        scalar_t val = (pass == 0) ? din(b,0,r,c+d) : tp[d*ncols];
+                        if (val) // Use non-zero depth only
+                        {
+                            scalar_t diff = val - center;
+                            scalar_t wt = lochalfkernel[std::abs(d)] * std::exp(-(diff * diff) * oneOverTwoSigmaDepth);
+                            totalWeight += wt;
+                            totalValue  += wt * val;
+                        }
+                    }
+
+                    // Save smoothed value
+                    if (pass == 0)
+                        temp[(b*nrows + r)*ncols + c] = totalValue / totalWeight;
+                    else
+                        dout(b,0,r,c) = totalValue / totalWeight;
+                }
+            }
+        }
+    }
+}
+
+int BilateralDepthSmoothingFast(
+            at::Tensor depth_i,
+            at::Tensor depth_o,
+            at::Tensor lochalfkernel,
+            double depthstd,
+            int step)
+{
+    check_input(depth_i, "depth_i");
+    TORCH_CHECK(lochalfkernel.dim() == 1, "lochalfkernel has to be 1D");
+    TORCH_CHECK(step > 0, "step has to be > 0");
+    depth_o.fill_(0); // Zero by default
+    AT_DISPATCH_FLOATING_TYPES(depth_i.scalar_type(), "BilateralDepthSmoothingFast", [&] {
+        at::Tensor k = lochalfkernel.to(depth_i.scalar_type()).contiguous();
+        std::vector<scalar_t> kernel(k.data_ptr<scalar_t>(), k.data_ptr<scalar_t>() + k.numel());
+        bilateraldepthsmoothingfast_kernel<scalar_t>(depth_i, depth_o, kernel, depthstd, step);
+    });
+    return 1;
+}
+
+// ===== EDGE BASED NOISE
+
+// Counter-based RNG (the noise for a seed does not depend on the number of threads)
+inline uint64_t mix64(uint64_t z)
+{
+    // Finalizer from splitmix64
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+    return z ^ (z >> 31);
+}
+
+// Random float in (0, 1.0)
+inline float randFloat(uint64_t seed, uint64_t counter)
+{
+    uint64_t z = mix64(mix64(seed) + 0x9E3779B97F4A7C15ULL * (counter + 1));
+    return ((float)(z >> 40) + 0.5f) / 16777216.0f; // 24 random bits
+}
+
+// Normal distribution, centered on 0, std dev 1 (uses counters 2*counter & 2*counter+1)
+inline float randNormal(uint64_t seed, uint64_t counter)
+{
+    return std::sqrt(-2*std::log(randFloat(seed, 2*counter))) * std::cos(2*M_PI*randFloat(seed, 2*counter+1));
+}
+
+template <typename scalar_t>
+void addnoise_kernel(
+            const at::Tensor &depth,
+            at::Tensor &depth_n,
+            scalar_t zthresh,
+            scalar_t edgeprob,
+            scalar_t defprob,
+            scalar_t noisestd,
+            uint64_t seed)
+{
+    // Initialize vars
+    const int64_t batchsize = depth.size(0);
+    const int64_t nrows     = depth.size(2);
+    const int64_t ncols     = depth.size(3);
+
+    // Get data
+    StridedPtr<const scalar_t> din(depth);
+    StridedPtr<scalar_t> dout(depth_n);
+
+    // Iterate over all (non-border) pixels
+    // Each (image, row) pair is independent, so split these across threads
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 1; r < nrows-1; r++)
+        {
+            for (int64_t c = 1; c < ncols-1; c++)
+            {
+                // Counter for the random numbers of this pixel (4 per pixel)
+                uint64_t ctr = 4 * (uint64_t)((b*nrows + r)*ncols + c);
+
+                // Check central diff for large gradients in x & y
+                scalar_t zdiff = (std::fabs(din(b,0,r,c-1) - din(b,0,r,c+1)) > zthresh) +
+                                 (std::fabs(din(b,0,r-1,c) - din(b,0,r+1,c)) > zthresh);
+
+                // Check if edge, if so based on edge prob this pixel is set to zero (not visible)
+                // Else, use smaller def prob to set pixels to zero at random
+                if ((randFloat(seed, ctr) < zdiff * edgeprob) || (randFloat(seed, ctr+1) < defprob))
+                {
+                    dout(b,0,r,c) = 0;
+                    continue;
+                }
+
+                // Otherwise add small Gaussian noise (BG has no noise)
+                if (din(b,0,r,c) == 0) continue;
+                dout(b,0,r,c) += randNormal(seed, (ctr+2)/2) * noisestd; // Uses counters ctr+2 & ctr+3
+            }
+        }
+    }
+}
+
+int AddNoise(
+            at::Tensor depth,
+            at::Tensor depth_n,
+            double zthresh,
+            double edgeprob,
+            double defprob,
+            double noisestd,
+            int64_t seed)
+{
+    check_input(depth, "depth");
+    AT_DISPATCH_FLOATING_TYPES(depth.scalar_type(), "AddNoise", [&] {
+        addnoise_kernel<scalar_t>(depth, depth_n, zthresh, edgeprob, defprob, noisestd, (uint64_t) seed);
+    });
+    return 1;
+}
+
+// ===== RT3X4 (batched ops on compact 3x4 transforms)
+
+// Pointer to a set of (3 x ncols) transforms with 0-2 leading dims (3 x ncols, K x 3 x ncols or B x K x 3 x ncols),
+// indexed using the strides of the tensor. Transform "n" is at (n / K, n % K) of the leading dims
+template <typename T>
+struct TfmPtr
+{
+    T *data;
+    int64_t ntfms, nk, s0, s1, sr, sc;
+
+    explicit TfmPtr(const at::Tensor &t)
+        : data(t.data_ptr<typename std::remove_const<T>::type>())
+    {
+        const int64_t d = t.dim();
+        ntfms = t.numel() / (3*t.size(d-1));
+        nk    = (d == 4) ? t.size(1) : 1;
+        s0    = (d >= 3) ? t.stride(0) : 0;
+        s1    = (d == 4) ? t.stride(1) : 0;
+        sr    = t.stride(d-2);
+        sc    = t.stride(d-1);
+    }
+
+    inline T* tfm(int64_t n) const
+    {
+        return data + (n / nk)*s0 + (n % nk)*s1;
+    }
+
+    // Copy the (3 x ncols) transform "n" to/from contiguous memory
+    template <typename S>
+    inline void load(int64_t n, int ncols, S *dst) const
+    {
+        const T *p = tfm(n);
+        for (int i = 0; i < 3; i++)
+            for (int j = 0; j < ncols; j++)
+                dst[i*ncols + j] = p[i*sr + j*sc];
+    }
+
+    template <typename S>
+    inline void store(int64_t n, int ncols, const S *src) const
+    {
+        T *p = tfm(n);
+        for (int i = 0; i < 3; i++)
+            for (int j = 0; j < ncols; j++)
+                p[i*sr + j*sc] = src[i*ncols + j];
+    }
+};
+
+// Check that a tensor is a set of (3 x ncols) CPU transforms with upto 2 leading dims
+void check_tfms(const at::Tensor &t, const char *name, int64_t ncols)
+{
+    TORCH_CHECK(!t.is_cuda(), name, " has to be a CPU tensor");
+    TORCH_CHECK(t.dim() >= 2 && t.dim() <= 4, name, " has to be 2D-4D");
+    TORCH_CHECK(t.size(-2) == 3 && t.size(-1) == ncols, name, " has to be ... x 3 x ", ncols);
+}
+
+// Per-transform math (same as the helpers in cuda/rt3x4_kernel.cu), on contiguous (3x4)/(3x5) blocks
+template <typename scalar_t>
+inline void compose_rt_pair(const scalar_t *A, const scalar_t *B, scalar_t *C)
+{
+    for (int i = 0; i < 3; i++)
+    {
+        const scalar_t *a = A + 4*i;
+        for (int j = 0; j < 4; j++)
+            C[4*i+j] = a[0] * B[j] + a[1] * B[4+j] + a[2] * B[8+j] + ((j == 3) ? a[3] : 0);
+    }
+}
+
+template <typename scalar_t>
+inline void compose_rt_pair_grad(const scalar_t *A, const scalar_t *B, const scalar_t *gC, scalar_t *gA, scalar_t *gB)
+{
+    for (int i = 0; i < 3; i++)
+    {
+        const scalar_t *g = gC + 4*i;
+        for (int j = 0; j < 3; j++)
+            gA[4*i+j] = g[0] * B[4*j+0] + g[1] * B[4*j+1] + g[2] * B[4*j+2] + g[3] * B[4*j+3]; // r_g * rB^T + t_g * tB^T
+        gA[4*i+3] = g[3];                                                                      // t_g
+        for (int j = 0; j < 4; j++)
+            gB[4*i+j] = A[i] * gC[j] + A[4+i] * gC[4+j] + A[8+i] * gC[8+j];                   // rA^T * [r_g | t_g]
+    }
+}
+
+template <typename scalar_t>
+inline void rt_inverse(const scalar_t *I, scalar_t *O)
+{
+    for (int i = 0; i < 3; i++)
+    {
+        O[4*i+0] = I[i];
+        O[4*i+1] = I[4+i];
+        O[4*i+2] = I[8+i];
+        O[4*i+3] = -(I[i] * I[3] + I[4+i] * I[7] + I[8+i] * I[11]);
+    }
+}
+
+template <typename scalar_t>
+inline void rt_inverse_grad(const scalar_t *I, const scalar_t *gO, scalar_t *gI)
+{
+    for (int i = 0; i < 3; i++)
+    {
+        for (int j = 0; j < 3; j++)
+            gI[4*i+j] = gO[4*j+i] - I[4*i+3] * gO[4*j+3];                              // ro_g^T - t * to_g^T
+        gI[4*i+3] = -(I[4*i+0] * gO[3] + I[4*i+1] * gO[7] + I[4*i+2] * gO[11]); // -r * to_g
+    }
+}
+
+template <typename scalar_t>
+inline void collapse_rt_pivots(const scalar_t *I, scalar_t *O)
+{
+    for (int i = 0; i < 3; i++)
+    {
+        const scalar_t *r = I + 5*i;
+        O[4*i+0] = r[0];
+        O[4*i+1] = r[1];
+        O[4*i+2] = r[2];
+        O[4*i+3] = r[3] + r[4] - (r[0] * I[4] + r[1] * I[9] + r[2] * I[14]); // t + p - Rp
+    }
+}
+
+template <typename scalar_t>
+inline void collapse_rt_pivots_grad(const scalar_t *I, const scalar_t *gO, scalar_t *gI)
+{
+    for (int i = 0; i < 3; i++)
+    {
+        for (int j = 0; j < 3; j++)
+            gI[5*i+j] = gO[4*i+j] - gO[4*i+3] * I[5*j+4];                                    // ro_g - to_g * p^T
+        gI[5*i+3] = gO[4*i+3];                                                                 // to_g
+        gI[5*i+4] = gO[4*i+3] - (I[i] * gO[3] + I[5+i] * gO[7] + I[10+i] * gO[11]);           // to_g - R^T * to_g
+    }
+}
+
+// Each transform is independent. All inputs of a transform are read before its outputs are written,
+// so the outputs can be the same tensors as the inputs (in-place ops)
+template <typename scalar_t>
+void composertpair_forward_kernel(const at::Tensor &A, const at::Tensor &B, at::Tensor &output)
+{
+    TfmPtr<const scalar_t> a(A), b(B);
+    TfmPtr<scalar_t> out(output);
+    #pragma omp parallel for if(a.ntfms > 1024)
+    for (int64_t n = 0; n < a.ntfms; n++)
+    {
+        scalar_t tA[12], tB[12], tC[12];
+        a.load(n, 4, tA);
+        b.load(n, 4, tB);
+        compose_rt_pair(tA, tB, tC);
+        out.store(n, 4, tC);
+    }
+}
+
+int ComposeRtPair_forward(
+            at::Tensor A,
+            at::Tensor B,
+            at::Tensor output)
+{
+    check_tfms(A, "A", 4);
+    check_tfms(B, "B", 4);
+    TORCH_CHECK(A.numel() == B.numel(), "A & B need to have the same number of transforms");
+    output.resize_(A.sizes());
+    AT_DISPATCH_FLOATING_TYPES(A.scalar_type(), "ComposeRtPair_forward", [&] {
+        composertpair_forward_kernel<scalar_t>(A, B, output);
+    });
+    return 1;
+}
+
+template <typename scalar_t>
+void composertpair_backward_kernel(const at::Tensor &A, const at::Tensor &B, at::Tensor &gradA, at::Tensor &gradB,
+                                   const at::Tensor &gradOutput, bool computeGradA, bool computeGradB)
+{
+    TfmPtr<const scalar_t> a(A), b(B), gout(gradOutput);
+    TfmPtr<scalar_t> ga(computeGradA ? gradA : A), gb(computeGradB ? gradB : B); // Unused if not needed
+    #pragma omp parallel for if(a.ntfms > 1024)
+    for (int64_t n = 0; n < a.ntfms; n++)
+    {
+        scalar_t tA[12], tB[12], tgO[12], tgA[12], tgB[12];
+        a.load(n, 4, tA);
+        b.load(n, 4, tB);
+        gout.load(n, 4, tgO);
+        compose_rt_pair_grad(tA, tB, tgO, tgA, tgB);
+        if (computeGradA) ga.store(n, 4, tgA);
+        if (computeGradB) gb.store(n, 4, tgB);
+    }
+}
+
+int ComposeRtPair_backward(
+            at::Tensor A,
+            at::Tensor B,
+            at::Tensor gradA,
+            at::Tensor gradB,
+            at::Tensor gradOutput,
+            bool computeGradA,
+            bool computeGradB)
+{
+    check_tfms(A, "A", 4);
+    check_tfms(B, "B", 4);
+    check_tfms(gradOutput, "gradOutput", 4);
+    TORCH_CHECK(A.numel() == B.numel() && A.numel() == gradOutput.numel(),
+                "A, B & gradOutput need to have the same number of transforms");
+    if (computeGradA) gradA.resize_(A.sizes());
+    if (computeGradB) gradB.resize_(B.sizes());
+    AT_DISPATCH_FLOATING_TYPES(A.scalar_type(), "ComposeRtPair_backward", [&] {
+        composertpair_backward_kernel<scalar_t>(A, B, gradA, gradB, gradOutput, computeGradA, computeGradB);
+    });
+    return 1;
+}
+
+template <typename scalar_t>
+void rtinverse_forward_kernel(const at::Tensor &input, at::Tensor &output)
+{
+    TfmPtr<const scalar_t> in(input);
+    TfmPtr<scalar_t> out(output);
+    #pragma omp parallel for if(in.ntfms > 1024)
+    for (int64_t n = 0; n < in.ntfms; n++)
+    {
+        scalar_t tI[12], tO[12];
+        in.load(n, 4, tI);
+        rt_inverse(tI, tO);
+        out.store(n, 4, tO);
+    }
+}
+
+int RtInverse_forward(
+            at::Tensor input,
+            at::Tensor output)
+{
+    check_tfms(input, "input", 4);
+    output.resize_(input.sizes());
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "RtInverse_forward", [&] {
+        rtinverse_forward_kernel<scalar_t>(input, output);
+    });
+    return 1;
+}
+
+template <typename scalar_t>
+void rtinverse_backward_kernel(const at::Tensor &input, at::Tensor &gradInput, const at::Tensor &gradOutput)
+{
+    TfmPtr<const scalar_t> in(input), gout(gradOutput);
+    TfmPtr<scalar_t> gin(gradInput);
+    #pragma omp parallel for if(in.ntfms > 1024)
+    for (int64_t n = 0; n < in.ntfms; n++)
+    {
+        scalar_t tI[12], tgO[12], tgI[12];
+        in.load(n, 4, tI);
+        gout.load(n, 4, tgO);
+        rt_inverse_grad(tI, tgO, tgI);
+        gin.store(n, 4, tgI);
+    }
+}
+
+int RtInverse_backward(
+            at::Tensor input,
+            at::Tensor gradInput,
+            at::Tensor gradOutput)
+{
+    check_tfms(input, "input", 4);
+    check_tfms(gradOutput, "gradOutput", 4);
+    TORCH_CHECK(input.numel() == gradOutput.numel(), "input & gradOutput need to have the same number of transforms");
+    gradInput.resize_(input.sizes());
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "RtInverse_backward", [&] {
+        rtinverse_backward_kernel<scalar_t>(input, gradInput, gradOutput);
+    });
+    return 1;
+}
+
+template <typename scalar_t>
+void collapsertpivots_forward_kernel(const at::Tensor &input, at::Tensor &output)
+{
+    TfmPtr<const scalar_t> in(input);
+    TfmPtr<scalar_t> out(output);
+    #pragma omp parallel for if(in.ntfms > 1024)
+    for (int64_t n = 0; n < in.ntfms; n++)
+    {
+        scalar_t tI[15], tO[12];
+        in.load(n, 5, tI);
+        collapse_rt_pivots(tI, tO);
+        out.store(n, 4, tO);
+    }
+}
+
+int CollapseRtPivots_forward(
+            at::Tensor input,
+            at::Tensor output)
+{
+    check_tfms(input, "input", 5);
+    check_tfms(output, "output", 4);
+    TORCH_CHECK(input.numel()/5 == output.numel()/4, "input & output need to have the same number of transforms");
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "CollapseRtPivots_forward", [&] {
+        collapsertpivots_forward_kernel<scalar_t>(input, output);
+    });
+    return 1;
+}
+
+template <typename scalar_t>
+void collapsertpivots_backward_kernel(const at::Tensor &input, at::Tensor &gradInput, const at::Tensor &gradOutput)
+{
+    TfmPtr<const scalar_t> in(input), gout(gradOutput);
+    TfmPtr<scalar_t> gin(gradInput);
+    #pragma omp parallel for if(in.ntfms > 1024)
+    for (int64_t n = 0; n < in.ntfms; n++)
+    {
+        scalar_t tI[15], tgO[12], tgI[15];
+        in.load(n, 5, tI);
+        gout.load(n, 4, tgO);
+        collapse_rt_pivots_grad(tI, tgO, tgI);
+        gin.store(n, 5, tgI);
+    }
+}
+
+int CollapseRtPivots_backward(
+            at::Tensor input,
+            at::Tensor gradInput,
+            at::Tensor gradOutput)
+{
+    check_tfms(input, "input", 5);
+    check_tfms(gradOutput, "gradOutput", 4);
+    TORCH_CHECK(input.numel()/5 == gradOutput.numel()/4, "input & gradOutput need to have the same number of transforms");
+    gradInput.resize_(input.sizes());
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "CollapseRtPivots_backward", [&] {
+        collapsertpivots_backward_kernel<scalar_t>(input, gradInput, gradOutput);
+    });
+    return 1;
+}
+
+template <typename scalar_t>
+void transformpoints3d_forward_kernel(const at::Tensor &points, const at::Tensor &tfms, at::Tensor &tfmpoints)
+{
+    // Initialize vars
+    const int64_t batchsize = points.size(0);
+    const int64_t nrows     = points.size(2);
+    const int64_t ncols     = points.size(3);
+
+    // Get data
+    StridedPtr<const scalar_t> pts(points);
+    StridedPtr<scalar_t> out(tfmpoints);
+    TfmPtr<const scalar_t> tp(tfms);
+    std::vector<scalar_t> tfms_data(batchsize*12);
+    for (int64_t b = 0; b < batchsize; b++)
+        tp.load(b, 4, &tfms_data[b*12]);
+
+    // Iterate over all points (each point is read before it is written, so the output can be the points)
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            const scalar_t *T = &tfms_data[b*12];
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                scalar_t x = pts(b,0,r,c), y = pts(b,1,r,c), z = pts(b,2,r,c);
+                out(b,0,r,c) = T[0] * x + T[1] * y + T[2]  * z + T[3];
+                out(b,1,r,c) = T[4] * x + T[5] * y + T[6]  * z + T[7];
+                out(b,2,r,c) = T[8] * x + T[9] * y + T[10] * z + T[11];
+            }
+        }
+    }
+}
+
+int TransformPoints3D_forward(
+            at::Tensor points,
+            at::Tensor tfms,
+            at::Tensor tfmpoints)
+{
+    check_input(points, "points");
+    check_tfms(tfms, "tfms", 4);
+    TORCH_CHECK(points.size(1) == 3, "points has to be B x 3 x N x M");
+    TORCH_CHECK(tfms.numel() == points.size(0)*12, "tfms has to have one transform per batch element");
+    tfmpoints.resize_(points.sizes());
+    AT_DISPATCH_FLOATING_TYPES(points.scalar_type(), "TransformPoints3D_forward", [&] {
+        transformpoints3d_forward_kernel<scalar_t>(points, tfms, tfmpoints);
+    });
+    return 1;
+}
+
+template <typename scalar_t>
+void transformpoints3d_backward_kernel(
+            const at::Tensor &points,
+            const at::Tensor &tfms,
+            at::Tensor &gradPoints,
+            at::Tensor &gradTfms,
+            const at::Tensor &gradTfmpoints,
+            bool computeGradPoints,
+            bool computeGradTfms)
+{
+    // Initialize vars
+    const int64_t batchsize = points.size(0);
+    const int64_t nrows     = points.size(2);
+    const int64_t ncols     = points.size(3);
+
+    // Get data
+    StridedPtr<const scalar_t> pts(points), gout(gradTfmpoints);
+    StridedPtr<scalar_t> gpts(computeGradPoints ? gradPoints : points); // Unused if not needed
+    TfmPtr<const scalar_t> tp(tfms);
+    std::vector<scalar_t> tfms_data(batchsize*12);
+    for (int64_t b = 0; b < batchsize; b++)
+        tp.load(b, 4, &tfms_data[b*12]);
+
+    // The gradients w.r.t the transforms are summed over all the points. Each row accumulates into its own
+    // buffer (so rows can be run in parallel) & these are summed up in order later (as in NTfm3D)
+    std::vector<scalar_t> rowgT(computeGradTfms ? batchsize*nrows*12 : 0, 0);
+
+    // Iterate over all points (each grad is read before it is written, so gradPoints can be gradTfmpoints)
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            const scalar_t *T = &tfms_data[b*12];
+            scalar_t *gT = computeGradTfms ? &rowgT[(b*nrows + r)*12] : nullptr;
+            for (int64_t c = 0; c < ncols; c++)
+            {
+                scalar_t gxt = gout(b,0,r,c), gyt = gout(b,1,r,c), gzt = gout(b,2,r,c);
+                if (computeGradTfms)
+                {
+                    scalar_t x = pts(b,0,r,c), y = pts(b,1,r,c), z = pts(b,2,r,c);
+                    gT[0] += gxt * x; gT[1] += gxt * y; gT[2]  += gxt * z; gT[3]  += gxt;
+                    gT[4] += gyt * x; gT[5] += gyt * y; gT[6]  += gyt * z; gT[7]  += gyt;
+                    gT[8] += gzt * x; gT[9] += gzt * y; gT[10] += gzt * z; gT[11] += gzt;
+                }
+                if (computeGradPoints)
+                {
+                    gpts(b,0,r,c) = T[0] * gxt + T[4] * gyt + T[8]  * gzt; // R^T * gpt
+                    gpts(b,1,r,c) = T[1] * gxt + T[5] * gyt + T[9]  * gzt;
+                    gpts(b,2,r,c) = T[2] * gxt + T[6] * gyt + T[10] * gzt;
+                }
+            }
+        }
+    }
+    if (!computeGradTfms) return;
+
+    // Sum up the gradients w.r.t the transforms across rows
+    TfmPtr<scalar_t> gtfm(gradTfms);
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        scalar_t gT[12] = {0};
+        for (int64_t r = 0; r < nrows; r++)
+            for (int k = 0; k < 12; k++)
+                gT[k] += rowgT[(b*nrows + r)*12 + k];
+        gtfm.store(b, 4, gT);
+    }
+}
+
+int TransformPoints3D_backward(
+            at::Tensor points,
+            at::Tensor tfms,
+            at::Tensor gradPoints,
+            at::Tensor gradTfms,
+            at::Tensor gradTfmpoints,
+            bool computeGradPoints,
+            bool computeGradTfms)
+{
+    check_input(points, "points");
+    check_tfms(tfms, "tfms", 4);
+    TORCH_CHECK(points.size(1) == 3, "points has to be B x 3 x N x M");
+    TORCH_CHECK(tfms.numel() == points.size(0)*12, "tfms has to have one transform per batch element");
+    if (computeGradPoints) gradPoints.resize_(points.sizes());
+    if (computeGradTfms)   gradTfms.resize_(tfms.sizes());
+    AT_DISPATCH_FLOATING_TYPES(points.scalar_type(), "TransformPoints3D_backward", [&] {
+        transformpoints3d_backward_kernel<scalar_t>(points, tfms, gradPoints, gradTfms, gradTfmpoints,
+                                                    computeGradPoints, computeGradTfms);
+    });
+    return 1;
+}
+
+// ===== LOSS3D (fused masked losses for dense 3D points/flows, see cuda/loss3d_kernel.cu)
+// The kernels are instantiated per loss type, for inputs with/without weights & for rows that are contiguous (the
+// common case, where the inner loops over the columns vectorize) or strided. The per-channel losses (mse, abs &
+// normmsesqrt) are computed one channel-row at a time, the per-point loss (normmsesqrtpt) one point at a time.
+// The sums over a row are accumulated in scalar_t & the sums over the rows in double.
+
+enum { LOSS_MSE = 0, LOSS_ABS = 1, LOSS_NORMMSESQRT = 2, LOSS_NORMMSESQRTPT = 3 };
+
+template <typename scalar_t>
+inline scalar_t sign(scalar_t x)
+{
+    return scalar_t(x > 0) - scalar_t(x < 0);
+}
+
+// Loss for a single value with weighted error "e" & target "yk" (per-channel losses only)
+template <int LossType, typename scalar_t>
+inline scalar_t value_loss(scalar_t e, scalar_t yk, scalar_t sigmaScale, scalar_t sigmaOffset, scalar_t sigmaMin)
+{
+    if (LossType == LOSS_MSE)
+        return scalar_t(0.5) * e * e;
+    else if (LossType == LOSS_ABS)
+        return std::abs(e);
+    const scalar_t sigma = std::max(sigmaScale * std::abs(yk) + sigmaOffset, sigmaMin);
+    return scalar_t(0.5) * e * e / sigma;
+}
+
+// Calls f(lossType, hasWts, unit) with compile time constants (std::integral_constant)
+template <typename F>
+void dispatch_loss3d(int lossType, bool hasWts, bool unit, const F &f)
+{
+    auto withWts = [&](auto lt) {
+        auto withUnit = [&](auto hw) {
+            if (unit) f(lt, hw, std::true_type());
+            else      f(lt, hw, std::false_type());
+        };
+        if (hasWts) withUnit(std::true_type());
+        else        withUnit(std::false_type());
+    };
+    switch (lossType)
+    {
+        case LOSS_MSE:           withWts(std::integral_constant<int, LOSS_MSE>());           break;
+        case LOSS_ABS:           withWts(std::integral_constant<int, LOSS_ABS>());           break;
+        case LOSS_NORMMSESQRT:   withWts(std::integral_constant<int, LOSS_NORMMSESQRT>());   break;
+        default:                 withWts(std::integral_constant<int, LOSS_NORMMSESQRTPT>()); break;
+    }
+}
+
+// True if the columns of a B x C x N x M tensor are contiguous
+inline bool unit_cols(const at::Tensor &t)
+{
+    return t.stride(3) == 1 || t.size(3) == 1;
+}
+
+template <typename scalar_t, int LossType, bool HasWts, bool Unit>
+void loss3d_forward_kernel(const at::Tensor &input, const at::Tensor &target, const at::Tensor &wts,
+                           const at::Tensor &motion, at::Tensor &lossSums, at::Tensor &wtSums, at::Tensor &motionSums,
+                           bool hasMotion, scalar_t motionThresh,
+                           scalar_t sigmaScale, scalar_t sigmaOffset, scalar_t sigmaMin)
+{
+    // Initialize vars
+    const int64_t batchsize = input.size(0);
+    const int64_t nchannels = input.size(1);
+    const int64_t nrows     = input.size(2);
+    const int64_t ncols     = input.size(3);
+
+    // Get data
+    StridedPtr<const scalar_t> x(input), y(target);
+    StridedPtr<const scalar_t> w(HasWts ? wts : input), m(hasMotion ? motion : input); // Unused if not given
+    const int64_t sx = Unit ? 1 : x.s[3], sy = Unit ? 1 : y.s[3], sw = Unit ? 1 : w.s[3], sm = Unit ? 1 : m.s[3];
+    scalar_t *lsum = lossSums.data_ptr<scalar_t>(), *wsum = wtSums.data_ptr<scalar_t>();
+    scalar_t *msum = motionSums.data_ptr<scalar_t>();
+
+    // Reduce over all the points of each batch element
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        double loss = 0, wt = 0, mot = 0;
+        #pragma omp parallel for reduction(+:loss,wt,mot)
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            const scalar_t *wr = &w(b,0,r,0);
+            scalar_t rloss = 0, rwt = 0, rmot = 0;
+            if (LossType != LOSS_NORMMSESQRTPT)
+            {
+                for (int64_t k = 0; k < nchannels; k++)
+                {
+                    const scalar_t *xr = &x(b,k,r,0), *yr = &y(b,k,r,0);
+                    #pragma omp simd reduction(+:rloss)
+                    for (int64_t c = 0; c < ncols; c++)
+                    {
+                        const scalar_t wc = HasWts ? wr[c*sw] : scalar_t(1);
+                        rloss += value_loss<LossType>(wc * (xr[c*sx] - yr[c*sy]), yr[c*sy],
+                                                      sigmaScale, sigmaOffset, sigmaMin);
+                    }
+                }
+            }
+            else
+            {
+                // Per-point sigma = max(s * ||y|| + o, m)
+                for (int64_t c = 0; c < ncols; c++)
+                {
+                    const scalar_t wc = HasWts ? wr[c*sw] : scalar_t(1);
+                    scalar_t norm2 = 0, esum = 0;
+                    for (int64_t k = 0; k < nchannels; k++)
+                    {
+                        const scalar_t yk = y(b,k,r,c), e = wc * (x(b,k,r,c) - yk);
+                        norm2 += yk * yk;
+                        esum  += e * e;
+                    }
+                    rloss += scalar_t(0.5) * esum / std::max(sigmaScale * std::sqrt(norm2) + sigmaOffset, sigmaMin);
+                }
+            }
+            if (HasWts)
+            {
+                #pragma omp simd reduction(+:rwt)
+                for (int64_t c = 0; c < ncols; c++)
+                    rwt += wr[c*sw];
+            }
+            else
+                rwt = ncols;
+            if (hasMotion)
+            {
+                #pragma omp simd reduction(+:rmot)
+                for (int64_t c = 0; c < ncols; c++)
+                {
+                    scalar_t ms = 0;
+                    for (int64_t k = 0; k < nchannels; k++)
+                        ms += std::abs((&m(b,k,r,0))[c*sm]);
+                    rmot += (ms > motionThresh) ? (HasWts ? wr[c*sw] : scalar_t(1)) : scalar_t(0);
+                }
+            }
+            loss += rloss; wt += rwt; mot += rmot;
+        }
+        lsum[b] = loss; wsum[b] = wt; msum[b] = mot;
+    }
+}
+
+int Loss3D_forward(
+            at::Tensor input,
+            at::Tensor target,
+            at::Tensor wts,
+            at::Tensor motion,
+            at::Tensor lossSums,
+            at::Tensor wtSums,
+            at::Tensor motionSums,
+            int lossType,
+            bool hasWts,
+            bool hasMotion,
+            double motionThresh,
+            double sigmaScale,
+            double sigmaOffset,
+            double sigmaMin)
+{
+    check_input(input, "input");
+    TORCH_CHECK(target.sizes() == input.sizes(), "target has to be the same size as the input");
+    TORCH_CHECK(!hasWts || (wts.dim() == 4 && wts.size(0) == input.size(0) && wts.size(1) == 1 &&
+                            wts.size(2) == input.size(2) && wts.size(3) == input.size(3)), "wts has to be B x 1 x N x M");
+    TORCH_CHECK(!hasMotion || motion.sizes() == input.sizes(), "motion has to be the same size as the input");
+    TORCH_CHECK(lossType >= LOSS_MSE && lossType <= LOSS_NORMMSESQRTPT, "Unknown loss type");
+    lossSums.resize_({input.size(0)});
+    wtSums.resize_({input.size(0)});
+    motionSums.resize_({input.size(0)});
+    const bool unit = unit_cols(input) && unit_cols(target) && (!hasWts || unit_cols(wts)) &&
+                      (!hasMotion || unit_cols(motion));
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "Loss3D_forward", [&] {
+        dispatch_loss3d(lossType, hasWts, unit, [&](auto lt, auto hw, auto u) {
+            loss3d_forward_kernel<scalar_t, decltype(lt)::value, decltype(hw)::value, decltype(u)::value>(
+                        input, target, wts, motion, lossSums, wtSums, motionSums, hasMotion,
+                        motionThresh, sigmaScale, sigmaOffset, sigmaMin);
+        });
+    });
+    return 1;
+}
+
+template <typename scalar_t, int LossType, bool HasWts, bool Unit>
+void loss3d_backward_kernel(const at::Tensor &input, const at::Tensor &target, const at::Tensor &wts,
+                            at::Tensor &gradInput, at::Tensor &gradTarget, const at::Tensor &gradLossSums,
+                            bool computeGradInput, bool computeGradTarget,
+                            scalar_t sigmaScale, scalar_t sigmaOffset, scalar_t sigmaMin)
+{
+    // Initialize vars
+    const int64_t batchsize = input.size(0);
+    const int64_t nchannels = input.size(1);
+    const int64_t nrows     = input.size(2);
+    const int64_t ncols     = input.size(3);
+
+    // Get data
+    StridedPtr<const scalar_t> x(input), y(target), gsum(gradLossSums);
+    StridedPtr<const scalar_t> w(HasWts ? wts : input); // Unused if not given
+    StridedPtr<scalar_t> gx(computeGradInput ? gradInput : gradTarget), gy(computeGradTarget ? gradTarget : gradInput);
+    const int64_t sx  = Unit ? 1 : x.s[3],  sy  = Unit ? 1 : y.s[3], sw = Unit ? 1 : w.s[3];
+    const int64_t sgx = Unit ? 1 : gx.s[3], sgy = Unit ? 1 : gy.s[3];
+
+    // Each point is independent
+    #pragma omp parallel for collapse(2)
+    for (int64_t b = 0; b < batchsize; b++)
+    {
+        for (int64_t r = 0; r < nrows; r++)
+        {
+            const scalar_t g = gsum(b,0,0,0);
+            const scalar_t *wr = &w(b,0,r,0);
+            if (LossType != LOSS_NORMMSESQRTPT)
+            {
+                for (int64_t k = 0; k < nchannels; k++)
+                {
+                    const scalar_t *xr = &x(b,k,r,0), *yr = &y(b,k,r,0);
+                    scalar_t *gxr = &gx(b,k,r,0), *gyr = &gy(b,k,r,0);
+                    #pragma omp simd
+                    for (int64_t c = 0; c < ncols; c++)
+                    {
+                        const scalar_t wc = HasWts ? wr[c*sw] : scalar_t(1);
+                        const scalar_t yk = yr[c*sy], e = wc * (xr[c*sx] - yk);
+                        scalar_t gxk, gyk;
+                        if (LossType == LOSS_MSE)
+                        {
+                            gxk = wc * e;
+                            gyk = -gxk;
+                        }
+                        else if (LossType == LOSS_ABS)
+                        {
+                            gxk = wc * sign(e);
+                            gyk = -gxk;
+                        }
+                        else
+                        {
+                            // sigma = max(s * |y| + o, m), dsigma/dy = s * sign(y) if not clamped
+                            const scalar_t sigmaRaw = sigmaScale * std::abs(yk) + sigmaOffset;
+                            const scalar_t sigmak   = std::max(sigmaRaw, sigmaMin);
+                            gxk = wc * e / sigmak;
+                            gyk = -gxk - ((sigmaRaw >= sigmaMin) ?
+                                          (scalar_t(0.5) * e * e / (sigmak * sigmak)) * sigmaScale * sign(yk) : scalar_t(0));
+                        }
+                        if (computeGradInput)  gxr[c*sgx] = g * gxk;
+                        if (computeGradTarget) gyr[c*sgy] = g * gyk;
+                    }
+                }
+            }
+            else
+            {
+                for (int64_t c = 0; c < ncols; c++)
+                {
+                    // Per-point sigma: sigma = max(s * ||y|| + o, m), dsigma/dy_k = (s/||y||) * y_k = dsigma * y_k
+                    const scalar_t wc = HasWts ? wr[c*sw] : scalar_t(1);
+                    scalar_t norm2 = 0, lsum = 0;
+                    for (int64_t k = 0; k < nchannels; k++)
+                    {
+                        const scalar_t yk = y(b,k,r,c), e = wc * (x(b,k,r,c) - yk);
+                        norm2 += yk * yk;
+                        lsum  += scalar_t(0.5) * e * e;
+                    }
+                    const scalar_t norm = std::sqrt(norm2), sigmaRaw = sigmaScale * norm + sigmaOffset;
+                    const scalar_t sigma  = std::max(sigmaRaw, sigmaMin);
+                    const scalar_t dsigma = (sigmaRaw >= sigmaMin && norm > 0) ? sigmaScale / norm : scalar_t(0);
+                    for (int64_t k = 0; k < nchannels; k++)
+                    {
+                        const scalar_t yk = y(b,k,r,c), e = wc * (x(b,k,r,c) - yk);
+                        const scalar_t gxk = wc * e / sigma;
+                        if (computeGradInput)  gx(b,k,r,c) = g * gxk;
+                        if (computeGradTarget) gy(b,k,r,c) = g * (-gxk - (lsum / (sigma * sigma)) * dsigma * yk);
+                    }
+                }
+            }
+        }
+    }
+}
+
+int Loss3D_backward(
+            at::Tensor input,
+            at::Tensor target,
+            at::Tensor wts,
+            at::Tensor gradInput,
+            at::Tensor gradTarget,
+            at::Tensor gradLossSums,
+            int lossType,
+            bool hasWts,
+            bool computeGradInput,
+            bool computeGradTarget,
+            double sigmaScale,
+            double sigmaOffset,
+            double sigmaMin)
+{
+    check_input(input, "input");
+    TORCH_CHECK(target.sizes() == input.sizes(), "target has to be the same size as the input");
+    TORCH_CHECK(!hasWts || (wts.dim() == 4 && wts.size(0) == input.size(0) && wts.size(1) == 1 &&
+                            wts.size(2) == input.size(2) && wts.size(3) == input.size(3)), "wts has to be B x 1 x N x M");
+    TORCH_CHECK(gradLossSums.dim() == 1 && gradLossSums.size(0) == input.size(0), "gradLossSums has to be of size B");
+    TORCH_CHECK(lossType >= LOSS_MSE && lossType <= LOSS_NORMMSESQRTPT, "Unknown loss type");
+    if (!computeGradInput && !computeGradTarget) return 1;
+    if (computeGradInput)  gradInput.resize_(input.sizes());
+    if (computeGradTarget) gradTarget.resize_(target.sizes());
+    const bool unit = unit_cols(input) && unit_cols(target) && (!hasWts || unit_cols(wts)) &&
+                      (!computeGradInput || unit_cols(gradInput)) && (!computeGradTarget || unit_cols(gradTarget));
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "Loss3D_backward", [&] {
+        dispatch_loss3d(lossType, hasWts, unit, [&](auto lt, auto hw, auto u) {
+            loss3d_backward_kernel<scalar_t, decltype(lt)::value, decltype(hw)::value, decltype(u)::value>(
+                        input, target, wts, gradInput, gradTarget, gradLossSums, computeGradInput, computeGradTarget,
+                        sigmaScale, sigmaOffset, sigmaMin);
+        });
+    });
+    return 1;
+}
+
+// ===== BINDINGS
+// The layers call <name>_float/_double/_cuda based on the input type (both the _float & _double names dispatch
+// on the input type here). The _cuda functions are only there if the extension was built with CUDA
+
+#ifdef WITH_CUDA
+void bind_cuda(py::module &m); // se3layers_cuda.cpp
+#endif
+
+PYBIND11_MODULE(TORCH_EXTENSION_NAME, m)
+{
+    const auto nogil = py::call_guard<py::gil_scoped_release>(); // Release the GIL while the kernels run
+    m.def("NTfm3D_forward_float", &NTfm3D_forward, nogil);
+    m.def("NTfm3D_forward_double", &NTfm3D_forward, nogil);
+    m.def("NTfm3D_backward_float", &NTfm3D_backward, nogil);
+    m.def("NTfm3D_backward_double", &NTfm3D_backward, nogil);
+    m.def("Project3DPointsToSubPixelDepth_forward_float", &Project3DPointsToSubPixelDepth_forward, nogil);
+    m.def("Project3DPointsToSubPixelDepth_forward_double", &Project3DPointsToSubPixelDepth_forward, nogil);
+    m.def("Project3DPointsToSubPixelDepth_backward_float", &Project3DPointsToSubPixelDepth_backward, nogil);
+    m.def("Project3DPointsToSubPixelDepth_backward_double", &Project3DPointsToSubPixelDepth_backward, nogil);
+    m.def("ComputeFlowAndVisibility_float", &ComputeFlowAndVisibility, nogil);
+    m.def("ComputeFlowAndVisibility_Pts_float", &ComputeFlowAndVisibility_Pts, nogil);
+    m.def("ComputeNormals_float", &ComputeNormals, nogil);
+    m.def("ComputeNormalsFast_float", &ComputeNormalsFast, nogil);
+    m.def("BilateralDepthSmoothing_float", &BilateralDepthSmoothing, nogil);
+    m.def("BilateralDepthSmoothingFast_float", &BilateralDepthSmoothingFast, nogil);
+    m.def("AddNoise_float", &AddNoise, nogil);
+    m.def("ComposeRtPair_forward_float", &ComposeRtPair_forward, nogil);
+    m.def("ComposeRtPair_forward_double", &ComposeRtPair_forward, nogil);
+    m.def("ComposeRtPair_backward_float", &ComposeRtPair_backward, nogil);
+    m.def("ComposeRtPair_backward_double", &ComposeRtPair_backward, nogil);
+    m.def("RtInverse_forward_float", &RtInverse_forward, nogil);
+    m.def("RtInverse_forward_double", &RtInverse_forward, nogil);
+    m.def("RtInverse_backward_float", &RtInverse_backward, nogil);
+    m.def("RtInverse_backward_double", &RtInverse_backward, nogil);
+    m.def("CollapseRtPivots_forward_float", &CollapseRtPivots_forward, nogil);
+    m.def("CollapseRtPivots_forward_double", &CollapseRtPivots_forward, nogil);
+    m.def("CollapseRtPivots_backward_float", &CollapseRtPivots_backward, nogil);
+    m.def("CollapseRtPivots_backward_double", &CollapseRtPivots_backward, nogil);
+    m.def("TransformPoints3D_forward_float", &TransformPoints3D_forward, nogil);
+    m.def("TransformPoints3D_forward_double", &TransformPoints3D_forward, nogil);
+    m.def("TransformPoints3D_backward_float", &TransformPoints3D_backward, nogil);
+    m.def("TransformPoints3D_backward_double", &TransformPoints3D_backward, nogil);
+    m.def("Loss3D_forward_float", &Loss3D_forward, nogil);
+    m.def("Loss3D_forward_double", &Loss3D_forward, nogil);
+    m.def("Loss3D_backward_float", &Loss3D_backward, nogil);
+    m.def("Loss3D_backward_double", &Loss3D_backward, nogil);
+#ifdef WITH_CUDA
+    bind_cuda(m);
+#endif
+}
@@ -0,0 +1,478 @@
+#include <torch/extension.h>
+#include <ATen/cuda/CUDAContext.h>
+#include <c10/cuda/CUDAGuard.h>
+#include <cmath>
+#include "cuda/ntfm3d_kernel.h"
+#include "cuda/project3dpts_kernel.h"
+#include "cuda/rt3x4_kernel.h"
+#include "cuda/loss3d_kernel.h"
+
+// CUDA versions of the layers (the *_cuda functions, same arguments as the CPU ones in se3layers_aten.cpp). These
+// are compiled in (WITH_CUDA) if build_aten.py finds a CUDA installation. The kernels (cuda/*.cu) are float only &
+// work on contiguous memory: the inputs are made contiguous & the outputs/grads are computed into contiguous tensors
+// which are copied back at the end (only if the given ones are not contiguous). The kernels run on the current stream
+
+// ===== HELPERS
+
+// Check that a tensor is a float CUDA tensor (on the same device as "ref")
+void check_cuda_input(const at::Tensor &t, const char *name, const at::Tensor &ref)
+{
+    TORCH_CHECK(t.is_cuda(), name, " has to be a CUDA tensor");
+    TORCH_CHECK(t.scalar_type() == at::kFloat, name, " has to be a float tensor (the CUDA kernels are float only)");
+    TORCH_CHECK(t.device() == ref.device(), name, " has to be on the same device as the other inputs");
+}
+
+// Contiguous tensor to compute an output into: the (resized) output if it is contiguous, else a new tensor
+at::Tensor contiguous_output(at::Tensor &out, at::IntArrayRef sizes)
+{
+    out.resize_(sizes);
+    return out.is_contiguous() ? out : at::empty(sizes, out.options());
+}
+
+// Copy the result to the output (if it was computed into a new tensor)
+void copy_back(at::Tensor &out, const at::Tensor &result)
+{
+    if (!result.is_same(out))
+        out.copy_(result);
+}
+
+// Strides of a (contiguous) tensor, as expected by the launchers
+inline const long *strides(const at::Tensor &t)
+{
+    return (const long *)t.strides().data();
+}
+
+// ===== NTFM3D
+
+int NTfm3D_forward_cuda(
+            at::Tensor points,
+            at::Tensor masks,
+            at::Tensor tfms,
+            at::Tensor tfmpoints)
+{
+    check_cuda_input(points, "points", points);
+    check_cuda_input(masks, "masks", points);
+    check_cuda_input(tfms, "tfms", points);
+    TORCH_CHECK(points.dim() == 4 && points.size(1) == 3, "points has to be B x 3 x N x M");
+    TORCH_CHECK(masks.dim() == 4 && masks.size(0) == points.size(0) && masks.size(2) == points.size(2) &&
+                masks.size(3) == points.size(3), "masks has to be B x k x N x M (the CUDA kernels do not upsample "
+                "low-resolution masks, NTfm3D upsamples these before calling them)");
+    TORCH_CHECK(tfms.dim() == 4 && tfms.size(0) == points.size(0) && tfms.size(1) == masks.size(1) &&
+                tfms.size(2) == 3 && tfms.size(3) == 4, "tfms has to be B x k x 3 x 4");
+    TORCH_CHECK(tfms.numel() <= 15000, "Number of transform parameters (", tfms.numel(), ") > 15000. Can't be stored "
+                "in constant memory. Please reduce batch size or number of SE3 transforms");
+    const c10::cuda::CUDAGuard guard(points.device());
+
+    // Inputs & output in contiguous memory
+    const at::Tensor pts = points.contiguous(), msk = masks.contiguous(), tfm = tfms.contiguous();
+    at::Tensor out = contiguous_output(tfmpoints, pts.sizes());
+
+    // Run the kernel
+    NTfm3D_ForwardLauncher(
+          pts.data_ptr<float>(), msk.data_ptr<float>(), tfm.data_ptr<float>(), out.data_ptr<float>(),
+          pts.size(0), pts.size(1), pts.size(2), pts.size(3), msk.size(1), tfm.numel(),
+          strides(pts), strides(msk), strides(tfm),
+          at::cuda::getCurrentCUDAStream());
+    copy_back(tfmpoints, out);
+    return 1;
+}
+
+int NTfm3D_backward_cuda(
+            at::Tensor points,
+            at::Tensor masks,
+            at::Tensor tfms,
+            at::Tensor tfmpoints,
+            at::Tensor gradPoints,
+            at::Tensor gradMasks,
+            at::Tensor gradTfms,
+            at::Tensor gradTfmpoints,
+            int useMaskGradMag,
+            int computeGradPoints,
+            int computeGradMasks,
+            int computeGradTfms)
+{
+    check_cuda_input(points, "points", points);
+    check_cuda_input(masks, "masks", points);
+    check_cuda_input(tfms, "tfms", points);
+    check_cuda_input(gradTfmpoints, "gradTfmpoints", points);
+    TORCH_CHECK(points.dim() == 4 && points.size(1) == 3, "points has to be B x 3 x N x M");
+    TORCH_CHECK(masks.dim() == 4 && masks.size(0) == points.size(0) && masks.size(2) == points.size(2) &&
+                masks.size(3) == points.size(3), "masks has to be B x k x N x M (the CUDA kernels do not upsample "
+                "low-resolution masks, NTfm3D upsamples these before calling them)");
+    TORCH_CHECK(tfms.dim() == 4 && tfms.size(0) == points.size(0) && tfms.size(1) == masks.size(1) &&
+                tfms.size(2) == 3 && tfms.size(3) == 4, "tfms has to be B x k x 3 x 4");
+    TORCH_CHECK(gradTfmpoints.sizes() == points.sizes(), "gradTfmpoints has to be of the same size as points");
+    TORCH_CHECK(tfms.numel() <= 15000, "Number of transform parameters (", tfms.numel(), ") > 15000. Can't be stored "
+                "in constant memory. Please reduce batch size or number of SE3 transforms");
+    TORCH_CHECK((16*16 + masks.size(1)) * 12 * sizeof(float) <= 32000, "Number of SE3 transforms (", masks.size(1),
+                ") is too large, the gradients w.r.t the transforms can't be stored in shared memory");
+    const c10::cuda::CUDAGuard guard(points.device());
+
+    // Inputs in contiguous memory
+    const at::Tensor pts = points.contiguous(), msk = masks.contiguous(), tfm = tfms.contiguous();
+    const at::Tensor gout = gradTfmpoints.contiguous();
+
+    // Only the gradients that are needed (computeGrad*) are computed, the other grad tensors are not used
+    // The grads w.r.t the tfms are summed in the kernel, so these start at zero
+    at::Tensor gpts, gmsk, gtfm;
+    if (computeGradPoints) gpts = contiguous_output(gradPoints, pts.sizes());
+    if (computeGradMasks)  gmsk = contiguous_output(gradMasks, msk.sizes());
+    if (computeGradTfms)   gtfm = contiguous_output(gradTfms, tfm.sizes());
+    if (computeGradTfms) gtfm.zero_();
+
+    // Run the kernel
+    NTfm3D_BackwardLauncher(
+          pts.data_ptr<float>(), msk.data_ptr<float>(), tfm.data_ptr<float>(), tfmpoints.data_ptr<float>(),
+          computeGradPoints ? gpts.data_ptr<float>() : nullptr,
+          computeGradMasks ? gmsk.data_ptr<float>() : nullptr,
+          computeGradTfms ? gtfm.data_ptr<float>() : nullptr,
+          gout.data_ptr<float>(), useMaskGradMag, computeGradPoints, computeGradMasks, computeGradTfms,
+          pts.size(0), pts.size(1), pts.size(2), pts.size(3), msk.size(1), tfm.numel(),
+          strides(pts), strides(msk), strides(tfm),
+          at::cuda::getCurrentCUDAStream());
+    if (computeGradPoints) copy_back(gradPoints, gpts);
+    if (computeGradMasks)  copy_back(gradMasks, gmsk);
+    if (computeGradTfms)   copy_back(gradTfms, gtfm);
+    return 1;
+}
+
+// ===== PROJECT 3D POINTS TO SUB-PIXEL DEPTH
+// NOTE: The index map of the CUDA kernels is only valid for the CUDA BWD pass (it is not the same as the CPU one)
+
+int Project3DPointsToSubPixelDepth_forward_cuda(
+            at::Tensor input,
+            at::Tensor indexMap,
+            at::Tensor output,
+            double fy, double fx,
+            double cy, double cx)
+{
+    check_cuda_input(input, "input", input);
+    TORCH_CHECK(input.dim() == 4 && input.size(1) == 3, "input has to be B x 3 x N x M");
+    TORCH_CHECK(indexMap.is_cuda() && indexMap.scalar_type() == at::kLong, "indexMap has to be a CUDA LongTensor");
+    const c10::cuda::CUDAGuard guard(input.device());
+
+    // Input, output & index map in contiguous memory (the output has the same strides as the input)
+    const at::Tensor in = input.contiguous();
+    at::Tensor out  = contiguous_output(output, in.sizes());
+    at::Tensor imap = contiguous_output(indexMap, {in.size(0), 1, in.size(2), in.size(3)});
+
+    // Fill with defaults: -1 is an invalid index & z = HUGE_VALF so that the atomicMin of the depth test works
+    out.zero_();
+    out.narrow(1, 2, 1).fill_(HUGE_VALF);
+    imap.fill_(-1);
+
+    // Run the kernel
+    Project3DPointsToSubPixelDepth_ForwardLauncher(
+          in.data_ptr<float>(), imap.data_ptr<int64_t>(), out.data_ptr<float>(),
+          in.size(0), in.size(2), in.size(3), fx, fy, cx, cy,
+          strides(in), strides(imap),
+          at::cuda::getCurrentCUDAStream());
+    copy_back(output, out);
+    copy_back(indexMap, imap);
+    return 1;
+}
+
+int Project3DPointsToSubPixelDepth_backward_cuda(
+            at::Tensor input,
+            at::Tensor indexMap,
+            at::Tensor gradInput,
+            at::Tensor gradOutput,
+            double fy, double fx,
+            double cy, double cx)
+{
+    check_cuda_input(input, "input", input);
+    check_cuda_input(gradOutput, "gradOutput", input);
+    TORCH_CHECK(input.dim() == 4 && input.size(1) == 3, "input has to be B x 3 x N x M");
+    TORCH_CHECK(gradOutput.sizes() == input.sizes(), "gradOutput has to be of the same size as input");
+    const c10::cuda::CUDAGuard guard(input.device());
+
+    // Inputs & grads in contiguous memory (the grads have the same strides as the input)
+    const at::Tensor in = input.contiguous(), gout = gradOutput.contiguous(), imap = indexMap.contiguous();
+    at::Tensor gin = contiguous_output(gradInput, in.sizes());
+    gin.zero_();
+
+    // Run the kernel
+    Project3DPointsToSubPixelDepth_BackwardLauncher(
+          in.data_ptr<float>(), imap.data_ptr<int64_t>(), gin.data_ptr<float>(), gout.data_ptr<float>(),
+          in.size(0), in.size(2), in.size(3), fx, fy, cx, cy,
+          strides(in), strides(imap),
+          at::cuda::getCurrentCUDAStream());
+    copy_back(gradInput, gin);
+    return 1;
+}
+
+// ===== BATCHED OPS ON COMPACT (3x4) TRANSFORMS (see rtops.py)
+// The outputs can be the same memory as the inputs (in-place ops, e.g. rtops.compose(A, B, out=B)), the kernels
+// read all the inputs of a transform/point before writing its outputs
+
+int ComposeRtPair_forward_cuda(
+            at::Tensor A,
+            at::Tensor B,
+            at::Tensor output)
+{
+    check_cuda_input(A, "A", A);
+    check_cuda_input(B, "B", A);
+    TORCH_CHECK(A.numel() % 12 == 0 && B.numel() == A.numel(), "A & B have to be the same number of (3x4) transforms");
+    const c10::cuda::CUDAGuard guard(A.device());
+    const at::Tensor a = A.contiguous(), b = B.contiguous();
+    at::Tensor out = contiguous_output(output, a.sizes());
+    ComposeRtPair_ForwardLauncher(a.data_ptr<float>(), b.data_ptr<float>(), out.data_ptr<float>(), a.numel() / 12,
+                                  at::cuda::getCurrentCUDAStream());
+    copy_back(output, out);
+    return 1;
+}
+
+int ComposeRtPair_backward_cuda(
+            at::Tensor A,
+            at::Tensor B,
+            at::Tensor gradA,
+            at::Tensor gradB,
+            at::Tensor gradOutput,
+            int computeGradA,
+            int computeGradB)
+{
+    check_cuda_input(A, "A", A);
+    check_cuda_input(B, "B", A);
+    check_cuda_input(gradOutput, "gradOutput", A);
+    TORCH_CHECK(A.numel() % 12 == 0 && B.numel() == A.numel() && gradOutput.numel() == A.numel(),
+                "A, B & gradOutput have to be the same number of (3x4) transforms");
+    const c10::cuda::CUDAGuard guard(A.device());
+    const at::Tensor a = A.contiguous(), b = B.contiguous(), gout = gradOutput.contiguous();
+    at::Tensor ga, gb;
+    if (computeGradA) ga = contiguous_output(gradA, a.sizes());
+    if (computeGradB) gb = contiguous_output(gradB, b.sizes());
+    ComposeRtPair_BackwardLauncher(a.data_ptr<float>(), b.data_ptr<float>(),
+                                   computeGradA ? ga.data_ptr<float>() : nullptr,
+                                   computeGradB ? gb.data_ptr<float>() : nullptr,
+                                   gout.data_ptr<float>(), computeGradA, computeGradB, a.numel() / 12,
+                                   at::cuda::getCurrentCUDAStream());
+    if (computeGradA) copy_back(gradA, ga);
+    if (computeGradB) copy_back(gradB, gb);
+    return 1;
+}
+
+int RtInverse_forward_cuda(
+            at::Tensor input,
+            at::Tensor output)
+{
+    check_cuda_input(input, "input", input);
+    TORCH_CHECK(input.numel() % 12 == 0, "input has to be a set of (3x4) transforms");
+    const c10::cuda::CUDAGuard guard(input.device());
+    const at::Tensor in = input.contiguous();
+    at::Tensor out = contiguous_output(output, in.sizes());
+    RtInverse_ForwardLauncher(in.data_ptr<float>(), out.data_ptr<float>(), in.numel() / 12,
+                              at::cuda::getCurrentCUDAStream());
+    copy_back(output, out);
+    return 1;
+}
+
+int RtInverse_backward_cuda(
+            at::Tensor input,
+            at::Tensor gradInput,
+            at::Tensor gradOutput)
+{
+    check_cuda_input(input, "input", input);
+    check_cuda_input(gradOutput, "gradOutput", input);
+    TORCH_CHECK(input.numel() % 12 == 0 && gradOutput.numel() == input.numel(),
+                "input & gradOutput have to be the same number of (3x4) transforms");
+    const c10::cuda::CUDAGuard guard(input.device());
+    const at::Tensor in = input.contiguous(), gout = gradOutput.contiguous();
+    at::Tensor gin = contiguous_output(gradInput, in.sizes());
+    RtInverse_BackwardLauncher(in.data_ptr<float>(), gin.data_ptr<float>(), gout.data_ptr<float>(), in.numel() / 12,
+                               at::cuda::getCurrentCUDAStream());
+    copy_back(gradInput, gin);
+    return 1;
+}
+
+int CollapseRtPivots_forward_cuda(
+            at::Tensor input,
+            at::Tensor output)
+{
+    check_cuda_input(input, "input", input);
+    check_cuda_input(output, "output", input);
+    TORCH_CHECK(input.numel() % 15 == 0 && output.numel() == (input.numel() / 15) * 12,
+                "input has to be a set of (3x5) transforms & output the same number of (3x4) transforms");
+    const c10::cuda::CUDAGuard guard(input.device());
+    const at::Tensor in = input.contiguous();
+    at::Tensor out = output.is_contiguous() ? output : output.contiguous();
+    CollapseRtPivots_ForwardLauncher(in.data_ptr<float>(), out.data_ptr<float>(), in.numel() / 15,
+                                     at::cuda::getCurrentCUDAStream());
+    copy_back(output, out);
+    return 1;
+}
+
+int CollapseRtPivots_backward_cuda(
+            at::Tensor input,
+            at::Tensor gradInput,
+            at::Tensor gradOutput)
+{
+    check_cuda_input(input, "input", input);
+    check_cuda_input(gradOutput, "gradOutput", input);
+    TORCH_CHECK(input.numel() % 15 == 0 && gradOutput.numel() == (input.numel() / 15) * 12,
+                "input has to be a set of (3x5) transforms & gradOutput the same number of (3x4) transforms");
+    const c10::cuda::CUDAGuard guard(input.device());
+    const at::Tensor in = input.contiguous(), gout = gradOutput.contiguous();
+    at::Tensor gin = contiguous_output(gradInput, in.sizes());
+    CollapseRtPivots_BackwardLauncher(in.data_ptr<float>(), gin.data_ptr<float>(), gout.data_ptr<float>(),
+                                      in.numel() / 15, at::cuda::getCurrentCUDAStream());
+    copy_back(gradInput, gin);
+    return 1;
+}
+
+int TransformPoints3D_forward_cuda(
+            at::Tensor points,
+            at::Tensor tfms,
+            at::Tensor tfmpoints)
+{
+    check_cuda_input(points, "points", points);
+    check_cuda_input(tfms, "tfms", points);
+    TORCH_CHECK(points.dim() == 4 && points.size(1) == 3, "points has to be B x 3 x H x W");
+    TORCH_CHECK(tfms.numel() == points.size(0) * 12, "Need one (3x4) transform per batch element");
+    const c10::cuda::CUDAGuard guard(points.device());
+    const at::Tensor pts = points.contiguous(), tfm = tfms.contiguous();
+    at::Tensor out = contiguous_output(tfmpoints, pts.sizes());
+    TransformPoints3D_ForwardLauncher(pts.data_ptr<float>(), tfm.data_ptr<float>(), out.data_ptr<float>(),
+                                      pts.size(0), pts.size(2) * pts.size(3), at::cuda::getCurrentCUDAStream());
+    copy_back(tfmpoints, out);
+    return 1;
+}
+
+int TransformPoints3D_backward_cuda(
+            at::Tensor points,
+            at::Tensor tfms,
+            at::Tensor gradPoints,
+            at::Tensor gradTfms,
+            at::Tensor gradTfmpoints,
+            int computeGradPoints,
+            int computeGradTfms)
+{
+    check_cuda_input(points, "points", points);
+    check_cuda_input(tfms, "tfms", points);
+    check_cuda_input(gradTfmpoints, "gradTfmpoints", points);
+    TORCH_CHECK(points.dim() == 4 && points.size(1) == 3, "points has to be B x 3 x H x W");
+    TORCH_CHECK(tfms.numel() == points.size(0) * 12, "Need one (3x4) transform per batch element");
+    TORCH_CHECK(gradTfmpoints.sizes() == points.sizes(), "gradTfmpoints has to be of the same size as points");
+    const c10::cuda::CUDAGuard guard(points.device());
+    const at::Tensor pts = points.contiguous(), tfm = tfms.contiguous(), gout = gradTfmpoints.contiguous();
+    at::Tensor gpts, gtfm; // The launcher zeroes the grads w.r.t the tfms (these are summed over the points)
+    if (computeGradPoints) gpts = contiguous_output(gradPoints, pts.sizes());
+    if (computeGradTfms)   gtfm = contiguous_output(gradTfms, tfm.sizes());
+    TransformPoints3D_BackwardLauncher(pts.data_ptr<float>(), tfm.data_ptr<float>(),
+                                       computeGradPoints ? gpts.data_ptr<float>() : nullptr,
+                                       computeGradTfms ? gtfm.data_ptr<float>() : nullptr,
+                                       gout.data_ptr<float>(), computeGradPoints, computeGradTfms,
+                                       pts.size(0), pts.size(2) * pts.size(3), at::cuda::getCurrentCUDAStream());
+    if (computeGradPoints) copy_back(gradPoints, gpts);
+    if (computeGradTfms)   copy_back(gradTfms, gtfm);
+    return 1;
+}
+
+// ===== LOSS3D (fused masked losses for dense 3D points/flows, see MaskedLoss3D.py)
+
+int Loss3D_forward_cuda(
+            at::Tensor input,
+            at::Tensor target,
+            at::Tensor wts,
+            at::Tensor motion,
+            at::Tensor lossSums,
+            at::Tensor wtSums,
+            at::Tensor motionSums,
+            int lossType,
+            bool hasWts,
+            bool hasMotion,
+            double motionThresh,
+            double sigmaScale,
+            double sigmaOffset,
+            double sigmaMin)
+{
+    check_cuda_input(input, "input", input);
+    check_cuda_input(target, "target", input);
+    if (hasWts)    check_cuda_input(wts, "wts", input);
+    if (hasMotion) check_cuda_input(motion, "motion", input);
+    TORCH_CHECK(input.dim() == 4, "input has to be B x C x N x M");
+    TORCH_CHECK(target.sizes() == input.sizes(), "target has to be the same size as the input");
+    TORCH_CHECK(!hasWts || (wts.dim() == 4 && wts.size(0) == input.size(0) && wts.size(1) == 1 &&
+                            wts.size(2) == input.size(2) && wts.size(3) == input.size(3)), "wts has to be B x 1 x N x M");
+    TORCH_CHECK(!hasMotion || motion.sizes() == input.sizes(), "motion has to be the same size as the input");
+    TORCH_CHECK(lossType >= 0 && lossType <= 3, "Unknown loss type");
+    const c10::cuda::CUDAGuard guard(input.device());
+    const at::Tensor in = input.contiguous(), tgt = target.contiguous();
+    const at::Tensor w = hasWts ? wts.contiguous() : wts, mot = hasMotion ? motion.contiguous() : motion;
+
+    // The per-batch sums are computed in contiguous memory (these are summed in the kernel)
+    at::Tensor ls = contiguous_output(lossSums, {in.size(0)});
+    at::Tensor ws = contiguous_output(wtSums, {in.size(0)});
+    at::Tensor ms = contiguous_output(motionSums, {in.size(0)});
+    Loss3D_ForwardLauncher(in.data_ptr<float>(), tgt.data_ptr<float>(),
+                           hasWts ? w.data_ptr<float>() : nullptr, hasMotion ? mot.data_ptr<float>() : nullptr,
+                           ls.data_ptr<float>(), ws.data_ptr<float>(), ms.data_ptr<float>(),
+                           lossType, hasWts, hasMotion, motionThresh, sigmaScale, sigmaOffset, sigmaMin,
+                           in.size(0), in.size(1), in.size(2) * in.size(3), at::cuda::getCurrentCUDAStream());
+    copy_back(lossSums, ls);
+    copy_back(wtSums, ws);
+    copy_back(motionSums, ms);
+    return 1;
+}
+
+int Loss3D_backward_cuda(
+            at::Tensor input,
+            at::Tensor target,
+            at::Tensor wts,
+            at::Tensor gradInput,
+            at::Tensor gradTarget,
+            at::Tensor gradLossSums,
+            int lossType,
+            bool hasWts,
+            bool computeGradInput,
+            bool computeGradTarget,
+            double sigmaScale,
+            double sigmaOffset,
+            double sigmaMin)
+{
+    check_cuda_input(input, "input", input);
+    check_cuda_input(target, "target", input);
+    check_cuda_input(gradLossSums, "gradLossSums", input);
+    if (hasWts) check_cuda_input(wts, "wts", input);
+    TORCH_CHECK(input.dim() == 4, "input has to be B x C x N x M");
+    TORCH_CHECK(target.sizes() == input.sizes(), "target has to be the same size as the input");
+    TORCH_CHECK(!hasWts || (wts.dim() == 4 && wts.size(0) == input.size(0) && wts.size(1) == 1 &&
+                            wts.size(2) == input.size(2) && wts.size(3) == input.size(3)), "wts has to be B x 1 x N x M");
+    TORCH_CHECK(gradLossSums.numel() == input.size(0), "gradLossSums has to have one value per batch element");
+    TORCH_CHECK(lossType >= 0 && lossType <= 3, "Unknown loss type");
+    const c10::cuda::CUDAGuard guard(input.device());
+    const at::Tensor in = input.contiguous(), tgt = target.contiguous(), gls = gradLossSums.contiguous();
+    const at::Tensor w = hasWts ? wts.contiguous() : wts;
+    at::Tensor gin, gtgt;
+    if (computeGradInput)  gin  = contiguous_output(gradInput, in.sizes());
+    if (computeGradTarget) gtgt = contiguous_output(gradTarget, tgt.sizes());
+    Loss3D_BackwardLauncher(in.data_ptr<float>(), tgt.data_ptr<float>(), hasWts ? w.data_ptr<float>() : nullptr,
+                            computeGradInput ? gin.data_ptr<float>() : nullptr,
+                            computeGradTarget ? gtgt.data_ptr<float>() : nullptr,
+                            gls.data_ptr<float>(), lossType, hasWts, computeGradInput, computeGradTarget,
+                            sigmaScale, sigmaOffset, sigmaMin,
+                            in.size(0), in.size(1), in.size(2) * in.size(3), at::cuda::getCurrentCUDAStream());
+    if (computeGradInput)  copy_back(gradInput, gin);
+    if (computeGradTarget) copy_back(gradTarget, gtgt);
+    return 1;
+}
+
+// ===== BINDINGS (added to the module in se3layers_aten.cpp)
+
+void bind_cuda(py::module &m)
+{
+    const auto nogil = py::call_guard<py::gil_scoped_release>(); // Release the GIL while the kernels run
+    m.def("NTfm3D_forward_cuda", &NTfm3D_forward_cuda, nogil);
+    m.def("NTfm3D_backward_cuda", &NTfm3D_backward_cuda, nogil);
+    m.def("Project3DPointsToSubPixelDepth_forward_cuda", &Project3DPointsToSubPixelDepth_forward_cuda, nogil);
+    m.def("Project3DPointsToSubPixelDepth_backward_cuda", &Project3DPointsToSubPixelDepth_backward_cuda, nogil);
+    m.def("ComposeRtPair_forward_cuda", &ComposeRtPair_forward_cuda, nogil);
+    m.def("ComposeRtPair_backward_cuda", &ComposeRtPair_backward_cuda, nogil);
+    m.def("RtInverse_forward_cuda", &RtInverse_forward_cuda, nogil);
+    m.def("RtInverse_backward_cuda", &RtInverse_backward_cuda, nogil);
+    m.def("CollapseRtPivots_forward_cuda", &CollapseRtPivots_forward_cuda, nogil);
+    m.def("CollapseRtPivots_backward_cuda", &CollapseRtPivots_backward_cuda, nogil);
+    m.def("TransformPoints3D_forward_cuda", &TransformPoints3D_forward_cuda, nogil);
+    m.def("TransformPoints3D_backward_cuda", &TransformPoints3D_backward_cuda, nogil);
+    m.def("Loss3D_forward_cuda", &Loss3D_forward_cuda, nogil);
+    m.def("Loss3D_backward_cuda", &Loss3D_backward_cuda, nogil);
+}
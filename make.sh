@@ -1,19 +1,7 @@
 #!/usr/bin/env bash
 
-CUDA_PATH=/usr/local/cuda/
-
-if [ -d "$CUDA_PATH" ]; then
-	cd layers/src/cuda
-	mkdir lib
-	echo "Compiling CUDA kernels using nvcc..."
-	nvcc -c -o lib/ntfm3d_kernel.cu.o ntfm3d_kernel.cu -x cu -Xcompiler -fPIC -arch=sm_52
-	nvcc -c -o lib/project3dpts_kernel.cu.o project3dpts_kernel.cu -x cu -Xcompiler -fPIC -arch=sm_52
-	cd ../../
-	python build.py
-	cd ../
-else
-	echo "Cannot find CUDA installation, just building the CPU version of the layers"
-	cd layers
-	python build.py
-	cd ../
-fi
+# Builds the C++/CUDA extension of the layers (layers/_ext/se3layers_aten*.so). The CUDA kernels are built in if
+# torch has CUDA & nvcc is found (set CUDA_HOME if it is not in /usr/local/cuda), else just the CPU version
+cd layers
+python build_aten.py build_ext --inplace
+cd ../
@@ -41,6 +41,14 @@ def setup_comon_options():
                         help='Windowsize for DA search (used for flow/visibility computation) (default: 5)')
     parser.add_argument('--use-only-da-for-flows', action='store_true', default=False,
                         help='Use only data-association for computing flows, dont use tracker info. (default: False)')
+    parser.add_argument('--da-early-exit', action='store_true', default=False,
+                        help='Stop the DA search at the nearest window row with a match, instead of searching the '
+                             'full window. Faster for large DA window sizes (default: False)')
+    parser.add_argument('--batch-flows', action='store_true', default=False,
+                        help='Compute flows/visibilities for the whole batch at once in the collater, '
+                             'instead of per-sample in the disk loader. (default: False)')
+    parser.add_argument('--batch-flow-threads', default=0, type=int, metavar='N',
+                        help='Number of threads used for the batched flow computation, 0 = torch default (default: 0)')
     parser.add_argument('--reject-left-motion', action='store_true', default=False,
                         help='Reject examples where any joint of the left arm moves by >0.005 radians inter-frame. (default: False)')
     parser.add_argument('--reject-right-still', action='store_true', default=False,
@@ -78,6 +86,9 @@ def setup_comon_options():
                         help='Wider network')
     parser.add_argument('--decomp-model', action='store_true', default=False,
                         help='Use a separate encoder for predicting the pose and masks')
+    parser.add_argument('--batch-encoder', action='store_true', default=False,
+                        help='Run the encoder once over all frames of a sequence (folded into the batch), '
+                             'batch-norm stats are then computed over all frames (default: False)')
     parser.add_argument('--use-jt-angles', action='store_true', default=False,
                         help='Model uses GT jt angles as inputs to the pose net. (default: False)')
     parser.add_argument('--use-jt-angles-trans', action='store_true', default=False,
@@ -92,6 +103,9 @@ def setup_comon_options():
                         metavar='W', help='Slope of the weight sharpening (default: 1.0)')
     parser.add_argument('--noise-stop-iter', default=1e6, type=int,
                         metavar='N', help='Stop noise addition during weight sharpening from this training iteration(default: 1e6)')
+    parser.add_argument('--mask-scale', default=1, type=int, metavar='S',
+                        help='predict the masks at 1/S of the image resolution (S = 1, 2 or 4) without the last '
+                             'deconvs of the mask decoder, NTfm3D upsamples them (default: 1)')
 
     # Loss options
     parser.add_argument('--loss-type', default='mse', type=str,
@@ -99,6 +113,18 @@ def setup_comon_options():
                                             'soft-masks (default: mse | abs, normmsesqrt, normmsesqrtpt )')
     parser.add_argument('--motion-norm-loss', action='store_true', default=False,
                         help='normalize the losses by number of points that actually move instead of size average (default: False)')
+    parser.add_argument('--fused-loss', action='store_true', default=False,
+                        help='compute the 3D point losses with the fused MaskedLoss3D kernels (default: False)')
+    parser.add_argument('--bptt-window', default=0, type=int, metavar='N',
+                        help='truncated backprop for multi-step rollouts: backprop every N steps & cut the graph, '
+                             '0 = backprop through the full sequence (default: 0)')
+    parser.add_argument('--recompute-rollout', action='store_true', default=False,
+                        help='recompute the activations of each rollout step in the BWD pass instead of '
+                             'storing them (default: False)')
+    parser.add_argument('--checkpoint-budget-mb', default=0, type=float, metavar='MB',
+                        help='activation checkpointing: recompute conv/deconv blocks of the encoders/decoders in the '
+                             'BWD pass till the activations they store for a training batch fit in MB megabytes, '
+                             '0 = store all (default: 0)')
     parser.add_argument('--consis-wt', default=0.1, type=float,
                         metavar='WT', help='Weight for the pose consistency loss (default: 0.1)')
     parser.add_argument('--loss-scale', default=10000, type=float,
@@ -109,6 +135,9 @@ def setup_comon_options():
     # Training options
     parser.add_argument('--no-cuda', action='store_true', default=False,
                         help='disables CUDA training (default: False)')
+    parser.add_argument('--mixed-precision', action='store_true', default=False,
+                        help='run the FWD pass under bfloat16 autocast (convs/matmuls in bfloat16, the se3layers, '
+                             'mask normalization & losses in float32) (default: False)')
     parser.add_argument('--use-pin-memory', action='store_true', default=False,
                         help='Use pin memory - note that this uses additional CPU RAM (default: False)')
     parser.add_argument('--epochs', default=100, type=int, metavar='N',
@@ -121,8 +150,18 @@ def setup_comon_options():
                         help='number of validation iterations per epoch (default: 500)')
     parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
                         help='evaluate model on test set (default: False)')
+    parser.add_argument('--int8', action='store_true', default=False,
+                        help='when evaluating, also evaluate the model with its conv layers quantized to int8 '
+                             '(post-training quantization, CPU only, see quantization.py) (default: False)')
+    parser.add_argument('--int8-calib-samples', default=256, type=int, metavar='N',
+                        help='number of training samples used to calibrate the int8 quantization (default: 256)')
+    parser.add_argument('--int8-keep-float', default='', type=str, metavar='NAMES',
+                        help='comma-separated names of the conv layers that are kept in float, '
+                             'e.g. posemaskmodel.conv1 (default: none)')
     parser.add_argument('--seed', type=int, default=1, metavar='S',
                         help='random seed (default: 1)')
+    parser.add_argument('--req-input-grads', action='store_true', default=False,
+                        help='Compute gradients w.r.t the input points, not needed for learning (default: False)')
 
     # Optimization options
     parser.add_argument('-o', '--optimization', default='adam', type=str,
@@ -0,0 +1,115 @@
+# Global imports
+import time
+import argparse
+
+# Torch imports
+import torch
+
+# Local imports
+import ctrlnets
+
+'''
+    --------------------- Planning with the SE3-Pose-Model ------------------------------
+    The pose is encoded once (MultiStepSE3PoseModel.forward_only_pose) & then N candidate control sequences
+    (B x N x H x num_ctrl) are rolled out over H steps through the transition model in a single batched call
+    (MultiStepSE3PoseModel.forward_plan). The candidates are scored with a cost function of the predicted poses,
+    by default the squared error between the final poses & a target pose.
+        evaluate_controls(model, pose, ctrls, target) : costs (B x N), deltas & poses (B x N x H x nSE3 x 3 x 4)
+        refine_controls(model, pose, ctrls, target)   : refines all candidates in parallel with gradient descent on
+                                                        their costs (the model weights are not touched)
+    The model should be in eval mode. Run this file to benchmark the throughput (in candidates/sec).
+'''
+
+### Squared error between the final predicted poses & the target poses (B x nSE3 x 3 x 4), returns B x N costs
+def pose_cost(poses, target):
+    err = poses.select(2, poses.size(2)-1) - target.unsqueeze(1)
+    return err.pow(2).view(poses.size(0), poses.size(1), -1).sum(2)
+
+### Rollout & score the candidates
+def evaluate_controls(model, pose, ctrls, target, jtangles=None, cost_fn=pose_cost):
+    deltas, poses = model.forward_plan(pose, ctrls, jtangles)
+    return cost_fn(poses, target), deltas, poses
+
+### Gradient based refinement of the candidates (each candidate minimizes its own cost)
+# "ctrl_bounds" is an optional (min, max) for the controls. Returns the refined controls & their costs (B x N)
+def refine_controls(model, pose, ctrls, target, jtangles=None, cost_fn=pose_cost,
+                    num_iters=10, lr=1e-2, ctrl_bounds=None):
+    pose, target = pose.detach(), target.detach()
+    jtangles = jtangles.detach() if jtangles is not None else None
+    ctrls = ctrls.detach().clone().requires_grad_()
+    optimizer = torch.optim.Adam([ctrls], lr=lr)
+    for _ in range(num_iters):
+        costs, _, _ = evaluate_controls(model, pose, ctrls, target, jtangles, cost_fn)
+        # The candidates are independent, so the grads of the summed cost are the per-candidate grads
+        # Only the grads w.r.t the controls are computed (none for the model weights)
+        ctrls.grad, = torch.autograd.grad(costs.sum(), [ctrls])
+        optimizer.step()
+        if ctrl_bounds is not None:
+            with torch.no_grad():
+                ctrls.clamp_(ctrl_bounds[0], ctrl_bounds[1])
+    with torch.no_grad():
+        costs, _, _ = evaluate_controls(model, pose, ctrls, target, jtangles, cost_fn)
+    return ctrls.detach(), costs
+
+################ Benchmark
+#### Setup options
+parser = argparse.ArgumentParser(description='Benchmark the planning throughput of the SE3-Pose-Model')
+parser.add_argument('--cuda', action='store_true', default=False,
+                    help='Run the benchmarks on the GPU (default: False)')
+parser.add_argument('--num-se3', default=8, type=int, metavar='K',
+                    help='Number of SE3s predicted by the network (default: 8)')
+parser.add_argument('--num-ctrl', default=7, type=int, metavar='N',
+                    help='Dimension of the control vector (default: 7)')
+parser.add_argument('--se3-type', default='se3aa', type=str, metavar='SE3',
+                    help='SE3 parameterization (default: se3aa)')
+parser.add_argument('--horizon', default=5, type=int, metavar='H',
+                    help='Planning horizon (default: 5)')
+parser.add_argument('--iters', default=20, type=int, metavar='N',
+                    help='Number of timed iterations per benchmark (default: 20)')
+parser.add_argument('--refine-iters', default=5, type=int, metavar='N',
+                    help='Number of gradient steps when benchmarking the refinement (default: 5)')
+
+# Time a function (in secs per call), sync the GPU before reading the clock
+def time_fn(fn, iters, cuda):
+    fn() # Warmup
+    if cuda:
+        torch.cuda.synchronize()
+    st = time.time()
+    for _ in range(iters):
+        fn()
+    if cuda:
+        torch.cuda.synchronize()
+    return (time.time() - st) / iters
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    args.cuda = args.cuda and torch.cuda.is_available()
+    device = torch.device('cuda' if args.cuda else 'cpu')
+    print('Running on: {}'.format('GPU' if args.cuda else 'CPU'))
+
+    # Model & encoded pose (encoded once)
+    model = ctrlnets.MultiStepSE3PoseModel(num_ctrl=args.num_ctrl, num_se3=args.num_se3,
+                                           se3_type=args.se3_type).to(device).eval()
+    with torch.no_grad():
+        pose   = model.forward_only_pose([torch.randn(1, 3, 240, 320, device=device), None])
+        target = model.forward_only_pose([torch.randn(1, 3, 240, 320, device=device), None])
+
+    print('==== Planning throughput (candidates/sec), horizon: {}'.format(args.horizon))
+    print('{:>10} {:>14} {:>14} {:>14}'.format('N', 'Per-cand copy', 'Batched', 'Refine/iter'))
+    for ncand in [16, 256, 4096]:
+        ctrls = torch.randn(1, ncand, args.horizon, args.num_ctrl, device=device)
+
+        # Baseline: pose copied per candidate, one forward_next_pose call per step
+        def copied():
+            with torch.no_grad():
+                p = pose.expand(ncand, *pose.size()[1:]).contiguous()
+                for h in range(args.horizon):
+                    _, p = model.forward_next_pose(p, ctrls[0, :, h])
+        def batched():
+            with torch.no_grad():
+                evaluate_controls(model, pose, ctrls, target)
+        def refine():
+            refine_controls(model, pose, ctrls, target, num_iters=args.refine_iters)
+        times = [time_fn(copied, args.iters, args.cuda), time_fn(batched, args.iters, args.cuda),
+                 time_fn(refine, max(args.iters // args.refine_iters, 1), args.cuda) / (args.refine_iters + 1)]
+        print('{:>10} {:>14.0f} {:>14.0f} {:>14.0f}'.format(ncand, *[ncand / t for t in times]))
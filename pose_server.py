@@ -0,0 +1,258 @@
+# Global imports
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+try:
+    import queue
+    import socketserver
+except ImportError: # Python 2.x
+    import Queue as queue
+    import SocketServer as socketserver
+
+# Torch imports
+import torch
+
+# Local imports
+import se3layers as se3nn
+import gridcache # se3layers adds layers/ to the path
+from inference import SE3PosePredictor, load_model
+
+'''
+    --------------------- Micro-batching inference server for the SE3-Pose-Model ------------------------------
+    python pose_server.py <checkpoint> --socket /tmp/se3pose.sock [--max-batch 8] [--max-delay-ms 5]
+
+    Serves an SE3PosePredictor (see inference.py) over a Unix socket. Each connection (tracker, planner,
+    visualizer, ...) sends requests & waits for the replies, requests from all the connections go into a single
+    queue. A batcher thread takes the first request from the queue & keeps collecting requests till it has
+    "max_batch" of them or the first one has waited for "max_delay" (the latency budget). The requests with the
+    same op & input sizes are stacked & run as one batch.
+
+    Messages (both ways) are a 4 byte (big-endian) header length, a JSON header & the raw (C-order) bytes of the
+    tensors listed in header['tensors'] as [name, dtype, shape]. Requests have an "op":
+        pose       : inputs "depth" (H x W, converted to points with the camera intrinsics of the checkpoint)
+                     or "points" (3 x H x W), "jtangles" if the model needs them. Returns "pose"
+        pose_mask  : same inputs, returns "pose" & "mask"
+        next_pose  : inputs "pose" (nSE3 x 3 x 4), "ctrl" & "jtangles" if needed. Returns "delta" & "pose"
+        info       : model info (no inputs)
+        stats      : latency (ms, p50/p99 from the last 1000 requests) & throughput stats (no inputs)
+    Errors are returned as {"error": message}. ReplayClient in replay_client.py streams a dataset at camera rate.
+'''
+
+################ Protocol
+# Read exactly "n" bytes into a (writable) buffer, None if the connection is closed
+def recv_exact(sock, n):
+    buf = bytearray(n)
+    view, pos = memoryview(buf), 0
+    while pos < n:
+        nread = sock.recv_into(view[pos:], n - pos)
+        if nread == 0:
+            return None
+        pos += nread
+    return buf
+
+# Send a header (dict) & a dict of tensors/arrays
+def send_msg(sock, header, tensors=None):
+    arrays = OrderedDict((k, np.ascontiguousarray(v.detach().cpu().numpy() if torch.is_tensor(v) else v))
+                         for k, v in (tensors or {}).items())
+    header = dict(header, tensors=[[k, v.dtype.name, list(v.shape)] for k, v in arrays.items()])
+    hdr = json.dumps(header).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(hdr)) + hdr)
+    for v in arrays.values():
+        sock.sendall(v.tobytes())
+
+# Receive a header & a dict of tensors, (None, None) if the connection is closed
+def recv_msg(sock):
+    size = recv_exact(sock, 4)
+    if size is None:
+        return None, None
+    header = json.loads(recv_exact(sock, struct.unpack('>I', bytes(size))[0]).decode('utf-8'))
+    tensors = OrderedDict()
+    for name, dtype, shape in header.pop('tensors', []):
+        dtype = np.dtype(dtype)
+        buf = recv_exact(sock, int(np.prod(shape)) * dtype.itemsize)
+        tensors[name] = torch.from_numpy(np.frombuffer(buf, dtype=dtype).reshape(shape))
+    return header, tensors
+
+################ Stats
+class LatencyStats(object):
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window) # Secs
+        self.start, self.nrequests, self.nbatches = time.time(), 0, 0
+
+    def update(self, latencies):
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.nrequests += len(latencies)
+            self.nbatches  += 1
+
+    def summary(self):
+        with self.lock:
+            lat = sorted(self.latencies)
+            nreq, nbatch, elapsed = self.nrequests, self.nbatches, time.time() - self.start
+        pct = lambda p: 1000.0 * lat[min(int(p * len(lat)), len(lat) - 1)] if lat else 0.0
+        return {'requests': nreq, 'batches': nbatch, 'mean_batch': float(nreq) / max(nbatch, 1),
+                'throughput': nreq / max(elapsed, 1e-6), 'p50_ms': pct(0.5), 'p99_ms': pct(0.99)}
+
+################ Micro-batcher
+class Request(object):
+    def __init__(self, op, inputs):
+        self.op, self.inputs = op, inputs
+        self.key = (op,) + tuple((k, tuple(v.size())) for k, v in inputs.items()) # Batched together if same
+        self.arrival = time.time()
+        self.done = threading.Event()
+        self.outputs, self.error = None, None
+
+class MicroBatcher(object):
+    def __init__(self, predictor, intrinsics=None, max_batch=8, max_delay=0.005):
+        self.predictor, self.intrinsics = predictor, intrinsics
+        self.max_batch, self.max_delay = max_batch, max_delay
+        self.queue = queue.Queue()
+        self.stats = LatencyStats()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # Queue a request & wait for it to be processed
+    def submit(self, op, inputs):
+        req = Request(op, inputs)
+        self.queue.put(req)
+        req.done.wait()
+        return req
+
+    # Batcher loop
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = batch[0].arrival + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            groups = OrderedDict()
+            for req in batch:
+                groups.setdefault(req.key, []).append(req)
+            for reqs in groups.values():
+                self.process(reqs)
+
+    # Points (B x 3 x H x W) from the inputs of a batch of requests
+    def points(self, reqs):
+        if 'points' in reqs[0].inputs:
+            return torch.stack([r.inputs['points'] for r in reqs], 0)
+        assert ('depth' in reqs[0].inputs), "Need either depth or points as inputs"
+        assert (self.intrinsics is not None), "Camera intrinsics are needed to convert depths to points"
+        depth = torch.stack([r.inputs['depth'] for r in reqs], 0).unsqueeze(1).float() # B x 1 x H x W
+        return depth * gridcache.camera_xyzgrid(depth.size(2), depth.size(3), self.intrinsics)
+
+    # Run a batch of requests with the same op & input sizes
+    def process(self, reqs):
+        stack = lambda key: torch.stack([r.inputs[key] for r in reqs], 0) if key in reqs[0].inputs else None
+        try:
+            op = reqs[0].op
+            if op == 'pose':
+                outputs = {'pose': self.predictor.predict_pose(self.points(reqs), stack('jtangles'))}
+            elif op == 'pose_mask':
+                pose, mask = self.predictor.predict_pose_mask(self.points(reqs), stack('jtangles'))
+                outputs = {'pose': pose, 'mask': mask}
+            elif op == 'next_pose':
+                delta, pose = self.predictor.predict_next_pose(stack('pose'), stack('ctrl'), stack('jtangles'))
+                outputs = {'delta': delta, 'pose': pose}
+            else:
+                assert False, "Unknown op: " + op
+            for k, r in enumerate(reqs):
+                r.outputs = OrderedDict((name, v[k]) for name, v in outputs.items())
+        except Exception as e:
+            for r in reqs:
+                r.error = '{}: {}'.format(type(e).__name__, e)
+        now = time.time()
+        self.stats.update([now - r.arrival for r in reqs])
+        for r in reqs:
+            r.done.set()
+
+################ Server
+class PoseRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            header, tensors = recv_msg(self.request)
+            if header is None:
+                break
+            op = header.get('op')
+            if op == 'stats':
+                send_msg(self.request, batcher.stats.summary())
+            elif op == 'info':
+                send_msg(self.request, self.server.info)
+            else:
+                req = batcher.submit(op, tensors)
+                if req.error is not None:
+                    send_msg(self.request, {'error': req.error})
+                else:
+                    send_msg(self.request, {'op': op}, req.outputs)
+
+class PoseServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, batcher, info):
+        if os.path.exists(path):
+            os.remove(path) # Stale socket
+        socketserver.UnixStreamServer.__init__(self, path, PoseRequestHandler)
+        self.batcher, self.info = batcher, info
+
+#### Setup options
+parser = argparse.ArgumentParser(description='Micro-batching inference server for the SE3-Pose-Model')
+parser.add_argument('checkpoint', type=str, metavar='PATH',
+                    help='path to the checkpoint (e.g. model_flow_best.pth.tar)')
+parser.add_argument('--socket', default='/tmp/se3pose.sock', type=str, metavar='PATH',
+                    help='path of the Unix socket (default: /tmp/se3pose.sock)')
+parser.add_argument('--cuda', action='store_true', default=False,
+                    help='Run on the GPU (default: False)')
+parser.add_argument('--max-batch', default=8, type=int, metavar='N',
+                    help='Max number of requests per batch (default: 8)')
+parser.add_argument('--max-delay-ms', default=5.0, type=float, metavar='MS',
+                    help='Max time a request waits for others to be batched with it (default: 5)')
+parser.add_argument('--stats-interval', default=10.0, type=float, metavar='SECS',
+                    help='Print the stats every N secs, 0 = never (default: 10)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    device = 'cuda' if (args.cuda and torch.cuda.is_available()) else 'cpu'
+    ckargs = torch.load(args.checkpoint, map_location=lambda storage, loc: storage)['args']
+    predictor = SE3PosePredictor(load_model(args.checkpoint, device), device)
+    intrinsics = ckargs.cam_intrinsics[0] if getattr(ckargs, 'cam_intrinsics', None) else None
+    info = {'num_se3': ckargs.num_se3, 'num_ctrl': ckargs.num_ctrl, 'img_ht': ckargs.img_ht, 'img_wd': ckargs.img_wd,
+            'img_scale': getattr(ckargs, 'img_scale', 1e-4), 'use_jt_angles': ckargs.use_jt_angles,
+            'use_jt_angles_trans': ckargs.use_jt_angles_trans,
+            'num_state': getattr(ckargs, 'num_state_net', ckargs.num_ctrl), 'depth_input': intrinsics is not None,
+            'ctrl_ids': ckargs.ctrl_ids[0].tolist() if getattr(ckargs, 'ctrl_ids', None) else None}
+    batcher = MicroBatcher(predictor, intrinsics, args.max_batch, args.max_delay_ms / 1000.0)
+    server = PoseServer(args.socket, batcher, info)
+    print('Serving {} on {} (max batch: {}, max delay: {} ms)'.format(args.checkpoint, args.socket,
+                                                                      args.max_batch, args.max_delay_ms))
+
+    # Print the stats periodically
+    def print_stats():
+        while True:
+            time.sleep(args.stats_interval)
+            s = batcher.stats.summary()
+            print('Requests: {requests}, mean batch: {mean_batch:.2f}, throughput: {throughput:.1f} req/s, '
+                  'latency p50: {p50_ms:.2f} ms, p99: {p99_ms:.2f} ms'.format(**s))
+            sys.stdout.flush()
+    if args.stats_interval > 0:
+        thread = threading.Thread(target=print_stats)
+        thread.daemon = True
+        thread.start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(args.socket)
@@ -0,0 +1,97 @@
+import torch
+import torch.nn as nn
+try:
+    import torch.ao.quantization as tq
+except ImportError: # Older torch versions
+    import torch.quantization as tq
+import ctrlnets
+
+'''
+    --------------------- Post-training int8 quantization of the conv encoders/decoders ------------------------------
+    quantize_int8(model, calib_batches, forward_fn, engine=None, keep_float=())
+
+    Quantizes the conv layers of a trained model (PoseMaskEncoder, PoseEncoder, MaskEncoder, FlowNet, SE3Model, ...)
+    for CPU inference. Each conv is replaced by an int8 "island": the float input is quantized (per-tensor scale & zero
+    point, calibrated), the int8 conv runs (per-channel weight scales) & the output is dequantized. The pooling & ReLU
+    of the Basic Conv blocks run in int8 too (the BN is folded into the conv first, ctrlnets.fold_batchnorm).
+    Everything else (the deconvs, PReLUs, skip-adds, the SE3 heads, the se3layers & the mask normalization) stays in
+    float & the blocks keep their float inputs/outputs, so the forward passes of the models do not change. The int8
+    deconvs are either wrong (x86/onednn kernels, padded deconvs) or slower than the float ones (fbgemm) & the int8
+    PReLU is off by ~40% (torch 2.1), so these are not quantized.
+    Steps:
+        1) Fold the BN layers & wrap the conv layers into islands (quantize_model)
+        2) Observe the activation ranges: forward_fn(model, batch) for each of the calibration batches
+        3) Convert the islands to int8
+    The layers with the given names (e.g. 'posemaskmodel.conv1') are kept in float. The quantized model runs on the
+    CPU only & can't be trained.
+'''
+
+### Quantize -> int8 modules -> dequantize
+class Int8Island(nn.Module):
+    def __init__(self, *modules):
+        super(Int8Island, self).__init__()
+        self.quant   = tq.QuantStub()
+        self.body    = nn.Sequential(*modules)
+        self.dequant = tq.DeQuantStub()
+
+    # The int8 kernels return channels-last outputs, the float layers after the island expect contiguous ones
+    def forward(self, x):
+        return self.dequant(self.body(self.quant(x))).contiguous()
+
+### Replace the conv of a Basic/Pre Conv block (in-place) or a bare conv layer with an island, returns the new module
+### (the deconv blocks & layers are returned as is, None if the module is not one of these)
+def quantize_block(module):
+    if isinstance(module, ctrlnets.BasicConv2D):
+        if not isinstance(module.conv, ctrlnets.CoordConvBase):
+            body = [module.conv] + ([module.pool] if module.pool is not None else [])
+            if module.bn is None and isinstance(module.nonlin, nn.ReLU): # ReLU in int8
+                body.append(module.nonlin)
+                module.nonlin = nn.Identity()
+            module.conv, module.pool = Int8Island(*body), None # BN (if it couldn't be folded) in float
+        return module
+    if isinstance(module, (ctrlnets.BasicDeconv2D, ctrlnets.PreDeconv2D, nn.ConvTranspose2d)):
+        return module # Float
+    if isinstance(module, ctrlnets.PreConv2D):
+        if not isinstance(module.conv, ctrlnets.CoordConvBase):
+            module.conv = Int8Island(module.conv)
+        return module
+    if isinstance(module, nn.Conv2d):
+        return Int8Island(module)
+    return None
+
+### Replace the conv layers with islands (in-place, skips the "keep_float" layers), returns the number of islands
+def quantize_model(model, keep_float=(), prefix=''):
+    nislands = 0
+    for name, child in list(model.named_children()):
+        fullname = prefix + name
+        if fullname in keep_float or isinstance(child, ctrlnets.CoordConvBase):
+            continue
+        block = quantize_block(child)
+        if block is None:
+            nislands += quantize_model(child, keep_float, fullname + '.')
+        else:
+            setattr(model, name, block)
+            nislands += sum(1 for m in block.modules() if isinstance(m, Int8Island))
+    return nislands
+
+### Qconfig of the islands (per-channel weight scales), the rest of the model stays in float
+def set_qconfig(model, engine):
+    qconfig = tq.get_default_qconfig(engine)
+    for island in [m for m in model.modules() if isinstance(m, Int8Island)]:
+        island.qconfig = qconfig
+
+### Calibrate & convert the islands to int8 (in-place), returns the model & the number of int8 islands
+def quantize_int8(model, calib_batches, forward_fn, engine=None, keep_float=()):
+    engine = engine or torch.backends.quantized.engine
+    assert (engine in torch.backends.quantized.supported_engines), "Unsupported quantization engine: " + engine
+    torch.backends.quantized.engine = engine
+    model = model.cpu().eval()
+    ctrlnets.fold_batchnorm(model)
+    nislands = quantize_model(model, keep_float)
+    set_qconfig(model, engine)
+    tq.prepare(model, inplace=True)
+    with torch.no_grad():
+        for batch in calib_batches:
+            forward_fn(model, batch)
+    tq.convert(model, inplace=True)
+    return model, nislands
@@ -0,0 +1,124 @@
+# Global imports
+import os
+import re
+import time
+import socket
+import argparse
+import threading
+
+# Torch imports
+import torch
+
+# Local imports
+import data
+from pose_server import send_msg, recv_msg
+
+'''
+    --------------------- Replay client for pose_server.py ------------------------------
+    python replay_client.py <dataset dir> --socket /tmp/se3pose.sock [--rate 30] [--num-clients 1] [--op pose_mask]
+
+    Stand-in camera for testing the server: streams the depth images (depth<k>.png) of a dataset directory at a
+    fixed rate (30 Hz by default). Each of the "num_clients" consumers (threads with their own connection) sends
+    every frame to the server & waits for the reply. A frame is "late" if its reply comes back after the next frame
+    is due, the consumer then skips ahead to the current frame (like a camera would). The jt angles are read from
+    the state<k>.txt files if the model needs them. At the end, the client-side latencies & the server stats are
+    printed.
+'''
+
+# Connect to the server
+def connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    return sock
+
+# Send a request & wait for the reply
+def request(sock, op, tensors=None):
+    send_msg(sock, {'op': op}, tensors)
+    header, outputs = recv_msg(sock)
+    assert (header is not None), "Server closed the connection"
+    assert ('error' not in header), "Server error: " + header.get('error', '')
+    return header, outputs
+
+# Load the frames of a dataset directory (sorted by their ID)
+def load_frames(load_dir, info, num_frames=0):
+    ids = sorted(int(m.group(1)) for m in [re.match(r'depth(\d+)\.png$', f) for f in os.listdir(load_dir)] if m)
+    ids = ids[:num_frames] if num_frames > 0 else ids
+    assert (len(ids) > 0), "No depth images in " + load_dir
+    frames = []
+    for k in ids:
+        frame = {'depth': data.read_depth_image(os.path.join(load_dir, 'depth' + str(k) + '.png'),
+                                                info['img_ht'], info['img_wd'], info['img_scale'])[0]}
+        if info['use_jt_angles'] or info['use_jt_angles_trans']:
+            assert (info['ctrl_ids'] is not None), "Checkpoint has no control ids to read the jt angles"
+            state = data.read_baxter_state_file(os.path.join(load_dir, 'state' + str(k) + '.txt'))
+            frame['jtangles'] = state['actjtpos'][torch.LongTensor(info['ctrl_ids'])]
+        frames.append(frame)
+    return frames
+
+# Stream the frames at a fixed rate, returns the latencies (secs) & the number of late frames
+def replay(path, op, frames, rate, duration):
+    sock = connect(path)
+    period, latencies, late = 1.0 / rate, [], 0
+    start = time.time()
+    k = 0
+    while (time.time() - start) < duration:
+        due = start + k * period
+        wait = due - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        st = time.time()
+        request(sock, op, frames[k % len(frames)])
+        latencies.append(time.time() - st)
+        # Skip to the current frame if the reply missed the next one
+        nextk = int((time.time() - start) / period) + 1
+        if nextk > k + 1:
+            late += 1
+        k = max(k + 1, nextk)
+    sock.close()
+    return latencies, late
+
+#### Setup options
+parser = argparse.ArgumentParser(description='Replays a dataset directory to pose_server.py at camera rate')
+parser.add_argument('data', type=str, metavar='DIR',
+                    help='dataset directory with the depth<k>.png (& state<k>.txt) files')
+parser.add_argument('--socket', default='/tmp/se3pose.sock', type=str, metavar='PATH',
+                    help='path of the Unix socket of the server (default: /tmp/se3pose.sock)')
+parser.add_argument('--op', default='pose_mask', type=str, metavar='OP',
+                    help='Request: pose | pose_mask (default: pose_mask)')
+parser.add_argument('--rate', default=30.0, type=float, metavar='HZ',
+                    help='Frame rate (default: 30)')
+parser.add_argument('--duration', default=10.0, type=float, metavar='SECS',
+                    help='Length of the replay (default: 10)')
+parser.add_argument('--num-clients', default=1, type=int, metavar='N',
+                    help='Number of concurrent consumers of the stream (default: 1)')
+parser.add_argument('--num-frames', default=0, type=int, metavar='N',
+                    help='Number of frames to load, looped over (default: 0 = all)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    sock = connect(args.socket)
+    info, _ = request(sock, 'info')
+    frames = load_frames(args.data, info, args.num_frames)
+    print('Replaying {} frames from {} at {} Hz to {} consumer(s)'.format(len(frames), args.data, args.rate,
+                                                                          args.num_clients))
+
+    # Run the consumers
+    results = [None] * args.num_clients
+    def run(k):
+        results[k] = replay(args.socket, args.op, frames, args.rate, args.duration)
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(args.num_clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Client-side stats
+    latencies = sorted(l for lat, _ in results for l in lat)
+    nlate = sum(late for _, late in results)
+    pct = lambda p: 1000.0 * latencies[min(int(p * len(latencies)), len(latencies) - 1)]
+    print('Client => Requests: {}, late: {}, throughput: {:.1f} req/s, latency p50: {:.2f} ms, p99: {:.2f} ms'.format(
+        len(latencies), nlate, len(latencies) / args.duration, pct(0.5), pct(0.99)))
+    stats, _ = request(sock, 'stats')
+    print('Server => Requests: {requests}, mean batch: {mean_batch:.2f}, throughput: {throughput:.1f} req/s, '
+          'latency p50: {p50_ms:.2f} ms, p99: {p99_ms:.2f} ms'.format(**stats))
+    sock.close()
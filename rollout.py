@@ -0,0 +1,125 @@
+import time
+import torch
+import torch.utils.checkpoint
+import se3layers as se3nn
+import ctrlnets
+
+'''
+    --------------------- Multi-step rollouts of the SE3-Pose-Model ------------------------------
+    rollout_se3pose(model, pts, ctrls, jtangles, fwdflows, fwdvis, ...) :
+
+    Runs the encoder once over all seq_len+1 frames (MultiStepSE3PoseModel.forward_poses_masks, mask only @ t=0)
+    & then rolls out the transition model for seq_len steps, starting from the encoder pose @ t=0:
+        [delta_k, pose_k+1] = transition(pose_k, ctrl_k),  pts_k+1 = NTfm3D(pts_k, mask_0, delta_k)
+    The loss for each step is the 3D point loss (pts_k+1 - pts_0 vs fwdflows_k, the flows are w.r.t t=0) & the
+    consistency loss between the encoder poses (encpose_k+1 vs delta_k * encpose_k, no grads to the deltas).
+
+    Memory:
+        bptt_window : Truncated backprop. The rollout state (pose & pts) is detached every "bptt_window" steps
+                      & the BWD pass of each window is run (if "backward" is set) before the next one starts, so
+                      only the graph of a single window is kept around. The encoder is cut from the rollout
+                      (its outputs become leaf tensors whose grads are accumulated over the windows) & its BWD
+                      pass is run once at the end. 0 = no truncation (full BPTT).
+        recompute   : The activations of each step are not stored, but recomputed in the BWD pass
+                      (torch.utils.checkpoint). Only the rollout state at the start of each step is kept.
+    All returned tensors are detached (copied into pre-allocated buffers as the rollout proceeds). If "backward"
+    is not set, "loss" is the total loss (with its graph, if grads are enabled) & no BWD pass is run.
+    The BWD passes of the windows are interleaved with the FWD pass, "bwd_time" is the time spent in them (so the
+    caller can split the time of the rollout into FWD & BWD time).
+'''
+
+### Results of a rollout
+class RolloutResult(object):
+    def __init__(self, loss, ptloss, consisloss, poses, deltaposes, transposes, predpts, initmask, bwd_time=0.0):
+        self.loss       = loss        # Total loss (scalar)
+        self.ptloss     = ptloss      # seq_len, 3D point loss per step
+        self.consisloss = consisloss  # seq_len, consistency loss per step
+        self.poses      = poses       # B x seq_len+1 x nSE3 x 3 x 4, encoder poses
+        self.deltaposes = deltaposes  # B x seq_len x nSE3 x 3 x 4, transition model deltas
+        self.transposes = transposes  # B x seq_len x nSE3 x 3 x 4, transition model poses
+        self.predpts    = predpts     # B x seq_len x 3 x H x W, predicted points
+        self.initmask   = initmask    # B x nSE3 x H x W (at 1/mask_scale of H x W), mask @ t=0
+        self.bwd_time   = bwd_time    # Time (s) spent in the BWD passes
+
+### Rollout (and optionally backprop through) "seq_len" steps of the transition model
+def rollout_se3pose(model, pts, ctrls, jtangles, fwdflows, fwdvis, loss_type='mse', motion_norm_loss=False,
+                    fused_loss=False, pt_wt=1.0, consis_wt=0.1, train_iter=0, bptt_window=0, recompute=False,
+                    backward=False):
+    # Check dimensions
+    bsz, seq_len = pts.size(0), pts.size(1) - 1 # B x seq_len+1 x 3 x H x W
+    assert (seq_len > 0 and ctrls.size(1) >= seq_len and fwdflows.size(1) >= seq_len), \
+        "Need controls & flows for all seq_len steps"
+    window = bptt_window if (bptt_window > 0) else seq_len
+
+    # Run the encoder over all frames, cut the graph between the encoder & the rollout
+    encposes, encmasks = model.forward_poses_masks([pts, jtangles], mask_steps=(0,), train_iter=train_iter)
+    encmask = encmasks[:, 0]
+    if backward:
+        poses, initmask = encposes.detach().requires_grad_(), encmask.detach().requires_grad_()
+    else:
+        poses, initmask = encposes, encmask
+
+    # One step of the rollout: predict the next pose & pts, compute the losses
+    ptpredlayer = se3nn.NTfm3D()
+    def step(pose, currpts, mask, ctrl, jtangle, flows, wts, encpose, encnextpose):
+        deltapose, transpose = model.forward_next_pose(pose, ctrl, jtangle, None)
+        nextpts = ptpredlayer(currpts, mask, deltapose)
+        inputs  = nextpts - pts[:, 0] # Flows are w.r.t the pts @ t=0
+        if motion_norm_loss:
+            ptloss = pt_wt * ctrlnets.MotionNormalizedLoss3D(inputs, flows, motion=flows, loss_type=loss_type,
+                                                             wts=wts, fused=fused_loss)
+        else:
+            ptloss = pt_wt * ctrlnets.Loss3D(inputs, flows, loss_type=loss_type, wts=wts, fused=fused_loss)
+        nextpose_trans = se3nn.ComposeRtPair()(deltapose.detach(), encpose) # No grads to the deltas
+        consisloss = consis_wt * ctrlnets.BiMSELoss(nextpose_trans, encnextpose)
+        return deltapose, transpose, nextpts, ptloss, consisloss
+
+    # Buffers for the outputs
+    deltaposes = poses.new_zeros(bsz, seq_len, *poses.size()[2:])
+    transposes = poses.new_zeros(bsz, seq_len, *poses.size()[2:])
+    predpts    = pts.new_zeros(bsz, seq_len, *pts.size()[2:])
+    ptlosses, consislosses = torch.zeros(seq_len), torch.zeros(seq_len)
+
+    # Rollout
+    pose, currpts = poses[:, 0], pts[:, 0]
+    loss, winloss, bwd_time = 0, 0, 0.0
+    for k in range(seq_len):
+        # Truncate (BWD pass for the previous window & cut the graph)
+        if (k > 0) and (k % window == 0):
+            if backward:
+                start = time.time()
+                winloss.backward()
+                bwd_time += time.time() - start
+                loss, winloss = loss + winloss.item(), 0
+            pose, currpts = pose.detach(), currpts.detach()
+
+        # Run the step
+        inps = [pose, currpts, initmask, ctrls[:, k], jtangles[:, k], fwdflows[:, k], fwdvis[:, k],
+                poses[:, k], poses[:, k+1]]
+        if recompute and torch.is_grad_enabled():
+            deltapose, transpose, nextpts, ptloss, consisloss = torch.utils.checkpoint.checkpoint(step, *inps,
+                                                                                                  use_reentrant=False)
+        else:
+            deltapose, transpose, nextpts, ptloss, consisloss = step(*inps)
+        winloss = winloss + ptloss + consisloss
+
+        # Save outputs & update state
+        deltaposes[:, k].copy_(deltapose.detach()); transposes[:, k].copy_(transpose.detach())
+        predpts[:, k].copy_(nextpts.detach())
+        ptlosses[k], consislosses[k] = ptloss.item(), consisloss.item()
+        pose, currpts = transpose, nextpts
+
+    # BWD pass for the last window & the encoder
+    if backward:
+        start = time.time()
+        winloss.backward()
+        outs = [(x, y.grad) for x, y in [(encposes, poses), (encmask, initmask)] if y.grad is not None]
+        torch.autograd.backward([x for x,_ in outs], [g for _,g in outs])
+        bwd_time += time.time() - start
+        loss = torch.tensor(loss + winloss.item())
+    else:
+        loss = winloss
+
+    # Return
+    return RolloutResult(loss, ptlosses, consislosses, encposes.detach(), deltaposes, transposes,
+                         predpts, encmask.detach(), bwd_time)
@@ -1,14 +1,18 @@
 import sys, os
 sys.path.append(os.path.join(os.path.dirname(__file__), "layers"))
 from layers.CollapseRtPivots import CollapseRtPivots
-from layers.ComposeRtPair import ComposeRtPair
+from layers.ComposeRtPair import ComposeRtPair, compose_rt_pair # Pure-tensor version (broadcasts over leading dims)
 from layers.ComposeRt import ComposeRt
 from layers.Dense3DPointsToRenderedSubPixelDepth import Dense3DPointsToRenderedSubPixelDepth
 from layers.DepthImageToDense3DPoints import DepthImageToDense3DPoints
 from layers.HuberLoss import HuberLoss
+from layers.MaskedLoss3D import MaskedLoss3D
 from layers.Noise import Noise
 from layers.NormalizedMSESqrtLoss import NormalizedMSESqrtLoss
-from layers.NTfm3D import NTfm3D
+from layers.NTfm3D import NTfm3D, upsample_masks # Bilinear upsampling of low-res masks (as in NTfm3D)
 from layers.RtInverse import RtInverse
+from layers.SE3Exp import SE3Exp
 from layers.SE3ToRt import SE3ToRt
 from layers.Normalize import Normalize
+from backend import set_use_reference, use_reference # Switch to the pure-tensor reference implementations
+from backend import float32 # Run in float32 under autocast (mixed precision)
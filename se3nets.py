@@ -114,7 +114,7 @@ class Encoder(nn.Module):
 # Model that takes in "depth/point cloud" to generate "k"-channel masks
 class MaskDecoder(nn.Module):
     def __init__(self, num_se3, pre_conv=False, use_bn=True, nonlinearity='prelu',
-                 use_wt_sharpening=False, sharpen_start_iter=0, sharpen_rate=1, wide=False):
+                 use_wt_sharpening=False, sharpen_start_iter=0, sharpen_rate=1, wide=False, mask_scale=1):
         super(MaskDecoder, self).__init__()
 
         ###### Choose type of convolution
@@ -143,6 +143,10 @@ class MaskDecoder(nn.Module):
         else:
             self.deconv5 = nn.ConvTranspose2d(chn[0], num_se3, kernel_size=8, stride=2, padding=3)  # 8x8, 120x160 -> 240x320
 
+        # Predict the masks at a lower resolution (if mask_scale > 1)
+        ctrlnets.add_lowres_mask_head(self, num_se3, chn, 5, mask_scale, pre_conv=pre_conv,
+                                      use_bn=use_bn, nonlinearity=nonlinearity)
+
         # Normalize to generate mask (wt-sharpening vs soft-mask model)
         self.use_wt_sharpening = use_wt_sharpening
         if use_wt_sharpening:
@@ -150,7 +154,7 @@ class MaskDecoder(nn.Module):
             self.sharpen_rate = sharpen_rate  # Rate for sharpening
             self.maskdecoder = ctrlnets.sharpen_masks  # Use the weight-sharpener
         else:
-            self.maskdecoder = nn.Softmax2d()  # SoftMax normalization
+            self.maskdecoder = ctrlnets.Softmax2d()  # SoftMax normalization
 
     def compute_wt_sharpening_stats(self, train_iter=0):
         citer = 1 + (train_iter - self.sharpen_start_iter)
@@ -166,11 +170,7 @@ class MaskDecoder(nn.Module):
         # Run mask-decoder to predict a smooth mask
         p, [c1,c2,c3,c4,c5] = x
         m = self.conv1x1(p)
-        m = self.deconv1(m, c4)
-        m = self.deconv2(m, c3)
-        m = self.deconv3(m, c2)
-        m = self.deconv4(m, c1)
-        m = self.deconv5(m)
+        m = ctrlnets.decode_masks(self, m, [c4, c3, c2, c1])
 
         # Predict a mask (either wt-sharpening or sigmoid-mask or soft-mask approach)
         # Normalize to sum across 1 along the channels (only for weight sharpening or soft-mask)
@@ -233,7 +233,7 @@ class SE3Model(nn.Module):
                 input_channels=3, use_bn=True, pre_conv=False,
                  nonlinearity='prelu', init_transse3_iden = False,
                  use_wt_sharpening=False, sharpen_start_iter=0, sharpen_rate=1, wide=False,
-                 num_state=0, use_jt_angles=False):
+                 num_state=0, use_jt_angles=False, mask_scale=1):
         super(SE3Model, self).__init__()
 
         # Initialize the pose-mask model
@@ -242,7 +242,7 @@ class SE3Model(nn.Module):
                                    use_jt_angles=use_jt_angles)
         self.maskdecoder = MaskDecoder(num_se3=num_se3, pre_conv=pre_conv, use_bn=use_bn, nonlinearity=nonlinearity,
                                        use_wt_sharpening=use_wt_sharpening, sharpen_start_iter=sharpen_start_iter,
-                                       sharpen_rate=sharpen_rate, wide=wide)
+                                       sharpen_rate=sharpen_rate, wide=wide, mask_scale=mask_scale)
         self.deltase3decoder  = DeltaSE3Decoder(input_dim=self.encoder.celem, num_se3=num_se3, use_pivot=use_pivot,
                                                 se3_type=se3_type,
                                                 nonlinearity=nonlinearity, init_se3_iden = init_transse3_iden)
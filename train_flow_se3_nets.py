@@ -21,9 +21,11 @@ import data
 import ctrlnets
 import flownets
 import se3nets
+import se3layers as se3nn
 import util
 from util import AverageMeter, Tee, DataEnumerator
 import helperfuncs as helpers
+import quantization
 
 #### Setup options
 # Common
@@ -222,8 +224,8 @@ def main():
         print("Adding noise to the depths, actual configs & ctrls")
     # noise_func = lambda d, c: data.add_gaussian_noise(d, c, std_d=0.02,
     #                                                  scale_d=True, std_j=0.02) if args.add_noise else None
-    noise_func = lambda d: data.add_edge_based_noise(d, zthresh=0.04, edgeprob=0.35,
-                                                     defprob=0.005, noisestd=0.005)
+    noise_func = lambda d, seed=None: data.add_edge_based_noise(d, zthresh=0.04, edgeprob=0.35,
+                                                                defprob=0.005, noisestd=0.005, seed=seed)
     valid_filter = lambda p, n, st, se, slab: data.valid_data_filter(p, n, st, se, slab,
                                                                mean_dt=args.mean_dt, std_dt=args.std_dt,
                                                                reject_left_motion=args.reject_left_motion,
@@ -250,10 +252,19 @@ def main():
                                                                        #num_tracker=args.num_tracker,
                                                                        dathreshold=args.da_threshold, dawinsize=args.da_winsize,
                                                                        use_only_da=args.use_only_da_for_flows,
-                                                                       noise_func=noise_func) # Need BWD flows / masks if using GT masks
-    train_dataset = data.BaxterSeqDataset(baxter_data, disk_read_func, 'train')  # Train dataset
-    val_dataset   = data.BaxterSeqDataset(baxter_data, disk_read_func, 'val')  # Val dataset
-    test_dataset  = data.BaxterSeqDataset(baxter_data, disk_read_func, 'test')  # Test dataset
+                                                                       noise_func=noise_func, # Need BWD flows / masks if using GT masks
+                                                                       defer_flows=args.batch_flows,
+                                                                       daearlyexit=args.da_early_exit)
+    batch_func = None
+    if args.batch_flows:
+        print("Computing flows/visibilities per-batch in the collater")
+        batch_func = data.BatchFlowAndVisibility(dathreshold=args.da_threshold, dawinsize=args.da_winsize,
+                                                 use_only_da=args.use_only_da_for_flows,
+                                                 compute_bwdflows=False, num_threads=args.batch_flow_threads,
+                                                 daearlyexit=args.da_early_exit)
+    train_dataset = data.BaxterSeqDataset(baxter_data, disk_read_func, 'train', batch_func=batch_func)  # Train dataset
+    val_dataset   = data.BaxterSeqDataset(baxter_data, disk_read_func, 'val', batch_func=batch_func)  # Val dataset
+    test_dataset  = data.BaxterSeqDataset(baxter_data, disk_read_func, 'test', batch_func=batch_func)  # Test dataset
     print('Dataset size => Train: {}, Validation: {}, Test: {}'.format(len(train_dataset), len(val_dataset), len(test_dataset)))
 
     # Create a data-collater for combining the samples of the data into batches along with some post-processing
@@ -297,8 +308,11 @@ def main():
                         use_wt_sharpening=args.use_wt_sharpening, sharpen_start_iter=args.sharpen_start_iter,
                         sharpen_rate=args.sharpen_rate, pre_conv=args.pre_conv,
                         wide=args.wide_model, use_jt_angles=args.use_jt_angles,
-                        num_state=args.num_state_net)
+                        num_state=args.num_state_net, mask_scale=args.mask_scale)
+        if args.mask_scale > 1:
+            print('Predicting the masks at 1/{} of the image resolution (upsampled in NTfm3D)'.format(args.mask_scale))
     else:
+        assert (args.mask_scale == 1), "Only the SE3-Nets predict masks, --mask-scale can't be used with the FlowNet"
         model = flownets.FlowNet(num_ctrl=args.num_ctrl, num_state=args.num_state_net,
                                  input_channels=num_input_channels, use_bn=args.batch_norm, pre_conv=args.pre_conv,
                                  nonlinearity=args.nonlin, init_flow_iden=args.init_flow_iden,
@@ -306,6 +320,19 @@ def main():
     if args.cuda:
         model.cuda() # Convert to CUDA if enabled
 
+    # Activation checkpointing: recompute conv/deconv blocks in the BWD pass till the activations stored for a
+    # training batch (estimated from a single sample) fit in the budget
+    if args.checkpoint_budget_mb > 0:
+        device = torch.device("cuda:0" if args.cuda else "cpu")
+        probe = lambda m: m([torch.zeros(1, 3, args.img_ht, args.img_wd, device=device),
+                             torch.zeros(1, args.num_state_net, device=device), torch.zeros(1, args.num_ctrl, device=device)])
+        with util.mixed_precision(device, args.mixed_precision):
+            ckptblocks, nbytes, ckptbytes = ctrlnets.set_checkpointing(model, args.checkpoint_budget_mb * 2**20, probe,
+                                                                       scale=args.batch_size)
+        print('Activation checkpointing of {} blocks ({}), activations per batch: {:.1f} MB -> {:.1f} MB '
+              '(budget: {:.1f} MB)'.format(len(ckptblocks), ', '.join(ckptblocks), nbytes / 2.0**20,
+                                           ckptbytes / 2.0**20, args.checkpoint_budget_mb))
+
     ### Load optimizer
     optimizer = helpers.load_optimizer(args.optimization, model.parameters(), lr=args.lr,
                                momentum=args.momentum, weight_decay=args.weight_decay)
@@ -354,6 +381,36 @@ def main():
                            },
         }, False, savedir=args.save_dir, filename='test_stats.pth.tar')
 
+        # Quantize the conv layers to int8 (calibrated on training samples) & evaluate again
+        if args.int8:
+            assert (not args.cuda), "The int8 model runs on the CPU only, use --no-cuda"
+            assert (not args.mixed_precision), "The int8 model can't be evaluated with --mixed-precision"
+            calib_loader = DataEnumerator(util.DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True,
+                                                          num_workers=args.num_workers,
+                                                          collate_fn=train_dataset.collate_batch))
+            ncalib = max(args.int8_calib_samples // args.batch_size, 1)
+            print('==== Calibrating the int8 quantization on {} training samples ==='.format(ncalib * args.batch_size))
+            model, nislands = quantization.quantize_int8(model, (calib_loader.next()[1] for _ in xrange(ncalib)),
+                    lambda m, s: m([s['points'][:, 0], s['actctrlconfigs'][:, 0], s['controls'][:, 0]]),
+                    keep_float=[x for x in args.int8_keep_float.split(',') if x])
+            print('==== Evaluating the int8 network ({} int8 conv layers) on test data ==='.format(nislands))
+            int8_stats = iterate(test_loader, model, tblogger, len(test_loader), mode='test')
+            save_checkpoint({
+                'args': args,
+                'test_stats': {'stats': int8_stats,
+                               'niters': test_loader.niters, 'nruns': test_loader.nruns,
+                               'totaliters': test_loader.iteration_count(),
+                               'ids': int8_stats.data_ids,
+                               },
+            }, False, savedir=args.save_dir, filename='test_stats_int8.pth.tar')
+
+            # Change in the test metrics
+            print('==== Float -> Int8 => Flow err sum: {:.4f} -> {:.4f}, Flow err avg: {:.4f} -> {:.4f}, '
+                  'Fwd time: {:.3f} -> {:.3f} s ({:.2f}x)'.format(
+                test_stats.flowerr_sum.avg.sum() / args.batch_size, int8_stats.flowerr_sum.avg.sum() / args.batch_size,
+                test_stats.flowerr_avg.avg.sum() / args.batch_size, int8_stats.flowerr_avg.avg.sum() / args.batch_size,
+                test_stats.fwd_time.avg, int8_stats.fwd_time.avg, test_stats.fwd_time.avg / int8_stats.fwd_time.avg))
+
         # Close log file & return
         logfile.close()
         return
@@ -370,6 +427,10 @@ def main():
         # Adjust learning rate
         adjust_learning_rate(optimizer, epoch, args.lr_decay, args.decay_epochs)
 
+        # Seed the noise of the samples with the epoch (same noise for a sample & epoch when resuming)
+        train_loader.set_epoch(epoch)
+        val_loader.set_epoch(epoch)
+
         # Train for one epoch
         train_stats = iterate(train_loader, model, tblogger, args.train_ipe,
                            mode='train', optimizer=optimizer, epoch=epoch+1)
@@ -477,6 +538,7 @@ def iterate(data_loader, model, tblogger, num_iters,
     stats.motionerr_sum, stats.motionerr_avg    = AverageMeter(), AverageMeter()
     stats.stillerr_sum, stats.stillerr_avg      = AverageMeter(), AverageMeter()
     stats.data_ids = []
+    stats.fwd_time = fwd_time # FWD pass time per iteration
     if mode == 'test':
         # Save the flow errors and poses if in "testing" mode
         stats.motion_err, stats.motion_npt, stats.still_err, stats.still_npt = [], [], [], []
@@ -496,7 +558,7 @@ def iterate(data_loader, model, tblogger, num_iters,
     # Run an epoch
     print('========== Mode: {}, Starting epoch: {}, Num iters: {} =========='.format(
         mode, epoch, num_iters))
-    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    device = torch.device("cuda:0" if args.cuda else "cpu")
     pt_wt = args.pt_wt * args.loss_scale
     for i in xrange(num_iters):
         # ============ Load data ============#
@@ -509,7 +571,7 @@ def iterate(data_loader, model, tblogger, num_iters,
 
         # Get inputs and targets (as variables)
         # Currently batchsize is the outer dimension
-        pts       = util.req_grad(sample['points'].to(device), train)  # Need gradients
+        pts       = util.req_grad(sample['points'].to(device), train and args.req_input_grads)  # Grads only if asked for
         ctrls     = util.req_grad(sample['controls'].to(device), train)  # Need gradients
         fwdflows  = util.req_grad(sample['fwdflows'].to(device), False)  # No gradients
         fwdvis    = util.req_grad(sample['fwdvisibilities'].float().to(device), False)
@@ -526,14 +588,17 @@ def iterate(data_loader, model, tblogger, num_iters,
 
         ### Run a FWD pass through the network
         # Make flow prediction
+        # (bfloat16 convs/matmuls if mixed-precision, the se3layers & the losses are always in float32)
         deltaposes, masks = [], []
-        if args.use_se3_nets:
-            flows, [deltapose, mask] = model([pts[:, 0], jtangles[:, 0], ctrls[:, 0]],
-                                             train_iter=num_train_iter)
-            deltaposes.append(deltapose)
-            masks.append(mask)
-        else:
-            flows = model([pts[:, 0], jtangles[:, 0], ctrls[:, 0]])
+        with util.mixed_precision(device, args.mixed_precision):
+            if args.use_se3_nets:
+                flows, [deltapose, mask] = model([pts[:, 0], jtangles[:, 0], ctrls[:, 0]],
+                                                 train_iter=num_train_iter)
+                deltaposes.append(deltapose)
+                masks.append(mask)
+            else:
+                flows = model([pts[:, 0], jtangles[:, 0], ctrls[:, 0]])
+        flows = flows.float() # Flow-Net predicts bfloat16 flows if mixed-precision
         nextpts = pts[:, 0] + flows  # Add flow to get next prediction
 
         # Append to list of predictions
@@ -549,9 +614,9 @@ def iterate(data_loader, model, tblogger, num_iters,
         if args.motion_norm_loss:
             motion = targets  # Use either delta-flows or full-flows
             loss = pt_wt * ctrlnets.MotionNormalizedLoss3D(inputs, targets, motion=motion,
-                                                           loss_type=args.loss_type, wts=fwdvis[:, 0])
+                                                           loss_type=args.loss_type, wts=fwdvis[:, 0], fused=args.fused_loss)
         else:
-            loss = pt_wt * ctrlnets.Loss3D(inputs, targets, loss_type=args.loss_type, wts=fwdvis[:, 0])
+            loss = pt_wt * ctrlnets.Loss3D(inputs, targets, loss_type=args.loss_type, wts=fwdvis[:, 0], fused=args.fused_loss)
         flowloss = torch.Tensor([loss.item()])
 
         # Update stats
@@ -668,7 +733,7 @@ def iterate(data_loader, model, tblogger, num_iters,
                             }
                     if args.use_se3_nets:
                         maskdisp = torchvision.utils.make_grid(
-                            torch.cat([masks[0].narrow(0, id, 1)], 0).cpu().view(-1, 1, args.img_ht, args.img_wd),
+                            se3nn.upsample_masks(masks[0].narrow(0, id, 1).float(), args.img_ht, args.img_wd).cpu().view(-1, 1, args.img_ht, args.img_wd),
                             nrow=args.num_se3, normalize=True, range=(0, 1))
                         info[mode+ '-masks'] = util.to_np(maskdisp.narrow(0,0,1))
                     for tag, images in info.items():
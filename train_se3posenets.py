@@ -24,6 +24,8 @@ import ctrlnets
 import util
 from util import AverageMeter, Tee, DataEnumerator
 import helperfuncs as helpers
+import rollout
+import quantization
 
 #### Setup options
 # Common
@@ -236,8 +238,8 @@ def main():
     ### Noise function
     #noise_func = lambda d, c: data.add_gaussian_noise(d, c, std_d=0.02,
     #                                                  scale_d=True, std_j=0.02) if args.add_noise else None
-    noise_func = lambda d: data.add_edge_based_noise(d, zthresh=0.04, edgeprob=0.35,
-                                                     defprob=0.005, noisestd=0.005)
+    noise_func = lambda d, seed=None: data.add_edge_based_noise(d, zthresh=0.04, edgeprob=0.35,
+                                                                defprob=0.005, noisestd=0.005, seed=seed)
     ### Load functions
     baxter_data     = data.read_recurrent_baxter_dataset(args.data, args.img_suffix,
                                                          step_len = args.step_len, seq_len = args.seq_len,
@@ -261,10 +263,18 @@ def main():
                                                  dathreshold=args.da_threshold, dawinsize=args.da_winsize,
                                                  use_only_da=args.use_only_da_for_flows,
                                                  noise_func=noise_func,
-                                                 load_color=load_color) # Need BWD flows / masks if using GT masks
-    train_dataset = data.BaxterSeqDataset(baxter_data, disk_read_func, 'train')  # Train dataset
-    val_dataset   = data.BaxterSeqDataset(baxter_data, disk_read_func, 'val')  # Val dataset
-    test_dataset  = data.BaxterSeqDataset(baxter_data, disk_read_func, 'test')  # Test dataset
+                                                 load_color=load_color, # Need BWD flows / masks if using GT masks
+                                                 defer_flows=args.batch_flows, daearlyexit=args.da_early_exit)
+    batch_func = None
+    if args.batch_flows:
+        print("Computing flows/visibilities per-batch in the collater")
+        batch_func = data.BatchFlowAndVisibility(dathreshold=args.da_threshold, dawinsize=args.da_winsize,
+                                                 use_only_da=args.use_only_da_for_flows,
+                                                 compute_bwdflows=False, num_threads=args.batch_flow_threads,
+                                                 daearlyexit=args.da_early_exit)
+    train_dataset = data.BaxterSeqDataset(baxter_data, disk_read_func, 'train', batch_func=batch_func)  # Train dataset
+    val_dataset   = data.BaxterSeqDataset(baxter_data, disk_read_func, 'val', batch_func=batch_func)  # Val dataset
+    test_dataset  = data.BaxterSeqDataset(baxter_data, disk_read_func, 'test', batch_func=batch_func)  # Test dataset
     print('Dataset size => Train: {}, Validation: {}, Test: {}'.format(len(train_dataset), len(val_dataset), len(test_dataset)))
 
     # Create a data-collater for combining the samples of the data into batches along with some post-processing
@@ -310,10 +320,26 @@ def main():
                     wide=args.wide_model, use_jt_angles=args.use_jt_angles,
                     use_jt_angles_trans=args.use_jt_angles_trans, num_state=args.num_state_net,
                     full_res=args.full_res, noise_stop_iter=args.noise_stop_iter,
-                    trans_type="default", posemask_type="default")
+                    trans_type="default", posemask_type="default", mask_scale=args.mask_scale)
+    if args.mask_scale > 1:
+        print('Predicting the masks at 1/{} of the image resolution (upsampled in NTfm3D)'.format(args.mask_scale))
     if args.cuda:
         model.cuda() # Convert to CUDA if enabled
 
+    # Activation checkpointing: recompute conv/deconv blocks in the BWD pass till the activations stored for a
+    # training batch (estimated from a single sample) fit in the budget
+    if args.checkpoint_budget_mb > 0:
+        device = torch.device("cuda:0" if args.cuda else "cpu")
+        nframes = args.seq_len + 1 # Encoder runs on all frames, mask decoder only @ t=0
+        probe = lambda m: m.forward_poses_masks([torch.zeros(1, nframes, 3, args.img_ht, args.img_wd, device=device),
+                                                 torch.zeros(1, nframes, args.num_state_net, device=device)])
+        with util.mixed_precision(device, args.mixed_precision):
+            ckptblocks, nbytes, ckptbytes = ctrlnets.set_checkpointing(model, args.checkpoint_budget_mb * 2**20, probe,
+                                                                       scale=args.batch_size)
+        print('Activation checkpointing of {} blocks ({}), activations per batch: {:.1f} MB -> {:.1f} MB '
+              '(budget: {:.1f} MB)'.format(len(ckptblocks), ', '.join(ckptblocks), nbytes / 2.0**20,
+                                           ckptbytes / 2.0**20, args.checkpoint_budget_mb))
+
     ### Load optimizer
     optimizer = helpers.load_optimizer(args.optimization, model.parameters(), lr=args.lr,
                                momentum=args.momentum, weight_decay=args.weight_decay)
@@ -375,6 +401,37 @@ def main():
                            },
         }, False, savedir=args.save_dir, filename='test_stats.pth.tar')
 
+        # Quantize the conv layers to int8 (calibrated on training samples) & evaluate again
+        if args.int8:
+            assert (not args.cuda), "The int8 model runs on the CPU only, use --no-cuda"
+            assert (not args.mixed_precision), "The int8 model can't be evaluated with --mixed-precision"
+            calib_loader = DataEnumerator(util.DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True,
+                                                          num_workers=args.num_workers,
+                                                          collate_fn=train_dataset.collate_batch))
+            ncalib = max(args.int8_calib_samples // args.batch_size, 1)
+            print('==== Calibrating the int8 quantization on {} training samples ==='.format(ncalib * args.batch_size))
+            model, nislands = quantization.quantize_int8(model, (calib_loader.next()[1] for _ in xrange(ncalib)),
+                    lambda m, s: m.forward_pose_mask([s['points'][:, 0], s['actctrlconfigs'][:, 0]]),
+                    keep_float=[x for x in args.int8_keep_float.split(',') if x])
+            print('==== Evaluating the int8 network ({} int8 conv layers) on test data ==='.format(nislands))
+            int8_stats = iterate(test_loader, model, tblogger, len(test_loader), mode='test')
+            helpers.save_checkpoint({
+                'args': args,
+                'test_stats': {'stats': int8_stats,
+                               'niters': test_loader.niters, 'nruns': test_loader.nruns,
+                               'totaliters': test_loader.iteration_count(),
+                               'ids': int8_stats.data_ids,
+                               },
+            }, False, savedir=args.save_dir, filename='test_stats_int8.pth.tar')
+
+            # Change in the test metrics
+            print('==== Float -> Int8 => Flow err sum: {:.4f} -> {:.4f}, Flow err avg: {:.4f} -> {:.4f}, '
+                  'Consis err: {:.4f} -> {:.4f}, Fwd time: {:.3f} -> {:.3f} s ({:.2f}x)'.format(
+                test_stats.flowerr_sum.avg.sum() / args.batch_size, int8_stats.flowerr_sum.avg.sum() / args.batch_size,
+                test_stats.flowerr_avg.avg.sum() / args.batch_size, int8_stats.flowerr_avg.avg.sum() / args.batch_size,
+                test_stats.consiserr.avg.sum(), int8_stats.consiserr.avg.sum(),
+                test_stats.fwd_time.avg, int8_stats.fwd_time.avg, test_stats.fwd_time.avg / int8_stats.fwd_time.avg))
+
         # Close log file & return
         logfile.close()
         return
@@ -393,6 +450,10 @@ def main():
         # Adjust learning rate
         adjust_learning_rate(optimizer, epoch, args.lr_decay, args.decay_epochs, args.min_lr)
 
+        # Seed the noise of the samples with the epoch (same noise for a sample & epoch when resuming)
+        train_loader.set_epoch(epoch)
+        val_loader.set_epoch(epoch)
+
         # Train for one epoch
         train_stats = iterate(train_loader, model, tblogger, args.train_ipe,
                            mode='train', optimizer=optimizer, epoch=epoch+1)
@@ -545,6 +606,7 @@ def iterate(data_loader, model, tblogger, num_iters,
     stats.stillerr_sum, stats.stillerr_avg      = AverageMeter(), AverageMeter()
     stats.consiserr                             = AverageMeter()
     stats.data_ids = []
+    stats.fwd_time = fwd_time # FWD pass time per iteration
     if mode == 'test':
         # Save the flow errors and poses if in "testing" mode
         stats.motion_err, stats.motion_npt, stats.still_err, stats.still_npt = [], [], [], []
@@ -579,10 +641,13 @@ def iterate(data_loader, model, tblogger, num_iters,
     # Type of loss (mixture of experts = wt sharpening or sigmoid)
     mex_loss = True
 
+    # Multi-step rollout engine (runs its own BWD pass in training mode, see rollout.py)
+    use_rollout = (args.seq_len > 1) or (args.bptt_window > 0) or args.recompute_rollout
+
     # Run an epoch
     print('========== Mode: {}, Starting epoch: {}, Num iters: {} =========='.format(
         mode, epoch, num_iters))
-    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    device = torch.device("cuda:0" if args.cuda else "cpu")
     pt_wt, consis_wt = args.pt_wt * args.loss_scale, args.consis_wt * args.loss_scale
     identfm = util.req_grad(torch.eye(4).view(1,1,4,4).expand(1,args.num_se3-1,4,4).narrow(2,0,3).to(device), False)
     for i in xrange(num_iters):
@@ -596,7 +661,7 @@ def iterate(data_loader, model, tblogger, num_iters,
 
         # Get inputs and targets (as variables)
         # Currently batchsize is the outer dimension
-        pts      = util.req_grad(sample['points'].to(device), train)  # Need gradients
+        pts      = util.req_grad(sample['points'].to(device), train and args.req_input_grads)  # Grads only if asked for
         ctrls    = util.req_grad(sample['controls'].to(device), train)  # Need gradients
         fwdflows = util.req_grad(sample['fwdflows'].to(device), False)  # No gradients
         fwdvis   = util.req_grad(sample['fwdvisibilities'].float().to(device), False)
@@ -610,45 +675,72 @@ def iterate(data_loader, model, tblogger, num_iters,
         # ============ FWD pass + Compute loss ============#
         # Start timer
         start = time.time()
-
-        ########## Run a FWD pass through the network
-        # Predict the poses and masks
-        pose0, initmask = model.forward_pose_mask([pts[:, 0], jtangles[:, 0]], train_iter=num_train_iter)
-        pose1 = model.forward_only_pose([pts[:, 1], jtangles[:, 1]])
-        poses = [pose0, pose1]
-
-        # Make next-pose predictions & corresponding 3D point predictions using the transition model
-        deltapose, transpose = model.forward_next_pose(pose0, ctrls[:, 0], jtangles[:, 0], None)
-        deltaposes = [deltapose]
-        transposes = [transpose]
-
-        # Make prediction of next pts
-        nextpts = ptpredlayer(pts[:,0], initmask, deltapose)
-        predpts = [nextpts]
-
-        ########## Losses
-        ### 3D loss
-        # If motion-normalized loss, pass in GT flows
-        inputs = nextpts - pts[:, 0]  # Delta flow for that step (note that gradients only go to the mask & deltas)
-        targets = fwdflows[:, 0]
-        if args.motion_norm_loss:
-            motion = targets  # Use either delta-flows or full-flows
-            currptloss = pt_wt * ctrlnets.MotionNormalizedLoss3D(inputs, targets, motion=motion,
-                                                                 loss_type=args.loss_type, wts=fwdvis[:, 0])
+        rollout_bwd_time = 0 # The rollout runs its BWD passes (interleaved with the FWD pass), counted as BWD time
+
+        if use_rollout:
+            ########## Rollout all steps (FWD + BWD pass in training mode)
+            if train:
+                optimizer.zero_grad() # Zero gradients
+            with util.mixed_precision(device, args.mixed_precision):
+                res = rollout.rollout_se3pose(model, pts, ctrls, jtangles, fwdflows, fwdvis, loss_type=args.loss_type,
+                                              motion_norm_loss=args.motion_norm_loss, fused_loss=args.fused_loss,
+                                              pt_wt=pt_wt, consis_wt=consis_wt, train_iter=num_train_iter,
+                                              bptt_window=args.bptt_window, recompute=args.recompute_rollout,
+                                              backward=train)
+            poses      = [res.poses[:, k] for k in xrange(args.seq_len+1)]
+            deltaposes = [res.deltaposes[:, k] for k in xrange(args.seq_len)]
+            transposes = [res.transposes[:, k] for k in xrange(args.seq_len)]
+            predpts    = [res.predpts[:, k] for k in xrange(args.seq_len)]
+            initmask   = res.initmask
+            loss, ptloss, consisloss = res.loss, res.ptloss, res.consisloss
+            rollout_bwd_time = res.bwd_time
         else:
-            currptloss = pt_wt * ctrlnets.Loss3D(inputs, targets, loss_type=args.loss_type, wts=fwdvis[:, 0])
+            ########## Run a FWD pass through the network
+            # (bfloat16 convs/matmuls if mixed-precision, the se3layers & the losses are always in float32)
+            with util.mixed_precision(device, args.mixed_precision):
+                # Predict the poses and masks
+                if args.batch_encoder:
+                    # Single encoder pass over both frames, mask is only decoded for the first one
+                    allposes, allmasks = model.forward_poses_masks([pts[:, :2], jtangles[:, :2]], mask_steps=(0,),
+                                                                   train_iter=num_train_iter)
+                    pose0, pose1, initmask = allposes[:, 0], allposes[:, 1], allmasks[:, 0]
+                else:
+                    pose0, initmask = model.forward_pose_mask([pts[:, 0], jtangles[:, 0]], train_iter=num_train_iter)
+                    pose1 = model.forward_only_pose([pts[:, 1], jtangles[:, 1]])
+                poses = [pose0, pose1]
+
+                # Make next-pose predictions & corresponding 3D point predictions using the transition model
+                deltapose, transpose = model.forward_next_pose(pose0, ctrls[:, 0], jtangles[:, 0], None)
+                deltaposes = [deltapose]
+                transposes = [transpose]
+
+            # Make prediction of next pts
+            nextpts = ptpredlayer(pts[:,0], initmask, deltapose)
+            predpts = [nextpts]
+
+            ########## Losses
+            ### 3D loss
+            # If motion-normalized loss, pass in GT flows
+            inputs = nextpts - pts[:, 0]  # Delta flow for that step (note that gradients only go to the mask & deltas)
+            targets = fwdflows[:, 0]
+            if args.motion_norm_loss:
+                motion = targets  # Use either delta-flows or full-flows
+                currptloss = pt_wt * ctrlnets.MotionNormalizedLoss3D(inputs, targets, motion=motion,
+                                                                     loss_type=args.loss_type, wts=fwdvis[:, 0], fused=args.fused_loss)
+            else:
+                currptloss = pt_wt * ctrlnets.Loss3D(inputs, targets, loss_type=args.loss_type, wts=fwdvis[:, 0], fused=args.fused_loss)
 
-        ### Consistency loss (between t & t+1)
-        # Poses from encoder @ t & @ t+1 should be separated by delta from t->t+1
-        # NOTE: For the consistency loss, the loss is only backpropagated to the encoder poses, not to the deltas
-        delta = deltapose.detach()  # Break the graph here
-        nextpose_trans = se3nn.ComposeRtPair()(delta, poses[0])
-        currconsisloss = consis_wt * ctrlnets.BiMSELoss(nextpose_trans, poses[1])
+            ### Consistency loss (between t & t+1)
+            # Poses from encoder @ t & @ t+1 should be separated by delta from t->t+1
+            # NOTE: For the consistency loss, the loss is only backpropagated to the encoder poses, not to the deltas
+            delta = deltapose.detach()  # Break the graph here
+            nextpose_trans = se3nn.ComposeRtPair()(delta, poses[0])
+            currconsisloss = consis_wt * ctrlnets.BiMSELoss(nextpose_trans, poses[1])
 
-        # Append to total loss
-        loss = currptloss + currconsisloss
-        ptloss     = torch.Tensor([currptloss.item()])
-        consisloss = torch.Tensor([currconsisloss.item()])
+            # Append to total loss
+            loss = currptloss + currconsisloss
+            ptloss     = torch.Tensor([currptloss.item()])
+            consisloss = torch.Tensor([currconsisloss.item()])
 
         # Update stats
         stats.ptloss.update(ptloss)
@@ -656,7 +748,7 @@ def iterate(data_loader, model, tblogger, num_iters,
         stats.loss.update(loss.item())
 
         # Measure FWD time
-        fwd_time.update(time.time() - start)
+        fwd_time.update(time.time() - start - rollout_bwd_time)
 
         # ============ Gradient backpass + Optimizer step ============#
         # Compute gradient and do optimizer update step (if in training mode)
@@ -665,15 +757,16 @@ def iterate(data_loader, model, tblogger, num_iters,
             start = time.time()
 
             # Backward pass & optimize
-            optimizer.zero_grad() # Zero gradients
-            loss.backward()       # Compute gradients - BWD pass
+            if not use_rollout:
+                optimizer.zero_grad() # Zero gradients
+                loss.backward()       # Compute gradients - BWD pass
             optimizer.step()      # Run update step
 
             # Increment number of training iterations by 1
             num_train_iter += 1
 
             # Measure BWD time
-            bwd_time.update(time.time() - start)
+            bwd_time.update(time.time() - start + rollout_bwd_time)
 
         # ============ Visualization ============#
         # Make sure to not add to the computation graph (will memory leak otherwise)!
@@ -810,7 +903,7 @@ def iterate(data_loader, model, tblogger, num_iters,
                                                                        predflows.narrow(0,id,1)], 0).cpu().view(-1, 3, args.img_ht, args.img_wd),
                                                             nrow=args.seq_len, normalize=True, range=(-0.01, 0.01))
                     #depthdisp = torchvision.utils.make_grid(sample['points'][id].narrow(1,2,1), normalize=True, range=(0.0,3.0))
-                    maskdisp  = torchvision.utils.make_grid(torch.cat([initmask.narrow(0,id,1)], 0).cpu().view(-1, 1, args.img_ht, args.img_wd),
+                    maskdisp  = torchvision.utils.make_grid(se3nn.upsample_masks(initmask.narrow(0,id,1).float(), args.img_ht, args.img_wd).cpu().view(-1, 1, args.img_ht, args.img_wd),
                                                             nrow=args.num_se3, normalize=True, range=(0,1))
 
 
@@ -34,7 +34,9 @@ def _worker_loop(dataset, index_queue, data_queue, collate_fn):
         if r is None:
             data_queue.put(None)
             break
-        idx, batch_indices = r
+        idx, batch_indices, epoch = r
+        if hasattr(dataset, 'set_epoch'):
+            dataset.set_epoch(epoch) # Used for seeding per-sample randomness (e.g. noise)
         try:
             samples = collate_fn([dataset[i] for i in batch_indices])
         except Exception:
@@ -135,6 +137,7 @@ class DataLoaderIter(object):
         self.num_workers = loader.num_workers
         self.pin_memory = loader.pin_memory
         self.drop_last = loader.drop_last
+        self.loader = loader # Epoch of the batches (loader.epoch, read when the batch indices are sent)
         self.done_event = threading.Event()
 
         self.samples_remaining = len(self.sampler)
@@ -188,6 +191,8 @@ class DataLoaderIter(object):
             if self.samples_remaining == 0:
                 raise StopIteration
             indices = self._next_indices()
+            if hasattr(self.dataset, 'set_epoch'):
+                self.dataset.set_epoch(self.loader.epoch)
             batch = self.collate_fn([self.dataset[i] for i in indices])
             if self.pin_memory:
                 batch = pin_memory_batch(batch)
@@ -229,7 +234,7 @@ class DataLoaderIter(object):
             if self.samples_remaining < self.batch_size and self.drop_last:
                 self._next_indices()
             else:
-                self.index_queue.put((self.send_idx, self._next_indices()))
+                self.index_queue.put((self.send_idx, self._next_indices(), self.loader.epoch))
                 self.batches_outstanding += 1
                 self.send_idx += 1
 
@@ -292,6 +297,7 @@ class DataLoader(object):
         self.collate_fn = collate_fn
         self.pin_memory = pin_memory
         self.drop_last = drop_last
+        self.epoch = 0 # Epoch of the training loop (set_epoch), seeds the per-sample randomness of the dataset
 
         if sampler is not None:
             self.sampler = sampler
@@ -317,6 +323,12 @@ class DataLoader(object):
     def __iter__(self):
         return DataLoaderIter(self)
 
+    # Epoch passed on to the dataset (dataset.set_epoch, in the workers too) for the batches requested from now on.
+    # Call it with the epoch of the training loop, so that a sample gets the same noise in an epoch after resuming
+    # from a checkpoint. Batches prefetched before the call (upto 2 x num_workers) keep the previous epoch
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
     def __len__(self):
         if self.drop_last:
             return len(self.sampler) // self.batch_size
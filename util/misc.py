@@ -1,4 +1,5 @@
 import os
+import contextlib
 import torch
 
 ################# HELPER FUNCTIONS
@@ -22,6 +23,17 @@ def req_grad(x, req=False):
 #         x = x.cuda()
 #     return torch.autograd.Variable(x, requires_grad=requires_grad, volatile=volatile)
 
+### Mixed-precision context: bfloat16 autocast on the device (the se3layers & losses run in float32, see
+### se3layers.float32), does nothing if not enabled. No loss scaling is needed with bfloat16
+@contextlib.contextmanager
+def mixed_precision(device, enabled=True):
+    if not enabled:
+        yield
+        return
+    assert hasattr(torch, 'autocast'), "Mixed precision needs torch.autocast (torch >= 1.10)"
+    with torch.autocast(torch.device(device).type, dtype=torch.bfloat16):
+        yield
+
 ### Create a directory. From: https://stackoverflow.com/questions/273192/how-can-i-create-a-directory-if-it-does-not-exist
 def create_dir(directory):
     if not os.path.exists(directory):
@@ -93,5 +105,8 @@ class DataEnumerator(object):
     def __len__(self):
         return len(self.data)
 
+    def set_epoch(self, epoch):
+        self.data.set_epoch(epoch) # Seeds the per-sample randomness (noise) of the data loader
+
     def iteration_count(self):
         return (self.nruns * self.len) + self.niters